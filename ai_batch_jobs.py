@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+AI Batch Jobs - Nightly batch submission of every run prompt via JSONL
+For re-analysis where throughput and cost matter more than latency.
+
+Flow:
+1. collect: run the pipeline with SHIF_AI_BATCH_MODE=collect. Cache misses are
+   written to a batch-request JSONL (OpenAI Batch API format) instead of being
+   sent; the run itself completes with empty AI results.
+2. submit / status / download: send the file through the OpenAI Batch API
+   (or `simulate` it locally with the offline backend for testing).
+3. ingest: load the batch results file into the AI response store.
+4. Run the normal pipeline: every collected prompt is now a cache hit.
+
+Simulated results are marked as such in the results file and are only ever
+ingested into the offline store (SHIF_OFFLINE_CACHE_DB), never the production
+one. Each request's prompt template and source hash are kept in a sidecar
+"<requests>.meta.jsonl" (the Batch API rejects unknown request fields), so
+ingest with --requests stores the version the prompt was rendered from and a
+template edit invalidates batch results like live ones.
+
+Each request's custom_id is "<tag>-<cache key>", so it is stable across runs
+and ingest can store the result under the exact key the pipeline looks up.
+Prompts that depend on earlier AI output (e.g. gap de-duplication) only get
+their final form once those results are cached; repeat collect/ingest to
+cover them.
+
+CLI:
+    SHIF_AI_BATCH_MODE=collect python integrated_comprehensive_analyzer.py
+    python ai_batch_jobs.py simulate outputs_run_X/ai_batch_requests.jsonl results.jsonl
+    python ai_batch_jobs.py submit outputs_run_X/ai_batch_requests.jsonl
+    python ai_batch_jobs.py status batch_abc123
+    python ai_batch_jobs.py download batch_abc123 results.jsonl
+    python ai_batch_jobs.py ingest results.jsonl --requests outputs_run_X/ai_batch_requests.jsonl
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from ai_response_store import AIResponseStore, get_default_store, offline_db_path
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_REQUESTS_FILENAME = "ai_batch_requests.jsonl"
+MAX_CUSTOM_ID_LENGTH = 64
+_TAG_SAFE_RE = re.compile(r"[^A-Za-z0-9_]+")
+
+
+def make_custom_id(tag: str, cache_key: str) -> str:
+    """Stable, readable batch id: '<tag>-<cache key>' within the 64-char limit."""
+    room = MAX_CUSTOM_ID_LENGTH - len(cache_key) - 1
+    prefix = _TAG_SAFE_RE.sub("_", tag or "untagged")[:room]
+    return f"{prefix}-{cache_key}"
+
+
+def cache_key_from_custom_id(custom_id: str) -> str:
+    return custom_id.rsplit("-", 1)[-1]
+
+
+def batch_request_line(custom_id: str, model: str, prompt: str, response_format: Dict = None) -> Dict:
+    """One Batch API request with the same parameters as the live calls."""
+    line = {
+        'custom_id': custom_id,
+        'method': 'POST',
+        'url': BATCH_ENDPOINT,
+        'body': {
+            'model': model,
+            'messages': [{'role': 'user', 'content': prompt}],
+            'temperature': 0,
+            'seed': 42,
+        },
+    }
+    if response_format:
+        line['body']['response_format'] = response_format
+    return line
+
+
+def batch_meta_path(requests_path) -> Path:
+    """Sidecar with each request's template version: ai_batch_requests.jsonl -> ai_batch_requests.meta.jsonl"""
+    path = Path(requests_path)
+    return path.with_name(f"{path.stem}.meta.jsonl")
+
+
+def _read_jsonl(path) -> Iterator[Dict]:
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except Exception:
+                continue
+
+
+class BatchCollector:
+    """Appends cache-miss prompts to a batch-request JSONL (thread-safe, de-duplicated)"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.meta_path = batch_meta_path(self.path)
+        self._lock = threading.Lock()
+        # Requests already in the file (a collect run can be resumed or repeated)
+        self._ids = {r.get('custom_id') for r in _read_jsonl(self.path)} if self.path.exists() else set()
+        self.added = 0
+
+    @property
+    def count(self) -> int:
+        return len(self._ids)
+
+    def add(self, cache_key: str, model: str, prompt: str, tag: str = "", response_format: Dict = None,
+            version: Dict = None) -> str:
+        """Queue one request; version is the analyzer's {'template', 'template_hash'} for the prompt."""
+        custom_id = make_custom_id(tag, cache_key)
+        with self._lock:
+            if custom_id in self._ids:
+                return custom_id
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(batch_request_line(custom_id, model, prompt, response_format), ensure_ascii=False) + '\n')
+            if version:
+                with open(self.meta_path, 'a') as f:
+                    f.write(json.dumps({'custom_id': custom_id, **version}) + '\n')
+            self._ids.add(custom_id)
+            self.added += 1
+        return custom_id
+
+
+def batch_collector_from_env(output_dir) -> Optional[BatchCollector]:
+    """BatchCollector when SHIF_AI_BATCH_MODE=collect (file: SHIF_AI_BATCH_FILE or the run dir)."""
+    if os.getenv('SHIF_AI_BATCH_MODE', '').strip().lower() != 'collect':
+        return None
+    path = os.getenv('SHIF_AI_BATCH_FILE') or Path(output_dir) / BATCH_REQUESTS_FILENAME
+    return BatchCollector(path)
+
+
+def _result_content(result: Dict) -> Optional[str]:
+    response = result.get('response') or {}
+    if result.get('error') or response.get('status_code', 200) != 200:
+        return None
+    choices = (response.get('body') or {}).get('choices') or []
+    if not choices:
+        return None
+    return (choices[0].get('message') or {}).get('content')
+
+
+def ingest_batch_results(results_path, store: AIResponseStore = None, requests_path=None,
+                         offline_store: AIResponseStore = None) -> Dict:
+    """Load a batch results JSONL into the response store under each request's cache key.
+
+    With the request file, each entry also gets its prompt hash, model, tag and
+    template version (so replay, store stats and template invalidation see it
+    like a live response). Simulated results go to offline_store (default: the
+    offline backend's store), never to store.
+    """
+    requests, versions = {}, {}
+    if requests_path:
+        requests = {r['custom_id']: r for r in _read_jsonl(requests_path) if r.get('custom_id')}
+        meta_path = batch_meta_path(requests_path)
+        if meta_path.exists():
+            versions = {m.pop('custom_id'): m for m in _read_jsonl(meta_path) if m.get('custom_id')}
+    counts = {'ingested': 0, 'simulated': 0, 'errors': 0, 'skipped': 0}
+    for result in _read_jsonl(results_path):
+        custom_id = result.get('custom_id')
+        if not custom_id:
+            counts['skipped'] += 1
+            continue
+        content = _result_content(result)
+        if content is None:
+            counts['errors'] += 1
+            continue
+        request = requests.get(custom_id, {})
+        body = request.get('body', {})
+        messages = body.get('messages') or [{}]
+        usage = ((result.get('response') or {}).get('body') or {}).get('usage') or {}
+        if result.get('simulated'):
+            if offline_store is None:
+                offline_store = AIResponseStore(db_path=offline_db_path())
+            target = offline_store
+        else:
+            target = store = store or get_default_store()
+        version = versions.get(custom_id, {})
+        target.set(
+            cache_key_from_custom_id(custom_id), content,
+            model=body.get('model') or ((result.get('response') or {}).get('body') or {}).get('model', ""),
+            tag=custom_id.rsplit("-", 1)[0],
+            prompt=messages[0].get('content') if request else None,
+            prompt_tokens=usage.get('prompt_tokens'),
+            completion_tokens=usage.get('completion_tokens'),
+            template=version.get('template'),
+            template_hash=version.get('template_hash'),
+        )
+        counts['simulated' if result.get('simulated') else 'ingested'] += 1
+    return counts
+
+
+def simulate_batch_results(requests_path, results_path, client=None) -> int:
+    """Local stand-in for the Batch API: answer every request with the offline backend.
+
+    Result lines carry "simulated": true so ingest keeps them out of the production store.
+    """
+    if client is None:
+        from config import get_offline_backend_settings
+        from offline_llm_backend import build_offline_client
+        client = build_offline_client(get_offline_backend_settings())
+    written = 0
+    with open(results_path, 'w') as out:
+        for request in _read_jsonl(requests_path):
+            body = request.get('body', {})
+            entry = {'id': f"batch_req_{written:06d}", 'custom_id': request.get('custom_id'), 'error': None,
+                     'simulated': True}
+            try:
+                resp = client.chat.completions.create(model=body.get('model'), messages=body.get('messages', []))
+                usage = getattr(resp, 'usage', None)
+                entry['response'] = {
+                    'status_code': 200,
+                    'body': {
+                        'model': resp.model,
+                        'choices': [{'index': 0, 'message': {'role': 'assistant',
+                                                             'content': resp.choices[0].message.content},
+                                     'finish_reason': 'stop'}],
+                        'usage': {'prompt_tokens': getattr(usage, 'prompt_tokens', None),
+                                  'completion_tokens': getattr(usage, 'completion_tokens', None)},
+                    },
+                }
+            except Exception as e:
+                entry['response'] = None
+                entry['error'] = {'code': 'simulated_error', 'message': str(e)}
+            out.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            written += 1
+    return written
+
+
+# ---------- OpenAI Batch API ----------
+
+def _openai_client():
+    from ai_client_registry import get_ai_registry
+    api_key = get_ai_registry().api_key()
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY not set")
+    import openai
+    return openai.OpenAI(api_key=api_key)
+
+
+def submit_batch(requests_path, completion_window: str = "24h") -> Dict:
+    client = _openai_client()
+    with open(requests_path, 'rb') as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT,
+                                  completion_window=completion_window,
+                                  metadata={'source': Path(requests_path).name})
+    return {'batch_id': batch.id, 'status': batch.status, 'input_file_id': uploaded.id}
+
+
+def batch_status(batch_id: str) -> Dict:
+    batch = _openai_client().batches.retrieve(batch_id)
+    counts = getattr(batch, 'request_counts', None)
+    return {
+        'batch_id': batch.id,
+        'status': batch.status,
+        'output_file_id': batch.output_file_id,
+        'error_file_id': batch.error_file_id,
+        'completed': getattr(counts, 'completed', None),
+        'failed': getattr(counts, 'failed', None),
+        'total': getattr(counts, 'total', None),
+    }
+
+
+def download_batch_results(batch_id: str, results_path) -> Optional[Path]:
+    client = _openai_client()
+    batch = client.batches.retrieve(batch_id)
+    if not batch.output_file_id:
+        return None
+    content = client.files.content(batch.output_file_id)
+    Path(results_path).write_text(content.text)
+    return Path(results_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-submit collected AI prompts and ingest the results")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sim_p = sub.add_parser('simulate', help="Answer a request file locally with the offline backend")
+    sim_p.add_argument('requests')
+    sim_p.add_argument('results')
+    submit_p = sub.add_parser('submit', help="Upload a request file and create an OpenAI batch")
+    submit_p.add_argument('requests')
+    status_p = sub.add_parser('status', help="Show batch progress")
+    status_p.add_argument('batch_id')
+    download_p = sub.add_parser('download', help="Download a finished batch's results")
+    download_p.add_argument('batch_id')
+    download_p.add_argument('results')
+    ingest_p = sub.add_parser('ingest', help="Load a results file into the AI response store")
+    ingest_p.add_argument('results')
+    ingest_p.add_argument('--requests', default=None,
+                          help="Request file (adds prompt hash/model/tag and the template version)")
+    ingest_p.add_argument('--db', default=None, help="SQLite path (default: ai_cache/ai_responses.sqlite3)")
+    ingest_p.add_argument('--offline-db', default=None,
+                          help="SQLite path for simulated results (default: ai_cache/offline_responses.sqlite3)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'simulate':
+        print(f"🧪 Simulated {simulate_batch_results(args.requests, args.results)} batch results → {args.results}")
+    elif args.command == 'submit':
+        info = submit_batch(args.requests)
+        print(f"📦 Submitted batch {info['batch_id']} ({info['status']})")
+    elif args.command == 'status':
+        print(json.dumps(batch_status(args.batch_id), indent=2))
+    elif args.command == 'download':
+        path = download_batch_results(args.batch_id, args.results)
+        print(f"✅ Results saved to {path}" if path else "⏳ Batch has no output file yet")
+    else:
+        store = AIResponseStore(db_path=args.db) if args.db else None
+        offline_store = AIResponseStore(db_path=args.offline_db) if args.offline_db else None
+        if not args.requests:
+            print("⚠️ No --requests file: entries are stored without a template version")
+        counts = ingest_batch_results(args.results, store=store, requests_path=args.requests,
+                                      offline_store=offline_store)
+        print(f"✅ Ingested {counts['ingested']} results ({counts['errors']} errors, {counts['skipped']} skipped)")
+        if counts['simulated']:
+            print(f"🧪 {counts['simulated']} simulated results → offline store only")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+AI Client Registry - Process-wide, lazily built OpenAI client
+Shared by the integrated analyzer, the pattern analyzer and the Streamlit app.
+
+Previously each setup_openai() sent "Hi" completions to the primary and
+fallback models on every construction. The registry instead:
+- reads the API key without touching the network
+- builds the real openai.OpenAI client on first attribute access
+- reports model health from real traffic (the shared model router)
+- hands out the offline backend instead when SHIF_AI_BACKEND=offline
+"""
+
+import os
+import threading
+from typing import Dict, Optional
+
+from model_router import get_model_router
+
+PRIMARY_MODEL = "gpt-5-mini"
+FALLBACK_MODEL = "gpt-4.1-mini"
+
+
+_OWN_FIELDS = frozenset({'_api_key', '_base_url', '_max_retries', '_client', '_lock'})
+
+
+class LazyOpenAIClient:
+    """Truthy when an API key is configured; builds openai.OpenAI on first use
+
+    base_url points the client at another OpenAI-compatible endpoint (e.g. Groq);
+    max_retries overrides the SDK's own retry count.
+    """
+
+    def __init__(self, api_key: str, base_url: str = None, max_retries: int = None):
+        self._api_key = api_key
+        self._base_url = base_url
+        self._max_retries = max_retries
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return bool(self._api_key)
+
+    @property
+    def is_built(self) -> bool:
+        return self._client is not None
+
+    def _build(self):
+        with self._lock:
+            if self._client is None:
+                import openai
+                extra = {'base_url': self._base_url} if self._base_url else {}
+                if self._max_retries is not None:
+                    extra['max_retries'] = self._max_retries
+                self._client = openai.OpenAI(api_key=self._api_key, **extra)
+        return self._client
+
+    def __getattr__(self, name):
+        # Only reached for attributes not defined here, e.g. .chat / .models. Dunder lookups
+        # (copy, pickle) and own fields not yet set (mid-__init__/unpickling) must not build
+        # a client or recurse through _build
+        if name in _OWN_FIELDS or (name.startswith('__') and name.endswith('__')):
+            raise AttributeError(name)
+        return getattr(self._build(), name)
+
+
+class AIClientRegistry:
+    """One lazy client per API key, plus health derived from routed calls"""
+
+    def __init__(self):
+        self._clients: Dict[str, LazyOpenAIClient] = {}
+        self._offline_client = None
+        self._lock = threading.Lock()
+        self._env_loaded = False
+
+    def _load_env(self) -> None:
+        if self._env_loaded:
+            return
+        try:
+            from dotenv import load_dotenv  # type: ignore
+            load_dotenv('.env', override=True)
+        except Exception:
+            pass
+        self._env_loaded = True
+
+    def api_key(self) -> Optional[str]:
+        self._load_env()
+        return os.getenv('OPENAI_API_KEY') or None
+
+    def backend(self) -> str:
+        self._load_env()
+        from config import get_ai_backend
+        return get_ai_backend()
+
+    def get_offline_client(self):
+        """Shared offline stand-in client (replay/synthetic, simulated latency and errors)."""
+        with self._lock:
+            if self._offline_client is None:
+                from config import get_offline_backend_settings
+                from offline_llm_backend import build_offline_client
+                self._offline_client = build_offline_client(get_offline_backend_settings())
+            return self._offline_client
+
+    def get_client(self, api_key: str = None):
+        """Shared lazy client for the given (or configured) key; None if no key.
+
+        With SHIF_AI_BACKEND=offline the offline client is returned instead,
+        whether or not a key is set.
+        """
+        if self.backend() == 'offline':
+            return self.get_offline_client()
+        api_key = api_key or self.api_key()
+        if not api_key:
+            return None
+        with self._lock:
+            if api_key not in self._clients:
+                self._clients[api_key] = LazyOpenAIClient(api_key)
+            return self._clients[api_key]
+
+    def health(self, primary_model: str = PRIMARY_MODEL, fallback_model: str = FALLBACK_MODEL) -> Dict[str, Dict]:
+        """Per-model health from real traffic: unknown / healthy / degraded / unavailable."""
+        report = get_model_router(primary_model, fallback_model).health()
+        for info in report.values():
+            if info['circuit'] == 'open':
+                info['status'] = 'unavailable'
+            elif info['last_error']:
+                info['status'] = 'degraded'
+            elif info['samples']:
+                info['status'] = 'healthy'
+            else:
+                info['status'] = 'unknown'
+        return report
+
+    def status_message(self, primary_model: str = PRIMARY_MODEL, fallback_model: str = FALLBACK_MODEL) -> str:
+        """One-line status for startup banners (no network calls)."""
+        if self.backend() == 'offline':
+            return f"🧪 Offline AI backend ({self.get_offline_client().mode}): no OpenAI calls will be made"
+        if not self.api_key():
+            return "⚠️ OPENAI_API_KEY not set. Core functionality will work without AI insights."
+        health = self.health(primary_model, fallback_model)
+        primary, fallback = health[primary_model], health[fallback_model]
+        if primary['status'] in ('unknown', 'healthy'):
+            suffix = "" if primary['status'] == 'healthy' else " (health checked on first request)"
+            return f"✅ OpenAI Ready: {primary_model}{suffix}"
+        if fallback['status'] in ('unknown', 'healthy'):
+            return f"✅ OpenAI Ready: {fallback_model} (fallback; {primary_model} {primary['status']})"
+        return f"⚠️ OpenAI models unavailable: {primary_model}, {fallback_model}"
+
+
+_registry: Optional[AIClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_ai_registry() -> AIClientRegistry:
+    """Process-wide registry (one per Python process, shared across Streamlit sessions)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = AIClientRegistry()
+        return _registry
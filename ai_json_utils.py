@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+AI JSON Utilities - Parsing helpers for model responses
+Used by the integrated analyzer for gap/contradiction extraction.
+
+extract_json_values scans a complete response once with a bracket/string-aware
+state machine and decodes each balanced top-level span with
+JSONDecoder.raw_decode, returning every JSON value with its offsets. Spans that
+fail to decode (or are truncated) are rescanned from the inside, so nested
+objects inside a broken wrapper are still recovered.
+
+IncrementalJSONArrayParser is fed a streamed completion chunk by chunk and
+emits each object of the target array (a top-level array, or the "gaps" /
+"contradictions" array of a top-level object) as soon as its closing brace
+arrives. It tracks string/escape state and container depth in one pass, so
+each character is inspected once regardless of how the text is chunked.
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+DEFAULT_ARRAY_KEYS = ('gaps', 'contradictions')
+_DECODER = json.JSONDecoder()
+
+
+@dataclass
+class JSONSpan:
+    """A decoded JSON value and its [start, end) offsets in the source text"""
+    value: Any
+    start: int
+    end: int
+
+
+def _match_brackets(text: str, start: int, end: int) -> Dict[int, int]:
+    """One pass: offset of each opening bracket -> offset just past its match.
+
+    Quotes only start strings inside a container, so prose apostrophes and
+    quoted words between JSON values do not derail the scan. Unclosed openers
+    (e.g. a truncated response) have no entry.
+    """
+    matches: Dict[int, int] = {}
+    stack: List[int] = []
+    in_string = False
+    escape = False
+    for i in range(start, end):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = bool(stack)
+        elif ch in '{[':
+            stack.append(i)
+        elif ch in '}]' and stack:
+            matches[stack.pop()] = i + 1
+    return matches
+
+
+def extract_json_values(text: str, start: int = 0, end: int = None) -> List[JSONSpan]:
+    """Every top-level JSON object/array in text, in order, with offsets.
+
+    Brackets are matched in a single pass; each balanced span is then decoded
+    once with raw_decode. Only when a span fails to decode (or never closes) is
+    the scan resumed inside it, so cost grows with text length times the depth
+    of broken wrappers rather than quadratically.
+    """
+    if not text:
+        return []
+    end = len(text) if end is None else end
+    matches = _match_brackets(text, start, end)
+    spans: List[JSONSpan] = []
+    i = start
+    while i < end:
+        close = matches.get(i)
+        if close is not None:
+            try:
+                value, decoded_end = _DECODER.raw_decode(text, i)
+            except ValueError:
+                decoded_end = None
+            if decoded_end == close:
+                spans.append(JSONSpan(value, i, close))
+                i = close
+                continue
+        # Not a value start, or an invalid/unclosed wrapper: keep scanning inside
+        i += 1
+    return spans
+
+
+def largest_json_value(text: str, types=(dict, list)):
+    """The longest top-level JSON value of the given types, or None."""
+    candidates = [s for s in extract_json_values(text) if isinstance(s.value, types)]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda s: s.end - s.start).value
+
+
+def collect_items(text: str, list_key: str, is_item=None) -> List[Dict]:
+    """Dict items from every JSON value in text.
+
+    Arrays contribute their dict elements, objects contribute their list_key
+    array when present, and bare objects are kept when is_item(obj) is true.
+    """
+    items: List[Dict] = []
+    for span in extract_json_values(text):
+        value = span.value
+        if isinstance(value, list):
+            items.extend(v for v in value if isinstance(v, dict))
+        elif isinstance(value, dict):
+            if isinstance(value.get(list_key), list):
+                items.extend(v for v in value[list_key] if isinstance(v, dict))
+            elif is_item is not None and is_item(value):
+                items.append(value)
+    return items
+
+
+class IncrementalJSONArrayParser:
+    """Emit completed objects of the target JSON array while text is streaming"""
+
+    def __init__(self, array_keys: Iterable[str] = DEFAULT_ARRAY_KEYS):
+        self.array_keys = set(array_keys)
+        self.text_parts: List[str] = []
+        self._pos = 0                 # absolute offset of the next character
+        self._stack: List[str] = []   # open containers: '{' or '['
+        self._in_string = False
+        self._escape = False
+        self._string_start: Optional[int] = None
+        self._last_key: Optional[str] = None
+        self._target_depth: Optional[int] = None  # stack length inside the target array
+        self._object_start: Optional[int] = None  # offset of the current element's '{'
+        self._object_buf: List[str] = []
+        self._string_buf: List[str] = []
+        self.emitted = 0
+        self.errors = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self.text_parts)
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Consume a chunk of streamed text; return objects completed by it."""
+        if not chunk:
+            return []
+        self.text_parts.append(chunk)
+        completed: List[Dict] = []
+        for ch in chunk:
+            if self._object_start is not None:
+                self._object_buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    # Remember object keys one level inside the top-level object
+                    if len(self._stack) == 1 and self._stack[0] == '{':
+                        self._last_key = "".join(self._string_buf)
+                elif len(self._stack) == 1:
+                    self._string_buf.append(ch)
+            elif ch == '"':
+                self._in_string = True
+                self._string_buf = []
+            elif ch in '{[':
+                if (ch == '{' and self._target_depth is not None
+                        and len(self._stack) == self._target_depth and self._object_start is None):
+                    self._object_start = self._pos
+                    self._object_buf = [ch]
+                self._stack.append(ch)
+                if ch == '[' and self._target_depth is None:
+                    top_level_array = len(self._stack) == 1
+                    keyed_array = (len(self._stack) == 2 and self._stack[0] == '{'
+                                   and self._last_key in self.array_keys)
+                    if top_level_array or keyed_array:
+                        self._target_depth = len(self._stack)
+            elif ch in '}]':
+                if self._stack:
+                    self._stack.pop()
+                if (ch == '}' and self._object_start is not None
+                        and len(self._stack) == self._target_depth):
+                    obj = self._decode("".join(self._object_buf))
+                    if isinstance(obj, dict):
+                        completed.append(obj)
+                        self.emitted += 1
+                    self._object_start = None
+                    self._object_buf = []
+                elif ch == ']' and self._target_depth is not None and len(self._stack) < self._target_depth:
+                    # Target array closed; ignore any later arrays
+                    self._target_depth = -1
+            self._pos += 1
+        return completed
+
+    def _decode(self, text: str):
+        try:
+            return json.loads(text)
+        except Exception:
+            self.errors += 1
+            return None
+
+
+def iter_stream_objects(chunks: Iterable[str], array_keys: Iterable[str] = DEFAULT_ARRAY_KEYS):
+    """Yield objects from an iterable of text chunks as they complete."""
+    parser = IncrementalJSONArrayParser(array_keys)
+    for chunk in chunks:
+        for obj in parser.feed(chunk):
+            yield obj
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+AI Provider Router - Latency/cost-aware choice of OpenAI-compatible provider per prompt class
+Used by the integrated analyzer behind _call_openai.
+
+OpenAI stays the default provider (routed across gpt-5-mini / gpt-4.1-mini by
+the model router). Other OpenAI-compatible providers - Groq when GROQ_API_KEY
+is set, plus any listed in SHIF_PROVIDERS - can take whole prompt classes.
+Each call's tag (or schema name) maps to a class: classification, dedup or
+analysis. Only the routable classes (default: classification and dedup) may
+leave OpenAI, unless a per-tag or per-class override in SHIF_PROVIDER_ROUTES
+pins a provider. By default only the row-level batch_service_analysis and the
+dedup tags are routable; expert assessments such as annex_quality stay on
+OpenAI unless SHIF_PROVIDER_CLASSES opts their tag into a routable class.
+
+For a routable call the providers are ranked by expected seconds:
+    p50 latency (configured prior until enough samples) x (1 + 4 x recent error rate)
+    + estimated USD cost x SHIF_ROUTE_SECONDS_PER_USD
+Latency includes rate-limiter waits, so a throttled provider loses traffic on
+its own. OpenAI's samples come from the analyzer's routed calls of the same
+prompt classes. A failed alternate provider, or one whose answer fails schema
+validation, counts as one failure and falls back to the OpenAI path.
+
+A provider ranked behind OpenAI gets no traffic, so its samples would never
+recover; once it has been idle for probe_seconds one call is sent to it first
+as a probe. Responses are cached under "<provider>:<model>" keys, so answers
+from different providers never overwrite each other.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from ai_client_registry import LazyOpenAIClient
+from ai_telemetry import model_prices
+from model_router import LatencyTracker
+
+OPENAI = "openai"
+ERROR_PENALTY = 4.0
+# Prompt class per call tag / schema name: only row-level classification and dedup by default.
+# Other tags (e.g. the expert annex_quality assessment) are opted in via SHIF_PROVIDER_CLASSES (JSON)
+DEFAULT_PROMPT_CLASSES = {
+    'batch_service_analysis': 'classification',
+    'gap_deduplication': 'dedup',
+    'canonicalization': 'dedup',
+}
+
+
+class InvalidResponse(ValueError):
+    """An alternate provider answered, but the answer failed the caller's validation"""
+
+
+@dataclass
+class Provider:
+    """One OpenAI-compatible endpoint and the model it serves routed prompts with"""
+    name: str
+    model: str
+    api_key: Optional[str] = None
+    base_url: Optional[str] = None
+    prior_seconds: float = 10.0
+    structured_outputs: bool = False
+    client: Any = None
+
+    def get_client(self):
+        if self.client is None:
+            # No SDK retries: a failed alternate falls back to OpenAI straight away
+            self.client = LazyOpenAIClient(self.api_key or "", self.base_url, max_retries=0)
+        return self.client
+
+
+class ProviderStats:
+    """Latency window and recent success/failure outcomes for one provider"""
+
+    def __init__(self, window: int = 50, outcomes: int = 20):
+        self.latency = LatencyTracker(window)
+        self.outcomes: Deque[bool] = deque(maxlen=outcomes)
+        self.last_used = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool) -> None:
+        if ok:
+            self.latency.record(seconds)
+        with self._lock:
+            self.outcomes.append(ok)
+            self.last_used = time.time()
+
+    def claim_probe(self, idle_seconds: float) -> bool:
+        """True (once) when the provider has had no call for idle_seconds."""
+        with self._lock:
+            if idle_seconds <= 0 or time.time() - self.last_used < idle_seconds:
+                return False
+            self.last_used = time.time()
+            return True
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return (self.outcomes.count(False) / len(self.outcomes)) if self.outcomes else 0.0
+
+
+class ProviderRouter:
+    """Ranks providers per prompt class from observed latency, error rate and price"""
+
+    def __init__(self, providers: List[Provider], routes: Dict[str, str] = None,
+                 prompt_classes: Dict[str, str] = None, routable_classes=('classification', 'dedup'),
+                 seconds_per_usd: float = 1000.0, min_samples: int = 3, completion_tokens: int = 1000,
+                 enabled: bool = True, probe_seconds: float = 600.0):
+        self.providers = {p.name: p for p in providers}
+        self.routes = dict(routes or {})
+        self.prompt_classes = dict(DEFAULT_PROMPT_CLASSES)
+        self.prompt_classes.update(prompt_classes or {})
+        self.routable_classes = set(routable_classes)
+        self.seconds_per_usd = seconds_per_usd
+        self.min_samples = min_samples
+        self.completion_tokens = completion_tokens
+        self.enabled = enabled
+        self.probe_seconds = probe_seconds
+        self.stats = {name: ProviderStats() for name in self.providers}
+
+    # ---------- planning ----------
+
+    def prompt_class(self, tag: str, schema: str = None) -> str:
+        return self.prompt_classes.get(tag or "") or self.prompt_classes.get(schema or "") or 'analysis'
+
+    def is_routable(self, tag: str, schema: str = None) -> bool:
+        """Whether calls of this tag/schema are ranked against OpenAI (and so feed its stats)."""
+        return self.prompt_class(tag, schema) in self.routable_classes
+
+    def expected_seconds(self, name: str, prompt_tokens: int) -> float:
+        provider, stats = self.providers[name], self.stats[name]
+        latency = stats.latency.percentile(50) if stats.latency.count() >= self.min_samples else None
+        latency = provider.prior_seconds if latency is None else latency
+        price = model_prices().get(provider.model) or {}
+        cost = (prompt_tokens * price.get('input', 0) + self.completion_tokens * price.get('output', 0)) / 1_000_000
+        return latency * (1 + ERROR_PENALTY * stats.error_rate()) + cost * self.seconds_per_usd
+
+    def plan(self, tag: str, prompt_tokens: int = 0, schema: str = None) -> List[str]:
+        """Providers to try in order; always ends with OpenAI."""
+        if not self.enabled or len(self.providers) < 2:
+            return [OPENAI]
+        prompt_class = self.prompt_class(tag, schema)
+        override = self.routes.get(tag or "") or self.routes.get(schema or "") or self.routes.get(prompt_class)
+        if override in self.providers:
+            order = [override]
+        elif prompt_class in self.routable_classes:
+            order = sorted(self.providers, key=lambda n: (self.expected_seconds(n, prompt_tokens), n != OPENAI))
+            # An idle alternate behind OpenAI gets one probe call, so a recovered provider can win traffic back
+            behind = order[order.index(OPENAI) + 1:]
+            probe = next((n for n in behind if self.stats[n].claim_probe(self.probe_seconds)), None)
+            if probe:
+                order.remove(probe)
+                order.insert(0, probe)
+        else:
+            order = []
+        # Alternates ranked after OpenAI are never tried: OpenAI's own router handles its fallback
+        order = order[:order.index(OPENAI)] if OPENAI in order else order
+        return order + [OPENAI]
+
+    def cache_model(self, name: str) -> str:
+        """Model part of an alternate provider's cache keys ("<provider>:<model>")."""
+        return f"{name}:{self.providers[name].model}"
+
+    # ---------- calls ----------
+
+    def record(self, name: str, seconds: float, ok: bool) -> None:
+        if name in self.stats:
+            self.stats[name].record(seconds, ok)
+
+    def complete(self, name: str, prompt: str, rate_limiter=None, response_format: Dict = None,
+                 validate: Callable[[str], bool] = None) -> Tuple[str, Any, float]:
+        """One non-streamed completion on an alternate provider: (content, usage, seconds waited).
+
+        An answer that validate() rejects is recorded as a failure and raised as InvalidResponse.
+        """
+        provider = self.providers[name]
+        client = provider.get_client()
+        extra = {'response_format': response_format} if response_format and provider.structured_outputs else {}
+
+        def send():
+            return client.chat.completions.create(
+                model=provider.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                **extra
+            )
+
+        started = time.time()
+        try:
+            if rate_limiter is not None:
+                resp, waited = rate_limiter.call(provider.model, rate_limiter.estimate_tokens(prompt), send)
+            else:
+                resp, waited = send(), 0.0
+        except Exception:
+            self.record(name, time.time() - started, False)
+            raise
+        content = resp.choices[0].message.content or ""
+        if validate is not None and not validate(content):
+            self.record(name, time.time() - started, False)
+            raise InvalidResponse(f"{name} returned an invalid response")
+        self.record(name, time.time() - started, True)
+        return content, getattr(resp, 'usage', None), waited
+
+    def health(self) -> Dict[str, Dict]:
+        return {
+            name: {
+                'model': p.model or "(caller's model)",
+                'samples': self.stats[name].latency.count(),
+                'p50_seconds': self.stats[name].latency.percentile(50),
+                'error_rate': round(self.stats[name].error_rate(), 3),
+                'expected_seconds_1k_tokens': round(self.expected_seconds(name, 1000), 2),
+            }
+            for name, p in self.providers.items()
+        }
+
+
+def providers_from_settings(settings: Dict) -> List[Provider]:
+    """OpenAI, then Groq (when keyed), then any extra providers from settings."""
+    providers = [Provider(OPENAI, settings.get('openai_model', ''), prior_seconds=settings['openai_prior_seconds'],
+                          structured_outputs=True)]
+    if settings.get('groq_api_key'):
+        providers.append(Provider('groq', settings['groq_model'], api_key=settings['groq_api_key'],
+                                  base_url=settings['groq_base_url'], prior_seconds=settings['groq_prior_seconds']))
+    for extra in settings.get('extra_providers') or []:
+        try:
+            providers.append(Provider(
+                extra['name'], extra['model'], api_key=os.getenv(extra.get('api_key_env', '')) or extra.get('api_key', 'none'),
+                base_url=extra.get('base_url'), prior_seconds=float(extra.get('prior_seconds', 5.0)),
+                structured_outputs=bool(extra.get('structured_outputs', False)),
+            ))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return providers
+
+
+_router: Optional[ProviderRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_provider_router(primary_model: str = "") -> ProviderRouter:
+    """Process-wide provider router built from config.get_provider_settings()."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            from config import get_provider_settings
+            settings = get_provider_settings()
+            settings['openai_model'] = primary_model
+            _router = ProviderRouter(
+                providers_from_settings(settings), routes=settings['routes'],
+                prompt_classes=settings['prompt_classes'], routable_classes=settings['routable_classes'],
+                seconds_per_usd=settings['seconds_per_usd'], enabled=settings['enabled'],
+                probe_seconds=settings['probe_seconds'],
+            )
+        return _router
+
+
+if __name__ == "__main__":
+    print(json.dumps(get_provider_router().health(), indent=2))
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+AI Rate Limiter - Cross-process token buckets for requests and tokens per minute
+Used by every chat-completion call site (integrated analyzer, pattern analyzer,
+Streamlit app) so concurrent sessions, batch runs and scheduled re-analysis
+share one budget per model instead of tripping 429s and the fallback path.
+
+Each model has two buckets, requests/minute and tokens/minute, refilled
+continuously. Their state lives in a small JSON file next to the AI cache and
+every read-modify-write happens under an exclusive lock on a sibling lock
+file, so all processes on the host draw from the same buckets. A caller that
+finds a bucket empty sleeps (outside the lock) until it refills; the time
+waited is returned so it can be recorded in telemetry.
+
+A 429 halves the model's effective rate and empties its buckets until the
+server's Retry-After has passed; each later success restores 10% of the
+configured rate (additive increase, multiplicative decrease). Token estimates
+are reconciled with the usage reported by the API.
+
+CLI:
+    python ai_rate_limiter.py status
+    python ai_rate_limiter.py reset
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl  # POSIX advisory locks; other platforms only coordinate threads
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+DEFAULT_STATE_PATH = Path("ai_cache") / "rate_limits.json"
+# Requests and tokens per minute by model; SHIF_RATE_LIMITS (JSON) overrides
+DEFAULT_LIMITS = {
+    'gpt-5-mini': {'rpm': 500, 'tpm': 200_000},
+    'gpt-4.1-mini': {'rpm': 500, 'tpm': 200_000},
+}
+MIN_SCALE = 0.1
+RECOVERY_STEP = 0.1
+MAX_SLEEP_SECONDS = 2.0
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for HTTP 429 / RateLimitError from the OpenAI client (or the offline backend)."""
+    if getattr(error, 'status_code', None) == 429 or type(error).__name__ == 'RateLimitError':
+        return True
+    text = str(error).lower()
+    return '429' in text or 'rate limit' in text
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Retry-After header of a rate-limit error, when the response carries one."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        value = headers.get('retry-after') or headers.get('Retry-After')
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def usage_total_tokens(usage) -> Optional[int]:
+    """Total tokens of an API usage object (None when the API reported none)."""
+    total = getattr(usage, 'total_tokens', None)
+    if total is None and usage is not None:
+        total = (getattr(usage, 'prompt_tokens', 0) or 0) + (getattr(usage, 'completion_tokens', 0) or 0)
+    return total
+
+
+class _FileLock:
+    """Exclusive lock on a lock file (threads in this process also serialise on a mutex)"""
+
+    _thread_locks: Dict[str, threading.Lock] = {}
+    _guard = threading.Lock()
+
+    def __init__(self, path: Path):
+        self.path = path
+        with self._guard:
+            self._mutex = self._thread_locks.setdefault(str(path), threading.Lock())
+        self._handle = None
+
+    def __enter__(self):
+        self._mutex.acquire()
+        if fcntl is not None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._handle = open(self.path, 'a+')
+                fcntl.flock(self._handle.fileno(), fcntl.LOCK_EX)
+            except OSError:
+                self._handle = None
+        return self
+
+    def __exit__(self, *exc):
+        if self._handle is not None:
+            try:
+                fcntl.flock(self._handle.fileno(), fcntl.LOCK_UN)
+            finally:
+                self._handle.close()
+                self._handle = None
+        self._mutex.release()
+
+
+class RateLimiter:
+    """Shared per-model request and token buckets"""
+
+    def __init__(self, state_path=None, limits: Dict[str, Dict] = None, default_rpm: float = None,
+                 default_tpm: float = None, completion_tokens: int = None, enabled: bool = None,
+                 sleep: Callable[[float], None] = time.sleep, clock: Callable[[], float] = time.time):
+        from config import get_rate_limit_settings
+        settings = get_rate_limit_settings()
+        self.state_path = Path(state_path or settings['state_path'] or DEFAULT_STATE_PATH)
+        self.lock = _FileLock(self.state_path.with_suffix(self.state_path.suffix + '.lock'))
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(settings['limits'] if limits is None else limits)
+        self.default_rpm = default_rpm if default_rpm is not None else settings['default_rpm']
+        self.default_tpm = default_tpm if default_tpm is not None else settings['default_tpm']
+        self.completion_tokens = completion_tokens if completion_tokens is not None else settings['completion_tokens']
+        self.enabled = settings['enabled'] if enabled is None else enabled
+        self.sleep = sleep
+        self.clock = clock
+
+    # ---------- state ----------
+
+    def limits_for(self, model: str) -> Tuple[float, float]:
+        limit = self.limits.get(model) or {}
+        return float(limit.get('rpm') or self.default_rpm), float(limit.get('tpm') or self.default_tpm)
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _save(self, state: Dict) -> None:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, sort_keys=True)
+        os.replace(tmp, self.state_path)
+
+    def _bucket(self, state: Dict, model: str, now: float) -> Dict:
+        """The model's bucket refilled up to now (created full on first use)."""
+        rpm, tpm = self.limits_for(model)
+        bucket = state.setdefault(model, {'requests': rpm, 'tokens': tpm, 'updated': now, 'scale': 1.0,
+                                          'blocked_until': 0.0, 'rate_limited': 0, 'waited_seconds': 0.0})
+        scale = bucket.get('scale', 1.0)
+        if now >= bucket.get('blocked_until', 0.0):
+            # No refill while paused after a 429
+            elapsed = max(0.0, now - max(bucket.get('updated', now), bucket.get('blocked_until', 0.0)))
+            bucket['requests'] = min(rpm * scale, bucket['requests'] + elapsed * rpm * scale / 60.0)
+            bucket['tokens'] = min(tpm * scale, bucket['tokens'] + elapsed * tpm * scale / 60.0)
+        bucket['updated'] = now
+        return bucket
+
+    # ---------- acquire / feedback ----------
+
+    def estimate_tokens(self, prompt: str) -> int:
+        from prompt_packer import count_tokens
+        return count_tokens(prompt or "") + self.completion_tokens
+
+    def acquire(self, model: str, tokens: int = 0, timeout: float = None) -> float:
+        """Block until one request and `tokens` tokens are available; returns seconds waited."""
+        if not self.enabled:
+            return 0.0
+        started = self.clock()
+        rpm, tpm = self.limits_for(model)
+        while True:
+            with self.lock:
+                state = self._load()
+                now = self.clock()
+                bucket = self._bucket(state, model, now)
+                scale = bucket.get('scale', 1.0)
+                need_tokens = min(float(tokens), tpm * scale)  # a prompt larger than the bucket waits for a full one
+                if now >= bucket['blocked_until'] and bucket['requests'] >= 1 and bucket['tokens'] >= need_tokens:
+                    bucket['requests'] -= 1
+                    bucket['tokens'] -= need_tokens
+                    waited = now - started
+                    bucket['waited_seconds'] = round(bucket.get('waited_seconds', 0.0) + waited, 3)
+                    self._save(state)
+                    return waited
+                delay = max(
+                    bucket['blocked_until'] - now,
+                    (1 - bucket['requests']) * 60.0 / (rpm * scale),
+                    (need_tokens - bucket['tokens']) * 60.0 / (tpm * scale),
+                    0.01,
+                )
+                self._save(state)
+            if timeout is not None and self.clock() - started + delay > timeout:
+                raise TimeoutError(f"Rate limit for {model}: no capacity within {timeout:.1f}s")
+            self.sleep(min(delay, MAX_SLEEP_SECONDS))
+
+    def rate_limited(self, model: str, retry_after: float = None) -> None:
+        """Record a 429: halve the effective rate and pause the model until Retry-After."""
+        if not self.enabled:
+            return
+        rpm, _ = self.limits_for(model)
+        with self.lock:
+            state = self._load()
+            now = self.clock()
+            bucket = self._bucket(state, model, now)
+            bucket['scale'] = max(MIN_SCALE, bucket.get('scale', 1.0) / 2)
+            bucket['requests'] = 0.0
+            bucket['tokens'] = 0.0
+            pause = retry_after if retry_after is not None else 60.0 / (rpm * bucket['scale'])
+            bucket['blocked_until'] = max(bucket.get('blocked_until', 0.0), now + pause)
+            bucket['rate_limited'] = bucket.get('rate_limited', 0) + 1
+            self._save(state)
+
+    def succeeded(self, model: str, estimated_tokens: int = 0, actual_tokens: int = None) -> None:
+        """Record a success: recover part of the rate and settle the token estimate."""
+        if not self.enabled:
+            return
+        _, tpm = self.limits_for(model)
+        with self.lock:
+            state = self._load()
+            bucket = self._bucket(state, model, self.clock())
+            scale = bucket.get('scale', 1.0)
+            if scale < 1.0:
+                bucket['scale'] = min(1.0, scale + RECOVERY_STEP)
+            if actual_tokens is not None:
+                bucket['tokens'] = min(tpm * bucket['scale'], bucket['tokens'] + estimated_tokens - actual_tokens)
+            self._save(state)
+
+    def call(self, model: str, tokens: int, send: Callable[[], Any]) -> Tuple[Any, float]:
+        """acquire, send(), then feed the outcome back; returns (response, seconds waited)."""
+        waited = self.acquire(model, tokens)
+        try:
+            response = send()
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.rate_limited(model, retry_after_seconds(e))
+            raise
+        self.succeeded(model, tokens, usage_total_tokens(getattr(response, 'usage', None)))
+        return response, waited
+
+    def status(self) -> Dict[str, Dict]:
+        with self.lock:
+            state = self._load()
+            now = self.clock()
+            report = {}
+            for model in sorted(state):
+                bucket = self._bucket(state, model, now)
+                rpm, tpm = self.limits_for(model)
+                report[model] = {
+                    'rpm': rpm, 'tpm': tpm, 'scale': round(bucket['scale'], 3),
+                    'requests_available': round(bucket['requests'], 2),
+                    'tokens_available': round(bucket['tokens']),
+                    'blocked_for_seconds': round(max(0.0, bucket['blocked_until'] - now), 2),
+                    'rate_limited': bucket.get('rate_limited', 0),
+                    'waited_seconds': bucket.get('waited_seconds', 0.0),
+                }
+            return report
+
+    def reset(self) -> None:
+        with self.lock:
+            self._save({})
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Process-wide limiter; processes share its state file."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Shared AI rate limiter")
+    parser.add_argument('--state', default=None, help="State file (default: ai_cache/rate_limits.json)")
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('status', help="Show bucket levels and 429 counts per model")
+    sub.add_parser('reset', help="Refill all buckets and clear 429 back-off")
+    args = parser.parse_args(argv)
+    limiter = RateLimiter(state_path=args.state)
+    if args.command == 'reset':
+        limiter.reset()
+        print(f"Reset {limiter.state_path}")
+        return 0
+    print(json.dumps(limiter.status(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+AI Request Executor - Background, de-duplicated AI requests for the Streamlit app
+Used by the dashboard's generate_ai_* methods so a button click never blocks the
+script thread on an LLM round trip.
+
+Each request is submitted under a job id (its response cache key) to a small
+process-wide thread pool. Submitting the same job id again while it is queued,
+running or finished-but-uncollected returns the existing job, so reruns and
+repeated clicks never send a second request. The job itself writes its answer
+to the shared AI response store, so once collected the same question is served
+from the cache.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+
+@dataclass
+class AIJob:
+    """One background request and when it was submitted"""
+    job_id: str
+    tag: str
+    future: Future
+    submitted_at: float = field(default_factory=time.time)
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    @property
+    def elapsed(self) -> float:
+        return time.time() - self.submitted_at
+
+
+class AIRequestExecutor:
+    """Bounded thread pool keyed by job id (one in-flight request per id)"""
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or int(os.getenv('SHIF_AI_UI_WORKERS', '2'))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ai-ui")
+        self._jobs: Dict[str, AIJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id: str, fn: Callable, tag: str = "") -> AIJob:
+        """Start fn() in the background, or return the job already registered under job_id."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                job = AIJob(job_id, tag, self._pool.submit(fn))
+                self._jobs[job_id] = job
+            return job
+
+    def get(self, job_id: str) -> Optional[AIJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def collect(self, job_id: str) -> Optional[AIJob]:
+        """Remove and return a finished job (None while it is still running or unknown)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not job.done():
+                return None
+            return self._jobs.pop(job_id)
+
+    def running(self) -> List[AIJob]:
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.done()]
+
+
+_executor: Optional[AIRequestExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_ai_executor() -> AIRequestExecutor:
+    """Process-wide executor (shared across Streamlit sessions and reruns)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = AIRequestExecutor()
+        return _executor
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+AI Response Store - Indexed, evicting cache for OpenAI responses
+Replaces the flat ai_cache/*.txt files with a single SQLite database.
+
+Each entry is keyed by the existing cache key (SHA-1 of model + prompt + tag)
+and records prompt hash, model, tag, timing, token counts, size and hit count.
+Entries are evicted least-recently-used once the store exceeds its size or
+entry limits. Large responses can be zlib-compressed.
+
+Entries can also record the prompt template that produced them and its
+source hash (see prompt_templates). A lookup made with a different template
+hash is a miss, so editing one template only invalidates that template's
+entries. Entries without a recorded version (written before template
+tracking, or imported without one) are misses for template-tracked lookups
+until they are explicitly marked for adoption (prompt_templates.py adopt);
+a marked entry takes the version of the first tracked lookup that reads it.
+
+A store can be snapshotted into a warm bundle and merged into the store of a
+fresh deployment (see warm_bundle).
+
+CLI:
+    python ai_response_store.py stats
+    python ai_response_store.py import [legacy_dir]
+    python ai_response_store.py evict
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_DB_PATH = Path("ai_cache") / "ai_responses.sqlite3"
+OFFLINE_DB_PATH = Path("ai_cache") / "offline_responses.sqlite3"
+# template_hash of untracked entries an operator chose to keep (see mark_for_adoption)
+ADOPT_PENDING = "adopt"
+LEGACY_TXT_RE = re.compile(r"^[0-9a-f]{40}$")
+LEGACY_JSON_RE = re.compile(r"^(?P<tag>.+)_(?P<model>gpt-[\w.\-]+?)_(?P<hash>[0-9a-f]{16})$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    cache_key TEXT PRIMARY KEY,
+    prompt_hash TEXT,
+    model TEXT,
+    tag TEXT,
+    created_at TEXT,
+    last_accessed TEXT,
+    latency_ms REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    byte_size INTEGER,
+    hit_count INTEGER DEFAULT 0,
+    compressed INTEGER DEFAULT 0,
+    content BLOB,
+    template TEXT,
+    template_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_responses_lru ON responses(last_accessed);
+CREATE INDEX IF NOT EXISTS idx_responses_model_tag ON responses(model, tag);
+"""
+# Columns added after the first release; older databases get them on open
+MIGRATIONS = (
+    ('template', "ALTER TABLE responses ADD COLUMN template TEXT"),
+    ('template_hash', "ALTER TABLE responses ADD COLUMN template_hash TEXT"),
+)
+
+
+def prompt_hash(prompt: str) -> str:
+    """SHA-1 of the prompt text alone (model/tag are stored separately)."""
+    return hashlib.sha1((prompt or "").encode("utf-8")).hexdigest()
+
+
+def response_cache_key(model: str, prompt: str, tag: str = "") -> str:
+    """Cache key for a response: SHA-1 of model + prompt (+ tag), as used by every caller."""
+    m = hashlib.sha1()
+    m.update(model.encode("utf-8"))
+    m.update(b"\0")
+    m.update(prompt.encode("utf-8"))
+    if tag:
+        m.update(b"\0")
+        m.update(tag.encode("utf-8"))
+    return m.hexdigest()
+
+
+class AIResponseStore:
+    """SQLite-backed response cache shared by all analyzers in this repo"""
+
+    def __init__(self, db_path: str = None, max_bytes: int = None, max_entries: int = None,
+                 compress: bool = None, compress_min_bytes: int = 4096):
+        self.db_path = Path(db_path or os.getenv('SHIF_AI_CACHE_DB', str(DEFAULT_DB_PATH)))
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv('SHIF_AI_CACHE_MAX_MB', '200')) * 1024 * 1024
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv('SHIF_AI_CACHE_MAX_ENTRIES', '5000'))
+        if compress is None:
+            compress = os.getenv('SHIF_AI_CACHE_COMPRESS', 'true').lower() in ('1', 'true', 'yes')
+        self.compress = compress
+        self.compress_min_bytes = compress_min_bytes
+        self._lock = threading.Lock()
+        is_new = not self.db_path.exists()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        for column, statement in MIGRATIONS:
+            if column not in columns:
+                self._conn.execute(statement)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_template ON responses(template)")
+        self._conn.commit()
+        if is_new:
+            # First use: bring over the legacy flat-file cache next to the database
+            self.import_legacy(self.db_path.parent)
+
+    # ---------- core get/set ----------
+
+    def get(self, cache_key: str, template_hash: str = None, template: str = None) -> Optional[str]:
+        """Return cached content and bump hit count / LRU timestamp.
+
+        With template_hash, an entry produced by another version of its template,
+        or without a recorded version, is a miss; an entry marked for adoption
+        takes this version (and template).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, compressed, template_hash FROM responses WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None or not self._version_matches(row[2], template_hash):
+                return None
+            adopt = bool(template_hash) and row[2] == ADOPT_PENDING
+            self._conn.execute(
+                """UPDATE responses SET hit_count = hit_count + 1, last_accessed = ?,
+                          template = CASE WHEN ? THEN ? ELSE template END,
+                          template_hash = CASE WHEN ? THEN ? ELSE template_hash END
+                   WHERE cache_key = ?""",
+                (datetime.now().isoformat(), adopt, template, adopt, template_hash, cache_key),
+            )
+            self._conn.commit()
+        return self._decode(row[0], row[1])
+
+    def set(self, cache_key: str, content: str, model: str = "", tag: str = "", prompt: str = None,
+            prompt_hash_value: str = None, latency_ms: float = None, prompt_tokens: int = None,
+            completion_tokens: int = None, template: str = None, template_hash: str = None) -> None:
+        """Insert or replace an entry, then evict if limits are exceeded."""
+        raw = (content or "").encode("utf-8")
+        compressed = 0
+        blob = raw
+        if self.compress and len(raw) >= self.compress_min_bytes:
+            blob = zlib.compress(raw, 6)
+            compressed = 1
+        now = datetime.now().isoformat()
+        phash = prompt_hash_value or (prompt_hash(prompt) if prompt is not None else None)
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO responses
+                   (cache_key, prompt_hash, model, tag, created_at, last_accessed, latency_ms,
+                    prompt_tokens, completion_tokens, byte_size, hit_count, compressed, content,
+                    template, template_hash)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?)""",
+                (cache_key, phash, model, tag, now, now, latency_ms, prompt_tokens,
+                 completion_tokens, len(blob), compressed, sqlite3.Binary(blob), template, template_hash),
+            )
+            self._conn.commit()
+        self.evict()
+
+    def find_by_prompt_hash(self, prompt_hash_value: str, model: str = None) -> Optional[str]:
+        """Most recent content stored for a prompt hash (optionally for one model), without bumping hits."""
+        query = "SELECT content, compressed FROM responses WHERE prompt_hash = ?"
+        params = [prompt_hash_value]
+        if model:
+            query += " AND model = ?"
+            params.append(model)
+        with self._lock:
+            row = self._conn.execute(query + " ORDER BY created_at DESC LIMIT 1", params).fetchone()
+        return self._decode(row[0], row[1]) if row else None
+
+    def sample_content(self, index: int) -> Optional[str]:
+        """Deterministic pick of a stored response by index (modulo entry count)."""
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if not total:
+                return None
+            row = self._conn.execute(
+                "SELECT content, compressed FROM responses ORDER BY cache_key LIMIT 1 OFFSET ?", (index % total,)
+            ).fetchone()
+        return self._decode(row[0], row[1]) if row else None
+
+    def contains(self, cache_key: str, template_hash: str = None) -> bool:
+        """Whether get() would return the entry (without counting a hit)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT template_hash FROM responses WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+        return row is not None and self._version_matches(row[0], template_hash)
+
+    @staticmethod
+    def _version_matches(stored: Optional[str], template_hash: Optional[str]) -> bool:
+        return not template_hash or stored in (template_hash, ADOPT_PENDING)
+
+    def delete(self, cache_keys: List[str]) -> int:
+        with self._lock:
+            cur = self._conn.executemany("DELETE FROM responses WHERE cache_key = ?", [(k,) for k in cache_keys])
+            self._conn.commit()
+            return cur.rowcount
+
+    # ---------- template versions ----------
+
+    def template_versions(self) -> List[Dict]:
+        """Entry counts per (template, template hash) for template-tracked entries."""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT template, template_hash, COUNT(*), COALESCE(SUM(byte_size), 0), GROUP_CONCAT(DISTINCT tag)
+                   FROM responses WHERE template IS NOT NULL GROUP BY template, template_hash
+                   ORDER BY template, template_hash"""
+            ).fetchall()
+        return [{'template': r[0], 'template_hash': r[1], 'entries': r[2], 'bytes': r[3],
+                 'tags': sorted(t for t in (r[4] or "").split(",") if t)} for r in rows]
+
+    def untracked_entries(self) -> int:
+        """Entries without a template version (misses for template-tracked calls)."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses WHERE template_hash IS NULL").fetchone()[0]
+
+    def pending_adoption(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM responses WHERE template_hash = ?", (ADOPT_PENDING,)
+            ).fetchone()[0]
+
+    def mark_for_adoption(self, tags: List[str] = None) -> int:
+        """Let untracked entries (optionally only these tags) take the version of their next tracked lookup."""
+        query = "UPDATE responses SET template_hash = ? WHERE template_hash IS NULL"
+        params: List = [ADOPT_PENDING]
+        if tags:
+            query += f" AND tag IN ({', '.join('?' * len(tags))})"
+            params += list(tags)
+        with self._lock:
+            marked = self._conn.execute(query, params).rowcount
+            self._conn.commit()
+        return marked
+
+    def delete_template_versions(self, versions: List[Tuple[str, Optional[str]]]) -> int:
+        """Delete all entries of the given (template, template hash) pairs."""
+        removed = 0
+        with self._lock:
+            for template, template_hash in versions:
+                removed += self._conn.execute(
+                    "DELETE FROM responses WHERE template = ? AND template_hash IS ?", (template, template_hash)
+                ).rowcount
+            self._conn.commit()
+        return removed
+
+    def _decode(self, blob, compressed: int) -> str:
+        data = bytes(blob or b"")
+        if compressed:
+            data = zlib.decompress(data)
+        return data.decode("utf-8")
+
+    # ---------- eviction ----------
+
+    def evict(self) -> int:
+        """Drop least-recently-used entries until both size and count limits hold."""
+        removed = 0
+        with self._lock:
+            total_bytes, total_entries = self._conn.execute(
+                "SELECT COALESCE(SUM(byte_size), 0), COUNT(*) FROM responses"
+            ).fetchone()
+            if total_bytes <= self.max_bytes and total_entries <= self.max_entries:
+                return 0
+            rows = self._conn.execute(
+                "SELECT cache_key, byte_size FROM responses ORDER BY last_accessed ASC"
+            ).fetchall()
+            victims = []
+            for key, size in rows:
+                if total_bytes <= self.max_bytes and total_entries <= self.max_entries:
+                    break
+                victims.append((key,))
+                total_bytes -= size or 0
+                total_entries -= 1
+            self._conn.executemany("DELETE FROM responses WHERE cache_key = ?", victims)
+            self._conn.commit()
+            removed = len(victims)
+        return removed
+
+    # ---------- snapshots (warm bundles) ----------
+
+    def snapshot(self, dest_path) -> Path:
+        """Consistent copy of the whole store (SQLite online backup) at dest_path."""
+        dest_path = Path(dest_path)
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        dest = sqlite3.connect(str(dest_path))
+        try:
+            with self._lock:
+                self._conn.backup(dest)
+        finally:
+            dest.close()
+        return dest_path
+
+    def merge_from(self, db_path) -> int:
+        """Insert entries of another store that this one lacks (existing keys win), then evict."""
+        with self._lock:
+            self._conn.execute("ATTACH DATABASE ? AS incoming", (str(db_path),))
+            try:
+                ours = [row[1] for row in self._conn.execute("PRAGMA main.table_info(responses)")]
+                theirs = {row[1] for row in self._conn.execute("PRAGMA incoming.table_info(responses)")}
+                columns = ", ".join(c for c in ours if c in theirs and c != 'last_accessed')
+                cur = self._conn.execute(
+                    f"""INSERT OR IGNORE INTO main.responses ({columns}, last_accessed)
+                        SELECT {columns}, ? FROM incoming.responses""",
+                    (datetime.now().isoformat(),),
+                )
+                merged = cur.rowcount
+                self._conn.commit()
+            finally:
+                self._conn.execute("DETACH DATABASE incoming")
+        self.evict()
+        return merged
+
+    # ---------- legacy import ----------
+
+    def import_legacy(self, legacy_dir) -> int:
+        """Import ai_cache/<sha1>.txt and <tag>_<model>_<hash>.json files (idempotent)."""
+        legacy_dir = Path(legacy_dir)
+        if not legacy_dir.exists():
+            return 0
+        imported = 0
+        for path in sorted(legacy_dir.iterdir()):
+            if not path.is_file():
+                continue
+            stem = path.stem
+            model, tag, phash = "legacy", "", None
+            if path.suffix == ".txt" and LEGACY_TXT_RE.match(stem):
+                pass  # stem is already the model+prompt+tag cache key
+            elif path.suffix == ".json":
+                m = LEGACY_JSON_RE.match(stem)
+                if not m:
+                    continue
+                model, tag, phash = m.group('model'), m.group('tag'), m.group('hash')
+            else:
+                continue
+            if self.contains(stem):
+                continue
+            try:
+                content = path.read_text(encoding='utf-8')
+            except Exception:
+                continue
+            created = datetime.fromtimestamp(path.stat().st_mtime).isoformat()
+            self.set(stem, content, model=model, tag=tag, prompt_hash_value=phash)
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE responses SET created_at = ?, last_accessed = ? WHERE cache_key = ?",
+                    (created, created, stem),
+                )
+                self._conn.commit()
+            imported += 1
+        if imported:
+            print(f"📥 Imported {imported} legacy AI cache files from {legacy_dir}")
+        return imported
+
+    # ---------- stats ----------
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self._conn.execute(
+                """SELECT COUNT(*), COALESCE(SUM(byte_size), 0), COALESCE(SUM(hit_count), 0),
+                          COALESCE(SUM(compressed), 0), MIN(created_at), MAX(last_accessed)
+                   FROM responses"""
+            ).fetchone()
+            by_model_tag = self._conn.execute(
+                """SELECT model, tag, COUNT(*), COALESCE(SUM(byte_size), 0), COALESCE(SUM(hit_count), 0),
+                          AVG(latency_ms), COALESCE(SUM(prompt_tokens), 0), COALESCE(SUM(completion_tokens), 0)
+                   FROM responses GROUP BY model, tag ORDER BY COUNT(*) DESC"""
+            ).fetchall()
+        return {
+            'db_path': str(self.db_path),
+            'entries': total[0],
+            'bytes': total[1],
+            'hits': total[2],
+            'compressed_entries': total[3],
+            'oldest_entry': total[4],
+            'last_access': total[5],
+            'limits': {'max_bytes': self.max_bytes, 'max_entries': self.max_entries},
+            'by_model_tag': [
+                {'model': r[0], 'tag': r[1], 'entries': r[2], 'bytes': r[3], 'hits': r[4],
+                 'avg_latency_ms': round(r[5], 1) if r[5] is not None else None,
+                 'prompt_tokens': r[6], 'completion_tokens': r[7]}
+                for r in by_model_tag
+            ],
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def offline_db_path() -> Path:
+    """Separate store for offline-backend (synthetic or replayed) completions."""
+    return Path(os.getenv('SHIF_OFFLINE_CACHE_DB', '') or OFFLINE_DB_PATH)
+
+
+def default_db_path() -> Path:
+    """Store used by this process: the production cache, or a separate one for the offline backend.
+
+    Synthetic and replayed completions are written under the real model keys,
+    so with SHIF_AI_BACKEND=offline they go to SHIF_OFFLINE_CACHE_DB (default
+    ai_cache/offline_responses.sqlite3) and are never served to a live run or
+    exported in a warm bundle. Replay still reads the production store.
+    """
+    from config import get_ai_backend
+    if get_ai_backend() == 'offline':
+        return offline_db_path()
+    return Path(os.getenv('SHIF_AI_CACHE_DB', '') or DEFAULT_DB_PATH)
+
+
+_default_stores: Dict[str, AIResponseStore] = {}
+_default_store_lock = threading.Lock()
+
+
+def get_default_store() -> AIResponseStore:
+    """Process-wide store instance for default_db_path() (one SQLite connection per path)."""
+    path = str(default_db_path())
+    with _default_store_lock:
+        if path not in _default_stores:
+            _default_stores[path] = AIResponseStore(db_path=path)
+        return _default_stores[path]
+
+
+def _print_stats(stats: Dict) -> None:
+    print(f"🗄️  AI response store: {stats['db_path']}")
+    print(f"   • Entries: {stats['entries']} ({stats['compressed_entries']} compressed)")
+    print(f"   • Size: {stats['bytes'] / 1024:,.1f} KiB of {stats['limits']['max_bytes'] / 1024 / 1024:,.0f} MiB")
+    print(f"   • Total hits: {stats['hits']}")
+    print(f"   • Oldest entry: {stats['oldest_entry']}  Last access: {stats['last_access']}")
+    if stats['by_model_tag']:
+        print(f"\n   {'MODEL':<16} {'TAG':<28} {'ENTRIES':>7} {'KIB':>9} {'HITS':>6} {'AVG MS':>8}")
+        for r in stats['by_model_tag']:
+            avg = f"{r['avg_latency_ms']:.0f}" if r['avg_latency_ms'] is not None else "-"
+            print(f"   {(r['model'] or '-'):<16} {(r['tag'] or '-'):<28} {r['entries']:>7} "
+                  f"{r['bytes'] / 1024:>9.1f} {r['hits']:>6} {avg:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and maintain the AI response store")
+    parser.add_argument('--db', default=None, help="SQLite path (default: ai_cache/ai_responses.sqlite3)")
+    sub = parser.add_subparsers(dest='command')
+    stats_p = sub.add_parser('stats', help="Show cache statistics")
+    stats_p.add_argument('--json', action='store_true', help="Print raw JSON")
+    import_p = sub.add_parser('import', help="Import legacy ai_cache files")
+    import_p.add_argument('legacy_dir', nargs='?', default='ai_cache')
+    sub.add_parser('evict', help="Apply size/entry limits now")
+    args = parser.parse_args(argv)
+
+    store = AIResponseStore(db_path=args.db)
+    if args.command == 'import':
+        print(f"✅ Imported {store.import_legacy(args.legacy_dir)} entries")
+    elif args.command == 'evict':
+        print(f"✅ Evicted {store.evict()} entries")
+    else:
+        stats = store.stats()
+        if getattr(args, 'json', False):
+            print(json.dumps(stats, indent=2))
+        else:
+            _print_stats(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+AI Schemas - JSON Schemas for every JSON-returning prompt
+Used by the integrated analyzer to request schema-constrained structured outputs
+(response_format json_schema) and to validate live responses.
+
+Each schema has an object root (the API requires one); prompts whose example is
+a bare array are wrapped under `list_key`, which is also the array the stream
+parser and the result extractors read. Only the fields downstream code depends
+on are required; extra fields are allowed so the rich prompt examples still
+come through.
+
+A live response that fails validation gets one repair call (cheaper model,
+the schema plus the validation errors); cached and legacy text keeps going
+through the existing salvage parsers.
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from ai_json_utils import largest_json_value
+
+MAX_REPAIR_INPUT_CHARS = 24000
+MAX_REPORTED_ERRORS = 12
+
+
+@dataclass
+class AISchema:
+    """One named output schema (object root)"""
+    name: str
+    schema: Dict
+    list_key: Optional[str] = None  # array holding the items, when the prompt returns a list
+
+    def response_format(self) -> Dict:
+        """response_format argument for chat.completions.create."""
+        return {
+            'type': 'json_schema',
+            'json_schema': {'name': self.name, 'schema': self.schema, 'strict': False},
+        }
+
+
+def _obj(required: List[str], **properties) -> Dict:
+    return {'type': 'object', 'properties': properties, 'required': required}
+
+
+def _array(item: Dict) -> Dict:
+    return {'type': 'array', 'items': item}
+
+
+def _str() -> Dict:
+    return {'type': 'string'}
+
+
+def _list_schema(name: str, list_key: str, item: Dict, **extra) -> AISchema:
+    return AISchema(name, _obj([list_key], **{list_key: _array(item)}, **extra), list_key)
+
+
+_SEVERITY = {'type': 'string', 'enum': ['CRITICAL', 'HIGH', 'MEDIUM', 'LOW']}
+
+SCHEMAS: Dict[str, AISchema] = {}
+
+
+def register_schema(schema: AISchema) -> AISchema:
+    SCHEMAS[schema.name] = schema
+    return schema
+
+
+def get_schema(name: Optional[str]) -> Optional[AISchema]:
+    return SCHEMAS.get(name) if name else None
+
+
+register_schema(_list_schema('contradictions', 'contradictions', _obj(
+    ['contradiction_id', 'contradiction_type', 'description'],
+    contradiction_id=_str(), medical_specialty=_str(), contradiction_type=_str(),
+    clinical_severity=_str(), description=_str(),
+)))
+register_schema(_list_schema('gaps', 'gaps', _obj(
+    ['gap_id', 'gap_type', 'description'],
+    gap_id=_str(), gap_category=_str(), gap_type=_str(), clinical_priority=_str(), description=_str(),
+)))
+register_schema(_list_schema('coverage_gaps', 'gaps', _obj(
+    ['gap_id', 'description'],
+    gap_id=_str(), gap_category=_str(), gap_type=_str(), coverage_priority=_str(), description=_str(),
+)))
+register_schema(AISchema('gap_deduplication', _obj(
+    ['duplicates_removed', 'unique_gaps'],
+    duplicates_removed=_array(_obj(
+        ['master_gap_id', 'merged_ids'],
+        master_gap_id=_str(), best_description=_str(), category=_str(),
+        merged_ids=_array(_str()), rationale=_str(),
+    )),
+    unique_gaps=_array(_obj(['gap_id'], gap_id=_str(), description=_str(), category=_str())),
+    summary={'type': 'object'},
+)))
+register_schema(AISchema('annex_quality', _obj(
+    ['executive_assessment'],
+    executive_assessment={'type': 'object'},
+)))
+register_schema(AISchema('rules_map', _obj(
+    ['contradictions'],
+    contradictions=_array(_obj(['description'], fund=_str(), service=_str(), type=_str(),
+                               description=_str(), examples=_array(_str()), severity=_SEVERITY)),
+    normalizations=_array(_obj(['proposal'], field=_str(), proposal=_str())),
+)))
+register_schema(_list_schema('batch_service_analysis', 'items', _obj(
+    ['row_id', 'service_name', 'clinical_risk', 'coverage_adequacy'],
+    row_id=_str(), service_name=_str(), specialty=_str(),
+    recommended_facility_level=_array({'type': 'integer'}),
+    clinical_risk={'type': 'string', 'enum': ['LOW', 'MEDIUM', 'HIGH']},
+    coverage_adequacy={'type': 'string', 'enum': ['ADEQUATE', 'INSUFFICIENT', 'MISSING']},
+    notes=_str(),
+)))
+register_schema(_list_schema('section_summaries', 'items', _obj(
+    ['fund', 'service'],
+    fund=_str(), service=_str(), key_points=_array(_str()), risks=_array(_str()), notes=_str(),
+)))
+register_schema(AISchema('canonicalization', _obj(
+    ['canonical_groups'],
+    canonical_groups=_array(_obj(['canonical', 'members'], canonical=_str(),
+                                 members=_array(_str()), notes=_str())),
+)))
+register_schema(AISchema('facility_validation', _obj(
+    ['validation_summary'],
+    validation_summary={'type': 'object'},
+)))
+register_schema(AISchema('policy_annex_alignment', _obj(
+    ['alignment_issues'],
+    alignment_issues=_array(_obj(['type'], type=_str(), example=_str(), recommendation=_str())),
+)))
+register_schema(AISchema('equity', _obj(
+    ['executive_equity_assessment'],
+    executive_equity_assessment={'type': 'object'},
+    geographic_equity_analysis={'type': 'object'},
+    socioeconomic_equity_analysis={'type': 'object'},
+)))
+
+
+# ---------- Validation ----------
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'boolean': bool,
+    'null': type(None),
+}
+
+
+def _type_ok(value, expected: str) -> bool:
+    if expected == 'integer':
+        return isinstance(value, int) and not isinstance(value, bool)
+    if expected == 'number':
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, _TYPES.get(expected, object))
+
+
+def validate(value, schema: Dict, path: str = "$") -> List[str]:
+    """Errors for value against the schema subset used here (type, required, properties, items, enum)."""
+    errors: List[str] = []
+    expected = schema.get('type')
+    if expected and not any(_type_ok(value, t) for t in ([expected] if isinstance(expected, str) else expected)):
+        return [f"{path}: expected {expected}, got {type(value).__name__}"]
+    if 'enum' in schema and value not in schema['enum']:
+        errors.append(f"{path}: {value!r} not in {schema['enum']}")
+    if isinstance(value, dict):
+        for field in schema.get('required', []):
+            if field not in value:
+                errors.append(f"{path}: missing required '{field}'")
+        for field, sub in schema.get('properties', {}).items():
+            if field in value:
+                errors.extend(validate(value[field], sub, f"{path}.{field}"))
+    elif isinstance(value, list) and 'items' in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema['items'], f"{path}[{i}]"))
+    return errors
+
+
+def parse_response(text: str, ai_schema: AISchema):
+    """Parsed JSON for a response (exact JSON first, then the largest embedded value).
+
+    A bare array is accepted for list schemas and wrapped under list_key, so text
+    from the array-shaped prompt examples validates the same as the object form.
+    """
+    try:
+        value = json.loads(text)
+    except Exception:
+        value = largest_json_value(text or "")
+    if isinstance(value, list) and ai_schema.list_key:
+        value = {ai_schema.list_key: value}
+    return value
+
+
+def validate_response(text: str, ai_schema: AISchema) -> Tuple[Optional[object], List[str]]:
+    """(parsed value, errors) for a response against its schema."""
+    value = parse_response(text, ai_schema)
+    if value is None:
+        return None, ["$: no JSON value found"]
+    return value, validate(value, ai_schema.schema)
+
+
+def structured_items(text: str, ai_schema: AISchema) -> Optional[List[Dict]]:
+    """The list_key items when text is a schema-valid response, else None (use the salvage parser)."""
+    if not text or ai_schema.list_key is None:
+        return None
+    value, errors = validate_response(text, ai_schema)
+    if errors:
+        return None
+    return value[ai_schema.list_key]
+
+
+def build_repair_prompt(ai_schema: AISchema, text: str, errors: List[str]) -> str:
+    """Prompt asking a model to rewrite an invalid response so it matches the schema."""
+    shown = errors[:MAX_REPORTED_ERRORS]
+    more = len(errors) - len(shown)
+    error_lines = "\n".join(f"- {e}" for e in shown) + (f"\n- ... and {more} more" if more > 0 else "")
+    return f"""The JSON below was meant to follow the "{ai_schema.name}" schema but failed validation.
+Return the corrected JSON only: keep every finding and field that is already present, fix the structure and fill missing required fields from the content. Do not add new findings.
+
+SCHEMA:
+{json.dumps(ai_schema.schema, indent=1)}
+
+VALIDATION ERRORS:
+{error_lines}
+
+INVALID OUTPUT:
+{(text or "")[:MAX_REPAIR_INPUT_CHARS]}
+"""
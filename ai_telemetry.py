@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+AI Telemetry - Per-call records, per-run rollups and run comparison
+Used by the integrated analyzer, the pattern analyzer and the Streamlit app.
+
+Every AI invocation appends one line to the run's analysis_metrics.jsonl in the
+same envelope as log_analysis_metrics (stage "AI Call"), with details:
+tag, model, fallback flag, hedged flag, cache hit, wall latency, prompt,
+completion and provider-cached prompt tokens (prompt_tokens_details.cached_tokens,
+the share of the prompt served from the provider's prefix cache), time spent
+waiting on the shared rate limiter (rate_limit_wait_ms), status and error.
+
+CLI:
+    python ai_telemetry.py rollup outputs_run_20250101_120000
+    python ai_telemetry.py compare outputs_run_A outputs_run_B
+"""
+
+import argparse
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+AI_CALL_STAGE = "AI Call"
+METRICS_FILENAME = "analysis_metrics.jsonl"
+ROLLUP_FILENAME = "ai_call_rollup.json"
+# USD per 1M tokens (input, provider-cached input, output); SHIF_MODEL_PRICES (JSON) overrides
+MODEL_PRICES_PER_1M = {
+    'gpt-5-mini': {'input': 0.25, 'cached_input': 0.025, 'output': 2.00},
+    'gpt-4.1-mini': {'input': 0.40, 'cached_input': 0.10, 'output': 1.60},
+    'llama-3.1-8b-instant': {'input': 0.05, 'cached_input': 0.05, 'output': 0.08},
+    'llama-3.3-70b-versatile': {'input': 0.59, 'cached_input': 0.59, 'output': 0.79},
+}
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    data = sorted(values)
+    idx = min(len(data) - 1, max(0, int(round(pct / 100.0 * (len(data) - 1)))))
+    return data[idx]
+
+
+def usage_tokens(usage) -> Dict:
+    """prompt/completion/cached token counts from an API usage object (None-safe)."""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_tokens', None),
+        'completion_tokens': getattr(usage, 'completion_tokens', None),
+        'cached_tokens': getattr(details, 'cached_tokens', None),
+    }
+
+
+def model_prices() -> Dict[str, Dict[str, float]]:
+    prices = dict(MODEL_PRICES_PER_1M)
+    try:
+        prices.update(json.loads(os.getenv('SHIF_MODEL_PRICES', '') or '{}'))
+    except Exception:
+        pass
+    return prices
+
+
+def estimate_cost_usd(records: List[Dict]) -> float:
+    """Estimated spend for AI call details (cache hits and unknown models cost nothing)."""
+    prices = model_prices()
+    total = 0.0
+    for d in records:
+        price = prices.get(d.get('model') or "")
+        if not price or d.get('cache_hit'):
+            continue
+        cached = d.get('cached_tokens') or 0
+        prompt = max(0, (d.get('prompt_tokens') or 0) - cached)
+        total += (prompt * price.get('input', 0) + cached * price.get('cached_input', price.get('input', 0))
+                  + (d.get('completion_tokens') or 0) * price.get('output', 0)) / 1_000_000
+    return total
+
+
+class AITelemetry:
+    """Appends per-call AI records to a metrics JSONL and keeps them for the rollup"""
+
+    def __init__(self, metrics_path, run_id: str = None, source: str = "integrated"):
+        self.metrics_path = Path(metrics_path)
+        self.run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.source = source
+        self.records: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def record(self, tag: str, model: str, latency_ms: float, cache_hit: bool, fallback_used: bool = False,
+               prompt_tokens: int = None, completion_tokens: int = None, hedged: bool = False,
+               status: str = "SUCCESS", error: str = None, cached_tokens: int = None, **extra) -> Dict:
+        details = {
+            'run_id': self.run_id,
+            'source': self.source,
+            'tag': tag or "untagged",
+            'model': model,
+            'fallback_used': bool(fallback_used),
+            'hedged': bool(hedged),
+            'cache_hit': bool(cache_hit),
+            'latency_ms': round(float(latency_ms or 0), 1),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cached_tokens': cached_tokens,
+        }
+        if error:
+            details['error'] = str(error)[:300]
+        details.update(extra)
+        entry = {
+            'timestamp': datetime.now().isoformat(),
+            'stage': AI_CALL_STAGE,
+            'input_size': prompt_tokens or 0,
+            'output_size': completion_tokens or 0,
+            'status': status,
+            'details': details,
+        }
+        with self._lock:
+            self.records.append(entry)
+            try:
+                self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.metrics_path, 'a') as f:
+                    f.write(json.dumps(entry, default=str) + '\n')
+            except Exception as e:
+                print(f"   ⚠️ Failed to log AI call telemetry: {e}")
+        return entry
+
+    def rollup(self) -> List[Dict]:
+        with self._lock:
+            return rollup_records(list(self.records))
+
+    def write_rollup(self, path=None) -> Optional[Path]:
+        """Write the per-run rollup next to the metrics file and print it."""
+        rows = self.rollup()
+        if not rows:
+            return None
+        path = Path(path) if path else self.metrics_path.parent / ROLLUP_FILENAME
+        with open(path, 'w') as f:
+            json.dump({'run_id': self.run_id, 'source': self.source, 'rollup': rows}, f, indent=2)
+        print_rollup(rows, title=f"AI calls ({self.source}, run {self.run_id})")
+        return path
+
+
+def load_call_records(path) -> List[Dict]:
+    """AI call records from a metrics JSONL file or a run directory."""
+    path = Path(path)
+    if path.is_dir():
+        path = path / METRICS_FILENAME
+    records = []
+    if not path.exists():
+        return records
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except Exception:
+                continue
+            if entry.get('stage') == AI_CALL_STAGE:
+                records.append(entry)
+    return records
+
+
+def rollup_records(records: List[Dict]) -> List[Dict]:
+    """Per-tag summary plus a TOTAL row."""
+    groups: Dict[str, List[Dict]] = {}
+    for r in records:
+        d = r.get('details', {})
+        groups.setdefault(d.get('tag', 'untagged'), []).append(d)
+    rows = [_summarize(tag, items) for tag, items in sorted(groups.items())]
+    if rows:
+        rows.append(_summarize('TOTAL', [r.get('details', {}) for r in records]))
+    return rows
+
+
+def _summarize(tag: str, items: List[Dict]) -> Dict:
+    latencies = [i.get('latency_ms') or 0 for i in items]
+    live = [i for i in items if not i.get('cache_hit')]
+    hits = len(items) - len(live)
+    prompt_tokens = sum(i.get('prompt_tokens') or 0 for i in items)
+    cached_tokens = sum(i.get('cached_tokens') or 0 for i in items)
+    models: Dict[str, int] = {}
+    for i in items:
+        if i.get('model'):
+            models[i['model']] = models.get(i['model'], 0) + 1
+    return {
+        'tag': tag,
+        'calls': len(items),
+        'cache_hits': hits,
+        'hit_rate': round(hits / len(items), 3) if items else 0.0,
+        'errors': sum(1 for i in items if i.get('error')),
+        'fallbacks': sum(1 for i in items if i.get('fallback_used')),
+        'hedged': sum(1 for i in items if i.get('hedged')),
+        'p50_ms': _percentile(latencies, 50),
+        'p95_ms': _percentile(latencies, 95),
+        'total_ms': round(sum(latencies), 1),
+        'live_p50_ms': _percentile([i.get('latency_ms') or 0 for i in live], 50),
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': sum(i.get('completion_tokens') or 0 for i in items),
+        'cached_tokens': cached_tokens,
+        'cached_share': round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+        'rate_limit_wait_ms': round(sum(i.get('rate_limit_wait_ms') or 0 for i in items), 1),
+        'models': models,
+    }
+
+
+def _fmt_ms(value) -> str:
+    return f"{value:,.0f}" if value is not None else "-"
+
+
+def print_rollup(rows: List[Dict], title: str = "AI calls") -> None:
+    print(f"\n📈 {title}")
+    print(f"   {'TAG':<30} {'CALLS':>5} {'HIT%':>5} {'ERR':>4} {'FB':>3} {'P50 MS':>8} {'P95 MS':>8} "
+          f"{'TOK IN':>9} {'CACHED':>7} {'TOK OUT':>8} {'RL WAIT':>8}")
+    for r in rows:
+        print(f"   {r['tag'][:30]:<30} {r['calls']:>5} {r['hit_rate'] * 100:>4.0f}% {r['errors']:>4} {r['fallbacks']:>3} "
+              f"{_fmt_ms(r['p50_ms']):>8} {_fmt_ms(r['p95_ms']):>8} {r['prompt_tokens']:>9,} "
+              f"{r.get('cached_share', 0) * 100:>6.0f}% {r['completion_tokens']:>8,} "
+              f"{_fmt_ms(r.get('rate_limit_wait_ms')):>8}")
+
+
+def compare_runs(records_a: List[Dict], records_b: List[Dict]) -> List[Dict]:
+    """Per-tag deltas between two runs (B minus A)."""
+    a = {r['tag']: r for r in rollup_records(records_a)}
+    b = {r['tag']: r for r in rollup_records(records_b)}
+    rows = []
+    for tag in sorted(set(a) | set(b), key=lambda t: (t == 'TOTAL', t)):
+        ra, rb = a.get(tag, {}), b.get(tag, {})
+        row = {'tag': tag}
+        for field in ('calls', 'cache_hits', 'errors', 'fallbacks', 'total_ms', 'p50_ms', 'p95_ms',
+                      'prompt_tokens', 'completion_tokens', 'cached_tokens', 'rate_limit_wait_ms'):
+            va, vb = ra.get(field), rb.get(field)
+            row[f'{field}_a'] = va
+            row[f'{field}_b'] = vb
+            row[f'{field}_delta'] = (vb or 0) - (va or 0) if (va is not None or vb is not None) else None
+        rows.append(row)
+    return rows
+
+
+def print_comparison(rows: List[Dict], label_a: str, label_b: str) -> None:
+    print(f"\n🔬 AI call comparison: A={label_a}  B={label_b}")
+    print(f"   {'TAG':<30} {'CALLS A→B':>11} {'HITS A→B':>10} {'P50 MS A→B':>19} {'TOTAL MS Δ':>12} {'TOKENS Δ':>10}")
+    for r in rows:
+        tokens_delta = (r['prompt_tokens_delta'] or 0) + (r['completion_tokens_delta'] or 0)
+        print(f"   {r['tag'][:30]:<30} {str(r['calls_a'] or 0) + '→' + str(r['calls_b'] or 0):>11} "
+              f"{str(r['cache_hits_a'] or 0) + '→' + str(r['cache_hits_b'] or 0):>10} "
+              f"{_fmt_ms(r['p50_ms_a']) + '→' + _fmt_ms(r['p50_ms_b']):>19} "
+              f"{r['total_ms_delta'] or 0:>+12,.0f} {tokens_delta:>+10,}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize and compare per-call AI telemetry")
+    sub = parser.add_subparsers(dest='command', required=True)
+    rollup_p = sub.add_parser('rollup', help="Per-tag rollup for one run")
+    rollup_p.add_argument('run', help="Run directory or analysis_metrics.jsonl")
+    rollup_p.add_argument('--json', action='store_true', help="Print raw JSON")
+    compare_p = sub.add_parser('compare', help="Compare two runs (B minus A)")
+    compare_p.add_argument('run_a')
+    compare_p.add_argument('run_b')
+    compare_p.add_argument('--json', action='store_true', help="Print raw JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == 'rollup':
+        rows = rollup_records(load_call_records(args.run))
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        elif rows:
+            print_rollup(rows, title=f"AI calls in {args.run}")
+        else:
+            print(f"⚠️ No AI call records found in {args.run}")
+    else:
+        rows = compare_runs(load_call_records(args.run_a), load_call_records(args.run_b))
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        else:
+            print_comparison(rows, args.run_a, args.run_b)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ Configuration module for API keys and environment variables.
 Load API keys from environment variables for security.
 """
 
+import json
 import os
 from typing import Optional
 
@@ -24,6 +25,106 @@ def get_groq_api_key() -> Optional[str]:
     """
     return os.getenv('GROQ_API_KEY')
 
+def get_ai_backend() -> str:
+    """
+    Get the chat-completions backend: 'openai' (default) or 'offline'.
+    Set SHIF_AI_BACKEND=offline to run every entry point without network calls.
+    """
+    return os.getenv('SHIF_AI_BACKEND', 'openai').strip().lower()
+
+def get_offline_backend_settings() -> dict:
+    """
+    Settings for the offline backend (offline_llm_backend.OfflineChatClient).
+    SHIF_OFFLINE_MODE: auto | replay | synthetic
+    SHIF_OFFLINE_LATENCY_MS / SHIF_OFFLINE_JITTER_MS: simulated response time
+    SHIF_OFFLINE_ERROR_RATE: fraction of calls that raise a simulated API error
+    SHIF_OFFLINE_REPLAY_DB: response store to replay from (default: the AI cache)
+    SHIF_OFFLINE_CACHE_DB: store offline responses are cached in (default ai_cache/offline_responses.sqlite3)
+    """
+    return {
+        'mode': os.getenv('SHIF_OFFLINE_MODE', 'auto'),
+        'latency_ms': float(os.getenv('SHIF_OFFLINE_LATENCY_MS', '0')),
+        'jitter_ms': float(os.getenv('SHIF_OFFLINE_JITTER_MS', '0')),
+        'error_rate': float(os.getenv('SHIF_OFFLINE_ERROR_RATE', '0')),
+        'seed': int(os.getenv('SHIF_OFFLINE_SEED', '42')),
+        'replay_db': os.getenv('SHIF_OFFLINE_REPLAY_DB', ''),
+    }
+
+def get_rate_limit_settings() -> dict:
+    """
+    Settings for the shared AI rate limiter (ai_rate_limiter.RateLimiter).
+    SHIF_RATE_LIMIT: enable the cross-process request/token buckets (default true)
+    SHIF_RATE_LIMITS: JSON {model: {"rpm": ..., "tpm": ...}} overriding the built-in limits
+    SHIF_RATE_DEFAULT_RPM / SHIF_RATE_DEFAULT_TPM: limits for models not listed
+    SHIF_RATE_COMPLETION_TOKENS: completion tokens reserved per request before usage is known
+    SHIF_RATE_STATE: bucket state file shared by all processes (default ai_cache/rate_limits.json)
+    """
+    try:
+        limits = json.loads(os.getenv('SHIF_RATE_LIMITS', '') or '{}')
+    except ValueError:
+        limits = {}
+    return {
+        'enabled': os.getenv('SHIF_RATE_LIMIT', 'true').lower() in ('1', 'true', 'yes'),
+        'limits': limits,
+        'default_rpm': float(os.getenv('SHIF_RATE_DEFAULT_RPM', '60')),
+        'default_tpm': float(os.getenv('SHIF_RATE_DEFAULT_TPM', '100000')),
+        'completion_tokens': int(os.getenv('SHIF_RATE_COMPLETION_TOKENS', '1000')),
+        'state_path': os.getenv('SHIF_RATE_STATE', ''),
+    }
+
+def get_provider_settings() -> dict:
+    """
+    Settings for multi-provider routing (ai_provider_router.ProviderRouter).
+    SHIF_PROVIDER_ROUTING: enable routing prompt classes off OpenAI (default true)
+    GROQ_API_KEY / SHIF_GROQ_MODEL / SHIF_GROQ_BASE_URL: the Groq provider (enabled when keyed)
+    SHIF_PROVIDERS: JSON list of extra OpenAI-compatible providers
+        [{"name", "model", "base_url", "api_key_env", "prior_seconds", "structured_outputs"}]
+    SHIF_PROVIDER_ROUTES: JSON {tag or prompt class: provider} pinning a route
+    SHIF_PROVIDER_CLASSES: JSON {tag: prompt class} added to the built-in class map
+        (opt-in for tags beyond batch_service_analysis, gap_deduplication and canonicalization)
+    SHIF_ROUTABLE_CLASSES: prompt classes allowed off OpenAI (default classification,dedup)
+    SHIF_ROUTE_SECONDS_PER_USD: seconds of latency one US dollar of estimated cost is worth
+    SHIF_OPENAI_PRIOR_SECONDS / SHIF_GROQ_PRIOR_SECONDS: latency assumed before samples exist
+    SHIF_PROVIDER_PROBE_SECONDS: retry a provider ranked behind OpenAI once it has been idle this long (0 disables)
+    """
+    def _json(name, default):
+        try:
+            return json.loads(os.getenv(name, '') or 'null') or default
+        except ValueError:
+            return default
+
+    return {
+        'enabled': os.getenv('SHIF_PROVIDER_ROUTING', 'true').lower() in ('1', 'true', 'yes'),
+        # The offline backend never sends prompts over the network
+        'groq_api_key': get_groq_api_key() if get_ai_backend() != 'offline' else None,
+        'groq_model': os.getenv('SHIF_GROQ_MODEL', 'llama-3.1-8b-instant'),
+        'groq_base_url': os.getenv('SHIF_GROQ_BASE_URL', 'https://api.groq.com/openai/v1'),
+        'extra_providers': _json('SHIF_PROVIDERS', []),
+        'routes': _json('SHIF_PROVIDER_ROUTES', {}),
+        'prompt_classes': _json('SHIF_PROVIDER_CLASSES', {}),
+        'routable_classes': [c.strip() for c in os.getenv('SHIF_ROUTABLE_CLASSES', 'classification,dedup').split(',')
+                             if c.strip()],
+        'seconds_per_usd': float(os.getenv('SHIF_ROUTE_SECONDS_PER_USD', '1000')),
+        'openai_prior_seconds': float(os.getenv('SHIF_OPENAI_PRIOR_SECONDS', '8')),
+        'groq_prior_seconds': float(os.getenv('SHIF_GROQ_PRIOR_SECONDS', '2')),
+        'probe_seconds': float(os.getenv('SHIF_PROVIDER_PROBE_SECONDS', '600')),
+    }
+
+def get_warm_bundle_settings() -> dict:
+    """
+    Settings for warm-cache bundles imported at app boot (warm_bundle.import_on_boot).
+    SHIF_WARM_BUNDLE: bundle file, directory of bundles or http(s) URL (default warm_bundles)
+    SHIF_WARM_BUNDLE_IMPORT: import the matching bundle when the app starts (default true)
+    SHIF_WARM_BUNDLE_SHA256: expected SHA-256 of the bundle file (recommended for URLs)
+    SHIF_WARM_BUNDLE_ALLOW_STALE: restore run results built by other code versions (default false)
+    """
+    return {
+        'enabled': os.getenv('SHIF_WARM_BUNDLE_IMPORT', 'true').lower() in ('1', 'true', 'yes'),
+        'location': os.getenv('SHIF_WARM_BUNDLE', 'warm_bundles'),
+        'sha256': os.getenv('SHIF_WARM_BUNDLE_SHA256', '').strip().lower(),
+        'allow_stale': os.getenv('SHIF_WARM_BUNDLE_ALLOW_STALE', 'false').lower() in ('1', 'true', 'yes'),
+    }
+
 # Example usage:
 # from config import get_openai_api_key
 # api_key = get_openai_api_key()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Extraction Cache - PDF extraction results keyed by PDF hash and extractor version
+Used by the integrated analyzer to skip the tabula/pdfplumber phases (document
+vocabulary, pages 1-18 policy structure, pages 19-54 annex procedures) when
+the same PDF was already extracted by the same extraction code.
+
+An entry is one gzip JSON file per (PDF SHA-256, extraction version), where the
+version is the source hash of the extraction methods (and the repo helpers
+they reference, see prompt_templates.source_hash). Editing the extractors
+therefore starts a new entry instead of serving stale frames. Frames are
+stored as pandas table-orient JSON so dtypes survive the round trip; the cache
+holds data only, so entries shipped in a warm bundle (warm_bundle) can be
+imported without executing anything.
+
+CLI:
+    python extraction_cache.py status [pdf]     # entries, and whether pdf has a current one
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+CACHE_FORMAT = 1
+DEFAULT_CACHE_DIR = Path("ai_cache") / "extractions"
+DEFAULT_PDF = "TARIFFS TO THE BENEFIT PACKAGE TO THE SHI.pdf"
+ANALYZER_CLASS = "integrated_comprehensive_analyzer:IntegratedComprehensiveMedicalAnalyzer"
+# Analyzer methods whose output is cached; their source is the extraction version
+EXTRACTION_METHODS = (
+    '_build_document_vocabulary',
+    '_extract_policy_structure',
+    '_extract_rules_manual_exact',
+    '_build_policy_structures',
+    '_split_bullets',
+    '_extract_tariff_pairs',
+    '_extract_primary_tariff',
+    '_extract_annex_procedures',
+)
+# Frames cached per result dict
+POLICY_FRAMES = ('raw', 'structured', 'wide', 'exploded')
+ANNEX_FRAMES = ('procedures',)
+
+_pdf_hashes: Dict[tuple, str] = {}
+_pdf_hash_lock = threading.Lock()
+
+
+def pdf_sha256(pdf_path) -> str:
+    """SHA-256 of a PDF's bytes (memoised per path, size and mtime)."""
+    path = Path(pdf_path)
+    stat = path.stat()
+    memo = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    with _pdf_hash_lock:
+        if memo in _pdf_hashes:
+            return _pdf_hashes[memo]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    with _pdf_hash_lock:
+        _pdf_hashes[memo] = digest.hexdigest()
+    return _pdf_hashes[memo]
+
+
+_version: Optional[str] = None
+_version_lock = threading.Lock()
+
+
+def extraction_version() -> str:
+    """Source hash of the analyzer's extraction methods (computed once per process)."""
+    global _version
+    with _version_lock:
+        if _version is None:
+            from prompt_templates import resolve, source_hash
+            digest = hashlib.sha1(f"format={CACHE_FORMAT}".encode("utf-8"))
+            for method in EXTRACTION_METHODS:
+                digest.update(f"\n{method}:{source_hash(resolve(f'{ANALYZER_CLASS}.{method}'))}".encode("utf-8"))
+            _version = digest.hexdigest()
+        return _version
+
+
+def frame_to_json(df: Optional[pd.DataFrame]) -> Optional[str]:
+    if df is None:
+        return None
+    return df.to_json(orient='table', date_format='iso', default_handler=str)
+
+
+def frame_from_json(text: Optional[str]) -> pd.DataFrame:
+    if not text:
+        return pd.DataFrame()
+    return pd.read_json(io.StringIO(text), orient='table')
+
+
+class ExtractionCache:
+    """Directory of extraction results, one file per (PDF hash, extraction version)"""
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = Path(cache_dir or os.getenv('SHIF_EXTRACTION_CACHE_DIR', '') or DEFAULT_CACHE_DIR)
+
+    def path_for(self, pdf_hash: str, version: str = None) -> Path:
+        return self.cache_dir / f"{pdf_hash[:16]}-{(version or extraction_version())[:12]}.json.gz"
+
+    def load(self, pdf_path) -> Optional[Dict]:
+        """{'doc_vocab', 'policy_results', 'annex_results'} for pdf_path, or None when not cached."""
+        path = self.path_for(pdf_sha256(pdf_path))
+        if not path.exists():
+            return None
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('format') != CACHE_FORMAT or data.get('extraction_version') != extraction_version():
+                return None
+            return {
+                'doc_vocab': set(data.get('doc_vocab') or []),
+                'policy_results': {k: frame_from_json(data['policy'].get(k)) for k in POLICY_FRAMES},
+                'annex_results': {k: frame_from_json(data['annex'].get(k)) for k in ANNEX_FRAMES},
+            }
+        except Exception as e:
+            print(f"   ⚠️ Ignoring unreadable extraction cache {path.name}: {e}")
+            return None
+
+    def save(self, pdf_path, doc_vocab, policy_results: Dict, annex_results: Dict) -> Optional[Path]:
+        """Store one extraction; skipped when either phase produced no rows."""
+        policy_raw = policy_results.get('raw')
+        annex = annex_results.get('procedures')
+        if policy_raw is None or policy_raw.empty or annex is None or annex.empty:
+            return None
+        pdf_hash = pdf_sha256(pdf_path)
+        data = {
+            'format': CACHE_FORMAT,
+            'pdf_sha256': pdf_hash,
+            'pdf_name': Path(pdf_path).name,
+            'extraction_version': extraction_version(),
+            'created_at': datetime.now().isoformat(),
+            'doc_vocab': sorted(doc_vocab or []),
+            'policy': {k: frame_to_json(policy_results.get(k)) for k in POLICY_FRAMES},
+            'annex': {k: frame_to_json(annex_results.get(k)) for k in ANNEX_FRAMES},
+        }
+        path = self.path_for(pdf_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+        return path
+
+    def entries(self, pdf_hash: str = None) -> List[Path]:
+        """Cached files, optionally only those of one PDF."""
+        if not self.cache_dir.exists():
+            return []
+        prefix = f"{pdf_hash[:16]}-" if pdf_hash else ""
+        return sorted(p for p in self.cache_dir.glob(f"{prefix}*.json.gz") if p.is_file())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="PDF extraction cache")
+    parser.add_argument('--dir', default=None, help=f"Cache directory (default: {DEFAULT_CACHE_DIR})")
+    sub = parser.add_subparsers(dest='command')
+    status_p = sub.add_parser('status', help="List cached extractions")
+    status_p.add_argument('pdf', nargs='?', default=DEFAULT_PDF)
+    args = parser.parse_args(argv)
+
+    cache = ExtractionCache(args.dir)
+    for path in cache.entries():
+        print(f"   {path.name}  {path.stat().st_size / 1024:.1f} KiB")
+    pdf = getattr(args, 'pdf', DEFAULT_PDF)
+    if Path(pdf).exists():
+        current = cache.path_for(pdf_sha256(pdf))
+        print(f"{'✅' if current.exists() else '⚠️'} {Path(pdf).name}: "
+              f"{'cached' if current.exists() else 'no entry for the current extraction code'} ({current.name})")
+        return 0 if current.exists() else 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Facility Level Validator - Rule-based check of policy access points against Kenya's 6 tiers
+Used by the integrated analyzer before get_facility_level_validation_prompt, so
+every policy row is validated locally and only the unclear ones reach the LLM.
+
+Each row's access_point (and, as a cross-check, its access_rules) is parsed for
+facility levels: explicit "Level 4 - 6" / "Level 2, 3 and 4" ranges first, then
+facility types (dispensary, health centre, county referral hospital, ...). The
+text is matched with whitespace removed because the PDF extraction splits words
+("surg ical", "C-sec tion"). The assigned levels are then checked against the
+tier table and the service capability rules (the minimum tier that can deliver
+a service safely, or the highest entry tier a primary service should need).
+
+Row status:
+  valid        levels parsed and no rule violated
+  conflict     a capability rule is violated, or access_rules name levels
+               outside the access point
+  ambiguous    no level could be read from a non-empty access point, a level
+               outside 1-6 was named, or a violation is qualified ("with
+               capacity", "where available")
+  unspecified  no access point or rules text (continuation rows)
+
+Only conflict and ambiguous rows are escalated.
+"""
+
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+ALL_LEVELS = frozenset(range(1, 7))
+
+# Kenya's 6-tier health system (as described to the LLM in get_facility_level_validation_prompt)
+KENYA_FACILITY_TIERS = {
+    1: "Community units (CHVs, health promotion, household visits)",
+    2: "Dispensaries (basic curative care, immunization, family planning)",
+    3: "Health centres (laboratory, pharmacy, maternity, minor procedures)",
+    4: "Sub-county hospitals (general surgery, internal medicine, blood transfusion, X-ray/ultrasound)",
+    5: "County referral hospitals (specialists, ICU, CT, blood bank, advanced imaging)",
+    6: "National referral hospitals (subspecialties, complex procedures, transplants)",
+}
+
+
+@dataclass(frozen=True)
+class CapabilityRule:
+    """Services matching pattern need at least min_level; entry services should be reachable by max_entry_level"""
+    name: str
+    pattern: str
+    min_level: int = 1
+    max_entry_level: int = 6
+    reason: str = ""
+
+
+CAPABILITY_RULES = (
+    CapabilityRule('transplant', r'transplant', 6, reason="Organ transplantation is a national referral service"),
+    CapabilityRule('cardiac_intervention', r'cardiothoracic|cardiaccath|catheteri[sz]ation|openheart', 6,
+                   reason="Needs a cath lab and cardiothoracic backup, only available at Level 6"),
+    CapabilityRule('neurosurgery', r'neurosurg', 5, reason="Needs neurosurgeons and neuro ICU"),
+    CapabilityRule('oncology_treatment', r'chemotherap|radiotherap|brachytherap|1stlinetreat|2ndlinetreat', 5,
+                   reason="Cancer treatment needs oncology specialists"),
+    CapabilityRule('advanced_imaging', r'\bmri\b|mri(?:at|scan)|ctscan|fluoroscopy|mammogra', 5,
+                   reason="CT/MRI and advanced imaging sit at Level 5 and above"),
+    CapabilityRule('critical_care', r'\bicu\b|icuupto|\bhdu\b|hduupto|intensivecare|highdependency', 4,
+                   reason="ICU/HDU needs 24/7 critical care staff and equipment"),
+    CapabilityRule('dialysis', r'dialysis|hemodiafiltration|haemodiafiltration', 4,
+                   reason="Dialysis needs renal units and nephrology oversight"),
+    CapabilityRule('caesarean', r'c-?section|caesarean|cesarean', 4,
+                   reason="Caesarean section needs a theatre, anaesthesia and blood transfusion"),
+    CapabilityRule('major_surgery', r'majorsurg|specializedsurg|specialisedsurg|generalsurg', 4,
+                   reason="Major surgery needs theatre and medical officers"),
+    CapabilityRule('blood_transfusion', r'bloodtransfusion|bloodbank', 4,
+                   reason="Transfusion needs compatibility testing and storage"),
+    CapabilityRule('minor_surgery', r'minorsurg', 3, reason="Minor procedures start at health centres"),
+    CapabilityRule('primary_care', r'immuni[sz]ation|kepi|familyplanning|healthpromotion|growthmonitoring', 1, 3,
+                   reason="Primary services should be available at Levels 2-3"),
+)
+
+# Facility types named without a level number (used only when no explicit level is given)
+FACILITY_TYPE_LEVELS = (
+    (r'communityunit|communityhealth', {1}),
+    (r'dispensar', {2}),
+    (r'healthcent(?:re|er)', {3}),
+    (r'primaryhealthcare|primarycare|\bphc\b', {2, 3}),
+    (r'sub-?countyhospital', {4}),
+    (r'countyreferral|countyhospital', {5}),
+    (r'nationalreferral|teachinghospital', {6}),
+    (r'alllevels|anylevel', set(ALL_LEVELS)),
+    (r'allfacilities|allpublicfacilit', set(ALL_LEVELS) - {1}),  # community units are not facilities
+)
+
+_QUALIFIER_RE = re.compile(r'withcapacity|wherever?available|withrequired|designatedby|selectiveprocurement|contracted')
+_LEVEL_RE = re.compile(r'levels?(\d+)((?:(?:-|–|to|,|&|and|/|or)(?:levels?)?\d+)*)')
+_LEVEL_TAIL_RE = re.compile(r'(-|–|to|,|&|and|/|or)(?:levels?)?(\d+)')
+_SPACE_RE = re.compile(r'\s+')
+_RULES = tuple((rule, re.compile(rule.pattern)) for rule in CAPABILITY_RULES)
+_TYPES = tuple((re.compile(p), frozenset(levels)) for p, levels in FACILITY_TYPE_LEVELS)
+
+
+def compact(text) -> str:
+    """Lower-cased text with all whitespace removed (joins split words from the PDF)."""
+    return _SPACE_RE.sub("", str(text or "")).lower()
+
+
+def parse_levels(text) -> Tuple[Set[int], Set[int], str]:
+    """(levels in 1-6, out-of-range level numbers, source) named in text.
+
+    Source is 'explicit' for "Level x" mentions, 'facility_type' for names such
+    as "health centre", and '' when nothing was found.
+    """
+    s = compact(text)
+    levels: Set[int] = set()
+    invalid: Set[int] = set()
+    for match in _LEVEL_RE.finditer(s):
+        current = int(match.group(1))
+        found = [current]
+        for sep, number in _LEVEL_TAIL_RE.findall(match.group(2)):
+            number = int(number)
+            if sep in ('-', '–', 'to'):
+                found.extend(range(current + 1, number + 1) if number > current else [number])
+            else:
+                found.append(number)
+            current = number
+        for level in found:
+            (levels if level in ALL_LEVELS else invalid).add(level)
+    if levels or invalid:
+        return levels, invalid, 'explicit'
+    for pattern, type_levels in _TYPES:
+        if pattern.search(s):
+            levels |= type_levels
+    return levels, invalid, 'facility_type' if levels else ''
+
+
+@dataclass
+class RowValidation:
+    """Local verdict for one policy row"""
+    row: int
+    fund: str
+    service: str
+    access_point: str
+    status: str
+    assigned_levels: List[int]
+    level_source: str = ""
+    rules: List[str] = field(default_factory=list)
+    findings: List[Dict] = field(default_factory=list)
+
+    @property
+    def escalate(self) -> bool:
+        return self.status in ('conflict', 'ambiguous')
+
+
+def _finding(rule: CapabilityRule, mismatch_type: str, assigned: Set[int], appropriate: Iterable[int]) -> Dict:
+    return {
+        'rule': rule.name,
+        'mismatch_type': mismatch_type,
+        'assigned_levels': sorted(assigned),
+        'appropriate_levels': sorted(appropriate),
+        'clinical_evidence': rule.reason,
+    }
+
+
+def validate_row(row: Dict, index: int = 0) -> RowValidation:
+    """Check one policy row (fund, service, scope, access_point, access_rules) against the tier rules."""
+    access_point = str(row.get('access_point') or "")
+    access_rules = str(row.get('access_rules') or row.get('access_rules_raw') or "")
+    result = RowValidation(index, str(row.get('fund') or ""), str(row.get('service') or ""),
+                           access_point, 'valid', [])
+    if not access_point.strip() and not access_rules.strip():
+        result.status = 'unspecified'
+        return result
+
+    levels, invalid, source = parse_levels(access_point)
+    rule_levels, rule_invalid, _ = parse_levels(access_rules)
+    if not levels and not invalid and rule_levels:
+        levels, source, rule_levels = rule_levels, 'access_rules', set()
+    invalid |= rule_invalid
+    result.assigned_levels = sorted(levels)
+    result.level_source = source
+    qualified = bool(_QUALIFIER_RE.search(compact(access_point)))
+
+    if invalid:
+        result.findings.append({'mismatch_type': 'invalid_level', 'levels': sorted(invalid),
+                                'clinical_evidence': "Kenya's facility tiers run from Level 1 to Level 6"})
+    if not levels:
+        result.status = 'ambiguous'
+        if not invalid:
+            result.findings.append({'mismatch_type': 'unparsed_access_point',
+                                    'clinical_evidence': "No facility level could be read from the access point"})
+        return result
+    if rule_levels - levels:
+        result.findings.append({'mismatch_type': 'inconsistent_levels', 'assigned_levels': sorted(levels),
+                                'rule_levels': sorted(rule_levels),
+                                'clinical_evidence': "Access rules name levels outside the access point"})
+
+    text = compact(" ".join(str(row.get(k) or "") for k in ('service', 'scope', 'scope_item'))
+                   + " " + access_rules)
+    for rule, pattern in _RULES:
+        if not pattern.search(text):
+            continue
+        result.rules.append(rule.name)
+        if min(levels) < rule.min_level:
+            result.findings.append(_finding(rule, 'over_assignment', levels, range(rule.min_level, 7)))
+        elif min(levels) > rule.max_entry_level:
+            result.findings.append(_finding(rule, 'under_utilization', levels, range(2, rule.max_entry_level + 1)))
+
+    if invalid:
+        result.status = 'ambiguous'
+    elif result.findings:
+        result.status = 'ambiguous' if qualified else 'conflict'
+    return result
+
+
+@dataclass
+class FacilityValidationReport:
+    """Per-row verdicts for a policy table and the rows to escalate"""
+    rows: List[RowValidation]
+    seconds: float = 0.0
+    llm_review: Optional[Dict] = None
+
+    def counts(self) -> Dict[str, int]:
+        counts = {'valid': 0, 'conflict': 0, 'ambiguous': 0, 'unspecified': 0}
+        for r in self.rows:
+            counts[r.status] += 1
+        return counts
+
+    def escalated(self) -> List[RowValidation]:
+        return [r for r in self.rows if r.escalate]
+
+    def escalation_records(self, policy_rows: List[Dict]) -> List[Dict]:
+        """Escalated policy rows with the local verdict attached, for the LLM prompt."""
+        return [dict(policy_rows[r.row], local_status=r.status, local_levels=r.assigned_levels,
+                     local_findings=r.findings) for r in self.escalated()]
+
+    def to_dict(self) -> Dict:
+        counts = self.counts()
+        mismatches = [dict(service=r.service or r.fund, fund=r.fund, row=r.row, status=r.status, source='rules', **f)
+                      for r in self.rows for f in r.findings]
+        return {
+            'validation_summary': {
+                'total_services_reviewed': len(self.rows),
+                'appropriate_assignments': counts['valid'],
+                'capability_mismatches': counts['conflict'],
+                'ambiguous_assignments': counts['ambiguous'],
+                'unspecified_access_points': counts['unspecified'],
+                'escalated_to_llm': counts['conflict'] + counts['ambiguous'],
+                'seconds': self.seconds,
+            },
+            'capability_mismatches': mismatches,
+            'row_results': [{k: v for k, v in asdict(r).items() if k != 'findings'} for r in self.rows],
+            'llm_review': self.llm_review or {},
+        }
+
+
+def validate_facility_levels(policy_rows: List[Dict]) -> FacilityValidationReport:
+    """Validate every policy row locally (no API calls)."""
+    started = time.perf_counter()
+    rows = [validate_row(row, i) for i, row in enumerate(policy_rows)]
+    return FacilityValidationReport(rows, seconds=round(time.perf_counter() - started, 4))
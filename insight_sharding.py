@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Insight Sharding - Map-reduce layout for the contradiction and gap prompts
+Used by the integrated analyzer when SHIF_INSIGHT_SHARDING is on, in place of
+one monolithic contradiction prompt and one monolithic gap prompt.
+
+Map: policy rows are grouped by fund and annex procedures by specialty. The
+groups are packed into at most max_shards balanced shards, policy and annex
+kept apart, so each shard is one fund/section or a set of related specialties.
+Each shard is rendered with more detail than the global summaries could carry
+(its services, access points and tariffs) and sent to the usual contradiction
+and gap prompts concurrently.
+
+Reduce: every shard is condensed into a compact digest (what it covers, its
+tariff ranges, and the findings already reported for it). The digests go to
+the cross-shard prompts, which only report issues spanning shards.
+
+ShardMerger renames colliding ids and drops repeated findings as they
+arrive, so the merged lists keep the same schema as the single-prompt run.
+"""
+
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from prompt_fingerprint import canonical_json, records_fingerprint, stable_value_counts
+
+DEFAULT_MAX_SHARDS = 6
+SHARD_POLICY_ROWS = 40
+SHARD_ANNEX_NAMES = 12
+DIGEST_FINDINGS = 15
+DIGEST_TEXT_CHARS = 160
+
+
+@dataclass
+class InsightShard:
+    """One map-step unit: a set of policy funds or annex specialties"""
+    name: str
+    source: str                       # 'policy' or 'annex'
+    groups: List[str]
+    index: List = field(default_factory=list)
+
+    @property
+    def rows(self) -> int:
+        return len(self.index)
+
+
+def _pack(groups: List[Tuple[str, List]], bins: int) -> List[List[Tuple[str, List]]]:
+    """Largest-first packing of (key, index) groups into `bins` bins of similar row count."""
+    packed: List[List[Tuple[str, List]]] = [[] for _ in range(max(1, min(bins, len(groups))))]
+    loads = [0] * len(packed)
+    for key, index in sorted(groups, key=lambda g: (-len(g[1]), g[0])):
+        target = loads.index(min(loads))
+        packed[target].append((key, index))
+        loads[target] += len(index)
+    return [sorted(b) for b in packed if b]
+
+
+def _groups(df: pd.DataFrame, column: str) -> List[Tuple[str, List]]:
+    if df is None or df.empty or column not in df.columns:
+        return []
+    keys = df[column].fillna("").astype(str).str.strip().replace("", "(unlabelled)")
+    return [(str(k), list(idx)) for k, idx in keys.groupby(keys, sort=True).groups.items()]
+
+
+def plan_shards(policy_df: pd.DataFrame, annex_df: pd.DataFrame,
+                max_shards: int = DEFAULT_MAX_SHARDS) -> List[InsightShard]:
+    """Policy funds and annex specialties packed into at most max_shards shards.
+
+    Shards are split between policy and annex in proportion to their rows
+    (at least one each when both have data).
+    """
+    policy_groups = _groups(policy_df, 'fund')
+    annex_groups = _groups(annex_df, 'specialty')
+    policy_rows = sum(len(i) for _, i in policy_groups)
+    annex_rows = sum(len(i) for _, i in annex_groups)
+    max_shards = max(max_shards, int(bool(policy_groups)) + int(bool(annex_groups)))
+    if policy_groups and annex_groups:
+        policy_bins = min(max_shards - 1, max(1, round(max_shards * policy_rows / (policy_rows + annex_rows))))
+    else:
+        policy_bins = max_shards if policy_groups else 0
+    annex_bins = max_shards - policy_bins
+
+    shards = []
+    for source, groups, bins in (('policy', policy_groups, policy_bins), ('annex', annex_groups, annex_bins)):
+        for n, packed in enumerate(_pack(groups, bins), 1):
+            shards.append(InsightShard(
+                name=f"{source}-{n}", source=source, groups=[k for k, _ in packed],
+                index=sorted(i for _, index in packed for i in index),
+            ))
+    return shards
+
+
+def shard_frames(shard: InsightShard, policy_df: pd.DataFrame, annex_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """(policy rows, annex rows) of one shard; the other source is empty."""
+    if shard.source == 'policy':
+        return policy_df.loc[shard.index], annex_df.iloc[0:0]
+    return policy_df.iloc[0:0], annex_df.loc[shard.index]
+
+
+def shard_fingerprint(shard: InsightShard, policy_df: pd.DataFrame, annex_df: pd.DataFrame) -> str:
+    frame = shard_frames(shard, policy_df, annex_df)[0 if shard.source == 'policy' else 1]
+    return records_fingerprint(frame)
+
+
+def _text(value, limit: int) -> str:
+    text = " ".join(str(value if value is not None and value == value else "").split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def _tariff_stats(values: pd.Series) -> Dict:
+    values = pd.to_numeric(values, errors='coerce').dropna()
+    values = values[values > 0]
+    if values.empty:
+        return {}
+    return {'min': float(values.min()), 'median': float(values.median()), 'max': float(values.max())}
+
+
+def render_shard_data(shard: InsightShard, policy_df: pd.DataFrame, annex_df: pd.DataFrame) -> str:
+    """Detailed data section for one shard's contradiction/gap prompts."""
+    policy, annex = shard_frames(shard, policy_df, annex_df)
+    if shard.source == 'policy':
+        rows = []
+        for _, r in policy.drop_duplicates(subset=[c for c in ('service', 'scope', 'access_point')
+                                                   if c in policy.columns]).head(SHARD_POLICY_ROWS).iterrows():
+            rows.append({
+                'fund': _text(r.get('fund'), 80), 'service': _text(r.get('service'), 80),
+                'scope': _text(r.get('scope'), 200), 'access_point': _text(r.get('access_point'), 120),
+                'tariff': _text(r.get('tariff_raw', r.get('tariff_num')), 60),
+            })
+        return (
+            f"SHARD {shard.name}: POLICY FUND/SECTION {', '.join(shard.groups)} ({len(policy)} entries)\n"
+            f"- Services: {stable_value_counts(policy['service'].fillna(''), top=15) if 'service' in policy else {}}\n"
+            f"- Access Points: {stable_value_counts(policy['access_point'].fillna(''), top=8) if 'access_point' in policy else {}}\n"
+            f"- Entries ({min(len(rows), SHARD_POLICY_ROWS)} of {len(policy)}):\n{canonical_json(rows)}\n"
+        )
+    lines = [f"SHARD {shard.name}: ANNEX SPECIALTIES {', '.join(shard.groups)} ({len(annex)} procedures)"]
+    for specialty, rows in annex.groupby(annex['specialty'].fillna('').astype(str), sort=True):
+        names = sorted({_text(n, 80) for n in rows.get('intervention', pd.Series(dtype=str)).dropna()})
+        lines.append(f"- {specialty}: {len(rows)} procedures, tariff KES {_tariff_stats(rows.get('tariff'))}; "
+                     f"e.g. {names[:SHARD_ANNEX_NAMES]}")
+    return "\n".join(lines) + "\n"
+
+
+def shard_digest(shard: InsightShard, policy_df: pd.DataFrame, annex_df: pd.DataFrame,
+                 contradictions: List[Dict], gaps: List[Dict]) -> Dict:
+    """Compact summary of a shard and its findings for the reduce prompts."""
+    policy, annex = shard_frames(shard, policy_df, annex_df)
+    frame = policy if shard.source == 'policy' else annex
+    digest = {'shard': shard.name, 'source': shard.source, 'covers': shard.groups, 'rows': len(frame)}
+    if shard.source == 'policy':
+        digest['access_points'] = stable_value_counts(policy.get('access_point', pd.Series(dtype=str)).fillna(''), top=5)
+        digest['tariffs'] = _tariff_stats(policy.get('tariff_num', pd.Series(dtype=float)))
+    else:
+        digest['tariffs'] = {str(s): _tariff_stats(rows.get('tariff'))
+                             for s, rows in annex.groupby(annex['specialty'].fillna('').astype(str), sort=True)}
+    digest['contradictions'] = [
+        {'id': c.get('contradiction_id'), 'type': c.get('contradiction_type'),
+         'description': _text(c.get('description'), DIGEST_TEXT_CHARS)}
+        for c in contradictions[:DIGEST_FINDINGS]
+    ]
+    digest['gaps'] = [
+        {'id': g.get('gap_id'), 'type': g.get('gap_type'), 'description': _text(g.get('description'), DIGEST_TEXT_CHARS)}
+        for g in gaps[:DIGEST_FINDINGS]
+    ]
+    return digest
+
+
+def render_digests(digests: List[Dict]) -> str:
+    return "\n".join(canonical_json(d) for d in digests)
+
+
+class ShardMerger:
+    """Thread-safe merge of one finding type across shards (unique ids, no repeats)"""
+
+    def __init__(self, id_key: str):
+        self.id_key = id_key
+        self.items: List[Dict] = []
+        self.per_shard: Dict[str, List[Dict]] = {}
+        self.duplicates = 0
+        self._ids = set()
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def accept(self, obj: Dict, shard: str) -> Optional[Dict]:
+        """obj with a unique id, or None when an equal finding was already merged."""
+        if not isinstance(obj, dict):
+            return None
+        marker = " ".join(str(obj.get('description') or canonical_json(obj)).lower().split())
+        with self._lock:
+            if marker in self._seen:
+                self.duplicates += 1
+                return None
+            self._seen.add(marker)
+            item_id = str(obj.get(self.id_key) or f"{shard.upper()}_{len(self.items) + 1:03d}")
+            if item_id in self._ids:
+                base = candidate = f"{item_id}_{shard.upper()}"
+                n = 1
+                while candidate in self._ids:
+                    n += 1
+                    candidate = f"{base}_{n}"
+                item_id = candidate
+            obj = dict(obj, **{self.id_key: item_id})
+            self._ids.add(item_id)
+            self.items.append(obj)
+            self.per_shard.setdefault(shard, []).append(obj)
+        return obj
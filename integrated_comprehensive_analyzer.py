@@ -34,7 +34,27 @@ import hashlib
 import os
 from difflib import SequenceMatcher
 import threading
-from updated_prompts import UpdatedHealthcareAIPrompts
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from updated_prompts import CROSS_SHARD_INSTRUCTIONS, RUN_DATA_MARKER, UpdatedHealthcareAIPrompts, with_run_data
+from ai_batch_jobs import batch_collector_from_env
+from ai_client_registry import get_ai_registry
+from ai_provider_router import OPENAI, InvalidResponse, get_provider_router
+from ai_rate_limiter import get_rate_limiter, is_rate_limit_error, retry_after_seconds, usage_total_tokens
+from ai_json_utils import DEFAULT_ARRAY_KEYS, IncrementalJSONArrayParser, collect_items, largest_json_value
+from ai_response_store import get_default_store, response_cache_key
+from ai_schemas import build_repair_prompt, get_schema, structured_items, validate_response
+from ai_telemetry import AITelemetry, estimate_cost_usd, usage_tokens
+from facility_level_validator import validate_facility_levels
+from insight_sharding import ShardMerger, plan_shards, render_digests, render_shard_data, shard_digest, shard_fingerprint
+from model_router import AllModelsFailed, attempt_abandoned, get_model_router
+from prompt_packer import count_tokens, merge_json_results, pack_records_stable
+from prompt_templates import template_version
+from extraction_cache import ExtractionCache
+from name_canonicalizer import canonicalize_names
+from row_classification import RowClassifier
+from tariff_outliers import detect_tariff_outliers
+from prompt_fingerprint import (canonical_json, canonical_records, canonicalize_prompt,
+                                data_fingerprint, records_fingerprint, stable_value_counts)
 
 class UniqueInsightTracker:
     """Tracks unique gaps and contradictions across multiple runs to prevent duplicates"""
@@ -518,7 +538,7 @@ class UpdatedHealthcareAIPrompts:
     @staticmethod
     def get_advanced_contradiction_prompt(extracted_data: str, specialties_data: str) -> str:
         """Advanced medical contradiction detection with clinical reasoning - REAL DATA VERSION"""
-        return f"""
+        return with_run_data(f"""
 You are **Dr. Amina Hassan**, Chief Medical Officer and Healthcare Policy Expert with 20+ years across multiple medical specializations. You're conducting a CRITICAL SAFETY REVIEW of Kenya's SHIF healthcare policies.
 
 **YOUR CLINICAL EXPERTISE:**
@@ -543,12 +563,6 @@ You are **Dr. Amina Hassan**, Chief Medical Officer and Healthcare Policy Expert
 - **CVD Impact**: 25% of hospital admissions, 13% of deaths (WHO Kenya 2024)
 - **Hypertension Prevalence**: 24% of adult population (Kenya STEPwise Survey 2015)
 
-**EXTRACTED KENYA SHIF DATA:**
-{extracted_data}
-
-**MEDICAL SPECIALTIES ANALYSIS:**
-{specialties_data}
-
 **🚨 CRITICAL DETECTION FRAMEWORK:**
 
 **PRIORITY 1 - LIFE-THREATENING CONTRADICTIONS:**
@@ -647,12 +661,15 @@ For EACH contradiction:
 4. Assess contradictions that may worsen health inequities in Kenya's 47 counties
 
 Apply your comprehensive medical expertise to identify policy inconsistencies that genuinely threaten healthcare quality and patient safety for Kenya's 56.4 million population.
-"""
+""",
+            ("**EXTRACTED KENYA SHIF DATA:**", extracted_data),
+            ("**MEDICAL SPECIALTIES ANALYSIS:**", specialties_data),
+        )
 
     @staticmethod
     def get_comprehensive_gap_analysis_prompt(services_data: str, kenya_context: str) -> str:
         """Comprehensive gap analysis with real Kenya health system data"""
-        return f"""
+        return with_run_data(f"""
 You are **Dr. Grace Kiprotich**, former Director of Medical Services for Kenya's Ministry of Health with 25+ years in health system design and policy implementation. You have intimate knowledge of Kenya's healthcare landscape, disease patterns, and implementation challenges.
 
 **YOUR EXPERTISE COVERS:**
@@ -663,9 +680,6 @@ You are **Dr. Grace Kiprotich**, former Director of Medical Services for Kenya's
 👥 **Health Equity**: Urban-rural disparities, vulnerable populations, access barriers
 📋 **WHO Standards**: Essential health services, universal health coverage benchmarks
 
-**CURRENT SHIF COVERAGE ANALYSIS:**
-{services_data}
-
 **REAL KENYA HEALTH PROFILE (2024 DATA):**
 - **Population**: 56.4 million total
   - Urban: 16.9 million (30%)
@@ -817,7 +831,21 @@ You are **Dr. Grace Kiprotich**, former Director of Medical Services for Kenya's
 Focus on gaps that would have the greatest population health impact for Kenya's 56.4 million population and are feasible within the country's health system constraints and county structure.
 
 **CRITICAL: RESPOND ONLY WITH JSON ARRAY FORMAT AS SHOWN IN THE EXAMPLE ABOVE. NO OTHER TEXT.**
-"""
+""",
+            ("**CURRENT SHIF COVERAGE ANALYSIS:**", services_data),
+        )
+
+    @staticmethod
+    def get_cross_shard_contradiction_prompt(shard_digests: str, specialties_data: str) -> str:
+        """Reduce step of sharded contradiction detection: only contradictions spanning shards"""
+        base = UpdatedHealthcareAIPrompts.get_advanced_contradiction_prompt(shard_digests, specialties_data)
+        return base.replace(RUN_DATA_MARKER, CROSS_SHARD_INSTRUCTIONS.format(kind="contradiction") + RUN_DATA_MARKER, 1)
+
+    @staticmethod
+    def get_cross_shard_gap_prompt(shard_digests: str, kenya_context: str) -> str:
+        """Reduce step of sharded gap analysis: only gaps visible across shards"""
+        base = UpdatedHealthcareAIPrompts.get_comprehensive_gap_analysis_prompt(shard_digests, kenya_context)
+        return base.replace(RUN_DATA_MARKER, CROSS_SHARD_INSTRUCTIONS.format(kind="gap") + RUN_DATA_MARKER, 1)
 
 class IntegratedComprehensiveMedicalAnalyzer:
     """
@@ -835,9 +863,15 @@ class IntegratedComprehensiveMedicalAnalyzer:
             pass
         
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
-        self.client = openai.OpenAI(api_key=self.api_key) if self.api_key else None
+        # Shared lazy client: built on first request, no startup probes
+        # (SHIF_AI_BACKEND=offline substitutes the local replay/synthetic backend)
+        self.client = get_ai_registry().get_client(self.api_key)
         self.primary_model = "gpt-5-mini"  # Primary model as specified
         self.fallback_model = "gpt-4.1-mini"  # Fallback model as specified
+        # Shared primary/fallback router (p95 hedging + circuit breaker)
+        self.model_router = get_model_router(self.primary_model, self.fallback_model)
+        # Latency/cost-aware choice of provider (e.g. Groq) for classification and dedup prompts
+        self.provider_router = get_provider_router(self.primary_model)
         
         # Store PDF path for CSV export
         self.pdf_path = pdf_path
@@ -849,10 +883,46 @@ class IntegratedComprehensiveMedicalAnalyzer:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.output_dir = Path(f"outputs_run_{timestamp}")
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        # Per-call AI telemetry (latency, tokens, model, cache hit) in analysis_metrics.jsonl
+        self.telemetry = AITelemetry(self.output_dir / 'analysis_metrics.jsonl', run_id=timestamp, source="integrated")
+        # SHIF_AI_BATCH_MODE=collect: write cache misses to a batch JSONL instead of sending them
+        self.batch_collector = batch_collector_from_env(self.output_dir)
+        if self.batch_collector is not None and not self.client:
+            # Prompts are only rendered, so no key is needed; keep the AI phases enabled
+            self.client = get_ai_registry().get_offline_client()
         # AI cache directory (shared across runs)
         self.ai_cache_dir = Path("ai_cache")
         self.ai_cache_dir.mkdir(parents=True, exist_ok=True)
-        
+        # Indexed response store (imports legacy ai_cache/*.txt on first use)
+        self.ai_store = get_default_store()
+        # Extraction results keyed by PDF hash and extractor source (also shipped in warm bundles)
+        self.extraction_cache = (ExtractionCache()
+                                 if os.getenv('SHIF_EXTRACTION_CACHE', 'true').lower() in ('1', 'true', 'yes') else None)
+        # Requests/tokens per minute shared with every other analyzer process on this host
+        self.rate_limiter = get_rate_limiter()
+        # Batch AI fan-out settings (chunked annex analysis)
+        self.ai_max_workers = int(os.getenv('SHIF_AI_MAX_WORKERS', '4'))
+        self.ai_max_retries = int(os.getenv('SHIF_AI_MAX_RETRIES', '3'))
+        self.batch_prompt_token_budget = int(os.getenv('SHIF_BATCH_TOKEN_BUDGET', '6000'))
+        # Token-budgeted row packing for data-bearing prompts (replaces head(N) samples)
+        self.prompt_token_budget = int(os.getenv('SHIF_PROMPT_TOKEN_BUDGET', '12000'))
+        self.prompt_max_calls = int(os.getenv('SHIF_PROMPT_MAX_CALLS', '6'))
+        self.prompt_coverage: Dict[str, Dict] = {}
+        # Local name canonicalization: similarity threshold and the margin above it that is escalated
+        self.canonical_threshold = float(os.getenv('SHIF_CANONICAL_THRESHOLD', '0.8'))
+        self.canonical_margin = float(os.getenv('SHIF_CANONICAL_MARGIN', '0.1'))
+        # Local per-specialty tariff outliers: robust z cut-off and how many flags the LLM explains
+        self.outlier_z_threshold = float(os.getenv('SHIF_OUTLIER_Z_THRESHOLD', '3.5'))
+        self.outlier_top_n = int(os.getenv('SHIF_OUTLIER_TOP_N', '25'))
+        # Map-reduce contradiction/gap analysis: one prompt pair per fund/specialty shard, then a cross-shard reduce
+        self.insight_sharding = os.getenv('SHIF_INSIGHT_SHARDING', 'false').lower() in ('1', 'true', 'yes')
+        self.insight_max_shards = int(os.getenv('SHIF_INSIGHT_MAX_SHARDS', '6'))
+        # Stream gap/contradiction completions and surface objects as they arrive
+        self.ai_stream = os.getenv('SHIF_AI_STREAM', 'true').lower() in ('1', 'true', 'yes')
+        # Request schema-constrained JSON (ai_schemas) and repair invalid responses once
+        self.ai_structured = os.getenv('SHIF_AI_STRUCTURED', 'true').lower() in ('1', 'true', 'yes')
+        self.insight_listeners = []
+
         # Storage for comprehensive results
         self.policy_services = []      # Pages 1-18 structured services
         self.annex_procedures = []     # Pages 19-54 procedures  
@@ -1074,17 +1144,26 @@ class IntegratedComprehensiveMedicalAnalyzer:
         
         start_time = time.time()
         
-        # PHASE 1: Build vocabulary from document
-        print(f"\n📚 PHASE 1: Building Document Vocabulary")
-        self._build_document_vocabulary(pdf_path)
-        
-        # PHASE 2: Extract Pages 1-18 with advanced processing
-        print(f"\n📊 PHASE 2: Extracting Pages 1-18 (Policy Structure)")
-        policy_results = self._extract_policy_structure(pdf_path, "1-18")
-        
-        # PHASE 3: Extract Pages 19-54 with simple tabula
-        print(f"\n📊 PHASE 3: Extracting Pages 19-54 (Annex Procedures)")
-        annex_results = self._extract_annex_procedures(pdf_path, "19-54")
+        cached_extraction = self._load_cached_extraction(pdf_path)
+        if cached_extraction is not None:
+            policy_results, annex_results = cached_extraction
+        else:
+            # PHASE 1: Build vocabulary from document
+            print(f"\n📚 PHASE 1: Building Document Vocabulary")
+            self._build_document_vocabulary(pdf_path)
+
+            # PHASE 2: Extract Pages 1-18 with advanced processing
+            print(f"\n📊 PHASE 2: Extracting Pages 1-18 (Policy Structure)")
+            policy_results = self._extract_policy_structure(pdf_path, "1-18")
+
+            # PHASE 3: Extract Pages 19-54 with simple tabula
+            print(f"\n📊 PHASE 3: Extracting Pages 19-54 (Annex Procedures)")
+            annex_results = self._extract_annex_procedures(pdf_path, "19-54")
+            if self.extraction_cache is not None:
+                try:
+                    self.extraction_cache.save(pdf_path, self.doc_vocab, policy_results, annex_results)
+                except Exception as e:
+                    print(f"   ⚠️ Could not cache extraction: {e}")
         
         # Save raw extraction immediately for direct access
         print(f"\n💾 DIRECT ACCESS: Raw extractions saved to {self.output_dir}")
@@ -1135,8 +1214,36 @@ class IntegratedComprehensiveMedicalAnalyzer:
         }
         
         self._print_comprehensive_summary(results, analysis_time)
+        self.telemetry.write_rollup()
+        if self.batch_collector is not None:
+            print(f"\n📦 Batch collect mode: {self.batch_collector.added} new request(s), "
+                  f"{self.batch_collector.count} total in {self.batch_collector.path}")
+            print(f"   Next: python ai_batch_jobs.py submit {self.batch_collector.path}")
         return results
 
+    def _load_cached_extraction(self, pdf_path: str) -> Optional[Tuple[Dict, Dict]]:
+        """(policy_results, annex_results) from the extraction cache, with the run CSVs written; None on a miss."""
+        if self.extraction_cache is None:
+            return None
+        try:
+            cached = self.extraction_cache.load(pdf_path)
+        except Exception as e:
+            print(f"   ⚠️ Extraction cache unavailable: {e}")
+            return None
+        if cached is None:
+            return None
+        self.doc_vocab = cached['doc_vocab']
+        policy_results, annex_results = cached['policy_results'], cached['annex_results']
+        print(f"\n♻️ PHASES 1-3: Extraction cache hit ({len(policy_results['raw'])} policy rows, "
+              f"{len(annex_results['procedures'])} annex procedures, {len(self.doc_vocab)} vocabulary terms)")
+        try:
+            policy_results['raw'].to_csv(self.output_dir / 'rules_p1_18_structured.csv', index=False)
+            policy_results['wide'].to_csv(self.output_dir / 'rules_p1_18_structured_wide.csv', index=False)
+            policy_results['exploded'].to_csv(self.output_dir / 'rules_p1_18_structured_exploded.csv', index=False)
+        except Exception:
+            pass
+        return policy_results, annex_results
+
     # ========== Dynamic De-glue Implementation ==========
     
     def _build_document_vocabulary(self, pdf_path: str):
@@ -1888,11 +1995,15 @@ ANNEX PROCEDURES DATA ({len(annex_df)} procedures):
 MEDICAL SPECIALTIES COVERED:
 - Total policy services: {len(policy_df)}
 - Total annex procedures: {len(annex_df)}
-- Specialty distribution: {annex_df['specialty'].value_counts().to_dict() if not annex_df.empty else {}}
+- Specialty distribution: {stable_value_counts(annex_df['specialty']) if not annex_df.empty else {}}
 """
 
+            if self.insight_sharding and not (policy_df.empty and annex_df.empty):
+                return self._sharded_insight_analysis(policy_df, annex_df, specialties_data)
+
             # Initialize enhanced prompts
             enhanced_prompts = UpdatedHealthcareAIPrompts()
+            data_fp = {'policy': self._frame_fingerprint(policy_df), 'annex': self._frame_fingerprint(annex_df)}
             
             # Initialize analysis variables to ensure proper scoping
             contradiction_analysis = "N/A"
@@ -1910,8 +2021,19 @@ MEDICAL SPECIALTIES COVERED:
             )
             
             try:
-                contradiction_analysis = self._call_openai(contradiction_prompt, tag="contradictions_main")
-                contradictions = self._extract_ai_contradictions(contradiction_analysis)
+                streamed_contradictions = []
+                contradiction_analysis = self._call_openai(
+                    contradiction_prompt, tag="contradictions_main",
+                    fingerprint=data_fingerprint('advanced_contradiction', **data_fp),
+                    on_object=self._stream_insight_consumer("contradiction", policy_df, annex_df, streamed_contradictions),
+                    stream_keys=('contradictions',), schema='contradictions'
+                )
+                if streamed_contradictions:
+                    # Already page-sourced and tracked item by item as they arrived
+                    contradictions = streamed_contradictions
+                    print(f"   📡 Streamed {len(contradictions)} AI contradictions")
+                else:
+                    contradictions = self._extract_ai_contradictions(contradiction_analysis)
                 
                 # Log metrics
                 self.log_analysis_metrics(
@@ -1926,13 +2048,15 @@ MEDICAL SPECIALTIES COVERED:
                     }
                 )
                 
-                # Add page source tracking for contradictions
-                contradictions = self._add_page_sources(contradictions, "contradiction", policy_df, annex_df)
-                
-                # Now add to unique tracker with page sources
+                if not streamed_contradictions:
+                    # Add page source tracking for contradictions
+                    contradictions = self._add_page_sources(contradictions, "contradiction", policy_df, annex_df)
+                    
+                    # Now add to unique tracker with page sources
+                    if contradictions:
+                        new_contradictions_count = self.unique_tracker.add_contradictions(contradictions)
+                        print(f"   🔍 Added {new_contradictions_count} new unique contradictions to tracker (Total: {len(self.unique_tracker.unique_contradictions)})")
                 if contradictions:
-                    new_contradictions_count = self.unique_tracker.add_contradictions(contradictions)
-                    print(f"   🔍 Added {new_contradictions_count} new unique contradictions to tracker (Total: {len(self.unique_tracker.unique_contradictions)})")
                     self.unique_tracker.save_insights()
                 
                 print(f"   📋 Extracted {len(contradictions)} AI contradictions with page sources")
@@ -1956,7 +2080,13 @@ MEDICAL SPECIALTIES COVERED:
             
             try:
                 print(f"   🔍 Gap prompt length: {len(gap_prompt)} characters")
-                gap_analysis = self._call_openai(gap_prompt, tag="gaps_main")
+                streamed_gaps = []
+                gap_analysis = self._call_openai(
+                    gap_prompt, tag="gaps_main",
+                    fingerprint=data_fingerprint('comprehensive_gap_analysis', **data_fp),
+                    on_object=self._stream_insight_consumer("gap", policy_df, annex_df, streamed_gaps),
+                    stream_keys=('gaps',), schema='gaps'
+                )
                 
                 if gap_analysis is None:
                     print(f"   ⚠️ Gap analysis returned None - OpenAI call failed")
@@ -1966,7 +2096,11 @@ MEDICAL SPECIALTIES COVERED:
                 if len(gap_analysis) > 200:
                     print(f"   🔍 Gap analysis starts with: {gap_analysis[:200]}...")
                 
-                gaps = self._extract_ai_gaps(gap_analysis)
+                if streamed_gaps:
+                    gaps = streamed_gaps
+                    print(f"   📡 Streamed {len(gaps)} AI gaps")
+                else:
+                    gaps = self._extract_ai_gaps(gap_analysis)
                 
                 # Log metrics
                 self.log_analysis_metrics(
@@ -1981,13 +2115,15 @@ MEDICAL SPECIALTIES COVERED:
                     }
                 )
                 
-                # Add page source tracking for gaps
-                gaps = self._add_page_sources(gaps, "gap", policy_df, annex_df)
-                
-                # Now add to unique tracker with page sources
+                if not streamed_gaps:
+                    # Add page source tracking for gaps
+                    gaps = self._add_page_sources(gaps, "gap", policy_df, annex_df)
+                    
+                    # Now add to unique tracker with page sources
+                    if gaps:
+                        new_gaps_count = self.unique_tracker.add_gaps(gaps)
+                        print(f"   🔍 Added {new_gaps_count} new unique gaps to tracker (Total: {len(self.unique_tracker.unique_gaps)})")
                 if gaps:
-                    new_gaps_count = self.unique_tracker.add_gaps(gaps)
-                    print(f"   🔍 Added {new_gaps_count} new unique gaps to tracker (Total: {len(self.unique_tracker.unique_gaps)})")
                     self.unique_tracker.save_insights()
                 
                 print(f"   📋 Extracted {len(gaps)} AI gaps with page sources")
@@ -2015,6 +2151,114 @@ MEDICAL SPECIALTIES COVERED:
             print(f"   ❌ AI analysis failed: {e}")
             return {'contradictions': [], 'gaps': [], 'insights': []}
 
+    def _sharded_insight_analysis(self, policy_df: pd.DataFrame, annex_df: pd.DataFrame,
+                                  specialties_data: str) -> Dict:
+        """Map-reduce contradiction and gap detection (SHIF_INSIGHT_SHARDING).
+
+        Map: the usual contradiction and gap prompts run concurrently, one pair per
+        shard (insight_sharding.plan_shards: policy funds, annex specialties).
+        Reduce: the cross-shard prompts get a compact digest of every shard and its
+        findings and report only issues spanning shards. Findings are page-sourced,
+        tracked and passed to insight listeners as they arrive, and the result has
+        the same layout and item schema as the single-prompt analysis.
+        """
+        started = time.time()
+        shards = plan_shards(policy_df, annex_df, self.insight_max_shards)
+        kenya_context = "Kenya 2024 health context with 56.4M population"
+        list_keys = {'contradiction': 'contradictions', 'gap': 'gaps'}
+        mergers = {'contradiction': ShardMerger('contradiction_id'), 'gap': ShardMerger('gap_id')}
+        collected: Dict[str, List[Dict]] = {'contradiction': [], 'gap': []}
+        consumers = {kind: self._stream_insight_consumer(kind, policy_df, annex_df, collected[kind])
+                     for kind in collected}
+        extractors = {'contradiction': self._extract_ai_contradictions, 'gap': self._extract_ai_gaps}
+        consume_lock = threading.Lock()  # the tracker and listeners are not thread-safe
+        texts: Dict[Tuple[str, str], str] = {}
+        errors: Dict[str, str] = {}
+
+        def run(kind: str, unit: str, prompt: str, tag: str, fingerprint: str = None) -> None:
+            def accept(obj: Dict) -> None:
+                item = mergers[kind].accept(obj, unit)
+                if item is not None:
+                    with consume_lock:
+                        consumers[kind](item)
+            try:
+                text = self._call_openai(prompt, tag=tag, fingerprint=fingerprint, on_object=accept,
+                                         stream_keys=(list_keys[kind],), schema=list_keys[kind])
+                if not mergers[kind].per_shard.get(unit):
+                    # Free-form text the incremental parser could not split into items
+                    for item in extractors[kind](text or ""):
+                        accept(item)
+                texts[(kind, unit)] = text or ""
+            except Exception as e:
+                errors[f"{kind}:{unit}"] = str(e)
+                print(f"   ⚠️ {kind} analysis for {unit} failed: {e}")
+
+        def map_task(task) -> None:
+            kind, shard = task
+            data = render_shard_data(shard, policy_df, annex_df)
+            shard_fp = shard_fingerprint(shard, policy_df, annex_df)
+            if kind == 'contradiction':
+                prompt = UpdatedHealthcareAIPrompts.get_advanced_contradiction_prompt(data, specialties_data)
+                fingerprint = data_fingerprint('advanced_contradiction_shard', shard_fp, specialties_data)
+            else:
+                prompt = UpdatedHealthcareAIPrompts.get_comprehensive_gap_analysis_prompt(data, kenya_context)
+                fingerprint = data_fingerprint('comprehensive_gap_analysis_shard', shard_fp)
+            run(kind, shard.name, prompt, f"{list_keys[kind]}_shard", fingerprint)
+
+        print(f"   🧩 Sharded insight analysis: {len(shards)} shards "
+              f"({', '.join(f'{s.name}={s.rows}' for s in shards)})")
+        tasks = [(kind, shard) for shard in shards for kind in ('contradiction', 'gap')]
+        with ThreadPoolExecutor(max_workers=max(1, min(self.ai_max_workers, len(tasks)))) as pool:
+            list(pool.map(map_task, tasks))
+        map_seconds = time.time() - started
+
+        if len(shards) > 1:
+            digests = render_digests([
+                shard_digest(shard, policy_df, annex_df, mergers['contradiction'].per_shard.get(shard.name, []),
+                             mergers['gap'].per_shard.get(shard.name, []))
+                for shard in shards
+            ])
+            reduce_prompts = [
+                ('contradiction', UpdatedHealthcareAIPrompts.get_cross_shard_contradiction_prompt(digests, specialties_data)),
+                ('gap', UpdatedHealthcareAIPrompts.get_cross_shard_gap_prompt(digests, kenya_context)),
+            ]
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                list(pool.map(lambda kp: run(kp[0], 'cross', kp[1], f"{list_keys[kp[0]]}_reduce"), reduce_prompts))
+
+        if collected['contradiction'] or collected['gap']:
+            self.unique_tracker.save_insights()
+        contradictions, gaps = collected['contradiction'], collected['gap']
+        per_unit = {kind: {unit: len(items) for unit, items in mergers[kind].per_shard.items()} for kind in mergers}
+        self.log_analysis_metrics(
+            "Sharded Insight Analysis",
+            input_size=len(policy_df) + len(annex_df),
+            output_size=len(contradictions) + len(gaps),
+            status="PARTIAL" if errors else "SUCCESS",
+            details={
+                'shards': [{'name': s.name, 'source': s.source, 'rows': s.rows, 'groups': len(s.groups)} for s in shards],
+                'map_seconds': round(map_seconds, 2),
+                'reduce_seconds': round(time.time() - started - map_seconds, 2),
+                'contradictions_per_shard': per_unit['contradiction'],
+                'gaps_per_shard': per_unit['gap'],
+                'duplicates_dropped': mergers['contradiction'].duplicates + mergers['gap'].duplicates,
+                'errors': errors,
+            }
+        )
+        print(f"   ✅ AI analysis complete: {len(contradictions)} contradictions, {len(gaps)} gaps "
+              f"({per_unit['contradiction'].get('cross', 0)} + {per_unit['gap'].get('cross', 0)} cross-shard, "
+              f"{time.time() - started:.1f}s)")
+
+        def section(kind: str) -> str:
+            return "\n\n".join(f"[{unit}]\n{text}" for (k, unit), text in sorted(texts.items(), key=lambda kv: (kv[0][1] == 'cross', kv[0][1]))
+                                 if k == kind)
+
+        return {
+            'contradictions': contradictions,
+            'gaps': gaps,
+            'insights': [],
+            'full_analysis': f"CONTRADICTIONS ANALYSIS:\n{section('contradiction')}\n\nGAPS ANALYSIS:\n{section('gap')}"
+        }
+
     def _run_coverage_analysis(self, policy_results: Dict, annex_results: Dict, clinical_analysis: Dict) -> Dict:
         """Run comprehensive coverage analysis to find systematic coverage gaps"""
         
@@ -2056,7 +2300,14 @@ ANNEX PROCEDURES DATA ({len(annex_df)} procedures):
             print(f"   🔍 Running comprehensive coverage analysis...")
             print(f"   🔍 Coverage prompt length: {len(coverage_prompt)} characters")
             
-            coverage_analysis_text = self._call_openai(coverage_prompt, tag="coverage_analysis")
+            coverage_fp = data_fingerprint(
+                'coverage_analysis',
+                policy=self._frame_fingerprint(policy_df),
+                annex=self._frame_fingerprint(annex_df),
+                clinical_gaps=clinical_gaps_summary[:10],
+            )
+            coverage_analysis_text = self._call_openai(coverage_prompt, tag="coverage_analysis", fingerprint=coverage_fp,
+                                                     schema='coverage_gaps')
             
             if not coverage_analysis_text:
                 print(f"   ⚠️ Coverage analysis returned empty - OpenAI call failed")
@@ -2203,15 +2454,12 @@ Focus on identifying 15-25 systematic coverage gaps that complement the existing
         gaps = []
         
         try:
-            # Try to parse as JSON first
-            import json
-            
-            # Look for JSON array in the text
-            json_match = re.search(r'\[[\s\S]*\]', analysis_text)
-            if json_match:
-                json_text = json_match.group(0)
-                parsed_gaps = json.loads(json_text)
-                
+            # Schema-valid structured output first; legacy text falls back to the JSON array regex
+            parsed_gaps = structured_items(analysis_text, get_schema('coverage_gaps'))
+            if parsed_gaps is None:
+                json_match = re.search(r'\[[\s\S]*\]', analysis_text)
+                parsed_gaps = json.loads(json_match.group(0)) if json_match else None
+            if parsed_gaps is not None:
                 for gap_data in parsed_gaps:
                     if isinstance(gap_data, dict) and gap_data.get('description'):
                         gap = {
@@ -2285,61 +2533,372 @@ Focus on identifying 15-25 systematic coverage gaps that complement the existing
     # ========== Extended AI routines (optional) ==========
 
     def _cache_key(self, model: str, prompt: str, tag: str = "") -> str:
-        m = hashlib.sha1()
-        m.update(model.encode("utf-8"))
-        m.update(b"\0")
-        m.update(prompt.encode("utf-8"))
-        if tag:
-            m.update(b"\0")
-            m.update(tag.encode("utf-8"))
-        return m.hexdigest()
-
-    def _cache_get(self, key: str) -> Optional[str]:
+        return response_cache_key(model, prompt, tag)
+
+    def _cache_get(self, key: str, version: Dict = None) -> Optional[str]:
         try:
-            path = self.ai_cache_dir / f"{key}.txt"
-            if path.exists():
-                return path.read_text(encoding='utf-8')
+            return self.ai_store.get(key, **(version or {}))
         except Exception:
             pass
         return None
 
-    def _cache_set(self, key: str, content: str) -> None:
+    def _cache_set(self, key: str, content: str, **meta) -> None:
         try:
-            path = self.ai_cache_dir / f"{key}.txt"
-            path.write_text(content or "", encoding='utf-8')
+            self.ai_store.set(key, content or "", **meta)
         except Exception:
             pass
 
-    def _call_openai(self, prompt: str, tag: str = "") -> str:
-        """Helper to call OpenAI with primary/fallback and on-disk caching."""
-        primary_key = self._cache_key(self.primary_model, prompt, tag)
-        cached = self._cache_get(primary_key)
-        if cached is not None:
-            return cached
-        fallback_key = self._cache_key(self.fallback_model, prompt, tag)
-        cached_fb = self._cache_get(fallback_key)
-        if cached_fb is not None:
-            return cached_fb
-        try:
-            resp = self.client.chat.completions.create(
-                model=self.primary_model,
+    def _template_version(self, tag: str, schema: str = None) -> Dict:
+        """Template identity and source hash stored with (and required of) this call's cache entries."""
+        template, digest = template_version(tag, schema)
+        return {'template': template, 'template_hash': digest} if digest else {}
+
+    def _create_completion(self, model: str, prompt: str, key: str, tag: str = "", usage_sink: Dict = None,
+                           response_format: Dict = None, version: Dict = None) -> str:
+        """Send one chat completion and store it with timing/token metadata."""
+        started = time.time()
+        extra = {'response_format': response_format} if response_format else {}
+        resp, waited = self.rate_limiter.call(
+            model, self.rate_limiter.estimate_tokens(prompt),
+            lambda: self.client.chat.completions.create(
+                model=model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0,  # Deterministic AI responses
-                seed=42  # Reproducible across runs
-            )
-            content = (resp.choices[0].message.content or "")
-            self._cache_set(primary_key, content)
+                seed=42,  # Reproducible across runs
+                **extra
+            ),
+        )
+        self._note_rate_wait(usage_sink, waited)
+        latency_ms = (time.time() - started - waited) * 1000
+        content = (resp.choices[0].message.content or "")
+        usage = getattr(resp, 'usage', None)
+        if usage_sink is not None:
+            usage_sink[model] = usage
+        if attempt_abandoned():
+            # A hedge that lost the race: the winner's answer is the one this prompt is cached with
             return content
+        self._cache_set(
+            key, content, model=model, tag=tag, prompt=prompt, latency_ms=latency_ms,
+            prompt_tokens=getattr(usage, 'prompt_tokens', None),
+            completion_tokens=getattr(usage, 'completion_tokens', None),
+            **(version or {})
+        )
+        return content
+
+    @staticmethod
+    def _note_rate_wait(usage_sink: Optional[Dict], waited: float) -> None:
+        """Add seconds spent waiting on the rate limiter to the call's usage sink (for telemetry)."""
+        if usage_sink is not None and waited:
+            usage_sink['rate_limit_wait_ms'] = usage_sink.get('rate_limit_wait_ms', 0.0) + waited * 1000
+
+    def _call_openai(self, prompt: str, tag: str = "", fingerprint: str = None,
+                     on_object=None, stream_keys=DEFAULT_ARRAY_KEYS, schema: str = None) -> str:
+        """Helper to call OpenAI with primary/fallback and persistent response caching.
+
+        The prompt is canonicalised (whitespace) before it is hashed or sent. When a
+        data fingerprint is supplied the cache key is built from it rather than from
+        the rendered text, so equivalent inputs always share an entry.
+
+        If on_object is given, each completed object of the response's top-level
+        array (or its stream_keys array) is passed to it as soon as it is parsed:
+        streamed live when SHIF_AI_STREAM is on, replayed from cached text otherwise.
+        The full text is still returned and cached.
+
+        schema names an ai_schemas entry: live calls request it as structured output
+        and a response that fails validation gets one repair call before it is
+        cached. Cached text is returned as stored (the extractors salvage legacy text).
+        """
+        started = time.time()
+        call: Dict = {'cache_hit': False, 'model': None, 'route': None}
+        usage: Dict = {}
+        try:
+            content = self._resolve_completion(
+                prompt, tag, fingerprint, on_object, stream_keys, call, usage, schema
+            )
+        except Exception as e:
+            self.telemetry.record(tag, None, (time.time() - started) * 1000, cache_hit=False,
+                                  status="ERROR", error=e,
+                                  rate_limit_wait_ms=round(usage.get('rate_limit_wait_ms', 0.0), 1))
+            raise
+        route = call['route']
+        model = route.model if route else call['model']
+        model_usage = usage.get(model)
+        self.telemetry.record(
+            tag, model, (time.time() - started) * 1000, cache_hit=call['cache_hit'],
+            fallback_used=bool(route and route.fallback_used), hedged=bool(route and route.hedged),
+            batched=call.get('batched', False), rate_limit_wait_ms=round(usage.get('rate_limit_wait_ms', 0.0), 1),
+            **usage_tokens(model_usage),
+            **({'provider': call['provider']} if call.get('provider') else {}),
+            **({'schema': schema, 'schema_errors': call['schema_errors'], 'schema_repaired': call['schema_repaired']}
+               if 'schema_errors' in call else {}),
+        )
+        return content
+
+    def _resolve_completion(self, prompt: str, tag: str, fingerprint: Optional[str], on_object,
+                            stream_keys, call: Dict, usage: Dict, schema: str = None) -> str:
+        """Cache lookup + routed completion (or batch collection) behind _call_openai; fills call/usage."""
+        ai_schema = get_schema(schema) if self.ai_structured else None
+        response_format = ai_schema.response_format() if ai_schema else None
+        if ai_schema and ai_schema.list_key and stream_keys is DEFAULT_ARRAY_KEYS:
+            stream_keys = (ai_schema.list_key,)
+        raw_prompt = prompt
+        prompt = canonicalize_prompt(prompt)
+        keyed_on = f"fingerprint:{fingerprint}" if fingerprint else prompt
+        version = self._template_version(tag, schema)
+        keys = {}
+        for model in (self.primary_model, self.fallback_model):
+            key = self._cache_key(model, keyed_on, tag)
+            cached = self._cache_get(key, version)
+            if cached is not None:
+                call['cache_hit'], call['model'] = True, model
+                return self._replay_objects(cached, on_object, stream_keys)
+            # Entries written before canonicalisation were keyed on the raw prompt
+            legacy_key = self._cache_key(model, raw_prompt, tag)
+            if legacy_key != key:
+                cached = self._cache_get(legacy_key, version)
+                if cached is not None:
+                    self._cache_set(key, cached, model=model, tag=tag, prompt=prompt, **version)
+                    call['cache_hit'], call['model'] = True, model
+                    return self._replay_objects(cached, on_object, stream_keys)
+            keys[model] = key
+        if self.batch_collector is not None:
+            self.batch_collector.add(keys[self.primary_model], self.primary_model, prompt, tag, response_format,
+                                     version)
+            call['model'], call['batched'] = self.primary_model, True
+            return ""
+        routed = self._call_alternate_provider(prompt, keyed_on, tag, schema, ai_schema, response_format, call, usage,
+                                               version)
+        if routed is not None:
+            return self._replay_objects(routed, on_object, stream_keys)
+        if on_object is None:
+            result = self._route_openai(
+                lambda model: self._create_completion(model, prompt, keys[model], tag, usage, response_format, version),
+                tag, schema,
+            )
+            self._log_route_decisions(tag, result)
+            call['route'] = result
+            return self._validate_structured(ai_schema, result.value, prompt, keys[result.model], tag, call, version)
+
+        # A fallback after a mid-stream failure may repeat objects already emitted
+        seen = set()
+        def emit(obj: Dict) -> None:
+            marker = canonical_json(obj)
+            if marker not in seen:
+                seen.add(marker)
+                on_object(obj)
+
+        if self.ai_stream:
+            # No hedging: two concurrent streams would interleave partial output
+            result = self._route_openai(
+                lambda model: self._stream_completion(model, prompt, keys[model], tag, emit, stream_keys, usage,
+                                                      response_format, version),
+                tag, schema, hedge=False,
+            )
+        else:
+            result = self._route_openai(
+                lambda model: self._create_completion(model, prompt, keys[model], tag, usage, response_format, version),
+                tag, schema,
+            )
+            self._replay_objects(result.value, emit, stream_keys)
+        self._log_route_decisions(tag, result)
+        call['route'] = result
+        content = self._validate_structured(ai_schema, result.value, prompt, keys[result.model], tag, call, version)
+        if content is not result.value:
+            # Items only the repaired text has (already-emitted ones are skipped)
+            self._replay_objects(content, emit, stream_keys)
+        return content
+
+    def _route_openai(self, send, tag: str, schema: Optional[str], hedge: bool = None):
+        """Primary/fallback model route; routable prompt classes also feed OpenAI's provider stats."""
+        started = time.time()
+        routable = self.provider_router.is_routable(tag, schema)
+        try:
+            result = self.model_router.route(send, hedge=hedge)
         except Exception:
-            resp = self.client.chat.completions.create(
-                model=self.fallback_model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0,  # Deterministic AI responses
-                seed=42  # Reproducible across runs
+            if routable:
+                self.provider_router.record(OPENAI, time.time() - started, False)
+            raise
+        if routable:
+            self.provider_router.record(OPENAI, result.latency_ms / 1000, True)
+        return result
+
+    def _call_alternate_provider(self, prompt: str, keyed_on: str, tag: str, schema: Optional[str], ai_schema,
+                                 response_format: Optional[Dict], call: Dict, usage: Dict,
+                                 version: Dict = None) -> Optional[str]:
+        """Serve the call from a non-OpenAI provider when the provider router ranks one first.
+
+        Returns None to fall through to the OpenAI route: the plan keeps the call on
+        OpenAI, or every planned provider failed or returned invalid structured output.
+        """
+        for name in self.provider_router.plan(tag, count_tokens(prompt), schema):
+            if name == OPENAI:
+                return None
+            cache_model = self.provider_router.cache_model(name)
+            key = self._cache_key(cache_model, keyed_on, tag)
+            provider_model = self.provider_router.providers[name].model
+            cached = self._cache_get(key, version)
+            if cached is not None:
+                call.update(cache_hit=True, model=provider_model, provider=name)
+                return cached
+            started = time.time()
+            # Schema repair stays on OpenAI; a fresh OpenAI answer is cheaper than a cross-provider repair
+            validate = (lambda text: not validate_response(text, ai_schema)[1]) if ai_schema is not None else None
+            try:
+                content, provider_usage, waited = self.provider_router.complete(
+                    name, prompt, self.rate_limiter, response_format, validate
+                )
+            except InvalidResponse:
+                print(f"   ⚠️ {tag or schema}: provider {name} returned invalid {ai_schema.name}; using OpenAI")
+                continue
+            except Exception as e:
+                print(f"   ⚠️ {tag or schema}: provider {name} failed ({str(e)[:80]}); using OpenAI")
+                continue
+            self._note_rate_wait(usage, waited)
+            usage[provider_model] = provider_usage
+            call.update(model=provider_model, provider=name)
+            self._cache_set(
+                key, content, model=cache_model, tag=tag, prompt=prompt,
+                latency_ms=(time.time() - started - waited) * 1000,
+                prompt_tokens=getattr(provider_usage, 'prompt_tokens', None),
+                completion_tokens=getattr(provider_usage, 'completion_tokens', None),
+                **(version or {})
             )
-            content = (resp.choices[0].message.content or "")
-            self._cache_set(fallback_key, content)
             return content
+        return None
+
+    def _validate_structured(self, ai_schema, text: str, prompt: str, key: str, tag: str, call: Dict,
+                             version: Dict = None) -> str:
+        """Validate a live response against its schema; on failure make one repair call.
+
+        The repair goes to the fallback model with the schema and validation errors.
+        A valid repair replaces the cached response; otherwise the original text is
+        kept and the extractors salvage what they can.
+        """
+        if ai_schema is None or not text:
+            return text
+        _, errors = validate_response(text, ai_schema)
+        call['schema_errors'], call['schema_repaired'] = len(errors), False
+        if not errors:
+            return text
+        print(f"   🩹 {tag or ai_schema.name}: {len(errors)} schema error(s), requesting one repair")
+        repair_prompt = build_repair_prompt(ai_schema, text, errors)
+        repair_tag = f"{tag or ai_schema.name}:repair"
+        started = time.time()
+        repair_usage: Dict = {}
+        try:
+            repaired = self._create_completion(
+                self.fallback_model, repair_prompt, self._cache_key(self.fallback_model, repair_prompt, repair_tag),
+                repair_tag, repair_usage, ai_schema.response_format()
+            )
+            _, repair_errors = validate_response(repaired, ai_schema)
+            self.telemetry.record(repair_tag, self.fallback_model, (time.time() - started) * 1000, cache_hit=False,
+                                  status="SUCCESS" if not repair_errors else "INVALID",
+                                  rate_limit_wait_ms=round(repair_usage.get('rate_limit_wait_ms', 0.0), 1),
+                                  **usage_tokens(repair_usage.get(self.fallback_model)))
+        except Exception as e:
+            self.telemetry.record(repair_tag, self.fallback_model, (time.time() - started) * 1000, cache_hit=False,
+                                  status="ERROR", error=e)
+            return text
+        if repair_errors:
+            print(f"   ⚠️ {tag or ai_schema.name}: repair still invalid ({len(repair_errors)} error(s)); keeping original")
+            return text
+        call['schema_repaired'] = True
+        route = call.get('route')
+        self._cache_set(key, repaired, model=route.model if route else self.fallback_model, tag=tag,
+                        prompt=prompt, **(version or {}))
+        return repaired
+
+    def _stream_completion(self, model: str, prompt: str, key: str, tag: str, on_object,
+                           stream_keys=DEFAULT_ARRAY_KEYS, usage_sink: Dict = None,
+                           response_format: Dict = None, version: Dict = None) -> str:
+        """Stream one chat completion, emitting array objects as they close; caches the full text."""
+        parser = IncrementalJSONArrayParser(stream_keys)
+        usage = None
+        extra = {'response_format': response_format} if response_format else {}
+        tokens = self.rate_limiter.estimate_tokens(prompt)
+        self._note_rate_wait(usage_sink, self.rate_limiter.acquire(model, tokens))
+        started = time.time()
+        try:
+            stream = self.client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                seed=42,
+                stream=True,
+                stream_options={"include_usage": True},
+                **extra
+            )
+            for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                for obj in parser.feed(delta):
+                    on_object(obj)
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.rate_limiter.rate_limited(model, retry_after_seconds(e))
+            raise
+        self.rate_limiter.succeeded(model, tokens, usage_total_tokens(usage))
+        content = parser.text
+        if usage_sink is not None:
+            usage_sink[model] = usage
+        self._cache_set(
+            key, content, model=model, tag=tag, prompt=prompt,
+            latency_ms=(time.time() - started) * 1000,
+            prompt_tokens=getattr(usage, 'prompt_tokens', None),
+            completion_tokens=getattr(usage, 'completion_tokens', None),
+            **(version or {})
+        )
+        return content
+
+    def _replay_objects(self, text: str, on_object, stream_keys=DEFAULT_ARRAY_KEYS) -> str:
+        """Feed a complete response through the incremental parser (cache hits, non-stream mode)."""
+        if on_object is not None and text:
+            for obj in IncrementalJSONArrayParser(stream_keys).feed(text):
+                on_object(obj)
+        return text
+
+    def add_insight_listener(self, callback) -> None:
+        """Register callback(kind, item, is_new) for gaps/contradictions as they are parsed."""
+        self.insight_listeners.append(callback)
+
+    def _stream_insight_consumer(self, kind: str, policy_df: pd.DataFrame, annex_df: pd.DataFrame,
+                                 collected: List[Dict]):
+        """Build an on_object callback: add page sources, track, and notify listeners per item."""
+        def consume(obj: Dict) -> None:
+            enriched = self._add_page_sources([obj], kind, policy_df, annex_df)
+            if not enriched:
+                return
+            item = enriched[0]
+            collected.append(item)
+            if kind == "gap":
+                is_new = self.unique_tracker.add_gaps([item]) > 0
+            else:
+                is_new = self.unique_tracker.add_contradictions([item]) > 0
+            for listener in self.insight_listeners:
+                try:
+                    listener(kind, item, is_new)
+                except Exception as e:
+                    print(f"   ⚠️ Insight listener failed: {e}")
+        return consume
+
+    def _log_route_decisions(self, tag: str, result) -> None:
+        """Append routing decisions (hedge/fallback/breaker timings) for this call."""
+        try:
+            with open(self.output_dir / 'model_routing.jsonl', 'a') as f:
+                f.write(json.dumps({
+                    'timestamp': datetime.now().isoformat(),
+                    'tag': tag,
+                    'model': result.model,
+                    'fallback_used': result.fallback_used,
+                    'hedged': result.hedged,
+                    'latency_ms': result.latency_ms,
+                    'decisions': result.decisions,
+                }) + '\n')
+        except Exception:
+            pass
 
     def _run_extended_ai(self, policy_results: Dict, annex_results: Dict) -> Dict:
         """Run extended AI analyses using enhanced prompt suite (does not affect tests)."""
@@ -2352,38 +2911,198 @@ Focus on identifying 15-25 systematic coverage gaps that complement the existing
         policy_summary = self._summarize_policy_data(policy_df)
         annex_summary = self._summarize_annex_data(annex_df)
 
-        # 1) Annex quality/outlier analysis (sample up to 40 rows for token control)
+        # 1) Annex quality/outlier analysis (all rows, packed to the token budget)
         try:
-            sample_rows = annex_df.head(40).to_json(orient='records') if not annex_df.empty else "[]"
-            prompt = P.get_annex_quality_prompt(annex_summary, sample_rows)
-            out['annex_quality'] = self._safe_parse_json_array(self._call_openai(prompt))
+            parts, _ = self._run_packed_prompt(
+                'annex_quality', canonical_records(annex_df),
+                lambda rows_json: P.get_annex_quality_prompt(annex_summary, rows_json),
+                parse=self._safe_parse_json, group_key='specialty',
+            )
+            # One executive_assessment object per chunk (the annex_quality schema), merged key by key
+            out['annex_quality'] = merge_json_results(parts) or {}
         except Exception as e:
             out['annex_quality_error'] = str(e)
 
-        # 2) Rules contradiction map by fund/section (sample up to 60 rows)
+        # 2) Rules contradiction map by fund/section (all rows, packed to the token budget)
         try:
-            rules_sample = policy_df.head(60).to_json(orient='records') if not policy_df.empty else "[]"
-            prompt = P.get_rules_contradiction_map_prompt(policy_summary, rules_sample)
-            out['rules_map'] = self._safe_parse_json(self._call_openai(prompt))
+            parts, _ = self._run_packed_prompt(
+                'rules_map', canonical_records(policy_df),
+                lambda rows_json: P.get_rules_contradiction_map_prompt(policy_summary, rows_json),
+                parse=self._safe_parse_json, group_key='fund',
+            )
+            out['rules_map'] = merge_json_results(parts) or {}
         except Exception as e:
             out['rules_map_error'] = str(e)
 
-        # 3) Batch service analysis from annex (chunked)
+        # 3) Per-row service classification from annex (deduplicated micro-batches, concurrent)
         try:
             batch_results = []
             if not annex_df.empty:
                 services = annex_df[['specialty','intervention','tariff']].rename(columns={'intervention':'service_name'}).fillna("")
-                chunk_size = 50
-                for i in range(0, len(services), chunk_size):
-                    chunk = services.iloc[i:i+chunk_size]
-                    prompt = P.get_batch_service_analysis_prompt(chunk.to_json(orient='records'), "Kenya 2024, 47 counties, 6-tier system")
-                    batch_results.extend(self._safe_parse_json_array(self._call_openai(prompt)))
+                records = services.to_dict(orient='records')
+                batch_results, classification = self._run_service_classification(records, P)
+                out['batch_service_classification'] = classification
             out['batch_service_analysis'] = batch_results
         except Exception as e:
             out['batch_service_analysis_error'] = str(e)
 
+        out['prompt_coverage'] = {k: self.prompt_coverage[k] for k in ('annex_quality', 'rules_map') if k in self.prompt_coverage}
         return out
 
+    def _estimate_tokens(self, text: str) -> int:
+        """Local token count used for prompt budgeting (tiktoken if installed)."""
+        return max(1, count_tokens(text or ""))
+
+    def _is_cached(self, tag: str, fingerprint: str, schema: str = None) -> bool:
+        """Whether a fingerprinted call would be served from the AI cache (by the current template version)."""
+        template_hash = self._template_version(tag, schema).get('template_hash')
+        try:
+            return any(self.ai_store.contains(self._cache_key(model, f"fingerprint:{fingerprint}", tag), template_hash)
+                       for model in (self.primary_model, self.fallback_model))
+        except Exception:
+            return False
+
+    def _run_packed_prompt(self, name: str, records: List, render, parse=None, tag: str = None,
+                           group_key: str = None, schema: str = None) -> Tuple[List, Dict]:
+        """Pack rows into content-addressed, budget-sized chunks and call each one.
+
+        render(rows_json) builds the prompt for one chunk. Chunks are grouped by
+        group_key and split by row-hash range, and each call is cached on the
+        prompt name, the hash of its rows and the hash of the text rendered
+        around them (render("[]")), so when only some rows change just those
+        chunks are re-sent; a change to the surrounding context re-sends all.
+
+        Each chunk is requested as the `schema` structured output (default: the
+        ai_schemas entry named after the prompt, when there is one).
+
+        Returns the per-chunk results (parsed when parse is given) and the
+        coverage report, which is also kept in self.prompt_coverage and written
+        to the metrics log.
+        """
+        pack = pack_records_stable(records, self.prompt_token_budget, render=render, group_key=group_key,
+                                   name=name, max_calls=self.prompt_max_calls)
+        call_tag = name if tag is None else tag
+        schema = schema or (name if get_schema(name) else None)
+        template_fp = data_fingerprint('packed_prompt_context', render("[]"))
+        fingerprints = [data_fingerprint('packed_prompt', name, template_fp, b.fingerprint) for b in pack.batches]
+        reused = sum(1 for fp in fingerprints if self._is_cached(call_tag, fp, schema))
+
+        def run(index_batch):
+            index, batch = index_batch
+            text = self._call_openai(render(canonical_json(batch.rows)), tag=call_tag,
+                                     fingerprint=fingerprints[index], schema=schema)
+            return parse(text) if parse else text
+
+        if len(pack.batches) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.ai_max_workers, len(pack.batches))) as pool:
+                results = list(pool.map(run, enumerate(pack.batches)))
+        else:
+            results = [run(b) for b in enumerate(pack.batches)]
+
+        report = pack.report()
+        report['chunks_reused'] = reused
+        report['chunks_sent'] = len(pack.batches) - reused
+        if pack.batches:
+            print(f"   ♻️ {name}: {reused}/{len(pack.batches)} chunks unchanged (cached), "
+                  f"{len(pack.batches) - reused} sent")
+        if pack.skipped_by_group:
+            skipped = ", ".join(f"{group or '(all)'}: {rows}" for group, rows in
+                                sorted(pack.skipped_by_group.items(), key=lambda kv: -kv[1]))
+            print(f"   ⚠️ {name}: {pack.total_rows - pack.packed_rows} rows over the {self.prompt_max_calls}-call "
+                  f"limit not analysed ({skipped})")
+        self.prompt_coverage[name] = report
+        self.log_analysis_metrics(
+            f"Prompt Coverage: {name}", input_size=pack.total_rows, output_size=pack.packed_rows,
+            status="SUCCESS" if pack.coverage >= 1 else "PARTIAL", details=report
+        )
+        return results, report
+
+    def _call_openai_with_retry(self, prompt: str, tag: str = "", retries: int = None, backoff: float = 1.5,
+                                fingerprint: str = None, schema: str = None) -> Tuple[str, int]:
+        """Call OpenAI with exponential backoff. Returns (content, attempts).
+
+        Only errors the model router did not handle are retried: when it raises
+        AllModelsFailed the primary and fallback were both already tried (each with
+        the SDK's own retries), so another round would only multiply live requests.
+        """
+        retries = self.ai_max_retries if retries is None else retries
+        last_error = None
+        for attempt in range(1, retries + 1):
+            try:
+                return self._call_openai(prompt, tag=tag, fingerprint=fingerprint, schema=schema), attempt
+            except AllModelsFailed:
+                raise
+            except Exception as e:
+                last_error = e
+                if attempt < retries:
+                    time.sleep(backoff ** attempt)
+        raise RuntimeError(f"{tag or 'AI call'} failed after {retries} attempts: {last_error}")
+
+    def _run_service_classification(self, records: List[Dict], prompts) -> Tuple[List[Dict], Dict]:
+        """Classify annex services per row: dedupe by content hash, micro-batch, run concurrently.
+
+        Each unique row's result is cached under its hash (and the prompt template),
+        so only new or edited rows are sent; results fan back out to duplicate rows.
+        Rows that still fail after retries get no result and are counted as failed.
+        """
+        context = "Kenya 2024, 47 counties, 6-tier system"
+        render = lambda rows_json: prompts.get_batch_service_analysis_prompt(rows_json, context)
+        template_fp = data_fingerprint('service_classification', render("[]"))
+        tag = "batch_service_analysis"
+
+        def row_key(h: str) -> str:
+            return response_cache_key("row", f"{template_fp}:{h}", tag)
+
+        def classify_batch(batch: List[Dict]) -> List[Dict]:
+            text, _ = self._call_openai_with_retry(
+                render(canonical_json(batch)), tag=tag, schema='batch_service_analysis',
+                fingerprint=data_fingerprint('batch_service_analysis', records_fingerprint(batch, ordered=True), context),
+            )
+            return self._safe_parse_json_array(text)
+
+        classifier = RowClassifier(
+            classify_batch,
+            cache_get=lambda h: self._cache_get(row_key(h)),
+            cache_set=lambda h, content: self._cache_set(row_key(h), content, model="row", tag=tag),
+            budget_tokens=self.batch_prompt_token_budget, render=render, max_workers=self.ai_max_workers,
+        )
+        calls_before = len(self.telemetry.records)
+        outputs, report = classifier.run(records)
+        report.cost_usd = estimate_cost_usd([r.get('details', {}) for r in self.telemetry.records[calls_before:]
+                                             if r.get('details', {}).get('tag') == tag])
+        summary = report.to_dict()
+        print(f"   🧩 Service classification: {report.rows} rows → {report.unique_rows} unique, "
+              f"{report.cached_rows} cached, {report.batches} batches ({self.ai_max_workers} workers); "
+              f"{summary['rows_per_second']} rows/s, {summary['rows_per_dollar'] or 'n/a'} rows/$")
+        if report.failed_rows:
+            print(f"   ⚠️ {report.failed_rows} row(s) without a classification")
+        self.log_analysis_metrics(
+            "Service Classification", input_size=report.rows, output_size=report.rows - report.failed_rows,
+            status="SUCCESS" if not report.failed_rows else "PARTIAL", details=summary
+        )
+        return [o for o in outputs if o is not None], summary
+
+    def _run_facility_validation(self, name: str, policy_rows: List[Dict], tag: str = None) -> Dict:
+        """Validate every policy row against the facility tier rules; only conflicting or
+        ambiguous rows are sent to get_facility_level_validation_prompt."""
+        report = validate_facility_levels(policy_rows)
+        escalated = report.escalation_records(policy_rows)
+        if escalated:
+            parts, _ = self._run_packed_prompt(
+                name, escalated, UpdatedHealthcareAIPrompts.get_facility_level_validation_prompt,
+                parse=self._safe_parse_json, tag=tag, group_key='fund', schema='facility_validation',
+            )
+            report.llm_review = merge_json_results([p for p in parts if isinstance(p, dict)]) or {}
+        result = report.to_dict()
+        summary = result['validation_summary']
+        print(f"   🏥 Facility levels: {summary['total_services_reviewed']} rows validated locally in "
+              f"{summary['seconds'] * 1000:.1f} ms; {summary['escalated_to_llm']} escalated to the LLM")
+        self.log_analysis_metrics(
+            f"Facility Validation: {name}", input_size=len(policy_rows), output_size=len(escalated),
+            status="SUCCESS", details=summary
+        )
+        return result
+
     def run_even_more_ai(self, policy_results: Dict, annex_results: Dict) -> Dict:
         """Optional additional analyses covering summaries, canonicalization, facility checks, alignment, equity."""
         from updated_prompts import UpdatedHealthcareAIPrompts as P
@@ -2394,36 +3113,50 @@ Focus on identifying 15-25 systematic coverage gaps that complement the existing
         policy_summary = self._summarize_policy_data(policy_df)
         annex_summary = self._summarize_annex_data(annex_df)
 
+        rule_columns = ['fund','service','scope','access_point','tariff_raw','access_rules']
+        rule_rows = canonical_records(policy_df[rule_columns].fillna("")) if not policy_df.empty else []
+
         # Section summaries for pages 1–18
         try:
-            rows = policy_df[['fund','service','scope','access_point','tariff_raw','access_rules']].fillna("") if not policy_df.empty else pd.DataFrame()
-            prompt = P.get_section_summaries_prompt(rows.head(80).to_json(orient='records'))
-            out['section_summaries'] = self._safe_parse_json_array(self._call_openai(prompt))
+            parts, _ = self._run_packed_prompt(
+                'section_summaries', rule_rows, P.get_section_summaries_prompt,
+                parse=self._safe_parse_json_array, tag="", group_key='fund',
+            )
+            out['section_summaries'] = merge_json_results(parts) or []
         except Exception as e:
             out['section_summaries_error'] = str(e)
 
-        # Canonicalization of annex procedure names
+        # Canonicalization of annex procedure names: local clustering, LLM only for ambiguous clusters
         try:
             if not annex_df.empty:
-                names = annex_df['intervention'].dropna().astype(str).head(200).tolist()
-                import json
-                prompt = P.get_name_canonicalization_prompt(json.dumps(names))
-                out['canonicalization'] = self._safe_parse_json(self._call_openai(prompt))
+                names = annex_df['intervention'].dropna().astype(str).tolist()
+                canon = canonicalize_names(names, threshold=self.canonical_threshold, margin=self.canonical_margin)
+                # One record per candidate set, so names that may merge always share a call
+                escalated = canon.escalation_groups()
+                if escalated:
+                    parts, _ = self._run_packed_prompt(
+                        'canonicalization', escalated, P.get_name_canonicalization_prompt,
+                        parse=self._safe_parse_json, tag="",
+                    )
+                    canon.apply_llm_groups((merge_json_results(parts) or {}).get('canonical_groups', []))
+                out['canonicalization'] = canon.to_dict()
+                mapping_path = canon.save_mapping(self.output_dir / 'canonical_name_map.json')
+                stats = out['canonicalization']['stats']
+                print(f"   🏷️ Canonicalized {stats['distinct_names']} names into {stats['canonical_names']} "
+                      f"locally; {stats['escalated_names']} escalated to the LLM ({mapping_path.name})")
         except Exception as e:
             out['canonicalization_error'] = str(e)
 
-        # Facility-level validation for rules
+        # Facility-level validation for rules: every row checked locally, unclear rows escalated
         try:
-            rows = policy_df[['fund','service','scope','access_point','tariff_raw','access_rules']].fillna("") if not policy_df.empty else pd.DataFrame()
-            prompt = P.get_facility_level_validation_prompt(rows.head(80).to_json(orient='records'))
-            out['facility_validation'] = self._safe_parse_json_array(self._call_openai(prompt))
+            out['facility_validation'] = self._run_facility_validation('facility_validation', rule_rows, tag="")
         except Exception as e:
             out['facility_validation_error'] = str(e)
 
         # Policy vs Annex alignment
         try:
             prompt = P.get_policy_annex_alignment_prompt(policy_summary, annex_summary)
-            out['policy_annex_alignment'] = self._safe_parse_json(self._call_openai(prompt))
+            out['policy_annex_alignment'] = self._safe_parse_json(self._call_openai(prompt, schema='policy_annex_alignment'))
         except Exception as e:
             out['policy_annex_alignment_error'] = str(e)
 
@@ -2432,29 +3165,19 @@ Focus on identifying 15-25 systematic coverage gaps that complement the existing
             coverage_summary = f"Policy entries: {len(policy_df)}; Annex procedures: {len(annex_df)}"
             county_note = "47 counties; rural 70%, urban 30%"
             prompt = P.get_equity_analysis_prompt(coverage_summary, county_note)
-            out['equity'] = self._safe_parse_json(self._call_openai(prompt))
+            out['equity'] = self._safe_parse_json(self._call_openai(prompt, schema='equity'))
         except Exception as e:
             out['equity_error'] = str(e)
 
+        out['prompt_coverage'] = {k: self.prompt_coverage[k] for k in ('section_summaries', 'canonicalization', 'facility_validation') if k in self.prompt_coverage}
         return out
 
     def _safe_parse_json(self, text: str):
-        """Parse first JSON object/array found in text; fallback to raw text."""
-        import json, re
-        s = text.strip()
-        if s.startswith('{') or s.startswith('['):
-            try:
-                return json.loads(s)
-            except Exception:
-                pass
-        # fallback: find first JSON block
-        m = re.search(r'\{[\s\S]*\}|\[[\s\S]*\]', text)
-        if m:
-            try:
-                return json.loads(m.group(0))
-            except Exception:
-                return {"raw": text}
-        return {"raw": text}
+        """Parse the main JSON object/array in text (the longest one); fallback to raw text."""
+        parsed = largest_json_value(text or "")
+        if parsed is None:
+            return {"raw": text}
+        return parsed
 
     def _safe_parse_json_array(self, text: str):
         """Ensure we return a list from AI responses."""
@@ -2468,18 +3191,24 @@ Focus on identifying 15-25 systematic coverage gaps that complement the existing
                     return parsed[k]
         return []
 
+    def _frame_fingerprint(self, df: pd.DataFrame) -> str:
+        """Order-independent content hash of an extracted table."""
+        if df is None or df.empty:
+            return "empty"
+        return records_fingerprint(df)
+
     def _summarize_policy_data(self, policy_df: pd.DataFrame) -> str:
         """Create summary of policy data for AI analysis"""
         if policy_df.empty:
             return "No policy data extracted"
         
         # Filter out empty values and count non-empty entries
-        funds = policy_df[policy_df['fund'] != '']['fund'].value_counts().head(5)
-        services = policy_df[policy_df['service'] != '']['service'].value_counts().head(10)
+        funds = stable_value_counts(policy_df[policy_df['fund'] != '']['fund'], top=5)
+        services = stable_value_counts(policy_df[policy_df['service'] != '']['service'], top=10)
         
         # Include scope items and access points for analysis - adapted for user's data structure
         scope_items = policy_df[policy_df['scope'] != '']['scope'].head(5).tolist() if 'scope' in policy_df.columns else []
-        access_points = policy_df[policy_df['access_point'] != '']['access_point'].value_counts().head(5) if 'access_point' in policy_df.columns else []
+        access_points = stable_value_counts(policy_df[policy_df['access_point'] != '']['access_point'], top=5) if 'access_point' in policy_df.columns else {}
         
         # Count entries with tariffs - use user's tariff_num field
         tariff_entries = len(policy_df[policy_df['tariff_num'].notna() & (policy_df['tariff_num'] > 0)]) if 'tariff_num' in policy_df.columns else 0
@@ -2507,11 +3236,11 @@ Focus on identifying 15-25 systematic coverage gaps that complement the existing
         if annex_df.empty:
             return "No annex data extracted"
             
-        specialties = annex_df['specialty'].value_counts()
+        specialties = stable_value_counts(annex_df['specialty'])
         tariffs = annex_df['tariff'].dropna()
         
         summary = f"Annex Procedures: {len(annex_df)} total\n"
-        summary += f"Specialties ({len(specialties)}): {dict(specialties.head(10))}\n"
+        summary += f"Specialties ({len(specialties)}): {dict(list(specialties.items())[:10])}\n"
         
         if len(tariffs) > 0:
             summary += f"Tariff Range: KES {tariffs.min():,.0f} - {tariffs.max():,.0f}\n"
@@ -2521,35 +3250,18 @@ Focus on identifying 15-25 systematic coverage gaps that complement the existing
 
     def _extract_ai_contradictions(self, analysis_text: str) -> List[Dict]:
         """Extract contradictions from AI analysis (JSON format)"""
-        contradictions = []
+        # Schema-valid structured output needs no salvage
+        contradictions = structured_items(analysis_text, get_schema('contradictions'))
+        if contradictions is None:
+            # Legacy/free-form text: every JSON value, {"contradictions": [...]}, or bare items
+            contradictions = collect_items(
+                analysis_text or "", 'contradictions',
+                is_item=lambda obj: bool(obj.get('contradiction_type'))
+            )
         
-        try:
-            # Try to parse as JSON first
-            import json
-            if analysis_text.strip().startswith('[') or analysis_text.strip().startswith('{'):
-                parsed = json.loads(analysis_text.strip())
-                if isinstance(parsed, list):
-                    contradictions = parsed
-                elif isinstance(parsed, dict) and 'contradictions' in parsed:
-                    contradictions = parsed['contradictions']
-            else:
-                # Fallback: extract JSON arrays/objects from text
-                json_pattern = r'\[[\s\S]*?\]|\{[\s\S]*?\}'
-                json_matches = re.findall(json_pattern, analysis_text)
-                for match in json_matches:
-                    try:
-                        parsed = json.loads(match)
-                        if isinstance(parsed, list) and parsed:
-                            contradictions.extend(parsed)
-                        elif isinstance(parsed, dict) and parsed.get('contradiction_type'):
-                            contradictions.append(parsed)
-                    except:
-                        continue
-        except Exception as e:
-            print(f"   ⚠️ JSON parsing failed, using text fallback: {e}")
-            
+        if not contradictions:
             # Original text-based parsing as fallback
-            contradictions_section = re.search(r'CONTRADICTIONS:.*?(?=\n[A-Z]+:|$)', analysis_text, re.DOTALL | re.IGNORECASE)
+            contradictions_section = re.search(r'CONTRADICTIONS:.*?(?=\n[A-Z]+:|$)', analysis_text or "", re.DOTALL | re.IGNORECASE)
             if contradictions_section:
                 lines = contradictions_section.group(0).split('\n')
                 for line in lines[1:]:  # Skip header
@@ -2569,45 +3281,24 @@ Focus on identifying 15-25 systematic coverage gaps that complement the existing
 
     def _extract_ai_gaps(self, analysis_text: str) -> List[Dict]:
         """Extract gaps from AI analysis - Enhanced to handle both JSON and conversational formats"""
-        gaps = []
-        
         try:
-            # Try to parse as JSON first
-            import json
-            if analysis_text.strip().startswith('[') or analysis_text.strip().startswith('{'):
-                parsed = json.loads(analysis_text.strip())
-                if isinstance(parsed, list):
-                    gaps = parsed
-                elif isinstance(parsed, dict) and 'gaps' in parsed:
-                    gaps = parsed['gaps']
-                    
-            else:
-                # Look for JSON arrays/objects embedded in text
-                json_pattern = r'\[[\s\S]*?\]|\{[\s\S]*?\}'
-                json_matches = re.findall(json_pattern, analysis_text)
-                for match in json_matches:
-                    try:
-                        parsed = json.loads(match)
-                        if isinstance(parsed, list) and parsed:
-                            # Only add dict items from the list
-                            gaps.extend([item for item in parsed if isinstance(item, dict)])
-                        elif isinstance(parsed, dict) and (
-                            'gap_type' in parsed or
-                            'gap_id' in parsed or
-                            'gap_category' in parsed or
-                            'missing' in parsed.get('description', '').lower()
-                        ):
-                            gaps.append(parsed)
-                    except:
-                        continue
-                        
-            # If JSON parsing found gaps, return them
+            gaps = structured_items(analysis_text, get_schema('gaps'))
+            if gaps is not None:
+                print(f"   📋 Extracted {len(gaps)} AI gaps from structured output")
+                return gaps
+            # Legacy/free-form text: every JSON value, {"gaps": [...]}, or bare gap objects
+            gaps = collect_items(
+                analysis_text or "", 'gaps',
+                is_item=lambda obj: (
+                    'gap_type' in obj or
+                    'gap_id' in obj or
+                    'gap_category' in obj or
+                    'missing' in str(obj.get('description', '')).lower()
+                )
+            )
             if gaps:
                 print(f"   📋 Extracted {len(gaps)} AI gaps from JSON")
-                return gaps
-
-            # No gaps found in JSON parsing
-            return []
+            return gaps
 
         except Exception as e:
             print(f"   ❌ Error parsing AI gaps: {e}")
@@ -3099,12 +3790,7 @@ OUTPUT FORMAT (JSON only, no other text):
 
             # Call OpenAI for deduplication
             if self.client:
-                response = self.client.chat.completions.create(
-                    model=self.primary_model,
-                    messages=[{"role": "user", "content": dedup_prompt}]
-                )
-                
-                dedup_analysis = response.choices[0].message.content
+                dedup_analysis = self._call_openai(dedup_prompt, tag="gap_deduplication", schema='gap_deduplication')
                 print(f"📋 OpenAI deduplication analysis received ({len(dedup_analysis)} chars)")
                 
                 # Parse the deduplication results
@@ -3141,11 +3827,12 @@ OUTPUT FORMAT (JSON only, no other text):
         """Parse OpenAI deduplication response and return clean gap list"""
         
         try:
-            # Try to extract JSON from the response
-            import re
-            json_match = re.search(r'\{.*\}', openai_response, re.DOTALL)
-            if json_match:
-                dedup_data = json.loads(json_match.group())
+            # Schema-valid structured output first; legacy text falls back to the JSON object regex
+            dedup_data, errors = validate_response(openai_response, get_schema('gap_deduplication'))
+            if errors:
+                json_match = re.search(r'\{.*\}', openai_response, re.DOTALL)
+                dedup_data = json.loads(json_match.group()) if json_match else None
+            if dedup_data is not None:
                 
                 # Create mapping from original gap IDs to gap objects
                 id_to_gap = {f"gap_{i+1}": gap['original_data'] for i, gap in enumerate(original_gaps)}
@@ -3271,12 +3958,12 @@ OUTPUT FORMAT (JSON only, no other text):
             annex_df = annex_results.get('procedures', pd.DataFrame())
             if not annex_df.empty:
                 annex_summary = f"Extracted {len(annex_df)} procedures across {annex_df['specialty'].nunique()} specialties"
-                sample_rows = annex_df.head(5).to_dict('records')
-                
-                annex_quality_prompt = UpdatedHealthcareAIPrompts.get_annex_quality_prompt(
-                    annex_summary, json.dumps(sample_rows, indent=2)
+                texts, _ = self._run_packed_prompt(
+                    'annex_quality_extended', canonical_records(annex_df),
+                    lambda rows_json: UpdatedHealthcareAIPrompts.get_annex_quality_prompt(annex_summary, rows_json),
+                    tag="annex_quality", group_key='specialty',
                 )
-                annex_quality = self._call_openai(annex_quality_prompt, tag="annex_quality")
+                annex_quality = "\n\n".join(texts)
                 extended_results['annex_quality'] = annex_quality
                 print(f"      ✅ Annex quality analysis complete")
             
@@ -3317,7 +4004,7 @@ OUTPUT FORMAT (JSON only, no other text):
             }
             
             recommendations_prompt = UpdatedHealthcareAIPrompts.get_strategic_policy_recommendations_prompt(
-                json.dumps(analysis_data, indent=2)
+                canonical_json(analysis_data, indent=2)
             )
             recommendations = self._call_openai(recommendations_prompt, tag="policy_recommendations")
             extended_results['strategic_recommendations'] = recommendations
@@ -3326,34 +4013,40 @@ OUTPUT FORMAT (JSON only, no other text):
             print("   🏥 Running facility level validation...")
             # 5. Facility Level Validation - Kenya's 6-tier system
             if not policy_df.empty:
-                policy_sample = policy_df.head(10).to_dict('records')
-                facility_prompt = UpdatedHealthcareAIPrompts.get_facility_level_validation_prompt(
-                    json.dumps(policy_sample, indent=2)
+                extended_results['facility_level_validation'] = self._run_facility_validation(
+                    'facility_validation_extended', canonical_records(policy_df), tag="facility_validation"
                 )
-                facility_validation = self._call_openai(facility_prompt, tag="facility_validation")
-                extended_results['facility_level_validation'] = facility_validation
                 print(f"      ✅ Facility validation complete")
             
             print("   💰 Running tariff outlier analysis...")
-            # 6. Tariff Outlier Analysis  
+            # 6. Tariff Outlier Analysis - scored locally per specialty, LLM explains the top-N flags
             if not annex_df.empty and 'tariff' in annex_df.columns:
-                tariffs = annex_df['tariff'].dropna()
-                if len(tariffs) > 0:
-                    tariff_stats = {
-                        'count': len(tariffs),
-                        'min': float(tariffs.min()),
-                        'max': float(tariffs.max()), 
-                        'mean': float(tariffs.mean()),
-                        'std': float(tariffs.std())
-                    }
-                    
-                    tariff_prompt = UpdatedHealthcareAIPrompts.get_tariff_outlier_prompt(
-                        json.dumps(tariff_stats, indent=2)
-                    )
+                codes, specialties = pd.factorize(annex_df['specialty'].fillna("").astype(str))
+                report = detect_tariff_outliers(
+                    pd.to_numeric(annex_df['tariff'], errors='coerce').to_numpy(dtype=float), codes,
+                    procedures=annex_df['intervention'].fillna("").to_numpy() if 'intervention' in annex_df.columns else None,
+                    specialty_names=list(specialties), z_threshold=self.outlier_z_threshold,
+                )
+                outlier_summary = report.to_dict(self.outlier_top_n)
+                extended_results['tariff_outlier_scores'] = outlier_summary
+                self.log_analysis_metrics(
+                    "Tariff Outliers", input_size=len(annex_df), output_size=len(report),
+                    status="SUCCESS", details=outlier_summary['summary']
+                )
+                if len(report):
+                    flagged = outlier_summary['flagged']
+                    flagged_specialties = {row['specialty'] for row in flagged}
+                    tariff_prompt = UpdatedHealthcareAIPrompts.get_tariff_outlier_prompt(canonical_json({
+                        'flagged': flagged,
+                        'specialty_stats': [s for s in outlier_summary['specialty_stats']
+                                            if s['specialty'] in flagged_specialties],
+                    }, indent=2))
                     tariff_outliers = self._call_openai(tariff_prompt, tag="tariff_outliers")
                     extended_results['tariff_outliers'] = tariff_outliers
-                    print(f"      ✅ Tariff outlier analysis complete")
+                print(f"      ✅ Tariff outlier analysis complete ({len(report)} flagged, "
+                      f"{len(outlier_summary['flagged'])} sent for explanation)")
             
+            extended_results['prompt_coverage'] = dict(self.prompt_coverage)
             print("   🎯 All extended analyses complete!")
             return extended_results
             
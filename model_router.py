@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Model Router - Shared primary/fallback routing for OpenAI chat completions
+Used by the integrated analyzer, the pattern analyzer and the Streamlit app.
+
+Instead of waiting for the primary model to raise before trying the fallback:
+- per-model latency is tracked over a sliding window
+- the fallback is started as a hedge once the primary passes its p95 latency
+- a circuit breaker skips a model that keeps failing for a cool-down period,
+  then lets a single trial call through
+- every routing decision is recorded with its elapsed time
+
+A hedge that loses the race keeps running in the pool. Its elapsed time at
+abandonment is recorded as a (censored) latency sample so p95 does not drift
+below the model's real tail, and send() can check attempt_abandoned() to skip
+side effects such as caching an answer nobody used.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+
+class AllModelsFailed(Exception):
+    """Every candidate model failed for one routed request (fallback already attempted)"""
+
+
+class LatencyTracker:
+    """Sliding window of call latencies for one model (abandoned calls count with their elapsed time)"""
+
+    def __init__(self, window: int = 50):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            data = sorted(self.samples)
+        if not data:
+            return None
+        idx = min(len(data) - 1, max(0, int(round(pct / 100.0 * (len(data) - 1)))))
+        return data[idx]
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self.samples)
+
+
+class CircuitBreaker:
+    """Opens after N consecutive failures; allows one trial call at a time after the cool-down"""
+
+    def __init__(self, failure_threshold: int = 3, cooldown_seconds: float = 120.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.time()
+            if now - self.opened_at < self.cooldown_seconds:
+                return False
+            # Half-open: a single trial call; concurrent callers keep skipping the model until
+            # it reports back (a probe that never does expires after another cool-down)
+            if self.probe_started is not None and now - self.probe_started < self.cooldown_seconds:
+                return False
+            self.probe_started = now
+            return True
+
+    def release_probe(self) -> None:
+        """Give back a trial call that was not sent or was abandoned, without judging the model."""
+        with self._lock:
+            self.probe_started = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.probe_started = None
+
+    def record_failure(self) -> bool:
+        """Returns True if this failure opened (or re-opened) the circuit."""
+        with self._lock:
+            self.probe_started = None
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.time()
+                return True
+            return False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.time() - self.opened_at >= self.cooldown_seconds:
+                return "half_open"
+            return "open"
+
+
+_attempt = threading.local()
+
+
+def attempt_abandoned() -> bool:
+    """True inside a hedged send() once the router has returned another model's answer."""
+    event = getattr(_attempt, 'abandoned', None)
+    return event is not None and event.is_set()
+
+
+@dataclass
+class RouteResult:
+    """Outcome of one routed request"""
+    value: Any
+    model: str
+    fallback_used: bool
+    hedged: bool
+    latency_ms: float
+    decisions: List[Dict] = field(default_factory=list)
+
+
+class ModelRouter:
+    """Routes a request across an ordered list of models (primary first)"""
+
+    def __init__(self, models: Sequence[str], hedge: bool = None, hedge_percentile: float = 95.0,
+                 min_samples: int = 5, default_hedge_seconds: float = None,
+                 failure_threshold: int = None, cooldown_seconds: float = None, max_workers: int = 8):
+        self.models = list(models)
+        self.hedge = hedge if hedge is not None else os.getenv('SHIF_AI_HEDGE', 'true').lower() in ('1', 'true', 'yes')
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.default_hedge_seconds = default_hedge_seconds if default_hedge_seconds is not None else float(os.getenv('SHIF_AI_HEDGE_AFTER_SECONDS', '90'))
+        failure_threshold = failure_threshold or int(os.getenv('SHIF_AI_BREAKER_FAILURES', '3'))
+        cooldown_seconds = cooldown_seconds if cooldown_seconds is not None else float(os.getenv('SHIF_AI_BREAKER_COOLDOWN_SECONDS', '120'))
+        self.latency = {m: LatencyTracker() for m in self.models}
+        self.breakers = {m: CircuitBreaker(failure_threshold, cooldown_seconds) for m in self.models}
+        self.decision_log: Deque[Dict] = deque(maxlen=500)
+        self.last_errors: Dict[str, str] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-router")
+
+    # ---------- introspection ----------
+
+    def hedge_after(self, model: str) -> Optional[float]:
+        """Seconds to wait on a model before hedging (p95 once enough samples exist)."""
+        tracker = self.latency[model]
+        if tracker.count() >= self.min_samples:
+            return tracker.percentile(self.hedge_percentile)
+        return self.default_hedge_seconds
+
+    def health(self) -> Dict[str, Dict]:
+        return {
+            m: {
+                'circuit': self.breakers[m].state,
+                'consecutive_failures': self.breakers[m].consecutive_failures,
+                'samples': self.latency[m].count(),
+                'p50_seconds': self.latency[m].percentile(50),
+                'p95_seconds': self.latency[m].percentile(95),
+                'last_error': self.last_errors.get(m),
+            }
+            for m in self.models
+        }
+
+    # ---------- routing ----------
+
+    def route(self, send: Callable[[str], Any], hedge: bool = None) -> RouteResult:
+        """Call send(model) with hedging/fallback; raises if every model fails.
+
+        With hedge=False (e.g. streamed calls that emit partial output) models are
+        tried one at a time in the caller's thread instead of on the pool.
+        """
+        hedge = self.hedge if hedge is None else hedge
+        started = time.time()
+        decisions: List[Dict] = []
+
+        def note(event: str, model: str = "", **extra) -> None:
+            entry = {'timestamp': datetime.now().isoformat(), 'elapsed_ms': round((time.time() - started) * 1000, 1),
+                     'event': event, 'model': model}
+            entry.update(extra)
+            decisions.append(entry)
+            self.decision_log.append(entry)
+
+        candidates = []
+        for m in self.models:
+            if self.breakers[m].allow():
+                candidates.append(m)
+            else:
+                note('skip_open_circuit', m)
+        if not candidates:
+            # Every circuit is open: try them all rather than fail without a request
+            candidates = list(self.models)
+            note('all_circuits_open')
+
+        def timed_call(model: str, abandoned: threading.Event = None) -> Tuple[Any, float]:
+            t0 = time.time()
+            _attempt.abandoned = abandoned
+            try:
+                value = send(model)
+            finally:
+                _attempt.abandoned = None
+            return value, time.time() - t0
+
+        pending: Dict[Any, str] = {}
+        launched: Dict[Any, Tuple[float, threading.Event]] = {}
+        errors: Dict[str, str] = {}
+        queue = list(candidates)
+        hedged = False
+
+        def failed(model: str, error: Exception) -> None:
+            errors[model] = str(error)
+            self.last_errors[model] = str(error)[:300]
+            opened = self.breakers[model].record_failure()
+            note('failure', model, error=str(error)[:200], circuit_opened=opened)
+
+        def succeeded(model: str, value: Any, seconds: float) -> RouteResult:
+            self.latency[model].record(seconds)
+            self.breakers[model].record_success()
+            self.last_errors.pop(model, None)
+            note('success', model, call_seconds=round(seconds, 2))
+            return RouteResult(
+                value=value, model=model, fallback_used=model != self.models[0], hedged=hedged,
+                latency_ms=round((time.time() - started) * 1000, 1), decisions=decisions,
+            )
+
+        def abandon_pending() -> None:
+            # The losers' true latency is at least their elapsed time; dropping it would pull p95 down
+            censored = {}
+            for future, model in pending.items():
+                launched_at, abandoned = launched[future]
+                abandoned.set()
+                censored[model] = time.time() - launched_at
+                self.latency[model].record(censored[model])
+                self.breakers[model].release_probe()
+            note('abandon_slower', ", ".join(pending.values()),
+                 censored_seconds={m: round(s, 2) for m, s in censored.items()})
+
+        def launch(reason: str, **extra) -> None:
+            model = queue.pop(0)
+            abandoned = threading.Event()
+            future = self._executor.submit(timed_call, model, abandoned)
+            pending[future] = model
+            launched[future] = (time.time(), abandoned)
+            note(reason, model, **extra)
+
+        try:
+            if not hedge:
+                while queue:
+                    model = queue.pop(0)
+                    note('start' if not errors else 'fallback', model)
+                    try:
+                        value, seconds = timed_call(model)
+                    except Exception as e:
+                        failed(model, e)
+                        continue
+                    return succeeded(model, value, seconds)
+                raise AllModelsFailed("All models failed. " + "; ".join(f"{m}: {e}" for m, e in errors.items()))
+
+            launch('start')
+            while pending:
+                timeout = None
+                if queue and len(pending) == 1:
+                    current = next(iter(pending.values()))
+                    timeout = self.hedge_after(current)
+                done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    launch('hedge', threshold_seconds=round(timeout, 2))
+                    continue
+                for future in done:
+                    model = pending.pop(future)
+                    try:
+                        value, seconds = future.result()
+                    except Exception as e:
+                        failed(model, e)
+                        if queue and not pending:
+                            launch('fallback')
+                        continue
+                    if pending:
+                        abandon_pending()
+                    return succeeded(model, value, seconds)
+            raise AllModelsFailed("All models failed. " + "; ".join(f"{m}: {e}" for m, e in errors.items()))
+        finally:
+            # Trial calls granted to candidates that were never sent
+            for m in queue:
+                self.breakers[m].release_probe()
+
+
+_routers: Dict[Tuple[str, ...], ModelRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def get_model_router(*models: str) -> ModelRouter:
+    """Process-wide router per model list, so latency/breaker state is shared."""
+    key = tuple(models)
+    with _routers_lock:
+        if key not in _routers:
+            _routers[key] = ModelRouter(models)
+        return _routers[key]
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Name Canonicalizer - Local clustering of near-duplicate procedure names
+Used by the integrated analyzer instead of sending every annex intervention
+name to get_name_canonicalization_prompt.
+
+Names are normalised (case, punctuation, spacing, a few spelling variants),
+blocked by character trigrams so only names sharing grams are compared, and
+linked with union-find when their trigram similarity reaches the threshold.
+Names whose numbers (level 4 / level 5, type II / type III), side
+(left / right) or negation (with / without) differ are never linked, however
+similar the rest of the text is. Each cluster's canonical form is its most frequent spelling. Clusters whose
+weakest member is within `margin` of the threshold, and pairs that just
+missed it, are the only names escalated to the LLM, one candidate set per
+record so a set is never split across calls; its groups are then applied on
+top of the local ones, under the same number/side/negation guard.
+
+The result is a name -> canonical lookup table (mapping(), save_mapping) that
+can be reused for later joins; to_dict() lists it as name/canonical rows.
+"""
+
+import json
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_MARGIN = 0.1
+MAX_BLOCK_SIZE = 300  # trigrams shared by more names than this are too common to block on
+
+_PUNCT_RE = re.compile(r"[^a-z0-9]+")
+# British/American and common clinical spelling variants folded before comparison
+_VARIANTS = (
+    ('haemo', 'hemo'), ('oesoph', 'esoph'), ('paed', 'ped'), ('orthopaed', 'orthoped'),
+    ('caesarean', 'cesarean'), ('anaes', 'anes'), ('tumour', 'tumor'), ('foetal', 'fetal'),
+)
+_DROP_TOKENS = frozenset({'of', 'the', 'and', 'for', 'with', 'a', 'an', 'to', 'in', 'on'})
+_DIGITS_RE = re.compile(r"\d+")
+# Tokens that make two otherwise similar names different procedures ('with' is a filler word,
+# so "with X" vs "without X" differ by the negation token alone)
+# ('x' is left out: it is the x of "x-ray" far more often than the numeral)
+_ROMAN_TOKENS = frozenset({'i', 'ii', 'iii', 'iv', 'v', 'vi', 'vii', 'viii', 'ix'})
+_LATERAL_TOKENS = frozenset({'left', 'right', 'bilateral', 'unilateral'})
+_NEGATION_TOKENS = frozenset({'without', 'non', 'no', 'not'})
+
+
+def normalize_name(name: str) -> str:
+    """Lower-case, variant-folded tokens without punctuation or filler words."""
+    text = (name or "").lower()
+    for old, new in _VARIANTS:
+        text = text.replace(old, new)
+    tokens = [t for t in _PUNCT_RE.split(text) if t and t not in _DROP_TOKENS]
+    return " ".join(tokens)
+
+
+def distinguishing_tokens(normalized: str) -> frozenset:
+    """Numbers, roman numerals, side and negation tokens of a normalised name; names that differ here never merge."""
+    tokens = normalized.split()
+    marks = {t for t in tokens if t in _ROMAN_TOKENS or t in _LATERAL_TOKENS or t in _NEGATION_TOKENS}
+    return frozenset(marks | {str(int(d)) for d in _DIGITS_RE.findall(normalized)})
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    """Jaccard similarity of two trigram sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+@dataclass
+class NameCluster:
+    """One canonical name, its spellings and how sure the local pass is"""
+    canonical: str
+    members: List[str]
+    confidence: float
+    source: str = "local"
+    notes: str = ""
+
+
+@dataclass
+class CanonicalizationResult:
+    clusters: List[NameCluster]
+    threshold: float
+    margin: float
+    total_names: int
+    near_misses: List[Tuple[str, str, float]] = field(default_factory=list)
+    comparisons: int = 0
+    blocked_pairs: int = 0
+    llm_groups_applied: int = 0
+    llm_members_rejected: int = 0
+
+    def mapping(self) -> Dict[str, str]:
+        return {member: c.canonical for c in self.clusters for member in c.members}
+
+    def ambiguous_clusters(self) -> List[NameCluster]:
+        return [c for c in self.clusters if len(c.members) > 1 and c.confidence < self.threshold + self.margin]
+
+    def escalation_groups(self) -> List[List[str]]:
+        """Candidate sets to escalate together: low-confidence clusters and near-miss pairs, overlapping sets joined.
+
+        Each set is one unit for the LLM, so names it may merge are always seen in the same call.
+        """
+        by_member = {m: c for c in self.clusters for m in c.members}
+        candidates = [c.members for c in self.ambiguous_clusters()]
+        candidates += [by_member[a].members + by_member[b].members for a, b, _ in self.near_misses]
+        groups: List[List[str]] = []
+        group_of: Dict[str, int] = {}
+        for candidate in candidates:
+            joined = sorted({group_of[n] for n in candidate if n in group_of})
+            if joined:
+                target = joined[0]
+                for other in joined[1:]:
+                    for name in groups[other]:
+                        group_of[name] = target
+                    groups[target].extend(groups[other])
+                    groups[other] = []
+            else:
+                target = len(groups)
+                groups.append([])
+            for name in candidate:
+                if name not in group_of:
+                    group_of[name] = target
+                    groups[target].append(name)
+        return [g for g in groups if g]
+
+    def ambiguous_names(self) -> List[str]:
+        """Names to escalate: members of low-confidence clusters and both sides of near misses."""
+        return [name for group in self.escalation_groups() for name in group]
+
+    def apply_llm_groups(self, groups: Iterable[Dict]) -> int:
+        """Re-cluster escalated names as the LLM grouped them; returns the groups applied.
+
+        The local guard still holds: a member whose numbers, side or negation differ
+        from the proposed canonical name keeps its local cluster.
+        """
+        by_member = {m: c for c in self.clusters for m in c.members}
+        applied = 0
+        for group in groups or []:
+            if not isinstance(group, dict):
+                continue
+            canonical = str(group.get('canonical') or "").strip()
+            marks = distinguishing_tokens(normalize_name(canonical))
+            proposed = [m for m in group.get('members') or [] if m in by_member]
+            members = [m for m in proposed if distinguishing_tokens(normalize_name(m)) == marks]
+            self.llm_members_rejected += len(proposed) - len(members)
+            if not members or not canonical:
+                continue
+            for member in members:
+                old = by_member[member]
+                old.members.remove(member)
+            cluster = NameCluster(canonical, members, 1.0, source="llm", notes=str(group.get('notes') or ""))
+            self.clusters.append(cluster)
+            for member in members:
+                by_member[member] = cluster
+            applied += 1
+        self.clusters = [c for c in self.clusters if c.members]
+        self.llm_groups_applied += applied
+        return applied
+
+    def to_dict(self) -> Dict:
+        multi = [c for c in self.clusters if len(c.members) > 1]
+        return {
+            'canonical_groups': [{'canonical': c.canonical, 'members': c.members, 'confidence': round(c.confidence, 3),
+                                  'source': c.source, 'notes': c.notes} for c in multi],
+            'mapping': [{'name': name, 'canonical': canonical} for name, canonical in sorted(self.mapping().items())],
+            'stats': {
+                'names': self.total_names,
+                'distinct_names': sum(len(c.members) for c in self.clusters),
+                'canonical_names': len(self.clusters),
+                'merged_groups': len(multi),
+                'comparisons': self.comparisons,
+                'blocked_pairs': self.blocked_pairs,
+                'escalated_names': len(self.ambiguous_names()),
+                'llm_groups_applied': self.llm_groups_applied,
+                'llm_members_rejected': self.llm_members_rejected,
+                'threshold': self.threshold,
+                'margin': self.margin,
+            },
+        }
+
+    def save_mapping(self, path) -> Path:
+        """Write the name -> canonical lookup table as JSON."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.mapping(), f, indent=2, ensure_ascii=False, sort_keys=True)
+        return path
+
+
+def load_mapping(path) -> Dict[str, str]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def canonicalize_names(names: Iterable[str], threshold: float = DEFAULT_THRESHOLD,
+                       margin: float = DEFAULT_MARGIN) -> CanonicalizationResult:
+    """Cluster all names locally (no API calls)."""
+    counts = Counter(n.strip() for n in names if n and str(n).strip())
+    distinct = sorted(counts)
+    normalized = [normalize_name(n) for n in distinct]
+    grams = [trigrams(n) for n in normalized]
+    marks = [distinguishing_tokens(n) for n in normalized]
+
+    # Identical normal forms merge outright; the rest are compared within trigram blocks
+    uf = _UnionFind(len(distinct))
+    first_by_norm: Dict[str, int] = {}
+    for i, norm in enumerate(normalized):
+        if norm in first_by_norm:
+            uf.union(first_by_norm[norm], i)
+        else:
+            first_by_norm[norm] = i
+    reps = sorted(first_by_norm.values())
+    blocks: Dict[str, List[int]] = defaultdict(list)
+    for i in reps:
+        for g in grams[i]:
+            blocks[g].append(i)
+
+    compared: Set[Tuple[int, int]] = set()
+    near: Dict[Tuple[int, int], float] = {}
+    blocked = 0
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > MAX_BLOCK_SIZE:
+            continue
+        for x in range(len(members)):
+            for y in range(x + 1, len(members)):
+                pair = (members[x], members[y])
+                if pair in compared:
+                    continue
+                compared.add(pair)
+                sim = similarity(grams[pair[0]], grams[pair[1]])
+                if marks[pair[0]] != marks[pair[1]]:
+                    # Same text, different level/side/negation: distinct procedures (every cluster
+                    # member shares its marks, so chains through other names cannot merge them either)
+                    blocked += sim >= threshold - margin
+                    continue
+                if sim >= threshold:
+                    uf.union(*pair)
+                elif sim >= threshold - margin:
+                    near[pair] = sim
+
+    groups: Dict[int, List[int]] = defaultdict(list)
+    for i in range(len(distinct)):
+        groups[uf.find(i)].append(i)
+    clusters = []
+    for idxs in groups.values():
+        canonical_idx = max(idxs, key=lambda i: (counts[distinct[i]], -len(distinct[i]), distinct[i]))
+        confidence = min(similarity(grams[i], grams[canonical_idx]) for i in idxs)
+        clusters.append(NameCluster(distinct[canonical_idx], [distinct[i] for i in sorted(idxs)], confidence))
+    clusters.sort(key=lambda c: c.canonical)
+
+    near_misses = [(distinct[a], distinct[b], round(s, 3)) for (a, b), s in sorted(near.items())
+                   if uf.find(a) != uf.find(b)]
+    return CanonicalizationResult(clusters, threshold, margin, total_names=sum(counts.values()),
+                                  near_misses=near_misses, comparisons=len(compared), blocked_pairs=blocked)
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Offline LLM Backend - Local stand-in for the OpenAI chat-completions client
+Lets the analyzers, the Streamlit app and perf tests run without network.
+
+OfflineChatClient exposes client.chat.completions.create(model=..., messages=...,
+stream=...) with the same response shape the analyzers read. Responses come from:
+- replay: the AI response store (exact prompt match, else a deterministic sample)
+- synthetic: a generator that follows the JSON example/schema embedded in the prompt
+- auto: replay on an exact prompt match, synthetic otherwise
+
+Latency, jitter and error rate are configurable so pipelines can be load-tested.
+Prompt-prefix caching is simulated for prompts laid out with a static prefix
+before RUN_DATA_MARKER: a repeated prefix of at least 1024 tokens is reported
+as usage.prompt_tokens_details.cached_tokens (in 128-token steps).
+Selected with SHIF_AI_BACKEND=offline (see config.get_offline_backend_settings).
+
+serve_chat_completions() puts a client behind a local OpenAI-compatible HTTP
+endpoint (POST .../chat/completions, non-streaming), so provider routing can be
+exercised against stand-in servers with real HTTP clients:
+    python offline_llm_backend.py serve --port 8011 --latency-ms 300
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+from ai_json_utils import extract_json_values
+from ai_response_store import AIResponseStore, prompt_hash
+from prompt_fingerprint import canonicalize_prompt
+from prompt_packer import count_tokens
+from updated_prompts import RUN_DATA_MARKER
+
+_SCHEMA_CUE_RE = re.compile(r"schema|format|return|respond|example|output", re.IGNORECASE)
+_TRAILING_NUMBER_RE = re.compile(r"[_-]?\d+$")
+PREFIX_CACHE_MIN_TOKENS = 1024
+PREFIX_CACHE_STEP_TOKENS = 128
+_SIMULATED_ERRORS = (
+    "Error code: 429 - simulated rate limit exceeded",
+    "Error code: 500 - simulated server error",
+    "Request timed out (simulated)",
+)
+
+
+class OfflineBackendError(Exception):
+    """Simulated API failure raised according to the configured error rate"""
+
+
+def _prompt_text(messages: List[Dict]) -> str:
+    return "\n".join(str(m.get('content', '')) for m in messages or [])
+
+
+def find_response_schema(prompt: str) -> Any:
+    """The JSON example the prompt asks for: the largest value after the last schema cue.
+
+    Per-run data after RUN_DATA_MARKER (rows, summaries) is never the schema.
+    """
+    prompt = prompt.split(RUN_DATA_MARKER, 1)[0]
+    spans = extract_json_values(prompt)
+    if not spans:
+        return None
+    cues = [m.end() for m in _SCHEMA_CUE_RE.finditer(prompt)]
+    after_cue = [s for s in spans if cues and s.start >= cues[-1]] or [
+        s for s in spans if any(c <= s.start for c in cues)
+    ]
+    candidates = after_cue or spans
+    return max(candidates, key=lambda s: s.end - s.start).value
+
+
+def synthesize_from_schema(schema: Any, rng: random.Random, min_items: int = 3, max_items: int = 8) -> Any:
+    """Fill a JSON example: arrays of objects get several items with distinct ids."""
+    if isinstance(schema, list):
+        templates = [t for t in schema if isinstance(t, dict)]
+        if not templates:
+            return copy.deepcopy(schema)
+        return [_vary_item(templates[i % len(templates)], i + 1, rng, min_items, max_items)
+                for i in range(rng.randint(min_items, max_items))]
+    if isinstance(schema, dict):
+        return {k: synthesize_from_schema(v, rng, min_items, max_items) if isinstance(v, (list, dict)) else v
+                for k, v in schema.items()}
+    return schema
+
+
+def _vary_item(template: Dict, index: int, rng: random.Random, min_items: int, max_items: int) -> Dict:
+    item = {}
+    for key, value in template.items():
+        if isinstance(value, str) and (key == 'id' or key.endswith('_id')):
+            prefix = _TRAILING_NUMBER_RE.sub('', value) or 'ITEM'
+            item[key] = f"{prefix}_{index:03d}"
+        elif isinstance(value, (list, dict)):
+            item[key] = synthesize_from_schema(value, rng, 1, max(1, max_items // 3))
+        else:
+            item[key] = value
+    return item
+
+
+class _Completions:
+    def __init__(self, backend: "OfflineChatClient"):
+        self._backend = backend
+
+    def create(self, model: str, messages: List[Dict], stream: bool = False, **kwargs):
+        return self._backend.create(model=model, messages=messages, stream=stream, **kwargs)
+
+
+class OfflineChatClient:
+    """Drop-in for openai.OpenAI() as used by this repo (chat.completions.create only)"""
+
+    def __init__(self, mode: str = "auto", latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 42, replay_db: str = None,
+                 store: AIResponseStore = None, stream_chunk_chars: int = 24):
+        self.mode = mode
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.seed = seed
+        self.stream_chunk_chars = stream_chunk_chars
+        self._replay_db = replay_db
+        self._store = store
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self._seen_prefixes = set()
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def __bool__(self) -> bool:
+        return True
+
+    @property
+    def store(self) -> AIResponseStore:
+        if self._store is None:
+            self._store = AIResponseStore(db_path=self._replay_db)
+        return self._store
+
+    # ---------- response content ----------
+
+    def respond(self, model: str, prompt: str) -> Dict:
+        """Pick content for a prompt: {'content', 'source'}."""
+        if self.mode in ("replay", "auto"):
+            for candidate in (canonicalize_prompt(prompt), prompt):
+                content = self.store.find_by_prompt_hash(prompt_hash(candidate), model) \
+                    or self.store.find_by_prompt_hash(prompt_hash(candidate))
+                if content is not None:
+                    return {'content': content, 'source': 'replay'}
+            if self.mode == "replay":
+                index = int(prompt_hash(prompt)[:8], 16)
+                content = self.store.sample_content(index)
+                if content is not None:
+                    return {'content': content, 'source': 'replay_sample'}
+        return {'content': self.synthesize(prompt), 'source': 'synthetic'}
+
+    def synthesize(self, prompt: str) -> str:
+        rng = random.Random(f"{self.seed}:{prompt_hash(prompt)}")
+        schema = find_response_schema(prompt)
+        if schema is None:
+            return f"Offline synthetic response ({count_tokens(prompt)} prompt tokens)."
+        return json.dumps(synthesize_from_schema(schema, rng), indent=2)
+
+    # ---------- timing / errors ----------
+
+    def _delay_seconds(self) -> float:
+        with self._lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000.0
+
+    def _maybe_fail(self) -> None:
+        with self._lock:
+            self.calls += 1
+            fail = self.error_rate and self._rng.random() < self.error_rate
+            message = self._rng.choice(_SIMULATED_ERRORS) if fail else None
+            if fail:
+                self.errors += 1
+        if fail:
+            raise OfflineBackendError(message)
+
+    def _cached_prefix_tokens(self, model: str, prompt: str) -> int:
+        """Simulated provider prefix cache: tokens of a previously seen static prefix."""
+        if RUN_DATA_MARKER not in prompt:
+            return 0
+        prefix = prompt.split(RUN_DATA_MARKER, 1)[0]
+        tokens = count_tokens(prefix)
+        if tokens < PREFIX_CACHE_MIN_TOKENS:
+            return 0
+        key = (model, prompt_hash(prefix))
+        with self._lock:
+            seen = key in self._seen_prefixes
+            self._seen_prefixes.add(key)
+        return tokens - tokens % PREFIX_CACHE_STEP_TOKENS if seen else 0
+
+    # ---------- chat.completions.create ----------
+
+    def create(self, model: str, messages: List[Dict], stream: bool = False, **kwargs):
+        prompt = _prompt_text(messages)
+        delay = self._delay_seconds()
+        self._maybe_fail()
+        picked = self.respond(model, prompt)
+        content = picked['content']
+        usage = SimpleNamespace(
+            prompt_tokens=count_tokens(prompt), completion_tokens=count_tokens(content),
+            total_tokens=count_tokens(prompt) + count_tokens(content),
+            prompt_tokens_details=SimpleNamespace(cached_tokens=self._cached_prefix_tokens(model, prompt)),
+        )
+        if stream:
+            return self._stream(model, content, usage, delay)
+        time.sleep(delay)
+        message = SimpleNamespace(role="assistant", content=content)
+        return SimpleNamespace(
+            id=f"offline-{hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]}",
+            model=model, object="chat.completion", offline_source=picked['source'],
+            choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")],
+            usage=usage,
+        )
+
+    def _stream(self, model: str, content: str, usage, delay: float) -> Iterator:
+        pieces = [content[i:i + self.stream_chunk_chars] for i in range(0, len(content), self.stream_chunk_chars)] or [""]
+        per_piece = delay / len(pieces)
+        for piece in pieces:
+            if per_piece:
+                time.sleep(per_piece)
+            delta = SimpleNamespace(role="assistant", content=piece)
+            yield SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)], usage=None)
+        yield SimpleNamespace(model=model, choices=[], usage=usage)
+
+
+def build_offline_client(settings: Dict) -> OfflineChatClient:
+    """OfflineChatClient from config.get_offline_backend_settings()."""
+    return OfflineChatClient(
+        mode=settings.get('mode', 'auto'),
+        latency_ms=float(settings.get('latency_ms', 0)),
+        jitter_ms=float(settings.get('jitter_ms', 0)),
+        error_rate=float(settings.get('error_rate', 0)),
+        seed=int(settings.get('seed', 42)),
+        replay_db=settings.get('replay_db') or None,
+    )
+
+
+def _response_json(resp) -> Dict:
+    """OpenAI wire format for a non-streamed OfflineChatClient response."""
+    usage = resp.usage
+    return {
+        'id': resp.id, 'object': resp.object, 'created': int(time.time()), 'model': resp.model,
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': resp.choices[0].message.content},
+                     'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': usage.prompt_tokens, 'completion_tokens': usage.completion_tokens,
+                  'total_tokens': usage.total_tokens,
+                  'prompt_tokens_details': {'cached_tokens': usage.prompt_tokens_details.cached_tokens}},
+    }
+
+
+def serve_chat_completions(client: OfflineChatClient, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serve client as an OpenAI-compatible endpoint on a daemon thread; returns the server.
+
+    The base URL for openai.OpenAI(base_url=...) is f"http://{host}:{server.server_port}/v1".
+    Simulated errors are returned with their HTTP status (429, 500) in the OpenAI error shape.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: Dict) -> None:
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._send(404, {'error': {'message': f"Unknown path {self.path}", 'type': 'invalid_request_error'}})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+                resp = client.create(model=body.get('model', ''), messages=body.get('messages', []))
+            except OfflineBackendError as e:
+                status = 429 if '429' in str(e) else 500
+                self._send(status, {'error': {'message': str(e), 'type': 'rate_limit_error' if status == 429 else 'server_error'}})
+                return
+            except Exception as e:
+                self._send(400, {'error': {'message': str(e), 'type': 'invalid_request_error'}})
+                return
+            self._send(200, _response_json(resp))
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="offline-llm-server", daemon=True).start()
+    return server
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible stand-in server")
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve_p = sub.add_parser('serve', help="Serve chat completions over HTTP")
+    serve_p.add_argument('--host', default="127.0.0.1")
+    serve_p.add_argument('--port', type=int, default=8011)
+    serve_p.add_argument('--mode', default="synthetic", choices=("auto", "replay", "synthetic"))
+    serve_p.add_argument('--latency-ms', type=float, default=0.0)
+    serve_p.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+    client = OfflineChatClient(mode=args.mode, latency_ms=args.latency_ms, error_rate=args.error_rate)
+    server = serve_chat_completions(client, args.host, args.port)
+    print(f"Serving http://{args.host}:{server.server_port}/v1/chat/completions (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
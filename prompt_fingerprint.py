@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Prompt Fingerprint - Canonical prompt construction and data fingerprints
+Makes semantically identical AI inputs produce identical cache keys.
+
+Prompts embed value_counts() dicts, head() samples serialized with to_json and
+formatted floats. Small ordering, float-representation or whitespace
+differences between runs would otherwise change the prompt hash and miss the
+AI cache. The helpers here give:
+
+- stable sort orders for counts and records
+- normalised numbers (ints stay ints, floats rounded to fixed significance)
+- normalised whitespace in rendered prompts
+- a structured fingerprint of the underlying data inputs
+"""
+
+import hashlib
+import json
+import math
+import re
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+FLOAT_SIGNIFICANT_DIGITS = 10
+_TRAILING_WS_RE = re.compile(r"[ \t]+$", re.MULTILINE)
+_INLINE_WS_RE = re.compile(r"(?<=\S)[ \t]{2,}(?=\S)")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def normalize_number(value: Any) -> Any:
+    """Integral floats become ints, other floats are rounded; NaN/inf become None."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return None
+        if value.is_integer():
+            return int(value)
+        return float(f"{value:.{FLOAT_SIGNIFICANT_DIGITS}g}")
+    # numpy scalars
+    if hasattr(value, 'item') and not isinstance(value, (str, bytes)):
+        try:
+            return normalize_number(value.item())
+        except Exception:
+            return value
+    return value
+
+
+def canonicalize_value(value: Any) -> Any:
+    """Recursively normalise numbers, strings and container ordering."""
+    if isinstance(value, dict):
+        return {str(k): canonicalize_value(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize_value(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((canonicalize_value(v) for v in value), key=lambda v: json.dumps(v, sort_keys=True, default=str))
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return normalize_number(value)
+
+
+def canonical_json(value: Any, indent: Optional[int] = None) -> str:
+    """Deterministic JSON: sorted keys, normalised numbers and whitespace."""
+    separators = (",", ": ") if indent else (",", ":")
+    return json.dumps(canonicalize_value(value), sort_keys=True, ensure_ascii=False,
+                      indent=indent, separators=separators, default=str)
+
+
+def stable_value_counts(series: pd.Series, top: Optional[int] = None) -> Dict[str, int]:
+    """value_counts() as a dict ordered by count desc, then key asc (ties are stable)."""
+    if series is None or len(series) == 0:
+        return {}
+    counts = series.value_counts()
+    items = sorted(((str(k), int(v)) for k, v in counts.items()), key=lambda kv: (-kv[1], kv[0]))
+    if top is not None:
+        items = items[:top]
+    return dict(items)
+
+
+def canonical_records(data, columns: Optional[List[str]] = None) -> List[Dict]:
+    """DataFrame or list of dicts -> canonicalised list of dicts (row order kept)."""
+    if isinstance(data, pd.DataFrame):
+        frame = data[columns] if columns else data
+        records = frame.to_dict(orient='records')
+    else:
+        records = list(data or [])
+        if columns:
+            records = [{c: r.get(c) for c in columns} for r in records]
+    return [canonicalize_value(r) for r in records]
+
+
+def canonical_records_json(data, columns: Optional[List[str]] = None, indent: Optional[int] = None) -> str:
+    """Stable replacement for df.to_json(orient='records') in prompts."""
+    return canonical_json(canonical_records(data, columns), indent=indent)
+
+
+def canonicalize_prompt(text: str) -> str:
+    """Normalise whitespace in a rendered prompt without changing its content."""
+    if not text:
+        return ""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _TRAILING_WS_RE.sub("", text)
+    text = _INLINE_WS_RE.sub(" ", text)
+    text = _BLANK_LINES_RE.sub("\n\n", text)
+    return text.strip() + "\n"
+
+
+def records_fingerprint(data, columns: Optional[List[str]] = None, ordered: bool = False) -> str:
+    """Hash of a set of rows; row order is ignored unless ordered=True."""
+    digests = [hashlib.sha1(canonical_json(r).encode("utf-8")).hexdigest()
+               for r in canonical_records(data, columns)]
+    if not ordered:
+        digests.sort()
+    m = hashlib.sha1()
+    for d in digests:
+        m.update(d.encode("ascii"))
+    return m.hexdigest()
+
+
+def data_fingerprint(*parts: Any, **named: Any) -> str:
+    """Structured fingerprint of prompt inputs (template name, rows, settings...)."""
+    payload = {"parts": list(parts), "named": named}
+    return hashlib.sha1(canonical_json(payload).encode("utf-8")).hexdigest()
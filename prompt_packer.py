@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Prompt Packer - Token-budgeted packing of extracted rows into AI prompts
+Replaces fixed head(N) sampling in the integrated analyzer.
+
+Rows are serialized canonically, counted locally (tiktoken when installed,
+otherwise a ~4 characters/token estimate) and packed greedily into prompts
+that fit a token budget, template included. Data that does not fit one
+window is split across several calls whose parsed results are merged, and
+each packed prompt reports its coverage (rows analysed / rows extracted).
+
+pack_records_stable builds content-addressed chunks instead: rows are keyed by
+group (e.g. specialty) plus row hash and split along hash-prefix ranges, so a
+changed row only alters the chunk whose range holds it and every other chunk's
+rows - and cache fingerprint - stay the same between runs. When a call limit
+still leaves rows out, they are taken from the largest groups first rather
+than by whole chunks, and reported per group.
+"""
+
+import hashlib
+import heapq
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from prompt_fingerprint import canonical_json, records_fingerprint
+
+# Optional dependency: tiktoken for exact counts; heuristic otherwise
+try:
+    import tiktoken  # type: ignore
+except Exception:
+    tiktoken = None
+
+_ENCODINGS: Dict[str, Any] = {}
+_HASH_BITS = 160
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Local token count for a prompt fragment (no API call)."""
+    if not text:
+        return 0
+    if tiktoken is not None:
+        try:
+            if model not in _ENCODINGS:
+                try:
+                    _ENCODINGS[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _ENCODINGS[model] = tiktoken.get_encoding("o200k_base")
+            return len(_ENCODINGS[model].encode(text))
+        except Exception:
+            pass
+    return max(1, len(text) // 4)
+
+
+@dataclass
+class PackedBatch:
+    """Rows packed into one prompt"""
+    rows: List[Any]
+    start_index: int
+    tokens: int
+    oversized: bool = False
+    chunk_id: str = ""
+    fingerprint: str = ""
+
+
+@dataclass
+class PackResult:
+    """All batches for one prompt plus what was left out"""
+    name: str
+    batches: List[PackedBatch] = field(default_factory=list)
+    total_rows: int = 0
+    template_tokens: int = 0
+    budget_tokens: int = 0
+    skipped_by_group: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def packed_rows(self) -> int:
+        return sum(len(b.rows) for b in self.batches)
+
+    @property
+    def coverage(self) -> float:
+        return self.packed_rows / self.total_rows if self.total_rows else 1.0
+
+    def report(self) -> Dict:
+        return {
+            'prompt': self.name,
+            'rows_extracted': self.total_rows,
+            'rows_analysed': self.packed_rows,
+            'coverage': round(self.coverage, 4),
+            'calls': len(self.batches),
+            'budget_tokens': self.budget_tokens,
+            'template_tokens': self.template_tokens,
+            'prompt_tokens': [b.tokens for b in self.batches],
+            'oversized_rows': sum(1 for b in self.batches if b.oversized),
+            'skipped_by_group': dict(self.skipped_by_group),
+        }
+
+
+def pack_records(records: List[Any], budget_tokens: int, render: Optional[Callable[[str], str]] = None,
+                 name: str = "", max_calls: Optional[int] = None, max_rows: Optional[int] = None,
+                 model: str = "gpt-4o") -> PackResult:
+    """Greedily pack rows (in order) into batches whose rendered prompt fits the budget.
+
+    render(rows_json) returns the full prompt for a batch; its overhead is
+    measured with an empty array. A single row larger than the remaining budget
+    gets a batch of its own. Rows beyond max_calls batches are not analysed and
+    show up as coverage below 100%.
+    """
+    template_tokens = count_tokens(render("[]"), model) if render else 0
+    row_budget = max(1, budget_tokens - template_tokens)
+    result = PackResult(name=name, total_rows=len(records), template_tokens=template_tokens,
+                        budget_tokens=budget_tokens)
+
+    def close(rows: List[Any], start: int, used: int) -> None:
+        result.batches.append(PackedBatch(rows, start, template_tokens + used,
+                                          oversized=len(rows) == 1 and used > row_budget))
+
+    current: List[Any] = []
+    used = 0
+    start = 0
+    for i, rec in enumerate(records):
+        # +1 for the separating comma
+        cost = count_tokens(canonical_json(rec), model) + 1
+        if current and (used + cost > row_budget or (max_rows and len(current) >= max_rows)):
+            close(current, start, used)
+            if max_calls and len(result.batches) >= max_calls:
+                return result
+            current, used, start = [], 0, i
+        current.append(rec)
+        used += cost
+    if current:
+        close(current, start, used)
+    return result
+
+
+def row_hash(record: Any) -> str:
+    """SHA-1 of a row's canonical JSON."""
+    return hashlib.sha1(canonical_json(record).encode("utf-8")).hexdigest()
+
+
+def _group_value(record: Any, group_key: Optional[str]) -> str:
+    if group_key and isinstance(record, dict):
+        return str(record.get(group_key) or "")
+    return ""
+
+
+def _trim_largest_groups(items: List[tuple], target_tokens: int, group_key: Optional[str]) -> List[tuple]:
+    """Drop rows until they fit target_tokens: always from the group with the most rows left, highest key first.
+
+    Every group keeps the same hash-ordered sample of its rows from run to run,
+    and small groups are only cut once the large ones are down to their size.
+    """
+    by_group: Dict[str, List[tuple]] = defaultdict(list)
+    for it in items:
+        by_group[_group_value(it[2], group_key)].append(it)
+    used = sum(it[3] for it in items)
+    heap = [(-len(rows), group) for group, rows in by_group.items()]
+    heapq.heapify(heap)
+    while used > target_tokens and heap:
+        _, group = heapq.heappop(heap)
+        rows = by_group[group]
+        used -= rows.pop()[3]
+        if rows:
+            heapq.heappush(heap, (-len(rows), group))
+    return sorted(it for rows in by_group.values() for it in rows)
+
+
+def pack_records_stable(records: List[Any], budget_tokens: int, render: Optional[Callable[[str], str]] = None,
+                        group_key: Optional[str] = None, name: str = "", max_calls: Optional[int] = None,
+                        max_rows: Optional[int] = None, model: str = "gpt-4o") -> PackResult:
+    """Content-addressed packing: chunk membership depends only on the rows' content.
+
+    Each row is keyed by hash(group) + hash(row) and the key space is split in
+    halves (one bit at a time) until every range fits the budget. Rows of one
+    group are contiguous, large groups are split by row-hash range, small
+    groups share a chunk. Adding, removing or editing a row only changes the
+    chunk whose range contains it; all other chunks keep the same rows, order,
+    chunk_id and fingerprint. Rows inside a chunk are ordered by group, then
+    by their original position.
+
+    Over max_calls, neighbouring under-filled ranges are merged first; if that
+    is still too many chunks, rows are dropped from the largest groups first
+    (see _trim_largest_groups) and counted per group in skipped_by_group.
+    """
+    template_tokens = count_tokens(render("[]"), model) if render else 0
+    row_budget = max(1, budget_tokens - template_tokens)
+    result = PackResult(name=name, total_rows=len(records), template_tokens=template_tokens,
+                        budget_tokens=budget_tokens)
+    items = []
+    for i, rec in enumerate(records):
+        group = _group_value(rec, group_key)
+        key = hashlib.sha1(group.encode("utf-8")).hexdigest()[:8] + row_hash(rec)
+        items.append((key, i, rec, count_tokens(canonical_json(rec), model) + 1))
+    items.sort()
+
+    def fits(rows: List[tuple]) -> bool:
+        return sum(it[3] for it in rows) <= row_budget and (not max_rows or len(rows) <= max_rows)
+
+    def ranges(entries: List[tuple]) -> List[Tuple[str, List[tuple]]]:
+        """(hash-prefix, rows) of every range that fits the budget, in key order."""
+        key_bits = len(entries[0][0]) * 4 if entries else 0
+        bits = [bin(int(k, 16))[2:].zfill(key_bits) for k, _, _, _ in entries]
+        out: List[Tuple[str, List[tuple]]] = []
+
+        def split(lo: int, hi: int, depth: int) -> None:
+            if fits(entries[lo:hi]) or hi - lo == 1 or depth >= key_bits or bits[lo] == bits[hi - 1]:
+                out.append((bits[lo][:depth] or "*", entries[lo:hi]))
+                return
+            # Rows are sorted by key, so the rows with bit `depth` set form a suffix
+            mid = lo
+            while mid < hi and bits[mid][depth] == '0':
+                mid += 1
+            for a, b in ((lo, mid), (mid, hi)):
+                if a < b:
+                    split(a, b, depth + 1)
+
+        if entries:
+            split(0, len(entries), 0)
+        return out
+
+    def merge_underfilled(chunks: List[Tuple[str, List[tuple]]]) -> List[Tuple[str, List[tuple]]]:
+        merged: List[Tuple[str, List[tuple]]] = []
+        for prefix, rows in chunks:
+            if merged and fits(merged[-1][1] + rows):
+                merged[-1] = (f"{merged[-1][0]}+{prefix}", merged[-1][1] + rows)
+            else:
+                merged.append((prefix, rows))
+        return merged
+
+    chunks = ranges(items)
+    if max_calls and len(chunks) > max_calls:
+        chunks = merge_underfilled(chunks)
+        kept, target = items, max_calls * row_budget
+        while len(chunks) > max_calls:
+            kept = _trim_largest_groups(kept, target, group_key)
+            chunks = merge_underfilled(ranges(kept))
+            target = int(target * 0.9)
+        kept_indexes = {it[1] for it in kept}
+        for it in items:
+            if it[1] not in kept_indexes:
+                group = _group_value(it[2], group_key)
+                result.skipped_by_group[group] = result.skipped_by_group.get(group, 0) + 1
+
+    for prefix, rows in chunks:
+        rows = sorted(rows, key=lambda it: (_group_value(it[2], group_key), it[1]))
+        used = sum(it[3] for it in rows)
+        chunk_rows = [it[2] for it in rows]
+        result.batches.append(PackedBatch(
+            chunk_rows, rows[0][1], template_tokens + used,
+            oversized=used > row_budget, chunk_id=prefix,
+            fingerprint=records_fingerprint(chunk_rows),
+        ))
+    return result
+
+
+def merge_json_results(parts: List[Any]) -> Any:
+    """Merge parsed results of a split prompt.
+
+    Lists are concatenated; dicts are merged key by key (lists concatenated,
+    nested dicts merged, scalars kept from the first part).
+    """
+    parts = [p for p in parts if p is not None]
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    if all(isinstance(p, list) for p in parts):
+        return [item for p in parts for item in p]
+    if all(isinstance(p, dict) for p in parts):
+        merged: Dict[str, Any] = {}
+        for p in parts:
+            for key, value in p.items():
+                if key not in merged:
+                    merged[key] = value
+                    continue
+                existing = merged[key]
+                if isinstance(existing, list) and isinstance(value, list):
+                    merged[key] = existing + value
+                elif isinstance(existing, dict) and isinstance(value, dict):
+                    merged[key] = merge_json_results([existing, value])
+        return merged
+    return parts
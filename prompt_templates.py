@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Prompt Templates - Source hashes of prompt templates for targeted cache invalidation
+Used by the integrated analyzer to tag every AI response store entry with the
+version of the template that produced it.
+
+A template's hash covers its own source, the source of this repo's helpers
+and other templates it calls (e.g. with_run_data, or the base-class prompt an
+override delegates to), the upper-case constants it references
+(persona blocks, RUN_DATA_MARKER, ...) and the JSON schema requested with it.
+Editing one template therefore changes the hash of that template (and of those
+built on it) only. A cached entry whose stored hash no longer matches is
+treated as a miss and replaced on the next live call; entries for other
+templates stay warm. Entries written before template tracking are misses too:
+`adopt` is the explicit one-off step that keeps them, letting each take the
+current hash of the first tracked call that reads it.
+
+Calls are mapped to templates by tag, or by schema name for packed prompts
+sent with an empty tag (TEMPLATE_REFS).
+
+CLI:
+    python prompt_templates.py status      # entries the current template sources invalidate (exit 1 if any)
+    python prompt_templates.py hashes      # current hash per template
+    python prompt_templates.py prune       # delete those entries now
+    python prompt_templates.py adopt [--tag TAG ...]  # keep untracked entries as current versions
+"""
+
+import argparse
+import hashlib
+import importlib
+import inspect
+import json
+import sys
+import textwrap
+import threading
+import types
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+ANALYZER = "integrated_comprehensive_analyzer"
+PROMPTS = "updated_prompts:UpdatedHealthcareAIPrompts"
+
+# Call tag (or schema name) -> "<module>:<qualname>" of the function that renders the prompt
+TEMPLATE_REFS = {
+    'contradictions_main': f"{ANALYZER}:UpdatedHealthcareAIPrompts.get_advanced_contradiction_prompt",
+    'contradictions_shard': f"{ANALYZER}:UpdatedHealthcareAIPrompts.get_advanced_contradiction_prompt",
+    'contradictions_reduce': f"{ANALYZER}:UpdatedHealthcareAIPrompts.get_cross_shard_contradiction_prompt",
+    'gaps_main': f"{ANALYZER}:UpdatedHealthcareAIPrompts.get_comprehensive_gap_analysis_prompt",
+    'gaps_shard': f"{ANALYZER}:UpdatedHealthcareAIPrompts.get_comprehensive_gap_analysis_prompt",
+    'gaps_reduce': f"{ANALYZER}:UpdatedHealthcareAIPrompts.get_cross_shard_gap_prompt",
+    'coverage_analysis': f"{ANALYZER}:IntegratedComprehensiveMedicalAnalyzer._get_coverage_analysis_prompt",
+    'gap_deduplication': f"{ANALYZER}:IntegratedComprehensiveMedicalAnalyzer.deduplicate_gaps_with_openai",
+    'annex_quality': f"{PROMPTS}.get_annex_quality_prompt",
+    'rules_map': f"{PROMPTS}.get_rules_contradiction_map_prompt",
+    'batch_service_analysis': f"{PROMPTS}.get_batch_service_analysis_prompt",
+    'facility_validation': f"{PROMPTS}.get_facility_level_validation_prompt",
+    'section_summaries': f"{PROMPTS}.get_section_summaries_prompt",
+    'canonicalization': f"{PROMPTS}.get_name_canonicalization_prompt",
+    'policy_annex_alignment': f"{PROMPTS}.get_policy_annex_alignment_prompt",
+    'policy_alignment': f"{PROMPTS}.get_policy_annex_alignment_prompt",
+    'equity': f"{PROMPTS}.get_equity_analysis_prompt",
+    'equity_analysis': f"{PROMPTS}.get_equity_analysis_prompt",
+    'policy_recommendations': f"{PROMPTS}.get_strategic_policy_recommendations_prompt",
+    'tariff_outliers': f"{PROMPTS}.get_tariff_outlier_prompt",
+}
+
+_CONSTANT_TYPES = (str, bytes, int, float, bool, tuple, list, dict, frozenset, set)
+_REPO_DIR = Path(__file__).resolve().parent
+
+
+def _module(name: str):
+    """Imported module by name; a script run as __main__ counts as its own module."""
+    module = sys.modules.get(name)
+    if module is None:
+        main = sys.modules.get('__main__')
+        if main is not None and Path(getattr(main, '__file__', '') or '').stem == name:
+            return main
+        module = importlib.import_module(name)
+    return module
+
+
+def resolve(ref: str):
+    """Function for a "<module>:<qualname>" reference."""
+    module_name, qualname = ref.split(":", 1)
+    obj = _module(module_name)
+    for part in qualname.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _code_names(code: types.CodeType) -> Set[str]:
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _is_local(obj) -> bool:
+    """Defined in one of this repo's modules (helpers imported from the standard library or packages are not hashed)."""
+    try:
+        return Path(inspect.getsourcefile(obj)).resolve().parent == _REPO_DIR
+    except (TypeError, OSError):
+        return False
+
+
+def _source(func) -> str:
+    try:
+        return textwrap.dedent(inspect.getsource(func))
+    except (OSError, TypeError):
+        return getattr(getattr(func, '__code__', None), 'co_code', b"").hex()
+
+
+def _constant(value) -> str:
+    try:
+        return json.dumps(value, sort_keys=True, default=repr, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return repr(value)
+
+
+def source_hash(func, _seen: Optional[Set[int]] = None) -> str:
+    """Hash of func's source plus the constants, helpers and templates it references from this repo."""
+    func = inspect.unwrap(getattr(func, '__func__', func))
+    seen = _seen if _seen is not None else set()
+    seen.add(id(func))
+    parts = [_source(func)]
+    code = getattr(func, '__code__', None)
+    scope = getattr(func, '__globals__', {})
+    names = _code_names(code) if code is not None else set()
+    for name in sorted(names):
+        value = scope.get(name)
+        if value is None:
+            continue
+        if name.isupper() and isinstance(value, _CONSTANT_TYPES):
+            parts.append(f"{name}={_constant(value)}")
+        elif inspect.isfunction(value) and id(value) not in seen and _is_local(value):
+            parts.append(f"{name}:{source_hash(value, seen)}")
+        elif inspect.isclass(value) and _is_local(value):
+            # Other templates called on a prompt class, e.g. the base prompt an override wraps
+            for attr in sorted(names):
+                member = inspect.getattr_static(value, attr, None)
+                member = getattr(member, '__func__', member)
+                if inspect.isfunction(member) and id(member) not in seen:
+                    parts.append(f"{name}.{attr}:{source_hash(member, seen)}")
+    return hashlib.sha1("\n\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def template_id(tag: str, schema: str = None) -> Optional[str]:
+    """Stored template identity for a call: its template ref, plus "#<schema>" when a schema is requested."""
+    ref = TEMPLATE_REFS.get(tag or "") or TEMPLATE_REFS.get(schema or "")
+    if ref is None:
+        return None
+    return f"{ref}#{schema}" if schema else ref
+
+
+_hash_cache: Dict[str, str] = {}
+_hash_lock = threading.Lock()
+
+
+def template_hash(template: str, refresh: bool = False) -> Optional[str]:
+    """Current hash of a template identity (source hash + requested schema); None if it cannot be resolved."""
+    with _hash_lock:
+        if not refresh and template in _hash_cache:
+            return _hash_cache[template]
+    ref, _, schema = template.partition("#")
+    try:
+        digest = hashlib.sha1(source_hash(resolve(ref)).encode("utf-8"))
+        if schema:
+            from ai_schemas import get_schema
+            ai_schema = get_schema(schema)
+            digest.update(_constant(ai_schema.response_format() if ai_schema else schema).encode("utf-8"))
+        value = digest.hexdigest()
+    except Exception:
+        value = None
+    with _hash_lock:
+        _hash_cache[template] = value
+    return value
+
+
+def template_version(tag: str, schema: str = None) -> Tuple[Optional[str], Optional[str]]:
+    """(template identity, current hash) for a call, or (None, None) for untracked calls."""
+    template = template_id(tag, schema)
+    return (template, template_hash(template)) if template else (None, None)
+
+
+def invalidation_report(store) -> List[Dict]:
+    """Per stored template: entries the current sources keep and those they would invalidate."""
+    by_template: Dict[str, Dict] = {}
+    for row in store.template_versions():
+        template = row['template']
+        current = template_hash(template, refresh=True)
+        entry = by_template.setdefault(template, {
+            'template': template, 'current_hash': current, 'entries': 0, 'stale_entries': 0, 'stale_bytes': 0,
+            'tags': set(), 'stale_hashes': [],
+        })
+        entry['entries'] += row['entries']
+        entry['tags'].update(row['tags'])
+        if current is None or row['template_hash'] != current:
+            entry['stale_entries'] += row['entries']
+            entry['stale_bytes'] += row['bytes']
+            entry['stale_hashes'].append(row['template_hash'])
+    report = []
+    for template in sorted(by_template):
+        entry = by_template[template]
+        entry['tags'] = sorted(t for t in entry['tags'] if t)
+        report.append(entry)
+    return report
+
+
+def prune_stale(store) -> int:
+    """Delete entries whose template hash no longer matches the current source."""
+    stale = [(e['template'], h) for e in invalidation_report(store) for h in e['stale_hashes']]
+    return store.delete_template_versions(stale)
+
+
+def _print_report(report: List[Dict], untracked: int, pending: int = 0) -> None:
+    stale = sum(e['stale_entries'] for e in report)
+    print(f"🧩 Template-tracked cache entries: {sum(e['entries'] for e in report)} "
+          f"({stale} would be invalidated, {untracked} untracked, {pending} pending adoption)")
+    if untracked:
+        print(f"   ⚠️ {untracked} entries have no template version and miss for tracked calls; "
+              f"`python prompt_templates.py adopt` keeps them")
+    if not report:
+        return
+    print(f"\n   {'TEMPLATE':<72} {'ENTRIES':>7} {'STALE':>6} {'KIB':>8}")
+    for e in report:
+        name = e['template'].split(":", 1)[-1]
+        marker = "⚠️ " if e['stale_entries'] else "  "
+        print(f" {marker}{name[:72]:<72} {e['entries']:>7} {e['stale_entries']:>6} {e['stale_bytes'] / 1024:>8.1f}")
+        if e['stale_entries'] and e['current_hash'] is None:
+            print(f"      template can no longer be resolved")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Template-aware AI cache invalidation")
+    parser.add_argument('--db', default=None, help="SQLite path (default: ai_cache/ai_responses.sqlite3)")
+    sub = parser.add_subparsers(dest='command')
+    status_p = sub.add_parser('status', help="Report entries that the current template sources invalidate")
+    status_p.add_argument('--json', action='store_true', help="Print raw JSON")
+    sub.add_parser('hashes', help="Print the current hash of every mapped template")
+    sub.add_parser('prune', help="Delete entries produced by changed templates")
+    adopt_p = sub.add_parser('adopt', help="Let untracked entries take the current template version on next read")
+    adopt_p.add_argument('--tag', action='append', default=None, help="Only entries with this tag (repeatable)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'hashes':
+        for template in sorted(set(TEMPLATE_REFS.values())):
+            print(f"{template_hash(template) or '(unresolved)':<40} {template}")
+        return 0
+
+    from ai_response_store import AIResponseStore
+    store = AIResponseStore(db_path=args.db)
+    if args.command == 'prune':
+        print(f"✅ Deleted {prune_stale(store)} entries from changed templates")
+        return 0
+    if args.command == 'adopt':
+        print(f"✅ Marked {store.mark_for_adoption(args.tag)} untracked entries for adoption")
+        return 0
+    report = invalidation_report(store)
+    if getattr(args, 'json', False):
+        print(json.dumps({'templates': report, 'untracked_entries': store.untracked_entries(),
+                          'pending_adoption': store.pending_adoption()}, indent=2))
+    else:
+        _print_report(report, store.untracked_entries(), store.pending_adoption())
+    return 1 if any(e['stale_entries'] for e in report) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
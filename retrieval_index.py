@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Retrieval Index - Local BM25 search over a run's extracted rows and findings
+Used by the Streamlit Q&A and predictive prompts to carry only the rows that
+are relevant to the question, instead of whole-run summaries.
+
+Documents are the policy rows and annex procedures (structured_rules), gaps
+and contradictions of one run. The index is built once per run and persisted
+next to the run outputs (retrieval_index.json) with a fingerprint of the
+indexed text, so later questions load it instead of re-tokenizing. A query
+only touches the postings of its own terms, and the prompt context is capped
+at top-k rows of bounded length, so prompt size stays flat as the data grows.
+"""
+
+import hashlib
+import json
+import math
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+INDEX_VERSION = 1
+INDEX_FILENAME = "retrieval_index.json"
+MAX_DOC_CHARS = 400
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in into is it its of on or per that the this to was were which
+with what how why when where who does do not no any all can will should would there their these those than
+""".split())
+# Fields that describe a finding; the rest of a gap/contradiction record is supporting detail
+_RULE_FIELDS = ('service_name', 'specialty', 'facility_level', 'tariff_amount', 'conditions', 'exclusions',
+                'payment_method')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case alphanumeric tokens without stopwords or single characters."""
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+def _flatten(value: Any, depth: int = 0) -> Iterable[str]:
+    if value is None or depth > 3:
+        return
+    if isinstance(value, dict):
+        for v in value.values():
+            yield from _flatten(v, depth + 1)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            yield from _flatten(v, depth + 1)
+    elif isinstance(value, float) and math.isnan(value):
+        return
+    else:
+        text = str(value).strip()
+        if text:
+            yield text
+
+
+@dataclass
+class RetrievalDoc:
+    """One indexed row: its kind, a short id and the text shown to the model"""
+    doc_id: str
+    kind: str
+    text: str
+
+
+def docs_from_results(results: Dict) -> List[RetrievalDoc]:
+    """Index documents for the app's canonical results (structured_rules, gaps, contradictions)."""
+    docs: List[RetrievalDoc] = []
+    for i, rule in enumerate(results.get('structured_rules') or []):
+        if not isinstance(rule, dict):
+            continue
+        kind = rule.get('rule_type') or 'rule'
+        parts = [f"{field}: {'; '.join(_flatten(rule.get(field)))}" for field in _RULE_FIELDS
+                 if list(_flatten(rule.get(field)))]
+        docs.append(RetrievalDoc(f"{kind}-{i + 1}", kind, " | ".join(parts)))
+    for kind, key, id_field in (('gap', 'gaps', 'gap_id'), ('contradiction', 'contradictions', 'contradiction_id')):
+        for i, item in enumerate(results.get(key) or []):
+            if not isinstance(item, dict):
+                continue
+            doc_id = str(item.get(id_field) or f"{kind}-{i + 1}")
+            lead = item.get('description') or ""
+            rest = [t for f, v in item.items() if f not in (id_field, 'description') for t in _flatten(v)]
+            docs.append(RetrievalDoc(doc_id, kind, " | ".join(filter(None, [lead] + rest))))
+    return docs
+
+
+def docs_fingerprint(docs: List[RetrievalDoc]) -> str:
+    m = hashlib.sha1()
+    for doc in docs:
+        m.update(f"{doc.kind}\0{doc.doc_id}\0{doc.text}\n".encode("utf-8"))
+    return m.hexdigest()
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index (postings per term)"""
+
+    def __init__(self, docs: List[RetrievalDoc], k1: float = 1.5, b: float = 0.75,
+                 doc_terms: List[Dict[str, int]] = None, fingerprint: str = None):
+        self.docs = docs
+        self.k1 = k1
+        self.b = b
+        self.doc_terms = doc_terms if doc_terms is not None else [dict(Counter(tokenize(d.text))) for d in docs]
+        self.fingerprint = fingerprint or docs_fingerprint(docs)
+        self.doc_lengths = [sum(terms.values()) for terms in self.doc_terms]
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        self.postings: Dict[str, List[tuple]] = defaultdict(list)
+        for index, terms in enumerate(self.doc_terms):
+            for term, tf in terms.items():
+                self.postings[term].append((index, tf))
+        n = len(docs)
+        self.idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def search(self, query: str, k: int = 10, kinds: Iterable[str] = None) -> List[Dict]:
+        """Top-k documents for the query as {'score', 'doc'} (optionally restricted to some kinds)."""
+        allowed = set(kinds) if kinds else None
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for index, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[index] / (self.avg_length or 1))
+                scores[index] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        hits = []
+        for index, score in ranked:
+            doc = self.docs[index]
+            if allowed is not None and doc.kind not in allowed:
+                continue
+            hits.append({'score': round(score, 4), 'doc': doc})
+            if len(hits) >= k:
+                break
+        return hits
+
+    def to_dict(self) -> Dict:
+        return {
+            'version': INDEX_VERSION,
+            'fingerprint': self.fingerprint,
+            'k1': self.k1,
+            'b': self.b,
+            'docs': [{'id': d.doc_id, 'kind': d.kind, 'text': d.text, 'terms': t}
+                     for d, t in zip(self.docs, self.doc_terms)],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BM25Index":
+        docs = [RetrievalDoc(d['id'], d['kind'], d['text']) for d in data.get('docs', [])]
+        return cls(docs, k1=data.get('k1', 1.5), b=data.get('b', 0.75),
+                   doc_terms=[d.get('terms', {}) for d in data.get('docs', [])],
+                   fingerprint=data.get('fingerprint'))
+
+    def save(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        return path
+
+
+def load_or_build_index(results: Dict, path=None) -> BM25Index:
+    """The run's index: loaded from path when its fingerprint matches, else built (and saved)."""
+    docs = docs_from_results(results)
+    fingerprint = docs_fingerprint(docs)
+    if path is not None and Path(path).exists():
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION and data.get('fingerprint') == fingerprint:
+                return BM25Index.from_dict(data)
+        except Exception:
+            pass
+    index = BM25Index(docs, fingerprint=fingerprint)
+    if path is not None:
+        try:
+            index.save(path)
+        except Exception:
+            pass
+    return index
+
+
+def format_hits(hits: List[Dict], max_chars: int = MAX_DOC_CHARS) -> str:
+    """Prompt context block: one line per retrieved row, each capped at max_chars."""
+    lines = []
+    for rank, hit in enumerate(hits, 1):
+        doc = hit['doc']
+        text = doc.text if len(doc.text) <= max_chars else doc.text[:max_chars - 3] + "..."
+        lines.append(f"{rank}. [{doc.kind} {doc.doc_id}] {text}")
+    return "\n".join(lines) if lines else "No matching rows in this run."
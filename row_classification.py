@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Row Classification - Deduplicated, micro-batched per-row LLM classification
+Used by the integrated analyzer for the annex batch service analysis.
+
+Rows are normalised (whitespace collapsed, text fields case-folded) and keyed
+by the hash of the normalised row, so interventions that differ only in
+spacing or casing are classified once. Each row's result is cached under its
+hash; only uncached unique rows are packed into micro-batches that fit the
+token budget, and the batches run concurrently. Each sent row carries a
+row_id the model echoes back; results are matched to rows by that id only
+(never by position or name), and a row whose id is missing from the answer
+counts as failed. Results are fanned back out to every original row,
+duplicates included.
+
+The report gives rows, unique rows, cache hits, batches, wall time and the
+throughput in rows/second and rows/dollar (cost filled in by the caller).
+"""
+
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from prompt_fingerprint import canonical_json
+from prompt_packer import pack_records, row_hash
+
+TEXT_FIELDS = ('service_name', 'specialty')
+ID_FIELD = 'row_id'
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(value) -> str:
+    return _SPACE_RE.sub(" ", str(value or "")).strip()
+
+
+def normalize_row(row: Dict, text_fields=TEXT_FIELDS) -> Dict:
+    """Row with whitespace collapsed everywhere and text_fields case-folded (the dedup identity)."""
+    normalized = {}
+    for key, value in row.items():
+        if isinstance(value, str):
+            value = normalize_text(value)
+            if key in text_fields:
+                value = value.casefold()
+        normalized[key] = value
+    return normalized
+
+
+def dedupe_rows(rows: List[Dict], text_fields=TEXT_FIELDS) -> Tuple[List[str], Dict[str, Dict]]:
+    """(hash per original row, first representative per hash) - representatives keep readable casing."""
+    hashes: List[str] = []
+    representatives: Dict[str, Dict] = {}
+    for row in rows:
+        h = row_hash(normalize_row(row, text_fields))
+        hashes.append(h)
+        if h not in representatives:
+            representatives[h] = {k: normalize_text(v) if isinstance(v, str) else v for k, v in row.items()}
+    return hashes, representatives
+
+
+@dataclass
+class ClassificationReport:
+    """Throughput and reuse for one classification run"""
+    rows: int = 0
+    unique_rows: int = 0
+    cached_rows: int = 0
+    classified_rows: int = 0
+    failed_rows: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    cost_usd: Optional[float] = None
+    batch_status: List[Dict] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        return round(self.rows / self.seconds, 2) if self.seconds > 0 else None
+
+    @property
+    def rows_per_dollar(self) -> Optional[float]:
+        return round(self.rows / self.cost_usd, 1) if self.cost_usd else None
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data['seconds'] = round(self.seconds, 3)
+        data['rows_per_second'] = self.rows_per_second
+        data['rows_per_dollar'] = self.rows_per_dollar
+        return data
+
+
+class RowClassifier:
+    """Classify rows through classify_batch(rows) -> results, with per-row caching by content hash"""
+
+    def __init__(self, classify_batch: Callable[[List[Dict]], List[Dict]],
+                 cache_get: Callable[[str], Optional[str]], cache_set: Callable[[str, str], None],
+                 budget_tokens: int, render: Callable[[str], str] = None, max_workers: int = 4,
+                 max_rows: int = 50, key_field: str = 'service_name', text_fields=TEXT_FIELDS):
+        self.classify_batch = classify_batch
+        self.cache_get = cache_get
+        self.cache_set = cache_set
+        self.budget_tokens = budget_tokens
+        self.render = render
+        self.max_workers = max(1, max_workers)
+        self.max_rows = max_rows
+        self.key_field = key_field
+        self.text_fields = text_fields
+
+    @staticmethod
+    def _match(batch: List[Dict], results: List[Dict]) -> List[Optional[Dict]]:
+        """Results aligned to batch rows by their echoed row_id (stripped); None where no result carries the id."""
+        by_id: Dict[str, Dict] = {}
+        for result in results or []:
+            if isinstance(result, dict) and result.get(ID_FIELD) is not None:
+                by_id.setdefault(str(result[ID_FIELD]).strip(), {k: v for k, v in result.items() if k != ID_FIELD})
+        return [by_id.get(row[ID_FIELD]) for row in batch]
+
+    def run(self, rows: List[Dict]) -> Tuple[List[Optional[Dict]], ClassificationReport]:
+        """One result per input row (None where classification failed) and the run report."""
+        started = time.time()
+        hashes, representatives = dedupe_rows(rows, self.text_fields)
+        report = ClassificationReport(rows=len(rows), unique_rows=len(representatives))
+
+        by_hash: Dict[str, Dict] = {}
+        pending: List[Tuple[str, Dict]] = []
+        for h, row in representatives.items():
+            cached = self.cache_get(h)
+            if cached is not None:
+                try:
+                    by_hash[h] = json.loads(cached)
+                    continue
+                except Exception:
+                    pass
+            pending.append((h, dict(row, **{ID_FIELD: f"r{len(pending) + 1}"})))
+        report.cached_rows = len(by_hash)
+
+        pack = pack_records([row for _, row in pending], self.budget_tokens, render=self.render,
+                            max_rows=self.max_rows)
+        report.batches = len(pack.batches)
+
+        def run_batch(index: int) -> Dict:
+            batch = pack.batches[index]
+            keyed = pending[batch.start_index:batch.start_index + len(batch.rows)]
+            batch_started = time.time()
+            try:
+                matched = self._match(batch.rows, self.classify_batch(batch.rows))
+            except Exception as e:
+                return {'batch': index, 'rows': len(batch.rows), 'items': 0, 'status': 'failed',
+                        'error': str(e), 'seconds': round(time.time() - batch_started, 2)}
+            items = 0
+            for (h, _), result in zip(keyed, matched):
+                if result is None:
+                    continue
+                by_hash[h] = result
+                self.cache_set(h, canonical_json(result))
+                items += 1
+            return {'batch': index, 'rows': len(batch.rows), 'items': items,
+                    'status': 'ok' if items == len(batch.rows) else 'partial',
+                    'seconds': round(time.time() - batch_started, 2)}
+
+        if pack.batches:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pack.batches))) as pool:
+                report.batch_status = list(pool.map(run_batch, range(len(pack.batches))))
+        report.classified_rows = sum(s['items'] for s in report.batch_status)
+
+        outputs: List[Optional[Dict]] = []
+        for row, h in zip(rows, hashes):
+            result = by_hash.get(h)
+            if result is None:
+                outputs.append(None)
+                report.failed_rows += 1
+                continue
+            item = dict(result)
+            if self.key_field in row:
+                item[self.key_field] = row[self.key_field]
+            item['row_hash'] = h
+            outputs.append(item)
+        report.seconds = time.time() - started
+        return outputs, report
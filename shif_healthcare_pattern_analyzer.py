@@ -20,6 +20,10 @@ from collections import defaultdict, Counter
 import openai
 import os
 from dotenv import load_dotenv
+from ai_client_registry import get_ai_registry
+from ai_rate_limiter import get_rate_limiter
+from ai_telemetry import AITelemetry, usage_tokens
+from model_router import get_model_router
 
 # Load environment variables from root .env
 load_dotenv('.env')
@@ -63,63 +67,54 @@ class SHIFHealthcarePatternAnalyzer:
         print(f"📁 Output directory: {self.output_dir}")
 
     def setup_openai(self):
-        """Setup OpenAI client with user-specified models (gpt-5-mini, gpt-4.1-mini)"""
+        """Attach the shared lazy OpenAI client (gpt-5-mini, gpt-4.1-mini); no network calls"""
         try:
-            # Force reload .env file to get correct API key
-            from dotenv import load_dotenv
-            load_dotenv('.env', override=True)
-            api_key = os.getenv('OPENAI_API_KEY')
-            if not api_key:
-                api_key = "OPENAI_API_KEY_REMOVED"
-            self.openai_client = openai.OpenAI(api_key=api_key)
-            
-            # Test the client with specified models (try primary first, then fallback)
-            try:
-                # Try primary model (gpt-5-mini) first
-                response = self.openai_client.chat.completions.create(
-                    model=self.primary_model,
-                    messages=[{"role": "user", "content": "Hi"}]
-                )
-                print(f"✅ OpenAI Ready: {self.primary_model}")
-            except Exception as primary_e:
-                try:
-                    # Try fallback model (gpt-4.1-mini)
-                    response = self.openai_client.chat.completions.create(
-                        model=self.fallback_model,
-                        messages=[{"role": "user", "content": "Hi"}]
-                    )
-                    print(f"✅ OpenAI Ready: {self.fallback_model} (fallback)")
-                except Exception as fallback_e:
-                    print(f"⚠️ OpenAI models unavailable: {self.primary_model}, {self.fallback_model}")
-                    self.openai_client = None
-                
+            registry = get_ai_registry()
+            self.openai_client = registry.get_client()
+            print(registry.status_message(self.primary_model, self.fallback_model))
         except Exception as e:
             print("⚠️ OpenAI not available. Core functionality will work without AI insights.")
             self.openai_client = None
 
-    def make_openai_request(self, messages):
-        """Make OpenAI request with primary/fallback model strategy"""
+    def make_openai_request(self, messages, tag: str = ""):
+        """Make OpenAI request through the shared primary/fallback model router"""
         if not self.openai_client:
             raise Exception("OpenAI client not available")
         
-        # Try primary model first
-        try:
-            response = self.openai_client.chat.completions.create(
-                model=self.primary_model,
+        usage = {}
+        waits = []
+        limiter = get_rate_limiter()
+        tokens = limiter.estimate_tokens(" ".join(str(m.get('content', '')) for m in messages))
+        def send(model):
+            response, waited = limiter.call(model, tokens, lambda: self.openai_client.chat.completions.create(
+                model=model,
                 messages=messages
-            )
-            return response.choices[0].message.content.strip(), self.primary_model
+            ))
+            waits.append(waited)
+            usage[model] = getattr(response, 'usage', None)
+            return response.choices[0].message.content.strip()
+        
+        started = time.time()
+        try:
+            result = get_model_router(self.primary_model, self.fallback_model).route(send)
         except Exception as e:
-            # Try fallback model
-            try:
-                print(f"Primary model {self.primary_model} failed, trying fallback {self.fallback_model}")
-                response = self.openai_client.chat.completions.create(
-                    model=self.fallback_model,
-                    messages=messages
-                )
-                return response.choices[0].message.content.strip(), self.fallback_model
-            except Exception as fallback_e:
-                raise Exception(f"Both models failed. Primary: {str(e)}, Fallback: {str(fallback_e)}")
+            self._ai_telemetry().record(tag, None, (time.time() - started) * 1000, cache_hit=False,
+                                        status="ERROR", error=e, rate_limit_wait_ms=round(sum(waits) * 1000, 1))
+            raise
+        self._ai_telemetry().record(
+            tag, result.model, (time.time() - started) * 1000, cache_hit=False,
+            fallback_used=result.fallback_used, hedged=result.hedged,
+            rate_limit_wait_ms=round(sum(waits) * 1000, 1), **usage_tokens(usage.get(result.model)),
+        )
+        if result.fallback_used:
+            print(f"Primary model {self.primary_model} {'slow' if result.hedged else 'failed'}, answered by {result.model}")
+        return result.value, result.model
+
+    def _ai_telemetry(self) -> AITelemetry:
+        """Per-call AI telemetry written to this run's analysis_metrics.jsonl"""
+        if getattr(self, 'telemetry', None) is None:
+            self.telemetry = AITelemetry(self.output_dir / 'analysis_metrics.jsonl', source="pattern")
+        return self.telemetry
 
     def _define_facility_patterns(self) -> Dict:
         """Define patterns for facility level extraction"""
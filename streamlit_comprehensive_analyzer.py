@@ -29,6 +29,15 @@ from io import BytesIO
 import json
 from dotenv import load_dotenv
 from demo_enhancement import DemoEnhancer
+from ai_client_registry import get_ai_registry
+from ai_rate_limiter import get_rate_limiter
+from ai_request_executor import get_ai_executor
+from ai_response_store import get_default_store, response_cache_key
+from ai_telemetry import AITelemetry, usage_tokens
+from model_router import get_model_router
+from prompt_fingerprint import canonicalize_prompt
+from retrieval_index import INDEX_FILENAME, format_hits, load_or_build_index
+from warm_bundle import import_on_boot
 
 # Load environment variables from root .env
 load_dotenv('.env')
@@ -56,6 +65,9 @@ except ImportError as e:
     integrated_available = False
     st.error(f"Error importing analyzers: {e}")
 
+# Seconds between checks for finished background AI requests (auto-refresh)
+AI_POLL_SECONDS = 3
+
 # Streamlit page configuration
 st.set_page_config(
     page_title="Kenya SHIF Healthcare Policy Analyzer",
@@ -211,69 +223,170 @@ class SHIFHealthcarePolicyAnalyzer:
         return html
     
     def setup_openai(self):
-        """Setup OpenAI client with user-specified models (gpt-5-mini, gpt-4.1-mini)"""
+        """Attach the shared lazy OpenAI client (gpt-5-mini, gpt-4.1-mini); no network calls"""
         try:
-            # Force reload .env file to get correct API key
-            from dotenv import load_dotenv
-            import os
-            load_dotenv('.env', override=True)
-            api_key = os.getenv('OPENAI_API_KEY')
-            if not api_key:
-                api_key = "OPENAI_API_KEY_REMOVED"
-            self.openai_client = openai.OpenAI(api_key=api_key)
-            
-            # Test the client with specified models (try primary first, then fallback)
-            try:
-                # Try primary model (gpt-5-mini) first
-                response = self.openai_client.chat.completions.create(
-                    model=self.primary_model,
-                    messages=[{"role": "user", "content": "Hi"}]
-                )
-                st.sidebar.success(f"✅ OpenAI Ready: {self.primary_model}")
-            except Exception as primary_e:
-                try:
-                    # Try fallback model (gpt-4.1-mini)
-                    response = self.openai_client.chat.completions.create(
-                        model=self.fallback_model,
-                        messages=[{"role": "user", "content": "Hi"}]
-                    )
-                    st.sidebar.success(f"✅ OpenAI Ready: {self.fallback_model} (fallback)")
-                except Exception as fallback_e:
-                    if 'quota' in str(fallback_e).lower():
-                        st.sidebar.warning("⚠️ OpenAI quota exceeded. Analysis functions will be disabled.")
-                    elif 'api_key' in str(fallback_e).lower() or 'invalid' in str(fallback_e).lower():
-                        st.sidebar.warning("⚠️ Please set OPENAI_API_KEY environment variable for AI insights")
-                    else:
-                        st.sidebar.warning(f"⚠️ OpenAI models unavailable: {self.primary_model}, {self.fallback_model}")
-                    self.openai_client = None
+            registry = get_ai_registry()
+            self.openai_client = registry.get_client()
+            if not self.openai_client:
+                st.sidebar.warning("⚠️ Please set OPENAI_API_KEY environment variable for AI insights")
+                return
+            # Health comes from real traffic through the shared router, not probes
+            health = registry.health(self.primary_model, self.fallback_model)
+            last_error = " ".join(filter(None, (h['last_error'] for h in health.values()))).lower()
+            if 'quota' in last_error:
+                st.sidebar.warning("⚠️ OpenAI quota exceeded. Analysis functions may fail.")
+            elif 'api_key' in last_error or 'invalid' in last_error:
+                st.sidebar.warning("⚠️ Please check OPENAI_API_KEY; recent AI requests were rejected")
+            message = registry.status_message(self.primary_model, self.fallback_model)
+            if message.startswith("✅"):
+                st.sidebar.success(message)
+            elif message.startswith("🧪"):
+                st.sidebar.info(message)
+            else:
+                st.sidebar.warning(message)
                 
         except Exception as e:
             st.sidebar.warning("⚠️ OpenAI not available. Core functionality will work without AI insights.")
             self.openai_client = None
     
-    def make_openai_request(self, messages):
-        """Make OpenAI request with primary/fallback model strategy"""
-        if not self.openai_client:
-            raise Exception("OpenAI client not available")
+    def _cached_ai_response(self, prompt: str, tag: str):
+        """(content, model) from the shared AI response store, or None"""
+        started = time.time()
+        store = get_default_store()
+        for model in (self.primary_model, self.fallback_model):
+            try:
+                content = store.get(response_cache_key(model, prompt, tag))
+            except Exception:
+                content = None
+            if content is not None:
+                self._ai_telemetry().record(tag, model, (time.time() - started) * 1000, cache_hit=True)
+                return content, model
+        return None
+
+    def _send_ai_request(self, messages, tag: str = ""):
+        """Routed request that stores the answer; safe off the script thread (no st.* calls).
+
+        Returns (content, model, note) where note describes a fallback answer.
+        """
+        prompt = messages[-1]['content'] if len(messages) == 1 else json.dumps(messages, sort_keys=True)
+        usage = {}
+        waits = []
+        limiter = get_rate_limiter()
+        tokens = limiter.estimate_tokens(" ".join(str(m.get('content', '')) for m in messages))
+        def send(model):
+            response, waited = limiter.call(model, tokens, lambda: self.openai_client.chat.completions.create(
+                model=model,
+                messages=messages
+            ))
+            waits.append(waited)
+            usage[model] = getattr(response, 'usage', None)
+            return response.choices[0].message.content.strip()
         
-        # Try primary model first
+        started = time.time()
         try:
-            response = self.openai_client.chat.completions.create(
-                model=self.primary_model,
-                messages=messages
-            )
-            return response.choices[0].message.content.strip(), self.primary_model
+            result = get_model_router(self.primary_model, self.fallback_model).route(send)
         except Exception as e:
-            # Try fallback model
-            try:
-                st.warning(f"Primary model {self.primary_model} failed, trying fallback {self.fallback_model}")
-                response = self.openai_client.chat.completions.create(
-                    model=self.fallback_model,
-                    messages=messages
-                )
-                return response.choices[0].message.content.strip(), self.fallback_model
-            except Exception as fallback_e:
-                raise Exception(f"Both models failed. Primary: {str(e)}, Fallback: {str(fallback_e)}")
+            self._ai_telemetry().record(tag, None, (time.time() - started) * 1000, cache_hit=False,
+                                        status="ERROR", error=e, rate_limit_wait_ms=round(sum(waits) * 1000, 1))
+            raise
+        latency_ms = (time.time() - started) * 1000
+        model_usage = usage.get(result.model)
+        self._ai_telemetry().record(
+            tag, result.model, latency_ms, cache_hit=False,
+            fallback_used=result.fallback_used, hedged=result.hedged,
+            rate_limit_wait_ms=round(sum(waits) * 1000, 1), **usage_tokens(model_usage),
+        )
+        try:
+            get_default_store().set(
+                response_cache_key(result.model, prompt, tag), result.value, model=result.model, tag=tag,
+                prompt=prompt, latency_ms=latency_ms,
+                prompt_tokens=getattr(model_usage, 'prompt_tokens', None),
+                completion_tokens=getattr(model_usage, 'completion_tokens', None),
+            )
+        except Exception:
+            pass
+        note = None
+        if result.fallback_used:
+            reason = "was slow (hedged)" if result.hedged else "failed"
+            note = f"Primary model {self.primary_model} {reason}, answered by fallback {result.model}"
+        return result.value, result.model, note
+
+    def _request_ai(self, prompt: str, tag: str, render: tuple):
+        """Cached answer, or start/poll a background request; None while it is still running.
+
+        render is (method name, args) that re-displays this analysis; it is kept in
+        the session, keyed by job id (two questions share a tag), so the result is
+        shown on the rerun after the job finishes.
+        """
+        prompt = canonicalize_prompt(prompt)
+        job_id = response_cache_key(self.primary_model, prompt, tag)
+        cached = self._cached_ai_response(prompt, tag)
+        pending = st.session_state.setdefault('ai_pending_jobs', {})
+        if cached is not None:
+            pending.pop(job_id, None)
+            return cached
+        executor = get_ai_executor()
+        messages = [{"role": "user", "content": prompt}]
+        executor.submit(job_id, lambda: self._send_ai_request(messages, tag), tag=tag)
+        job = executor.collect(job_id)
+        if job is None:
+            pending[job_id] = {'tag': tag, 'render': render}
+            st.info("⏳ AI request running in the background. Keep exploring: the result appears "
+                    "here when ready.")
+            return None
+        pending.pop(job_id, None)
+        content, model, note = job.future.result()
+        if note:
+            st.warning(note)
+        return content, model
+
+    def _render_pending_ai_jobs(self):
+        """Show finished background AI requests and list the ones still running"""
+        pending = st.session_state.get('ai_pending_jobs') or {}
+        if not pending:
+            return
+        executor = get_ai_executor()
+        running = False
+        for job_id, entry in list(pending.items()):
+            job = executor.get(job_id)
+            if job is not None and not job.done():
+                running = True
+                continue
+            name, args = entry['render']
+            getattr(self, name)(*args)
+        if running:
+            self._poll_pending_ai_jobs()
+
+    def _poll_pending_ai_jobs(self):
+        """List running background AI requests; rerun the page as soon as one finishes"""
+        executor = get_ai_executor()
+
+        def poll():
+            pending = st.session_state.get('ai_pending_jobs') or {}
+            running = []
+            for job_id, entry in pending.items():
+                job = executor.get(job_id)
+                if job is None or job.done():
+                    st.rerun()
+                running.append(f"{entry['tag']} ({job.elapsed:.0f}s)")
+            if running:
+                st.caption(f"⏳ Running in background: {', '.join(running)}")
+
+        fragment = getattr(st, 'fragment', None)
+        if fragment is None:
+            # Streamlit < 1.37 has no timed fragment reruns; a sleep here would block the page
+            poll()
+            st.button("🔄 Check AI results")
+            return
+        fragment(run_every=AI_POLL_SECONDS)(poll)()
+    
+    def _ai_telemetry(self) -> AITelemetry:
+        """Per-call AI telemetry in the current integrated run folder (or outputs/)"""
+        metrics_path = Path(getattr(self, 'integrated_output_dir', None) or 'outputs') / 'analysis_metrics.jsonl'
+        telemetry = getattr(self, 'telemetry', None)
+        if telemetry is None or telemetry.metrics_path != metrics_path:
+            self.telemetry = AITelemetry(metrics_path, source="streamlit")
+        return self.telemetry
     
     def run(self):
         """Main application runner"""
@@ -293,6 +406,11 @@ class SHIFHealthcarePolicyAnalyzer:
         </div>
         """, unsafe_allow_html=True)
         
+        # Cold instance: restore AI/extraction caches and the latest run from a warm bundle (once per process)
+        warm = import_on_boot(pdf_path)
+        if warm and warm.get('error'):
+            st.sidebar.warning(f"⚠️ Warm bundle rejected: {warm['error']}")
+
         # Load cached results on startup if available
         if "results" not in st.session_state or not st.session_state.results:
             cache_file = Path("unified_analysis_output.json")
@@ -308,6 +426,12 @@ class SHIFHealthcarePolicyAnalyzer:
             else:
                 st.session_state.results = {}
                 st.session_state.has_analysis = False  # No analysis run yet
+                if warm and warm.get('run_dir') and not st.session_state.get('warm_bundle_loaded'):
+                    # Serve the bundled run right away instead of waiting for a fresh extraction
+                    st.session_state.warm_bundle_loaded = True
+                    self.load_existing_results()
+                    if st.session_state.get('results'):
+                        st.sidebar.success(f"♨️ Warm results from {warm['bundle']}")
         else:
             # Results already in session state, use them
             pass
@@ -858,6 +982,20 @@ class SHIFHealthcarePolicyAnalyzer:
             progress.progress(5)
             analyzer = IntegratedComprehensiveMedicalAnalyzer()
 
+            # Show gaps/contradictions as each one is parsed from the streamed response
+            live_findings = st.expander("Live AI findings", expanded=True)
+            findings_placeholder = live_findings.empty()
+            findings = []
+            def _on_insight(kind, item, is_new):
+                label = item.get('gap_id') or item.get('contradiction_id') or kind.title()
+                summary = str(item.get('description') or item.get('gap_category') or item.get('contradiction_type') or '')[:160]
+                findings.append(f"- {'🕳️' if kind == 'gap' else '⚡'} **{label}**{' 🆕' if is_new else ''}: {summary}")
+                gap_count = sum(1 for f in findings if f.startswith('- 🕳️'))
+                findings_placeholder.markdown(
+                    f"**{gap_count} gaps, {len(findings) - gap_count} contradictions so far**\n\n" + "\n".join(findings[-25:])
+                )
+            analyzer.add_insight_listener(_on_insight)
+
             status.text("📊 Extracting and analyzing (enhanced prompts)…")
             progress.progress(30)
             results = analyzer.analyze_complete_document(pdf_path, run_extended_ai=True)
@@ -922,7 +1060,7 @@ class SHIFHealthcarePolicyAnalyzer:
                             json.dump(results['extended_ai'], xf, indent=2)
                         # Also write CSVs per section where possible
                         ext = results['extended_ai']
-                        self._write_structured_csvs(str(analyzer.output_dir), 'extended_annex_quality', ext.get('annex_quality', []))
+                        self._write_structured_csvs(str(analyzer.output_dir), 'extended_annex_quality', ext.get('annex_quality', {}))
                         self._write_structured_csvs(str(analyzer.output_dir), 'extended_rules_map', ext.get('rules_map', {}))
                         self._write_structured_csvs(str(analyzer.output_dir), 'extended_batch_service_analysis', ext.get('batch_service_analysis', []))
                     if 'even_more_ai' in results:
@@ -3581,7 +3719,23 @@ class SHIFHealthcarePolicyAnalyzer:
             )
         with scen_col2:
             run_predictive = st.button("Run Predictive Analysis")
+
+        # Question answering over the run's rows (BM25 top-k, not whole-run summaries)
+        st.markdown("### 💬 Ask About This Analysis")
+        qa_col1, qa_col2 = st.columns([2,1])
+        with qa_col1:
+            user_question = st.text_input(
+                "Question",
+                value="",
+                placeholder="e.g. Which dialysis rules conflict across facility levels?",
+                help="Answered from the rows of this run most relevant to the question",
+            )
+        with qa_col2:
+            ask_question = st.button("Ask", disabled=not user_question.strip())
         
+        # Results of background AI requests started on earlier reruns
+        self._render_pending_ai_jobs()
+
         # Execute AI analysis based on user selection
         if analyze_contradictions:
             if not self.openai_client:
@@ -3613,6 +3767,12 @@ class SHIFHealthcarePolicyAnalyzer:
             else:
                 self.generate_ai_predictive_analysis(user_scenario)
 
+        if ask_question:
+            if not self.openai_client:
+                st.warning("⚠️ OpenAI not available")
+            else:
+                self.generate_ai_question_answer(user_question.strip())
+
         # Show integrated extended AI outputs if present
         if isinstance(getattr(self, 'results', None), dict) and (
             'extended_ai' in self.results or 'even_more_ai' in self.results
@@ -3711,8 +3871,10 @@ For each contradiction:
 **OUTPUT FORMAT (JSON array):**
 Analyze each contradiction using your generalized medical knowledge across all specialties. Focus on contradictions that genuinely threaten clinical care quality or patient safety."""
                 
-                messages = [{"role": "user", "content": prompt}]
-                ai_analysis, model_used = self.make_openai_request(messages)
+                answer = self._request_ai(prompt, "streamlit_contradictions", ('generate_ai_contradiction_analysis', ()))
+                if answer is None:
+                    return
+                ai_analysis, model_used = answer
                 
                 st.markdown("### 🤖 AI Analysis: Policy Contradictions")
                 st.info(f"Analysis generated using {model_used}")
@@ -3841,7 +4003,10 @@ For each gap, provide:
 
 Focus on actionable, Kenya-specific recommendations with medical rationale."""
                 
-                ai_analysis, model_used = self.make_openai_request([{"role": "user", "content": prompt}])
+                answer = self._request_ai(prompt, "streamlit_gaps", ('generate_ai_gap_analysis', ()))
+                if answer is None:
+                    return
+                ai_analysis, model_used = answer
                 
                 st.markdown("### 🤖 AI Analysis: Coverage Gaps")
                 st.info(f"Analysis generated using {model_used}")
@@ -3932,7 +4097,11 @@ Focus on actionable, Kenya-specific recommendations with medical rationale."""
                     summary_data = self.prepare_comprehensive_summary()
                     from updated_prompts import UpdatedHealthcareAIPrompts as P
                     prompt = P.get_strategic_policy_recommendations_prompt(summary_data)
-                    ai_recommendations, model_used = self.make_openai_request([{"role": "user", "content": prompt}])
+                    answer = self._request_ai(prompt, "streamlit_recommendations",
+                                              ('generate_ai_policy_recommendations', ()))
+                    if answer is None:
+                        return
+                    ai_recommendations, model_used = answer
                 st.markdown("### 🤖 Executive Policy Recommendations")
                 st.info(f"Analysis generated using {model_used}")
                 # Try to render as JSON if possible
@@ -3991,11 +4160,16 @@ Focus on actionable, Kenya-specific recommendations with medical rationale."""
                     import json
                     trends_data = json.dumps({
                         'coverage': coverage,
-                        'notes': 'Kenya 2024 context: 56.4M pop, 47 counties, CVD 25% admissions, HTN 24% adults'
+                        'notes': 'Kenya 2024 context: 56.4M pop, 47 counties, CVD 25% admissions, HTN 24% adults',
+                        'relevant_rows': self.retrieve_relevant_rows(scenario_text).splitlines(),
                     })
                     from updated_prompts import UpdatedHealthcareAIPrompts as P
                     prompt = P.get_predictive_analysis_prompt(trends_data, scenario_text)
-                    ai_pred, model_used = self.make_openai_request([{"role": "user", "content": prompt}])
+                    answer = self._request_ai(prompt, "streamlit_predictive",
+                                              ('generate_ai_predictive_analysis', (scenario_text,)))
+                    if answer is None:
+                        return
+                    ai_pred, model_used = answer
                 st.markdown("### 🔮 Predictive Scenario Results")
                 st.info(f"Analysis generated using {model_used}")
                 try:
@@ -4026,6 +4200,56 @@ Focus on actionable, Kenya-specific recommendations with medical rationale."""
             except Exception as e:
                 st.error(f"Predictive analysis failed: {str(e)}")
     
+    def _retrieval_index(self):
+        """BM25 index of this run's rows and findings (built once, saved beside the run outputs).
+
+        Kept in the session while the results object is unchanged, so a question does
+        not re-flatten, re-hash and re-load the whole run.
+        """
+        results = self.results if isinstance(self.results, dict) else {}
+        path = Path(getattr(self, 'integrated_output_dir', None) or 'outputs') / INDEX_FILENAME
+        sizes = tuple(len(results.get(key) or []) for key in ('structured_rules', 'gaps', 'contradictions'))
+        cached = st.session_state.get('retrieval_index')
+        if cached and cached['results'] is results and cached['path'] == path and cached['sizes'] == sizes:
+            return cached['index']
+        index = load_or_build_index(results, path)
+        st.session_state['retrieval_index'] = {'results': results, 'path': path, 'sizes': sizes, 'index': index}
+        return index
+
+    def retrieve_relevant_rows(self, query: str, k: int = None) -> str:
+        """Prompt context with the top-k rows of this run for the query"""
+        k = k or int(os.getenv('SHIF_RAG_TOP_K', '12'))
+        return format_hits(self._retrieval_index().search(query, k=k))
+
+    def generate_ai_question_answer(self, question: str):
+        """Answer a free-form question from the rows most relevant to it"""
+        with st.spinner("🤖 Answering from the most relevant rows..."):
+            try:
+                index = self._retrieval_index()
+                hits = index.search(question, k=int(os.getenv('SHIF_RAG_TOP_K', '12')))
+                context = (
+                    f"Run totals: {len(self.results.get('structured_rules', []))} services, "
+                    f"{len(self.results.get('contradictions', []))} contradictions, "
+                    f"{len(self.results.get('gaps', []))} gaps.\n"
+                    f"Most relevant rows ({len(hits)} of {len(index)} indexed):\n{format_hits(hits)}"
+                )
+                from updated_prompts import UpdatedHealthcareAIPrompts as P
+                prompt = P.get_conversational_analysis_prompt(question, context)
+                answer = self._request_ai(prompt, "streamlit_qa", ('generate_ai_question_answer', (question,)))
+                if answer is None:
+                    return
+                ai_answer, model_used = answer
+                st.markdown(f"### 💬 {question}")
+                st.info(f"Answered using {model_used} from {len(hits)} retrieved rows")
+                st.markdown(ai_answer)
+                with st.expander("📄 Rows sent to the model"):
+                    st.text(format_hits(hits))
+                if not hasattr(self, 'ai_insights'):
+                    self.ai_insights = {}
+                self.ai_insights[f"question: {question[:60]}"] = ai_answer
+            except Exception as e:
+                st.error(f"Question answering failed: {str(e)}")
+
     def generate_ai_kenya_insights(self):
         """Generate Kenya-specific AI insights"""
         
@@ -4101,7 +4325,10 @@ How benefit package addresses variations across Kenya's 47 counties
 
 Focus on actionable, evidence-based insights that consider Kenya's unique challenges and opportunities."""
                 
-                ai_insights, model_used = self.make_openai_request([{"role": "user", "content": prompt}])
+                answer = self._request_ai(prompt, "streamlit_kenya_insights", ('generate_ai_kenya_insights', ()))
+                if answer is None:
+                    return
+                ai_insights, model_used = answer
                 
                 st.markdown("### 🤖 AI Insights: Kenya Healthcare Context")
                 st.info(f"Analysis generated using {model_used}")
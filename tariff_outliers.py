@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Tariff Outliers - Vectorised per-specialty tariff outlier detection
+Used by the integrated analyzer in place of sending global min/max/mean/std
+to get_tariff_outlier_prompt.
+
+Tariffs are compared on a log scale within their own specialty. One grouped
+pass (a lexsort by specialty then log tariff) yields each specialty's median,
+quartiles and IQR; a second sort of the absolute deviations yields the MAD.
+Every procedure gets a robust z-score, 0.6745 * (log t - median) / MAD, and
+is flagged when |z| reaches the threshold or it falls outside the log-scale
+IQR fences. Flags are ranked by score so the LLM only has to explain the
+top-N, and no per-row Python runs before that point.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_Z_THRESHOLD = 3.5  # Iglewicz-Hoaglin cut-off for modified z-scores
+DEFAULT_IQR_K = 1.5
+DEFAULT_MIN_GROUP_SIZE = 5
+MAD_SCALE = 0.6745  # makes the MAD consistent with the standard deviation of a normal
+
+
+def _group_quantiles(sorted_values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """Linear-interpolated q-quantile of every group in a group-sorted array (NaN for empty groups)."""
+    out = np.full(len(counts), np.nan)
+    present = counts > 0
+    if not present.any():
+        return out
+    last = starts[present] + counts[present] - 1
+    pos = starts[present] + q * (counts[present] - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, last)
+    frac = pos - lo
+    out[present] = sorted_values[lo] * (1 - frac) + sorted_values[hi] * frac
+    return out
+
+
+@dataclass
+class TariffOutlierReport:
+    """Per-specialty statistics and the ranked flagged procedures"""
+    specialties: List[str]
+    stats: Dict[str, np.ndarray]
+    row_index: np.ndarray       # original row of each flagged procedure, best score first
+    scores: np.ndarray          # |z| of each flagged procedure
+    z: np.ndarray               # signed robust z-score of every input row (NaN when not scored)
+    codes: np.ndarray
+    tariffs: np.ndarray
+    procedures: Optional[Sequence] = None
+    skipped_rows: int = 0
+    settings: Dict = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.row_index)
+
+    def specialty_stats(self) -> List[Dict]:
+        rows = []
+        for g, name in enumerate(self.specialties):
+            if not self.stats['count'][g]:
+                continue
+            rows.append({
+                'specialty': name,
+                'count': int(self.stats['count'][g]),
+                'median_tariff': round(float(np.exp(self.stats['median'][g])), 2),
+                'q1_tariff': round(float(np.exp(self.stats['q1'][g])), 2),
+                'q3_tariff': round(float(np.exp(self.stats['q3'][g])), 2),
+                'log_iqr': round(float(self.stats['iqr'][g]), 4),
+                'log_mad': round(float(self.stats['mad'][g]), 4),
+                'flagged': int(self.stats['flagged'][g]),
+            })
+        return rows
+
+    def top(self, n: int = None) -> List[Dict]:
+        """The n highest-scoring flagged procedures as plain dicts (all of them when n is None)."""
+        rows = []
+        for i, score in zip(self.row_index[:n], self.scores[:n]):
+            g = self.codes[i]
+            z = float(self.z[i])
+            median = float(np.exp(self.stats['median'][g]))
+            rows.append({
+                'row': int(i),
+                'specialty': self.specialties[g],
+                'procedure': str(self.procedures[i]) if self.procedures is not None else "",
+                'tariff': float(self.tariffs[i]),
+                'specialty_median': round(median, 2),
+                'ratio_to_median': round(float(self.tariffs[i]) / median, 2) if median else None,
+                'robust_z': round(z, 2) if np.isfinite(z) else None,
+                'direction': 'high' if self.tariffs[i] >= median else 'low',
+                'score': round(float(score), 2),
+            })
+        return rows
+
+    def to_dict(self, top_n: int = None) -> Dict:
+        return {
+            'flagged': self.top(top_n),
+            'specialty_stats': self.specialty_stats(),
+            'summary': {
+                'rows': int(len(self.tariffs)),
+                'scored_rows': int(self.stats['count'].sum()),
+                'skipped_rows': self.skipped_rows,
+                'specialties': len(self.specialty_stats()),
+                'flagged': len(self),
+                **self.settings,
+            },
+        }
+
+
+def detect_tariff_outliers(tariffs, specialties, procedures: Sequence = None,
+                           specialty_names: Sequence[str] = None,
+                           z_threshold: float = DEFAULT_Z_THRESHOLD, iqr_k: float = DEFAULT_IQR_K,
+                           min_group_size: int = DEFAULT_MIN_GROUP_SIZE) -> TariffOutlierReport:
+    """Score every tariff against its specialty and rank the outliers.
+
+    specialties holds one label per row, or integer codes into specialty_names
+    when those are given (e.g. from pandas.factorize, which avoids sorting strings).
+    Missing, zero and negative tariffs are not scored. Specialties with fewer than
+    min_group_size scored rows get statistics but no flags.
+    """
+    tariffs = np.asarray(tariffs, dtype=np.float64)
+    if specialty_names is None:
+        names, codes = np.unique(np.asarray(specialties, dtype=object).astype(str), return_inverse=True)
+        specialty_names = [str(n) for n in names]
+    else:
+        codes = np.asarray(specialties, dtype=np.int64)
+        specialty_names = [str(n) for n in specialty_names]
+    codes = codes.reshape(-1)
+    n_groups = len(specialty_names)
+
+    valid = np.isfinite(tariffs) & (tariffs > 0) & (codes >= 0)
+    idx = np.flatnonzero(valid)
+    log_t = np.log(tariffs[idx])
+    group = codes[idx]
+
+    # Pass 1: sort by (specialty, log tariff) -> median and quartiles per specialty
+    order = np.lexsort((log_t, group))
+    sorted_log = log_t[order]
+    counts = np.bincount(group, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    median = _group_quantiles(sorted_log, starts, counts, 0.5)
+    q1 = _group_quantiles(sorted_log, starts, counts, 0.25)
+    q3 = _group_quantiles(sorted_log, starts, counts, 0.75)
+    iqr = q3 - q1
+
+    # Pass 2: sort absolute deviations within specialty -> MAD
+    sorted_group = group[order]
+    deviation = np.abs(sorted_log - median[sorted_group])
+    mad = _group_quantiles(deviation[np.lexsort((deviation, sorted_group))], starts, counts, 0.5)
+    # A specialty where most tariffs are identical has MAD 0; fall back to IQR / 1.349 (its normal
+    # consistency factor), and leave the z-score undefined when that is 0 too
+    spread = np.where(mad > 0, mad, iqr * MAD_SCALE / 1.349)
+    spread = np.where(spread > 0, spread, np.nan)
+
+    z_valid = MAD_SCALE * (log_t - median[group]) / spread[group]
+    outside_fence = (log_t < q1[group] - iqr_k * iqr[group]) | (log_t > q3[group] + iqr_k * iqr[group])
+    outside_fence &= iqr[group] > 0
+    with np.errstate(invalid='ignore'):
+        flagged = (np.abs(z_valid) >= z_threshold) | outside_fence
+    flagged &= counts[group] >= min_group_size
+
+    # Fence-only flags get a score just below the z cut-off so z-flags rank first
+    scores_all = np.where(np.isfinite(z_valid), np.abs(z_valid), 0.0)
+    flagged_idx = np.flatnonzero(flagged)
+    flagged_scores = scores_all[flagged_idx]
+    fence_only = np.abs(np.nan_to_num(z_valid[flagged_idx])) < z_threshold
+    flagged_scores = np.where(fence_only, np.minimum(flagged_scores, z_threshold - 1e-6), flagged_scores)
+    rank = np.argsort(-flagged_scores, kind='stable')
+
+    z = np.full(len(tariffs), np.nan)
+    z[idx] = z_valid
+    return TariffOutlierReport(
+        specialties=specialty_names,
+        stats={'count': counts, 'median': median, 'q1': q1, 'q3': q3, 'iqr': iqr, 'mad': mad,
+               'flagged': np.bincount(group[flagged_idx], minlength=n_groups)},
+        row_index=idx[flagged_idx][rank],
+        scores=flagged_scores[rank],
+        z=z,
+        codes=codes,
+        tariffs=tariffs,
+        procedures=procedures,
+        skipped_rows=int(len(tariffs) - len(idx)),
+        settings={'z_threshold': z_threshold, 'iqr_k': iqr_k, 'min_group_size': min_group_size},
+    )
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Tests that the shared AI client registry is lazy and reports traffic-based health"""
+
+import copy
+import os
+
+from ai_client_registry import AIClientRegistry, LazyOpenAIClient
+from model_router import get_model_router
+
+
+def test_cold_start_is_lazy_and_shared():
+    """Getting a client builds nothing; the same key returns the same client"""
+    registry = AIClientRegistry()
+    registry._env_loaded = True
+    os.environ['OPENAI_API_KEY'] = 'sk-test-registry'
+    try:
+        client = registry.get_client()
+        assert client and not client.is_built
+        assert registry.get_client() is client
+        assert registry.get_client('sk-other') is not client
+    finally:
+        os.environ.pop('OPENAI_API_KEY', None)
+    assert registry.get_client() is None
+    print("   ✅ Lazy shared client")
+
+
+def test_introspection_does_not_build():
+    """Dunder probes and a half-initialised instance raise AttributeError instead of building a client"""
+    client = LazyOpenAIClient('sk-test-lazy')
+    assert not hasattr(client, '__deepcopy_hook__') and not client.is_built
+    assert copy.copy(client)._api_key == 'sk-test-lazy' and not client.is_built
+    bare = LazyOpenAIClient.__new__(LazyOpenAIClient)
+    for name in ('_api_key', '_client', '_lock'):
+        try:
+            getattr(bare, name)
+            raise AssertionError(name)
+        except AttributeError:
+            pass
+    print("   ✅ Introspection stays lazy")
+
+
+def test_health_from_traffic():
+    """Models start 'unknown' and become 'healthy' after a routed call"""
+    registry = AIClientRegistry()
+    health = registry.health('registry-primary', 'registry-fallback')
+    assert health['registry-primary']['status'] == 'unknown'
+    get_model_router('registry-primary', 'registry-fallback').route(lambda model: "ok")
+    health = registry.health('registry-primary', 'registry-fallback')
+    assert health['registry-primary']['status'] == 'healthy'
+    assert health['registry-fallback']['status'] == 'unknown'
+    print("   ✅ Health from real traffic")
+
+
+if __name__ == "__main__":
+    test_cold_start_is_lazy_and_shared()
+    test_introspection_does_not_build()
+    test_health_from_traffic()
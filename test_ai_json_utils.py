@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Tests for parsing gap/contradiction JSON out of model responses"""
+
+from ai_json_utils import IncrementalJSONArrayParser, collect_items, extract_json_values, largest_json_value
+
+RESPONSE = (
+    'Here are the findings:\n```json\n'
+    '{"summary": "brace } and [bracket] in a string", '
+    '"gaps": [{"gap_id": "GAP_01", "description": "Quote \\" and } inside", "evidence": {"pages": [3, 4]}}, '
+    '{"gap_id": "GAP_02", "description": "Second"}], '
+    '"notes": [{"ignored": true}]}\n```'
+)
+
+
+def test_incremental_objects_any_chunking():
+    """Objects are emitted on their closing brace regardless of chunk boundaries"""
+    for size in (1, 2, 5, 17, len(RESPONSE)):
+        parser = IncrementalJSONArrayParser(('gaps',))
+        ids = []
+        for i in range(0, len(RESPONSE), size):
+            ids.extend(obj['gap_id'] for obj in parser.feed(RESPONSE[i:i + size]))
+        assert ids == ['GAP_01', 'GAP_02'], (size, ids)
+        assert parser.text == RESPONSE and parser.errors == 0
+    print("   ✅ Incremental parsing independent of chunking")
+
+
+def test_emits_before_stream_ends():
+    """The first object is available as soon as its brace closes"""
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('[{"contradiction_id": "C1"}') == [{'contradiction_id': 'C1'}]
+    assert parser.feed(', {"contradiction_id": "C2", "x": [1, {"y": 2}]') == []
+    assert parser.feed('}]') == [{'contradiction_id': 'C2', 'x': [1, {'y': 2}]}]
+    print("   ✅ Objects emitted before the stream completes")
+
+
+def test_extract_values_with_offsets():
+    """All top-level values are found; nested braces in strings do not split them"""
+    text = ('Intro "quoted" text {"contradiction_type": "tier", "note": "a } b"} then '
+            '[{"contradiction_id": "C1", "evidence": {"pages": [1]}}] and a stray } brace')
+    spans = extract_json_values(text)
+    assert [type(s.value) for s in spans] == [dict, list]
+    assert text[spans[0].start:spans[0].end].startswith('{"contradiction_type"')
+    assert text[spans[1].start:spans[1].end].endswith('}]')
+    items = collect_items(text, 'contradictions', is_item=lambda o: 'contradiction_type' in o)
+    assert [i.get('contradiction_id', i.get('contradiction_type')) for i in items] == ['tier', 'C1']
+    assert largest_json_value(text) == spans[1].value
+    print("   ✅ Values extracted with offsets")
+
+
+def test_truncated_response_salvages_items():
+    """A response cut off mid-array still yields its complete objects"""
+    text = '{"gaps": [{"gap_id": "G1", "d": {"x": 1}}, {"gap_id": "G2"}, {"gap_id": "G3", "d": "cut'
+    items = collect_items(text, 'gaps', is_item=lambda o: 'gap_id' in o)
+    assert [i['gap_id'] for i in items] == ['G1', 'G2']
+    print("   ✅ Truncated responses salvaged")
+
+
+if __name__ == "__main__":
+    test_incremental_objects_any_chunking()
+    test_emits_before_stream_ends()
+    test_extract_values_with_offsets()
+    test_truncated_response_salvages_items()
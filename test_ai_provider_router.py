@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Tests for latency/cost-aware provider routing against local stand-in servers"""
+
+import shutil
+import time
+
+from ai_provider_router import OPENAI, InvalidResponse, Provider, ProviderRouter
+from ai_response_store import response_cache_key
+from offline_llm_backend import OfflineChatClient, serve_chat_completions
+
+
+def _stand_in(latency_ms, error_rate=0.0):
+    server = serve_chat_completions(OfflineChatClient(mode="synthetic", latency_ms=latency_ms, error_rate=error_rate))
+    return server, f"http://127.0.0.1:{server.server_port}/v1"
+
+
+def _router(fast_url, slow_url, **kw):
+    providers = [
+        Provider(OPENAI, 'gpt-5-mini', prior_seconds=8.0),
+        Provider('fast', 'stand-in-fast', api_key='none', base_url=fast_url, prior_seconds=1.0),
+        Provider('slow', 'stand-in-slow', api_key='none', base_url=slow_url, prior_seconds=1.0),
+    ]
+    return ProviderRouter(providers, **kw)
+
+
+def test_routing_follows_observed_latency():
+    """Classification prompts move to the provider that answers fastest over HTTP"""
+    fast, fast_url = _stand_in(10)
+    slow, slow_url = _stand_in(250)
+    try:
+        router = _router(fast_url, slow_url)
+        for _ in range(3):
+            for name in ('slow', 'fast'):
+                content, usage, waited = router.complete(name, "Classify these services: []")
+                assert content and usage.total_tokens > 0 and waited == 0.0
+        assert router.plan('batch_service_analysis', 500) == ['fast', 'slow', OPENAI]
+        assert router.plan('', 500, schema='canonicalization')[0] == 'fast'
+        # Analysis prompts stay on OpenAI
+        assert router.plan('contradictions_main', 500, schema='contradictions') == [OPENAI]
+        assert router.health()['fast']['samples'] == 3
+    finally:
+        fast.shutdown()
+        slow.shutdown()
+    print("   ✅ Routing follows observed latency")
+
+
+def test_error_rate_cost_and_overrides():
+    """Errors and price push a provider down; overrides pin a route"""
+    router = _router("http://127.0.0.1:9/v1", "http://127.0.0.1:9/v1")
+    for _ in range(3):
+        router.record('fast', 0.5, True)
+        router.record('slow', 1.0, True)
+    assert router.plan('batch_service_analysis')[0] == 'fast'
+    for _ in range(3):
+        router.record('fast', 0.5, False)
+    # 3/6 failures: 0.5s x (1 + 4 x 0.5) = 1.5s > 1.0s
+    assert router.plan('batch_service_analysis')[0] == 'slow'
+
+    # OpenAI outranks both once their price is worth more than its latency
+    priced = _router("http://x/v1", "http://y/v1", seconds_per_usd=1e6)
+    priced.providers['fast'].model = priced.providers['slow'].model = 'gpt-4.1-mini'
+    assert priced.plan('gap_deduplication', 10_000) == [OPENAI]
+
+    pinned = _router("http://x/v1", "http://y/v1", routes={'gaps_main': 'slow', 'classification': OPENAI})
+    assert pinned.plan('gaps_main') == ['slow', OPENAI]
+    assert pinned.plan('batch_service_analysis') == [OPENAI]
+    assert ProviderRouter([Provider(OPENAI, 'gpt-5-mini')]).plan('batch_service_analysis') == [OPENAI]
+
+    # Expert assessments stay on OpenAI unless a deployment opts their tag into a routable class
+    assert router.plan('annex_quality') == [OPENAI]
+    opted_in = _router("http://x/v1", "http://y/v1", prompt_classes={'annex_quality': 'classification'})
+    assert opted_in.plan('annex_quality')[0] != OPENAI
+    print("   ✅ Error penalty, cost and overrides shape the plan")
+
+
+def test_failed_provider_and_cache_keys():
+    """A failing provider raises to the caller and is recorded; cache keys are provider-specific"""
+    broken, broken_url = _stand_in(0, error_rate=1.0)
+    try:
+        router = _router(broken_url, broken_url)
+        try:
+            router.complete('fast', "Classify these services: []")
+            raise AssertionError("expected the simulated error to propagate")
+        except Exception as e:
+            assert not isinstance(e, AssertionError)
+        assert router.stats['fast'].error_rate() == 1.0
+    finally:
+        broken.shutdown()
+    keys = {response_cache_key(m, "prompt", "annex_quality")
+            for m in ('gpt-5-mini', router.cache_model('fast'), router.cache_model('slow'))}
+    assert len(keys) == 3
+    assert router.cache_model('fast') == 'fast:stand-in-fast'
+    print("   ✅ Provider failures are recorded and cache keys stay provider-specific")
+
+
+def test_invalid_answers_count_once_and_openai_is_measured():
+    """A rejected answer is one failure; routable OpenAI calls feed OpenAI's own stats"""
+    server, url = _stand_in(0)
+    try:
+        router = _router(url, url)
+        try:
+            router.complete('fast', "Classify these services: []", validate=lambda text: False)
+            raise AssertionError("expected InvalidResponse")
+        except InvalidResponse:
+            pass
+        assert list(router.stats['fast'].outcomes) == [False] and router.stats['fast'].latency.count() == 0
+    finally:
+        server.shutdown()
+
+    from integrated_comprehensive_analyzer import IntegratedComprehensiveMedicalAnalyzer
+    analyzer = IntegratedComprehensiveMedicalAnalyzer()
+    try:
+        analyzer.provider_router = router
+        analyzer._route_openai(lambda model: "ok", 'batch_service_analysis', None)
+        analyzer._route_openai(lambda model: "ok", 'gaps_main', 'gaps')
+        assert list(router.stats[OPENAI].outcomes) == [True] and router.stats[OPENAI].latency.count() == 1
+    finally:
+        shutil.rmtree(analyzer.output_dir, ignore_errors=True)
+    print("   ✅ Invalid answers count once; OpenAI outcomes are recorded")
+
+
+def test_idle_provider_behind_openai_is_probed():
+    """A provider that fell behind OpenAI gets one probe call after being idle"""
+    router = _router("http://x/v1", "http://y/v1", probe_seconds=0.2)
+    for _ in range(3):
+        router.record(OPENAI, 0.5, True)
+        router.record('fast', 0.2, False)
+        router.record('slow', 5.0, True)
+    assert router.plan('batch_service_analysis') == [OPENAI]
+    time.sleep(0.25)
+    probes = {router.plan('batch_service_analysis')[0], router.plan('batch_service_analysis')[0]}
+    assert probes == {'fast', 'slow'}
+    assert router.plan('batch_service_analysis') == [OPENAI]  # one probe per provider and idle period
+    router.probe_seconds = 0  # disabled
+    time.sleep(0.25)
+    assert router.plan('batch_service_analysis') == [OPENAI]
+    print("   ✅ Idle providers behind OpenAI are probed")
+
+
+if __name__ == "__main__":
+    test_routing_follows_observed_latency()
+    test_error_rate_cost_and_overrides()
+    test_failed_provider_and_cache_keys()
+    test_invalid_answers_count_once_and_openai_is_measured()
+    test_idle_provider_behind_openai_is_probed()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Tests for the cross-process AI rate limiter"""
+
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from ai_rate_limiter import RateLimiter, is_rate_limit_error
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def _limiter(tmp, clock, **kw):
+    return RateLimiter(state_path=Path(tmp) / 'rate_limits.json', limits={'m': {'rpm': 60, 'tpm': 6000}},
+                       enabled=True, sleep=clock.sleep, clock=clock, **kw)
+
+
+def test_buckets_wait_for_requests_and_tokens():
+    """Requests past the per-minute budget wait for the bucket to refill"""
+    clock = FakeClock()
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = _limiter(tmp, clock)
+        waits = [limiter.acquire('m', 100) for _ in range(60)]
+        assert sum(waits) == 0
+        assert round(limiter.acquire('m', 100), 2) == 1.0  # 60 rpm refills one request per second
+        assert limiter.acquire('m', 6000) > 0  # token bucket was drained by 61 * 100 tokens
+        status = limiter.status()['m']
+        assert status['waited_seconds'] > 1 and status['rate_limited'] == 0
+    print("   ✅ Request and token buckets enforce per-minute limits")
+
+
+def test_rate_limit_feedback():
+    """A 429 halves the rate and pauses until Retry-After; successes recover it"""
+    clock = FakeClock()
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = _limiter(tmp, clock)
+        error = Exception("Error code: 429 - rate limit exceeded")
+        error.response = SimpleNamespace(headers={'retry-after': '5'})
+
+        def send():
+            raise error
+
+        try:
+            limiter.call('m', 10, send)
+        except Exception as e:
+            assert is_rate_limit_error(e)
+        assert limiter.status()['m']['scale'] == 0.5
+        assert limiter.acquire('m', 10) >= 5.0
+        response = SimpleNamespace(usage=SimpleNamespace(total_tokens=3, prompt_tokens=2, completion_tokens=1))
+        assert limiter.call('m', 10, lambda: response)[0] is response
+        assert limiter.status()['m']['scale'] == 0.6
+        assert not is_rate_limit_error(ValueError("bad json"))
+    print("   ✅ 429s back off the bucket, successes recover it")
+
+
+def _worker(state_path, count, queue):
+    limiter = RateLimiter(state_path=state_path, limits={'m': {'rpm': 600, 'tpm': 1_000_000}}, enabled=True)
+    for _ in range(count):
+        limiter.acquire('m', 1)
+    queue.put(time.time())
+
+
+def test_processes_share_one_budget():
+    """Two processes draw from the same bucket via the state file"""
+    with tempfile.TemporaryDirectory() as tmp:
+        state_path = str(Path(tmp) / 'rate_limits.json')
+        RateLimiter(state_path=state_path, limits={'m': {'rpm': 600, 'tpm': 1_000_000}}, enabled=True).acquire('m')
+        queue = multiprocessing.Queue()
+        started = time.time()
+        procs = [multiprocessing.Process(target=_worker, args=(state_path, 302, queue)) for _ in range(2)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(30)
+        finished = max(queue.get() for _ in procs)
+        # 604 requests against the 599 left in a 600 rpm bucket: 5 refills at 10/s
+        assert finished - started >= 0.4, finished - started
+    print("   ✅ Processes share one rate-limit budget")
+
+
+if __name__ == "__main__":
+    test_buckets_wait_for_requests_and_tokens()
+    test_rate_limit_feedback()
+    test_processes_share_one_budget()
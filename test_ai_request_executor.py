@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Tests for the background, de-duplicated AI request executor used by the dashboard"""
+
+import threading
+
+from ai_request_executor import AIRequestExecutor
+
+
+def test_same_job_id_runs_once():
+    """Resubmitting a running job returns it; the function runs once"""
+    executor = AIRequestExecutor(max_workers=2)
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return ("answer", "gpt-5-mini", None)
+
+    job = executor.submit('key-1', slow, tag='streamlit_gaps')
+    assert executor.submit('key-1', slow) is job
+    assert executor.collect('key-1') is None and [j.tag for j in executor.running()] == ['streamlit_gaps']
+    release.set()
+    job.future.result(timeout=5)
+    assert executor.collect('key-1') is job and executor.get('key-1') is None
+    assert len(calls) == 1 and job.future.result() == ("answer", "gpt-5-mini", None)
+    print("   ✅ One request per job id")
+
+
+def test_failed_job_is_collected_with_its_error():
+    """A failing request finishes, is collected, and re-raises on result()"""
+    executor = AIRequestExecutor(max_workers=1)
+
+    def fail():
+        raise RuntimeError("Error code: 429")
+
+    job = executor.submit('key-2', fail)
+    try:
+        job.future.result(timeout=5)
+    except RuntimeError:
+        pass
+    collected = executor.collect('key-2')
+    assert collected is job and isinstance(collected.future.exception(), RuntimeError)
+    # A later submit starts a fresh attempt
+    assert executor.submit('key-2', lambda: "ok").future.result(timeout=5) == "ok"
+    print("   ✅ Failed job collected and retried")
+
+
+if __name__ == "__main__":
+    test_same_job_id_runs_once()
+    test_failed_job_is_collected_with_its_error()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Tests for the SQLite AI response store (legacy import, LRU eviction, stats)"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+from ai_response_store import AIResponseStore
+
+
+def test_legacy_import_and_hits():
+    """Legacy .txt/.json cache files are imported under their original keys"""
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = Path(tmp) / "ai_cache"
+        legacy.mkdir()
+        key = "a" * 40
+        (legacy / f"{key}.txt").write_text('[{"gap_id": "G1"}]', encoding='utf-8')
+        (legacy / "kenya_gaps_gpt-4o_0123456789abcdef.json").write_text("[]", encoding='utf-8')
+        (legacy / "notes.txt").write_text("ignored", encoding='utf-8')
+
+        store = AIResponseStore(db_path=str(legacy / "store.sqlite3"))
+        assert store.get(key) == '[{"gap_id": "G1"}]'
+        assert store.get("kenya_gaps_gpt-4o_0123456789abcdef") == "[]"
+        assert store.get("notes") is None
+
+        stats = store.stats()
+        assert stats['entries'] == 2
+        assert stats['hits'] == 2
+        print(f"   ✅ Imported {stats['entries']} legacy entries")
+        store.close()
+
+
+def test_lru_eviction_and_compression():
+    """Oldest-accessed entries are evicted first; large bodies round-trip compressed"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = AIResponseStore(db_path=str(Path(tmp) / "s.sqlite3"), max_entries=2, compress_min_bytes=16)
+        store.set("k1", "x" * 100, model="gpt-5-mini", tag="gaps_main", prompt="p1", latency_ms=10.0)
+        store.set("k2", "y" * 100, model="gpt-5-mini", tag="gaps_main", prompt="p2")
+        store.get("k1")  # k1 becomes most recently used
+        store.set("k3", "z", model="gpt-4.1-mini", tag="equity_analysis", prompt="p3")
+
+        assert store.get("k2") is None
+        assert store.get("k1") == "x" * 100
+        assert store.get("k3") == "z"
+        assert store.stats()['compressed_entries'] == 1
+        print("   ✅ LRU eviction and compression working")
+        store.close()
+
+
+if __name__ == "__main__":
+    test_legacy_import_and_hits()
+    test_lru_eviction_and_compression()
+    print("\n✅ ALL TESTS PASSED")
+    sys.exit(0)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Tests for the analyzer's retry wrapper around routed AI calls"""
+
+import shutil
+
+from model_router import AllModelsFailed
+
+
+def _analyzer(outcomes):
+    """Analyzer whose _call_openai raises/returns the given outcomes in order."""
+    from integrated_comprehensive_analyzer import IntegratedComprehensiveMedicalAnalyzer
+    analyzer = IntegratedComprehensiveMedicalAnalyzer()
+    calls = []
+
+    def call_openai(prompt, tag="", fingerprint=None, schema=None):
+        outcome = outcomes[len(calls)]
+        calls.append(tag)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    analyzer._call_openai = call_openai
+    return analyzer, calls
+
+
+def test_unrouted_errors_are_retried():
+    """An error outside the model route is retried with backoff until a call succeeds"""
+    analyzer, calls = _analyzer([ValueError("store busy"), "[]"])
+    try:
+        assert analyzer._call_openai_with_retry("p", tag="batch_service_analysis", retries=3, backoff=0.01) == ("[]", 2)
+        analyzer, calls = _analyzer([ValueError("a"), ValueError("b")])
+        try:
+            analyzer._call_openai_with_retry("p", tag="batch_service_analysis", retries=2, backoff=0.01)
+            raise AssertionError("expected RuntimeError")
+        except RuntimeError as e:
+            assert "after 2 attempts" in str(e) and len(calls) == 2
+    finally:
+        shutil.rmtree(analyzer.output_dir, ignore_errors=True)
+    print("   ✅ Unrouted errors retried")
+
+
+def test_router_failures_are_not_retried():
+    """When primary and fallback both failed in the router, the wrapper gives up at once"""
+    analyzer, calls = _analyzer([AllModelsFailed("All models failed. gpt-5-mini: 503"), "[]"])
+    try:
+        try:
+            analyzer._call_openai_with_retry("p", tag="batch_service_analysis", retries=3, backoff=0.01)
+            raise AssertionError("expected AllModelsFailed")
+        except AllModelsFailed:
+            pass
+        assert len(calls) == 1
+    finally:
+        shutil.rmtree(analyzer.output_dir, ignore_errors=True)
+    print("   ✅ Router failures not retried")
+
+
+if __name__ == "__main__":
+    test_unrouted_errors_are_retried()
+    test_router_failures_are_not_retried()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Tests for the structured-output schema registry, validation and repair prompts"""
+
+import json
+
+from ai_batch_jobs import batch_request_line
+from ai_schemas import SCHEMAS, build_repair_prompt, get_schema, structured_items, validate_response
+
+GAPS = [
+    {'gap_id': 'GAP_01', 'gap_type': 'missing_essential_service', 'description': 'No stroke rehabilitation'},
+    {'gap_id': 'GAP_02', 'gap_type': 'access_barrier', 'description': 'No ICU at level 4', 'extra': {'a': 1}},
+]
+
+
+def test_valid_responses_skip_salvage():
+    """Object and bare-array forms both validate and yield the list_key items"""
+    schema = get_schema('gaps')
+    assert structured_items(json.dumps({'gaps': GAPS}), schema) == GAPS
+    assert structured_items(json.dumps(GAPS), schema) == GAPS
+    assert structured_items('Findings:\n```json\n' + json.dumps(GAPS) + '\n```', schema) == GAPS
+    for ai_schema in SCHEMAS.values():
+        fmt = ai_schema.response_format()
+        assert fmt['type'] == 'json_schema' and fmt['json_schema']['schema']['type'] == 'object'
+    print("   ✅ Valid structured responses parsed without salvage")
+
+
+def test_invalid_responses_report_errors():
+    """Missing fields, wrong types and enum violations are reported; prose has no JSON"""
+    schema = get_schema('batch_service_analysis')
+    value, errors = validate_response(json.dumps([
+        {'service_name': 'Dialysis', 'clinical_risk': 'SEVERE', 'coverage_adequacy': 'ADEQUATE'},
+        {'service_name': 'MRI', 'clinical_risk': 'LOW', 'recommended_facility_level': ['5']},
+    ]), schema)
+    assert value['items'][0]['service_name'] == 'Dialysis'
+    assert any("'SEVERE' not in" in e for e in errors)
+    assert "$.items[1]: missing required 'coverage_adequacy'" in errors
+    assert any(e.startswith('$.items[1].recommended_facility_level[0]: expected integer') for e in errors)
+    assert structured_items(json.dumps(value), schema) is None
+    assert validate_response('No JSON here at all', schema) == (None, ["$: no JSON value found"])
+    print("   ✅ Validation errors reported with paths")
+
+
+def test_repair_prompt_and_batch_body():
+    """The repair prompt carries the schema and capped errors; batch lines carry response_format"""
+    schema = get_schema('contradictions')
+    errors = [f"$.contradictions[{i}]: missing required 'description'" for i in range(20)]
+    prompt = build_repair_prompt(schema, '{"contradictions": []}', errors)
+    assert '"contradiction_type"' in prompt and '... and 8 more' in prompt
+    assert prompt.count("missing required 'description'") == 12
+    line = batch_request_line('gaps-1', 'gpt-5-mini', 'prompt', get_schema('gaps').response_format())
+    assert line['body']['response_format']['json_schema']['name'] == 'gaps'
+    assert 'response_format' not in batch_request_line('gaps-1', 'gpt-5-mini', 'prompt')['body']
+    print("   ✅ Repair prompt and batch request body")
+
+
+if __name__ == "__main__":
+    test_valid_responses_skip_salvage()
+    test_invalid_responses_report_errors()
+    test_repair_prompt_and_batch_body()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Tests for per-call AI telemetry, run rollups and run comparison"""
+
+import json
+import tempfile
+from pathlib import Path
+
+from ai_telemetry import AITelemetry, compare_runs, load_call_records, main
+
+
+def _write_run(run_dir: Path, latency: float, hit: bool) -> AITelemetry:
+    telemetry = AITelemetry(run_dir / 'analysis_metrics.jsonl', run_id=run_dir.name)
+    telemetry.record('contradictions', 'gpt-5-mini', latency, cache_hit=hit, prompt_tokens=1000, completion_tokens=200,
+                     cached_tokens=768)
+    telemetry.record('gaps', 'gpt-4.1-mini', latency * 2, cache_hit=False, fallback_used=True,
+                     prompt_tokens=800, completion_tokens=150)
+    telemetry.record('gaps', 'gpt-5-mini', 5, cache_hit=False, status='FAILED', error='Error code: 500')
+    return telemetry
+
+
+def test_record_and_rollup():
+    """Records land in the metrics JSONL and roll up per tag with a TOTAL row"""
+    with tempfile.TemporaryDirectory() as tmp:
+        run = Path(tmp) / 'outputs_run_a'
+        telemetry = _write_run(run, 1200, hit=False)
+        # Non-AI stage entries in the same file are ignored
+        with open(run / 'analysis_metrics.jsonl', 'a') as f:
+            f.write(json.dumps({'stage': 'Data Extraction', 'status': 'SUCCESS', 'details': {}}) + '\n')
+        assert len(load_call_records(run)) == 3
+        rows = {r['tag']: r for r in telemetry.rollup()}
+        assert rows['gaps']['calls'] == 2 and rows['gaps']['errors'] == 1 and rows['gaps']['fallbacks'] == 1
+        assert rows['TOTAL']['calls'] == 3 and rows['TOTAL']['prompt_tokens'] == 1800
+        assert rows['contradictions']['cached_tokens'] == 768 and rows['contradictions']['cached_share'] == 0.768
+        path = telemetry.write_rollup()
+        assert json.loads(path.read_text())['rollup'][-1]['tag'] == 'TOTAL'
+    print("   ✅ Per-tag rollup with errors, fallbacks and tokens")
+
+
+def test_compare_runs_and_cli():
+    """A cached second run shows fewer live milliseconds and more hits"""
+    with tempfile.TemporaryDirectory() as tmp:
+        run_a, run_b = Path(tmp) / 'a', Path(tmp) / 'b'
+        _write_run(run_a, 1200, hit=False)
+        _write_run(run_b, 3, hit=True)
+        rows = {r['tag']: r for r in compare_runs(load_call_records(run_a), load_call_records(run_b))}
+        assert rows['contradictions']['cache_hits_delta'] == 1
+        assert rows['TOTAL']['total_ms_delta'] < 0
+        main(['compare', str(run_a), str(run_b)])
+        main(['rollup', str(run_b)])
+    print("   ✅ Run comparison reports hit and latency deltas")
+
+
+if __name__ == "__main__":
+    test_record_and_rollup()
+    test_compare_runs_and_cli()
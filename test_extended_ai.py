@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""Tests for the analyzer's extended AI analyses over packed prompts"""
+
+import json
+import shutil
+
+import pandas as pd
+
+
+def test_annex_quality_object_is_kept():
+    """The annex_quality schema answers with an object per chunk; it is merged, not dropped as a non-list"""
+    from integrated_comprehensive_analyzer import IntegratedComprehensiveMedicalAnalyzer
+    analyzer = IntegratedComprehensiveMedicalAnalyzer()
+    tags = []
+
+    def call_openai(prompt, tag="", fingerprint=None, schema=None):
+        tags.append((tag, schema))
+        if tag == 'annex_quality':
+            return json.dumps({'executive_assessment': {'overall_quality': 'FAIR'},
+                               'outliers': [{'intervention': 'Caesarean section'}]})
+        return "{}"
+
+    analyzer._call_openai = call_openai
+    analyzer._run_service_classification = lambda records, prompts: ([], {})
+    annex = pd.DataFrame([
+        {'specialty': 'Obstetrics', 'intervention': 'Caesarean section', 'tariff': 30000},
+        {'specialty': 'Renal', 'intervention': 'Haemodialysis session', 'tariff': 10650},
+    ])
+    try:
+        out = analyzer._run_extended_ai({'structured': pd.DataFrame()}, {'procedures': annex})
+    finally:
+        shutil.rmtree(analyzer.output_dir, ignore_errors=True)
+    assert ('annex_quality', 'annex_quality') in tags
+    assert out['annex_quality']['executive_assessment'] == {'overall_quality': 'FAIR'}
+    assert out['annex_quality']['outliers'] and 'annex_quality_error' not in out
+    print("   ✅ Annex quality object kept")
+
+
+if __name__ == "__main__":
+    test_annex_quality_object_is_kept()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Tests for the PDF extraction cache"""
+
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+import extraction_cache
+from extraction_cache import ExtractionCache, pdf_sha256
+
+
+def _results():
+    raw = pd.DataFrame({'fund': ['PRIMARY HEALTH CARE FUND'] * 2, 'service': ['Outpatient', 'Maternity'],
+                        'tariff_num': [1500.0, None]})
+    annex = pd.DataFrame({'specialty': ['Cardiology', 'ENT'], 'intervention': ['Angioplasty', 'Tonsillectomy'],
+                          'id': pd.array([1, None], dtype='Int64'), 'tariff': [250000.0, 40000.0]})
+    return ({'raw': raw, 'structured': raw, 'wide': raw.head(1), 'exploded': raw},
+            {'procedures': annex})
+
+
+def test_round_trip_keyed_by_pdf_and_code():
+    """Frames come back unchanged for the same PDF and extractor code only"""
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(tmp) / "doc.pdf"
+        pdf.write_bytes(b"%PDF-1.4 first")
+        cache = ExtractionCache(Path(tmp) / "extractions")
+        policy, annex = _results()
+        assert cache.load(pdf) is None
+        assert cache.save(pdf, {'tariff', 'scope'}, policy, annex) is not None
+        hit = cache.load(pdf)
+        assert hit['doc_vocab'] == {'tariff', 'scope'}
+        for name, frame in policy.items():
+            pd.testing.assert_frame_equal(hit['policy_results'][name], frame)
+        pd.testing.assert_frame_equal(hit['annex_results']['procedures'], annex['procedures'])
+        assert len(cache.entries(pdf_sha256(pdf))) == 1
+
+        # Another PDF, or edited extraction code, misses
+        other = Path(tmp) / "other.pdf"
+        other.write_bytes(b"%PDF-1.4 second")
+        assert cache.load(other) is None
+        version = extraction_cache._version
+        try:
+            extraction_cache._version = "0" * 40
+            assert cache.load(pdf) is None
+        finally:
+            extraction_cache._version = version
+
+        # Failed extractions are not cached
+        assert cache.save(other, set(), policy, {'procedures': pd.DataFrame()}) is None
+    print("   ✅ Extraction cache round-trips frames per PDF and extractor version")
+
+
+if __name__ == "__main__":
+    test_round_trip_keyed_by_pdf_and_code()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Tests for the rule-based facility level validator"""
+
+from facility_level_validator import parse_levels, validate_facility_levels, validate_row
+
+
+def test_parse_levels_from_split_pdf_text():
+    """Ranges, lists and facility types are read from text with split words"""
+    assert parse_levels("Level 4 - 6") == ({4, 5, 6}, set(), 'explicit')
+    assert parse_levels("LEVEL 2, 3 and level 4 primary health care refe rral faci lity")[0] == {2, 3, 4}
+    assert parse_levels("Minor surg ical proced ures at Level 2 & 3 facili ties")[0] == {2, 3}
+    assert parse_levels("Level 5 - 8") == ({5, 6}, {7, 8}, 'explicit')
+    assert parse_levels("All public faci lity pharma cies") == ({2, 3, 4, 5, 6}, set(), 'facility_type')
+    assert parse_levels("Where avail able") == (set(), set(), '')
+    print("   ✅ Facility levels parsed from access points")
+
+
+def test_rows_classified_and_escalated():
+    """Capability violations conflict, qualified or unreadable access points are ambiguous"""
+    rows = [
+        {'fund': 'SHIF', 'service': 'RENAL CARE', 'scope': 'Haemo dialysis', 'access_point': 'Level 4 - 6',
+         'access_rules': 'Maximum of 3 sess ions per week'},
+        {'fund': 'PHC', 'service': 'MATERNITY', 'scope': 'Deliveries', 'access_point': 'Level 2 - 3',
+         'access_rules': 'C-sec tion - maximum stay of 72 hours'},
+        {'fund': 'SHIF', 'service': 'IMAGING', 'scope': 'MRI scans', 'access_point': 'All facilities with required imaging',
+         'access_rules': ''},
+        {'fund': 'SHIF', 'service': 'SURGERY', 'scope': '', 'access_point': 'Level 3 - 6',
+         'access_rules': 'Minor surg ical procedures performed at Level 2 & 3 facilities'},
+        {'fund': 'SHIF', 'service': 'PHARMACY', 'scope': '', 'access_point': 'Where avail able', 'access_rules': ''},
+        {'fund': 'SHIF', 'service': '', 'scope': '', 'access_point': '', 'access_rules': ''},
+    ]
+    assert validate_row(rows[0]).status == 'valid' and validate_row(rows[0]).rules == ['dialysis']
+    report = validate_facility_levels(rows)
+    assert [r.status for r in report.rows] == ['valid', 'conflict', 'ambiguous', 'conflict', 'ambiguous', 'unspecified']
+    caesarean = report.rows[1].findings[0]
+    assert caesarean['rule'] == 'caesarean' and caesarean['mismatch_type'] == 'over_assignment'
+    assert report.rows[3].findings[0]['mismatch_type'] == 'inconsistent_levels'
+    records = report.escalation_records(rows)
+    assert [r['service'] for r in records] == ['MATERNITY', 'IMAGING', 'SURGERY', 'PHARMACY']
+    assert records[0]['local_status'] == 'conflict' and records[0]['local_levels'] == [2, 3]
+    summary = report.to_dict()['validation_summary']
+    assert summary['total_services_reviewed'] == 6 and summary['escalated_to_llm'] == 4
+    print("   ✅ Rows validated locally, only unclear ones escalated")
+
+
+def test_every_row_validated_quickly():
+    """Thousands of rows are validated in well under a second"""
+    rows = [{'fund': 'SHIF', 'service': f'Service {i}', 'scope': 'ICU up to 14 days',
+             'access_point': 'Level 4 - 6', 'access_rules': 'Co-pay ment above per diem'} for i in range(5000)]
+    report = validate_facility_levels(rows)
+    assert report.counts()['valid'] == 5000
+    assert report.seconds < 1.0
+    print(f"   ✅ 5000 rows validated in {report.seconds * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    test_parse_levels_from_split_pdf_text()
+    test_rows_classified_and_escalated()
+    test_every_row_validated_quickly()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Tests for map-reduce sharding of the contradiction and gap prompts"""
+
+import threading
+
+import pandas as pd
+
+from insight_sharding import (ShardMerger, plan_shards, render_digests, render_shard_data, shard_digest,
+                              shard_fingerprint)
+
+
+def _frames():
+    funds = ['Primary Health Care Fund'] * 30 + ['Social Health Insurance Fund'] * 50 + ['Emergency Fund'] * 20
+    policy = pd.DataFrame({
+        'fund': funds,
+        'service': [f"service {i % 7}" for i in range(100)],
+        'scope': [f"scope item {i}" for i in range(100)],
+        'access_point': ['Level 2-3' if i % 2 else 'Level 4-6' for i in range(100)],
+        'tariff_num': [float(1000 + i) for i in range(100)],
+    })
+    specialties = ['Cardiology'] * 120 + ['Neurosurgery'] * 60 + ['Ophthalmology'] * 40 + ['ENT'] * 30
+    annex = pd.DataFrame({
+        'specialty': specialties,
+        'intervention': [f"procedure {i}" for i in range(250)],
+        'tariff': [float(5000 + 10 * i) for i in range(250)],
+    })
+    return policy, annex
+
+
+def test_shards_cover_every_row_once():
+    """Funds and specialties are packed into balanced shards without splitting a group"""
+    policy, annex = _frames()
+    shards = plan_shards(policy, annex, max_shards=5)
+    assert len(shards) <= 5
+    assert {s.source for s in shards} == {'policy', 'annex'}
+    policy_rows = sorted(i for s in shards if s.source == 'policy' for i in s.index)
+    annex_rows = sorted(i for s in shards if s.source == 'annex' for i in s.index)
+    assert policy_rows == list(policy.index) and annex_rows == list(annex.index)
+    for s in shards:
+        column = 'fund' if s.source == 'policy' else 'specialty'
+        frame = policy if s.source == 'policy' else annex
+        assert set(frame.loc[s.index, column]) == set(s.groups)
+    # Deterministic, and a shard's fingerprint only depends on its own rows
+    again = plan_shards(policy, annex, max_shards=5)
+    assert [s.groups for s in again] == [s.groups for s in shards]
+    edited = annex.copy()
+    edited.loc[edited['specialty'] == 'ENT', 'tariff'] += 1
+    changed = [s.name for s in shards if shard_fingerprint(s, policy, annex) != shard_fingerprint(s, policy, edited)]
+    assert changed == [s.name for s in shards if 'ENT' in s.groups]
+    assert len(plan_shards(policy, annex.iloc[0:0], max_shards=3)) == 3
+    print("   ✅ Shards cover every row once and stay stable")
+
+
+def test_merger_keeps_ids_unique_and_drops_repeats():
+    """Colliding ids get a shard suffix; a finding reported by two shards is kept once"""
+    merger = ShardMerger('contradiction_id')
+    a = merger.accept({'contradiction_id': 'C1', 'contradiction_type': 't', 'description': 'Dialysis limit'}, 'policy-1')
+    b = merger.accept({'contradiction_id': 'C1', 'contradiction_type': 't', 'description': 'Other'}, 'annex-1')
+    c = merger.accept({'contradiction_id': 'C1', 'contradiction_type': 't', 'description': 'Third'}, 'annex-1')
+    dup = merger.accept({'contradiction_id': 'C9', 'contradiction_type': 't', 'description': ' dialysis  LIMIT'}, 'cross')
+    assert (a['contradiction_id'], b['contradiction_id'], c['contradiction_id']) == ('C1', 'C1_ANNEX-1', 'C1_ANNEX-1_2')
+    assert dup is None and merger.duplicates == 1
+    assert set(b) == {'contradiction_id', 'contradiction_type', 'description'}  # schema unchanged
+
+    threaded = ShardMerger('gap_id')
+    workers = [threading.Thread(target=lambda n=n: [threaded.accept({'gap_id': f"G{i}", 'description': f"{n}-{i}"},
+                                                                    f"s{n}") for i in range(50)])
+               for n in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert len({g['gap_id'] for g in threaded.items}) == len(threaded.items) == 200
+    print("   ✅ Merged findings keep unique ids and no repeats")
+
+
+def test_shard_data_and_digests():
+    """Shard prompts carry detail for their own groups; digests stay compact"""
+    policy, annex = _frames()
+    shards = plan_shards(policy, annex, max_shards=4)
+    policy_shard = next(s for s in shards if s.source == 'policy')
+    annex_shard = next(s for s in shards if s.source == 'annex')
+    text = render_shard_data(policy_shard, policy, annex)
+    assert all(g in text for g in policy_shard.groups) and 'Level' in text
+    text = render_shard_data(annex_shard, policy, annex)
+    assert all(f"- {g}:" in text for g in annex_shard.groups) and 'procedure' in text
+
+    findings = [{'contradiction_id': f"C{i}", 'contradiction_type': 't', 'description': "x" * 500} for i in range(40)]
+    digest = shard_digest(annex_shard, policy, annex, findings, [])
+    assert len(digest['contradictions']) == 15
+    assert all(len(c['description']) <= 160 for c in digest['contradictions'])
+    assert set(digest['tariffs']) == set(annex_shard.groups)
+    rendered = render_digests([digest, shard_digest(policy_shard, policy, annex, [], [])])
+    assert len(rendered.splitlines()) == 2 and len(rendered) < 4000
+    print("   ✅ Shard data and digests are rendered")
+
+
+if __name__ == "__main__":
+    test_shards_cover_every_row_once()
+    test_merger_keeps_ids_unique_and_drops_repeats()
+    test_shard_data_and_digests()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Tests for hedged primary/fallback routing and the circuit breaker"""
+
+import threading
+import time
+
+from model_router import CircuitBreaker, ModelRouter, attempt_abandoned
+
+
+def test_hedge_after_p95():
+    """A slow primary is hedged once it passes the learned p95 latency"""
+    router = ModelRouter(['primary', 'fallback'], hedge=True, min_samples=3, default_hedge_seconds=5)
+    for _ in range(5):
+        router.latency['primary'].record(0.05)
+
+    def send(model):
+        time.sleep(1.0 if model == 'primary' else 0.01)
+        return f"answer from {model}"
+
+    result = router.route(send)
+    assert result.model == 'fallback' and result.hedged and result.fallback_used
+    assert result.latency_ms < 900
+    events = [d['event'] for d in result.decisions]
+    assert events[:2] == ['start', 'hedge'] and 'success' in events
+    assert all('elapsed_ms' in d for d in result.decisions)
+    print("   ✅ Slow primary hedged to fallback")
+
+
+def test_circuit_breaker_skips_failing_model():
+    """Consecutive failures open the circuit; the model is skipped until cool-down"""
+    router = ModelRouter(['primary', 'fallback'], hedge=False, failure_threshold=2, cooldown_seconds=0.3)
+    calls = []
+
+    def send(model):
+        calls.append(model)
+        if model == 'primary':
+            raise RuntimeError("503")
+        return "ok"
+
+    for _ in range(2):
+        assert router.route(send).model == 'fallback'
+    assert router.breakers['primary'].state == 'open'
+
+    calls.clear()
+    result = router.route(send)
+    assert calls == ['fallback']
+    assert result.decisions[0]['event'] == 'skip_open_circuit'
+
+    time.sleep(0.35)
+    calls.clear()
+    router.route(send)
+    assert calls == ['primary', 'fallback']  # half-open trial call
+    print("   ✅ Circuit breaker opens and half-opens")
+
+
+def test_abandoned_hedge_is_censored_and_not_cached():
+    """The losing call adds its elapsed time to the latency window and skips its side effects"""
+    router = ModelRouter(['primary', 'fallback'], hedge=True, min_samples=3, default_hedge_seconds=5)
+    for _ in range(5):
+        router.latency['primary'].record(0.05)
+    cached = []
+    primary_done = threading.Event()
+
+    def send(model):
+        if model == 'primary':
+            time.sleep(0.4)
+        if not attempt_abandoned():
+            cached.append(model)
+        if model == 'primary':
+            primary_done.set()
+        return model
+
+    result = router.route(send)
+    assert result.model == 'fallback'
+    abandon = [d for d in result.decisions if d['event'] == 'abandon_slower'][0]
+    assert abandon['model'] == 'primary' and abandon['censored_seconds']['primary'] >= 0.05
+    assert router.latency['primary'].count() == 6
+    assert router.latency['primary'].percentile(100) >= 0.05
+    assert primary_done.wait(2) and cached == ['fallback']
+    print("   ✅ Abandoned hedge recorded as censored sample, side effects skipped")
+
+
+def test_half_open_lets_one_probe_through():
+    """After the cool-down only one concurrent caller tries the failing model"""
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=0.2)
+    breaker.record_failure()
+    time.sleep(0.25)
+    assert breaker.allow() and not breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+
+    router = ModelRouter(['primary', 'fallback'], hedge=False, failure_threshold=1, cooldown_seconds=0.2)
+    calls = []
+
+    def send(model):
+        calls.append(model)
+        if model == 'primary':
+            time.sleep(0.1)
+            raise RuntimeError("503")
+        return "ok"
+
+    router.route(send)
+    time.sleep(0.25)
+    calls.clear()
+    threads = [threading.Thread(target=router.route, args=(send,)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls.count('primary') == 1 and calls.count('fallback') == 4
+    print("   ✅ Half-open circuit allows a single probe")
+
+
+if __name__ == "__main__":
+    test_hedge_after_p95()
+    test_circuit_breaker_skips_failing_model()
+    test_abandoned_hedge_is_censored_and_not_cached()
+    test_half_open_lets_one_probe_through()
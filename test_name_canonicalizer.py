@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Tests for local procedure-name canonicalisation with LLM escalation"""
+
+import tempfile
+from pathlib import Path
+
+from name_canonicalizer import canonicalize_names, distinguishing_tokens, load_mapping, normalize_name
+from prompt_packer import pack_records_stable
+
+NAMES = [
+    'Haemodialysis session', 'Hemodialysis  Session', 'HAEMODIALYSIS SESSION', 'Haemodialysis session',
+    'Caesarean section', 'Cesarean Section (C-section)', 'Caesarean sections',
+    'Total knee replacement', 'Total hip replacement',
+    'Cataract surgery',
+]
+
+
+def test_local_clusters_cover_every_name():
+    """Variant spellings merge; distinct procedures stay apart; every name is mapped"""
+    assert normalize_name('Haemodialysis  Session,') == normalize_name('hemodialysis session')
+    result = canonicalize_names(NAMES)
+    mapping = result.mapping()
+    assert set(mapping) == {n.strip() for n in NAMES}
+    assert mapping['HAEMODIALYSIS SESSION'] == mapping['Hemodialysis  Session'] == 'Haemodialysis session'
+    assert mapping['Caesarean sections'] == mapping['Caesarean section']
+    assert mapping['Total knee replacement'] != mapping['Total hip replacement']
+    assert mapping['Cataract surgery'] == 'Cataract surgery'
+    stats = result.to_dict()['stats']
+    assert stats['names'] == len(NAMES) and stats['canonical_names'] < stats['distinct_names']
+    print("   ✅ Local clusters cover all names")
+
+
+def test_only_ambiguous_names_escalate():
+    """Low-confidence clusters escalate; LLM groups override them; the mapping round-trips as a lookup table"""
+    result = canonicalize_names(NAMES)
+    escalated = result.ambiguous_names()
+    assert 'Cataract surgery' not in escalated and 'HAEMODIALYSIS SESSION' not in escalated
+    assert 'Total knee replacement' not in escalated
+    assert sorted(escalated) == ['Caesarean section', 'Caesarean sections', 'Cesarean Section (C-section)']
+    assert result.apply_llm_groups([{'canonical': 'Caesarean section',
+                                     'members': ['Cesarean Section (C-section)', 'Caesarean sections'],
+                                     'notes': 'abbreviation'}, {'members': []}]) == 1
+    assert result.mapping()['Cesarean Section (C-section)'] == 'Caesarean section'
+    with tempfile.TemporaryDirectory() as tmp:
+        path = result.save_mapping(Path(tmp) / 'canonical_name_map.json')
+        assert load_mapping(path) == result.mapping()
+    print("   ✅ Only ambiguous names escalate")
+
+
+def test_levels_sides_and_negations_never_merge():
+    """Names that differ only in a number, side or with/without stay separate, even through a chain"""
+    names = ['Haemodialysis session at level 4 hospital facility',
+             'Hemodialysis session at level 4 hospital facility',
+             'Haemodialysis session at level 5 hospital facility',
+             'Haemodialysis session at level hospital facility',
+             'Left total knee replacement', 'Right total knee replacement',
+             'Repair of hernia with mesh', 'Repair of hernia without mesh',
+             'Type II diabetes review', 'Type III diabetes review']
+    result = canonicalize_names(names)
+    mapping = result.mapping()
+    assert mapping[names[0]] == mapping[names[1]]
+    assert len({mapping[n] for n in names[:4]}) == 3
+    for a, b in ((4, 5), (6, 7), (8, 9)):
+        assert mapping[names[a]] != mapping[names[b]], names[a]
+    assert result.blocked_pairs > 0 and not any(names[2] in pair for pair in result.near_misses)
+
+    # The LLM cannot merge them either; "x-ray" carries no roman numeral
+    assert result.apply_llm_groups([{'canonical': 'Type II diabetes review', 'members': names[8:10]},
+                                    {'canonical': 'Total knee replacement', 'members': names[4:6]}]) == 1
+    mapping = result.mapping()
+    assert mapping[names[8]] == 'Type II diabetes review' and mapping[names[9]] == names[9]
+    assert mapping[names[4]] != mapping[names[5]] and result.llm_members_rejected == 3
+    assert distinguishing_tokens(normalize_name('Chest X-ray')) == frozenset()
+    print("   ✅ Different levels, sides and negations are not merged")
+
+
+def test_escalation_groups_stay_in_one_call():
+    """Each ambiguous cluster or near-miss pair is one record, so packing never splits it across calls"""
+    names = NAMES + ['Appendicectomy open', 'Appendectomy (open)', 'Appendicectomy, laparoscopic',
+                     'Laparoscopic appendicectomy']
+    result = canonicalize_names(names)
+    groups = result.escalation_groups()
+    assert sorted(n for g in groups for n in g) == sorted(result.ambiguous_names())
+    assert len(result.ambiguous_names()) == len(set(result.ambiguous_names()))
+    by_name = {n: i for i, g in enumerate(groups) for n in g}
+    for a, b, _ in result.near_misses:
+        assert by_name[a] == by_name[b]
+    pack = pack_records_stable(groups, budget_tokens=20)
+    assert len(pack.batches) > 1
+    assert sorted(sorted(g) for b in pack.batches for g in b.rows) == sorted(sorted(g) for g in groups)
+    print("   ✅ Escalation groups packed whole")
+
+
+if __name__ == "__main__":
+    test_local_clusters_cover_every_name()
+    test_only_ambiguous_names_escalate()
+    test_escalation_groups_stay_in_one_call()
+    test_levels_sides_and_negations_never_merge()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Tests for the offline chat-completions backend used in perf tests"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from ai_json_utils import collect_items
+from ai_response_store import AIResponseStore
+from offline_llm_backend import OfflineBackendError, OfflineChatClient
+from updated_prompts import RUN_DATA_MARKER, UpdatedHealthcareAIPrompts
+
+PROMPT = """Analyze the Kenya SHIF tariffs below.
+DATA: [{"service": "Dialysis", "tariff": 9500}]
+Return JSON in this format:
+{"gaps": [{"gap_id": "GAP_001", "description": "Missing service", "priority": "high"}], "summary": "text"}
+"""
+
+
+def test_synthetic_follows_prompt_schema():
+    """Synthetic responses follow the prompt's example and are deterministic"""
+    client = OfflineChatClient(mode="synthetic", store=object())
+    resp = client.chat.completions.create(model="gpt-5-mini", messages=[{"role": "user", "content": PROMPT}])
+    content = resp.choices[0].message.content
+    assert content == client.chat.completions.create(model="gpt-5-mini", messages=[{"role": "user", "content": PROMPT}]).choices[0].message.content
+    gaps = json.loads(content)['gaps']
+    assert len(gaps) >= 3 and len({g['gap_id'] for g in gaps}) == len(gaps)
+    assert set(gaps[0]) == {'gap_id', 'description', 'priority'}
+    assert resp.usage.prompt_tokens > 0 and resp.usage.completion_tokens > 0
+
+    chunks = list(client.chat.completions.create(model="gpt-5-mini", messages=[{"role": "user", "content": PROMPT}], stream=True))
+    streamed = "".join(c.choices[0].delta.content for c in chunks if c.choices)
+    assert streamed == content and chunks[-1].usage.completion_tokens > 0
+    print(f"   ✅ Synthetic response with {len(gaps)} gaps")
+
+
+def test_replay_latency_and_errors():
+    """Stored responses are replayed; latency and error rate are applied"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = AIResponseStore(db_path=os.path.join(tmp, "replay.sqlite3"))
+        store.set("k1", '[{"gap_id": "REAL_1"}]', model="gpt-5-mini", tag="gaps", prompt=PROMPT)
+        client = OfflineChatClient(mode="auto", latency_ms=50, store=store)
+        started = time.time()
+        resp = client.chat.completions.create(model="gpt-5-mini", messages=[{"role": "user", "content": PROMPT}])
+        assert time.time() - started >= 0.045
+        assert resp.offline_source == "replay"
+        assert collect_items(resp.choices[0].message.content, 'gaps')[0]['gap_id'] == "REAL_1"
+        store.close()
+
+    failing = OfflineChatClient(mode="synthetic", error_rate=1.0, store=object())
+    try:
+        failing.chat.completions.create(model="gpt-5-mini", messages=[{"role": "user", "content": "Hi"}])
+        assert False, "expected a simulated error"
+    except OfflineBackendError:
+        pass
+    print("   ✅ Replay, latency and simulated errors")
+
+
+def test_static_prefix_is_cached_across_runs():
+    """Prompt builders put run data last, so the static prefix repeats and is reported as cached"""
+    rows_a = json.dumps([{"specialty": "Renal", "intervention": "Haemodialysis", "tariff": 9500}])
+    rows_b = json.dumps([{"specialty": "Cardiology", "intervention": "Angiogram", "tariff": 80000}])
+    prompt_a = UpdatedHealthcareAIPrompts.get_annex_quality_prompt("12 procedures", rows_a)
+    prompt_b = UpdatedHealthcareAIPrompts.get_annex_quality_prompt("14 procedures", rows_b)
+    assert prompt_a.split(RUN_DATA_MARKER)[0] == prompt_b.split(RUN_DATA_MARKER)[0]
+    assert rows_a not in prompt_a.split(RUN_DATA_MARKER)[0]
+
+    client = OfflineChatClient(mode="synthetic", store=object())
+    first = client.chat.completions.create(model="gpt-5-mini", messages=[{"role": "user", "content": prompt_a}])
+    second = client.chat.completions.create(model="gpt-5-mini", messages=[{"role": "user", "content": prompt_b}])
+    assert first.usage.prompt_tokens_details.cached_tokens == 0
+    assert second.usage.prompt_tokens_details.cached_tokens >= 1024
+    # The schema comes from the static prefix, not from the run data
+    assert 'executive_assessment' in json.loads(second.choices[0].message.content)
+    print(f"   ✅ {second.usage.prompt_tokens_details.cached_tokens} prefix tokens cached on the second call")
+
+
+def test_offline_calls_leave_the_default_store_untouched():
+    """Offline completions are cached in their own store, never under the production model keys"""
+    import ai_response_store
+    from integrated_comprehensive_analyzer import IntegratedComprehensiveMedicalAnalyzer
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {'SHIF_AI_BACKEND': 'offline', 'SHIF_AI_CACHE_DB': os.path.join(tmp, "prod.sqlite3"),
+               'SHIF_OFFLINE_CACHE_DB': os.path.join(tmp, "offline.sqlite3")}
+        saved = {k: os.environ.get(k) for k in env}
+        os.environ.update(env)
+        analyzer = None
+        try:
+            production = AIResponseStore()
+            production.set("real", '{"gaps": []}', model="gpt-5-mini", tag="gaps_main")
+            analyzer = IntegratedComprehensiveMedicalAnalyzer()
+            assert str(analyzer.ai_store.db_path) == env['SHIF_OFFLINE_CACHE_DB']
+            assert analyzer._call_openai(PROMPT, tag="gaps_main")
+            assert [(r['model'], r['tag'], r['entries']) for r in production.stats()['by_model_tag']] == \
+                [('gpt-5-mini', 'gaps_main', 1)]
+            assert analyzer.ai_store.stats()['entries'] >= 1
+            production.close()
+        finally:
+            for k, v in saved.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+            for path in [p for p in ai_response_store._default_stores if p.startswith(tmp)]:
+                ai_response_store._default_stores.pop(path).close()
+            if analyzer is not None:
+                shutil.rmtree(analyzer.output_dir, ignore_errors=True)
+    print("   ✅ Offline calls are kept out of the production store")
+
+
+if __name__ == "__main__":
+    test_synthetic_follows_prompt_schema()
+    test_replay_latency_and_errors()
+    test_static_prefix_is_cached_across_runs()
+    test_offline_calls_leave_the_default_store_untouched()
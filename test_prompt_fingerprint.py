@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""Tests that semantically identical prompt inputs produce identical cache keys"""
+
+import sys
+
+import pandas as pd
+
+from prompt_fingerprint import (canonical_records_json, canonicalize_prompt, data_fingerprint,
+                                records_fingerprint, stable_value_counts)
+
+
+def test_stable_counts_and_records():
+    """Tie order, column order and float noise do not change the rendering"""
+    a = pd.Series(['Renal', 'Cardiology', 'Renal', 'Cardiology', 'ENT'])
+    b = pd.Series(['Cardiology', 'Renal', 'ENT', 'Renal', 'Cardiology'])
+    assert stable_value_counts(a) == stable_value_counts(b)
+    assert list(stable_value_counts(a)) == ['Cardiology', 'Renal', 'ENT']
+
+    df1 = pd.DataFrame([{'specialty': 'ENT', 'tariff': 1500.0}, {'specialty': 'Renal', 'tariff': 0.1 + 0.2}])
+    df2 = pd.DataFrame([{'tariff': 1500, 'specialty': 'ENT '}, {'tariff': 0.3, 'specialty': 'Renal'}])
+    assert canonical_records_json(df1) == canonical_records_json(df2)
+    print("   ✅ Stable counts and records")
+
+
+def test_fingerprints_and_whitespace():
+    """Row order is ignored by default and whitespace is normalised in prompts"""
+    rows = [{'service_name': 'Dialysis', 'tariff': 9500}, {'service_name': 'MRI', 'tariff': 12000}]
+    assert records_fingerprint(rows) == records_fingerprint(list(reversed(rows)))
+    assert records_fingerprint(rows, ordered=True) != records_fingerprint(list(reversed(rows)), ordered=True)
+    assert data_fingerprint('gaps', policy='x', annex='y') == data_fingerprint('gaps', annex='y', policy='x')
+
+    p1 = "Analyze   the data.  \n\n\n\n  DATA:\n{\n  \"a\": 1\n}   "
+    p2 = "Analyze the data.\n\n  DATA:\n{\n  \"a\": 1\n}"
+    assert canonicalize_prompt(p1) == canonicalize_prompt(p2)
+    print("   ✅ Fingerprints and whitespace normalisation")
+
+
+if __name__ == "__main__":
+    test_stable_counts_and_records()
+    test_fingerprints_and_whitespace()
+    print("\n✅ ALL TESTS PASSED")
+    sys.exit(0)
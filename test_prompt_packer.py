@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Tests for token-budgeted prompt packing and result merging"""
+
+from prompt_packer import count_tokens, merge_json_results, pack_records, pack_records_stable
+
+
+def render(rows_json):
+    return "Analyze these Kenya SHIF annex rows and return a JSON array of issues.\nROWS:\n" + rows_json
+
+
+def test_pack_covers_all_rows_within_budget():
+    """All rows are packed, in order, and every prompt fits the budget"""
+    rows = [{'specialty': 'Renal', 'intervention': f'Procedure {i}', 'tariff': 1000 + i} for i in range(300)]
+    result = pack_records(rows, 800, render=render, name='annex_quality')
+    assert len(result.batches) > 1 and result.coverage == 1.0
+    assert [r for b in result.batches for r in b.rows] == rows
+    for b in result.batches:
+        assert b.tokens <= 800
+        assert count_tokens(render(str(b.rows))) > 0
+    report = result.report()
+    assert report['rows_analysed'] == report['rows_extracted'] == 300
+    print(f"   ✅ Packed 300 rows into {report['calls']} prompts")
+
+
+def test_max_calls_reports_partial_coverage():
+    """Rows beyond the call limit are reported as not analysed"""
+    rows = [{'name': 'x' * 200, 'i': i} for i in range(50)]
+    result = pack_records(rows, 400, render=render, max_calls=2)
+    assert len(result.batches) == 2 and 0 < result.coverage < 1
+    assert merge_json_results([[1, 2], [3]]) == [1, 2, 3]
+    assert merge_json_results([{'rules': [1], 'summary': 'a'}, {'rules': [2], 'summary': 'b'}]) == {'rules': [1, 2], 'summary': 'a'}
+    print(f"   ✅ Partial coverage reported ({result.coverage:.0%})")
+
+
+def test_stable_chunks_only_change_where_rows_changed():
+    """Editing and inserting rows leaves the other chunks' rows and fingerprints intact"""
+    rows = [{'specialty': f'Specialty {i % 7}', 'intervention': f'Procedure {i}', 'tariff': 1000 + i} for i in range(500)]
+    before = pack_records_stable(rows, 600, group_key='specialty')
+    changed = list(rows)
+    changed[17] = dict(changed[17], tariff=1)
+    changed.insert(40, {'specialty': 'Specialty 3', 'intervention': 'New procedure', 'tariff': 5})
+    after = pack_records_stable(changed, 600, group_key='specialty')
+    assert before.coverage == after.coverage == 1.0
+    assert all(b.tokens <= 600 for b in before.batches)
+    old = {b.fingerprint for b in before.batches}
+    new = {b.fingerprint for b in after.batches}
+    assert len(new - old) <= 3 and len(old & new) >= len(before.batches) - 3
+    # Row order does not matter
+    shuffled = pack_records_stable(list(reversed(rows)), 600, group_key='specialty')
+    assert [b.fingerprint for b in shuffled.batches] == [b.fingerprint for b in before.batches]
+    print(f"   ✅ {len(old & new)}/{len(before.batches)} chunks unchanged after editing two rows")
+
+
+def test_stable_call_limit_trims_largest_groups():
+    """Over max_calls, under-filled ranges merge first, then rows go from the largest groups, not whole chunks"""
+    rows = [{'specialty': 'Surgery', 'intervention': f'Procedure {i}', 'tariff': 1000 + i} for i in range(120)]
+    rows += [{'specialty': f'Rare {i}', 'intervention': f'Rare procedure {i}', 'tariff': 10} for i in range(6)]
+    full = pack_records_stable(rows, 600, group_key='specialty')
+    merged = pack_records_stable(rows, 600, group_key='specialty', max_calls=len(full.batches) - 1)
+    assert len(merged.batches) < len(full.batches) and merged.coverage == 1.0 and not merged.skipped_by_group
+    assert all(b.tokens <= 600 for b in merged.batches)
+
+    limited = pack_records_stable(rows, 600, group_key='specialty', max_calls=2)
+    assert len(limited.batches) <= 2 and 0 < limited.coverage < 1
+    assert set(limited.skipped_by_group) == {'Surgery'}
+    assert sum(limited.skipped_by_group.values()) == limited.total_rows - limited.packed_rows
+    analysed = {r['specialty'] for b in limited.batches for r in b.rows}
+    assert {f'Rare {i}' for i in range(6)} <= analysed
+    again = pack_records_stable(list(reversed(rows)), 600, group_key='specialty', max_calls=2)
+    assert [b.fingerprint for b in again.batches] == [b.fingerprint for b in limited.batches]
+    assert limited.report()['skipped_by_group'] == limited.skipped_by_group
+    print(f"   ✅ Call limit kept {limited.coverage:.0%} of rows and every small group")
+
+
+if __name__ == "__main__":
+    test_pack_covers_all_rows_within_budget()
+    test_max_calls_reports_partial_coverage()
+    test_stable_chunks_only_change_where_rows_changed()
+    test_stable_call_limit_trims_largest_groups()
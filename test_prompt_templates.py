@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Tests for template-aware invalidation of cached AI responses"""
+
+import contextlib
+import importlib
+import io
+import json
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+import prompt_templates
+from ai_response_store import AIResponseStore
+from prompt_templates import TEMPLATE_REFS, invalidation_report, prune_stale, source_hash, template_hash
+
+TEMPLATES = '''
+PERSONA = "You are a reviewer."
+
+
+def _rules():
+    return "{rules}"
+
+
+def template_a(data):
+    return PERSONA + _rules() + data
+
+
+def template_b(data):
+    return "Summarise: " + data
+'''
+
+
+def _load(tmp: str, name: str, rules: str):
+    Path(tmp, f"{name}.py").write_text(TEMPLATES.format(rules=rules))
+    return importlib.import_module(name)
+
+
+def test_hash_changes_only_for_edited_template():
+    """Editing a helper a template calls changes that template's hash, not its neighbours'"""
+    repo_dir = prompt_templates._REPO_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        sys.path.insert(0, tmp)
+        prompt_templates._REPO_DIR = Path(tmp).resolve()
+        try:
+            v1 = _load(tmp, "_tpl_v1", "Flag every contradiction.")
+            v2 = _load(tmp, "_tpl_v2", "Flag contradictions with evidence only.")
+            assert source_hash(v1.template_a) != source_hash(v2.template_a)
+            assert source_hash(v1.template_b) == source_hash(v2.template_b)
+            # Constants the template references count too
+            v3 = _load(tmp, "_tpl_v3", "Flag contradictions with evidence only.")
+            assert source_hash(v3.template_a) == source_hash(v2.template_a)
+            v3.PERSONA = "You are an auditor."
+            assert source_hash(v3.template_a) != source_hash(v2.template_a)
+            assert source_hash(v3.template_b) == source_hash(v1.template_b)
+        finally:
+            prompt_templates._REPO_DIR = repo_dir
+            sys.path.remove(tmp)
+            for name in ("_tpl_v1", "_tpl_v2", "_tpl_v3"):
+                sys.modules.pop(name, None)
+
+    # Every mapped template resolves; a schema is part of the identity
+    assert all(template_hash(t) for t in set(TEMPLATE_REFS.values()))
+    template, digest = prompt_templates.template_version('', 'annex_quality')
+    assert template.endswith("get_annex_quality_prompt#annex_quality")
+    assert digest and digest != template_hash(TEMPLATE_REFS['annex_quality'])
+    assert prompt_templates.template_version('unmapped_tag') == (None, None)
+    print("   ✅ Template hashes follow their own sources only")
+
+
+def test_store_honours_template_hash():
+    """Another template version is a miss; untracked entries miss until explicitly adopted"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / "old.sqlite3"
+        conn = sqlite3.connect(str(db))
+        conn.execute("CREATE TABLE responses (cache_key TEXT PRIMARY KEY, prompt_hash TEXT, model TEXT, tag TEXT, "
+                     "created_at TEXT, last_accessed TEXT, latency_ms REAL, prompt_tokens INTEGER, "
+                     "completion_tokens INTEGER, byte_size INTEGER, hit_count INTEGER DEFAULT 0, "
+                     "compressed INTEGER DEFAULT 0, content BLOB)")
+        conn.execute("INSERT INTO responses (cache_key, content, byte_size) VALUES ('legacy', ?, 2)", (b'{}',))
+        conn.commit()
+        conn.close()
+
+        store = AIResponseStore(db_path=str(db))
+        assert store.untracked_entries() == 1
+        assert store.get('legacy', template_hash='h1', template='t') is None
+        assert not store.contains('legacy', 'h1') and store.contains('legacy') and store.get('legacy') == '{}'
+        assert prompt_templates.main(['--db', str(db), 'adopt', '--tag', 'other']) == 0
+        assert store.pending_adoption() == 0
+        assert prompt_templates.main(['--db', str(db), 'adopt']) == 0
+        assert store.pending_adoption() == 1 and store.untracked_entries() == 0
+        assert store.contains('legacy', 'h1') and store.contains('legacy', 'h2')
+        assert store.get('legacy', template_hash='h1', template='t') == '{}'
+        assert store.get('legacy', template_hash='h2', template='t') is None
+        assert not store.contains('legacy', 'h2') and store.contains('legacy', 'h1') and store.pending_adoption() == 0
+
+        store.set('k', 'v1', tag='gaps_main', template='t', template_hash='h2')
+        assert store.get('k', template_hash='h2') == 'v1' and store.get('k') == 'v1'
+        assert store.get('k', template_hash='h3') is None
+        assert {(r['template_hash'], r['entries']) for r in store.template_versions()} == {('h1', 1), ('h2', 1)}
+        assert store.delete_template_versions([('t', 'h1')]) == 1 and store.get('legacy') is None
+    print("   ✅ Store treats other template versions as misses")
+
+
+def test_report_and_prune_stale_entries():
+    """Only entries from templates whose source changed are reported and pruned"""
+    current_ref = TEMPLATE_REFS['gaps_main']
+    other_ref = TEMPLATE_REFS['annex_quality']
+    with tempfile.TemporaryDirectory() as tmp:
+        db = str(Path(tmp) / "ai.sqlite3")
+        store = AIResponseStore(db_path=db)
+        store.set('fresh', 'x', tag='gaps_main', template=current_ref, template_hash=template_hash(current_ref))
+        store.set('stale', 'y' * 100, tag='annex_quality', template=other_ref, template_hash='edited-since')
+        store.set('gone', 'z', tag='old', template="updated_prompts:Removed.prompt", template_hash='abc')
+        store.set('untracked', 'w', tag='misc')
+
+        report = {e['template']: e for e in invalidation_report(store)}
+        assert report[current_ref]['stale_entries'] == 0 and report[current_ref]['entries'] == 1
+        assert report[other_ref]['stale_entries'] == 1 and report[other_ref]['tags'] == ['annex_quality']
+        assert report["updated_prompts:Removed.prompt"]['current_hash'] is None
+        assert prompt_templates.main(['--db', db, 'status']) == 1
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            prompt_templates.main(['--db', db, 'status', '--json'])
+        assert json.loads(out.getvalue())['untracked_entries'] == 1
+
+        assert prune_stale(store) == 2
+        assert store.get('fresh') == 'x' and store.get('untracked') == 'w'
+        assert store.get('stale') is None and store.get('gone') is None
+        assert prompt_templates.main(['--db', db, 'status']) == 0
+    print("   ✅ Stale template entries are reported and pruned")
+
+
+if __name__ == "__main__":
+    test_hash_changes_only_for_edited_template()
+    test_store_honours_template_hash()
+    test_report_and_prune_stale_entries()
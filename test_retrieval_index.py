@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Tests for the per-run BM25 retrieval index used by the Q&A and predictive prompts"""
+
+import json
+import tempfile
+from pathlib import Path
+
+from retrieval_index import BM25Index, format_hits, load_or_build_index
+
+RESULTS = {
+    'structured_rules': [
+        {'rule_type': 'policy', 'service_name': 'Haemodialysis maximum 3 sessions per week',
+         'specialty': 'Renal care', 'facility_level': [4, 5, 6], 'tariff_amount': 10650},
+        {'rule_type': 'policy', 'service_name': 'Hemodiafiltration maximum 2 sessions per week',
+         'specialty': 'Renal care', 'facility_level': [5, 6], 'tariff_amount': 12000},
+        {'rule_type': 'annex_procedure', 'service_name': 'Caesarean section', 'specialty': 'Obstetrics',
+         'tariff_amount': 30000},
+        {'rule_type': 'annex_procedure', 'service_name': 'Total knee replacement', 'specialty': 'Orthopaedics',
+         'tariff_amount': 500000},
+    ],
+    'gaps': [{'gap_id': 'GAP_STROKE', 'description': 'No stroke rehabilitation services',
+              'gap_category': 'rehabilitation'}],
+    'contradictions': [{'contradiction_id': 'DIAL_001', 'description': 'Dialysis session limits differ',
+                        'medical_specialty': 'nephrology'}],
+}
+
+
+def test_search_ranks_relevant_rows():
+    """Rows sharing rare query terms rank first; kinds can be filtered"""
+    index = load_or_build_index(RESULTS)
+    top = [h['doc'].doc_id for h in index.search("dialysis sessions per week", k=3)]
+    assert top[0] in ('policy-1', 'DIAL_001') and 'annex_procedure-3' not in top
+    assert [h['doc'].doc_id for h in index.search("stroke rehabilitation", k=1)] == ['GAP_STROKE']
+    assert [h['doc'].kind for h in index.search("dialysis", kinds=['contradiction'])] == ['contradiction']
+    assert index.search("unrelated zebra") == []
+    context = format_hits(index.search("knee replacement tariff", k=1), max_chars=40)
+    assert context.startswith("1. [annex_procedure annex_procedure-4]") and context.endswith("...")
+    print("   ✅ BM25 ranks relevant rows")
+
+
+def test_persisted_once_per_run():
+    """The index is saved with a fingerprint and reloaded unless the results change"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'retrieval_index.json'
+        built = load_or_build_index(RESULTS, path)
+        saved = json.loads(path.read_text())
+        assert saved['fingerprint'] == built.fingerprint and len(saved['docs']) == len(built) == 6
+        loaded = load_or_build_index(RESULTS, path)
+        assert isinstance(loaded, BM25Index)
+        assert [h['doc'].doc_id for h in loaded.search("caesarean")] == ['annex_procedure-3']
+        changed = dict(RESULTS, gaps=[])
+        assert load_or_build_index(changed, path).fingerprint != built.fingerprint
+        assert len(json.loads(path.read_text())['docs']) == 5
+    print("   ✅ Index persisted and reused per run")
+
+
+if __name__ == "__main__":
+    test_search_ranks_relevant_rows()
+    test_persisted_once_per_run()
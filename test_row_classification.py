@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Tests for deduplicated, micro-batched per-row classification"""
+
+import threading
+
+from ai_telemetry import estimate_cost_usd
+from prompt_fingerprint import canonical_json
+from prompt_packer import count_tokens
+from row_classification import RowClassifier, dedupe_rows
+
+ROWS = [
+    {'specialty': 'Renal', 'service_name': 'Haemodialysis  session', 'tariff': 10650},
+    {'specialty': 'renal', 'service_name': 'HAEMODIALYSIS session', 'tariff': 10650},
+    {'specialty': 'Obstetrics', 'service_name': 'Caesarean section', 'tariff': 30000},
+    {'specialty': 'Obstetrics', 'service_name': 'Caesarean section', 'tariff': 45000},
+]
+
+
+def _classifier(cache, calls):
+    lock = threading.Lock()
+
+    def classify(batch):
+        with lock:
+            calls.append([r['service_name'] for r in batch])
+        return [{'row_id': r['row_id'], 'service_name': r['service_name'], 'clinical_risk': 'HIGH',
+                 'coverage_adequacy': 'ADEQUATE'} for r in batch]
+    return RowClassifier(classify, cache.get, cache.__setitem__, budget_tokens=60, max_rows=1, max_workers=3)
+
+
+def test_duplicates_classified_once_and_fanned_out():
+    """Whitespace/case variants share one call; every original row gets a result"""
+    hashes, reps = dedupe_rows(ROWS)
+    assert hashes[0] == hashes[1] and len(reps) == 3
+    assert reps[hashes[0]]['service_name'] == 'Haemodialysis session'
+    cache, calls = {}, []
+    outputs, report = _classifier(cache, calls).run(ROWS)
+    assert sorted(c[0] for c in calls) == ['Caesarean section', 'Caesarean section', 'Haemodialysis session']
+    assert [o['service_name'] for o in outputs] == [r['service_name'] for r in ROWS]
+    assert outputs[0]['row_hash'] == outputs[1]['row_hash'] != outputs[2]['row_hash']
+    assert all('row_id' not in o for o in outputs)
+    assert (report.rows, report.unique_rows, report.batches, report.classified_rows) == (4, 3, 3, 3)
+    assert report.rows_per_second is not None
+    print("   ✅ Duplicates classified once")
+
+
+def test_cached_rows_are_not_resent():
+    """A second run (one row edited) sends only the changed row; rows/$ uses call cost"""
+    cache, calls = {}, []
+    _classifier(cache, calls).run(ROWS)
+    calls.clear()
+    edited = ROWS[:3] + [dict(ROWS[3], tariff=50000)]
+    outputs, report = _classifier(cache, calls).run(edited)
+    assert calls == [['Caesarean section']] and report.cached_rows == 2 and None not in outputs
+    report.cost_usd = estimate_cost_usd([{'model': 'gpt-5-mini', 'prompt_tokens': 1_000_000,
+                                          'completion_tokens': 0}])
+    assert report.cost_usd == 0.25 and report.rows_per_dollar == 16.0
+    print("   ✅ Cached rows reused")
+
+
+def test_batches_fit_the_token_budget():
+    """Rows are split into prompts within the budget; a failing batch only fails its own rows"""
+    rows = [{'specialty': 'Surgery', 'service_name': f'Procedure number {i}', 'tariff': 1000 + i} for i in range(40)]
+    render = lambda rows_json: f"Classify these services: {rows_json}"
+    prompts = []
+    lock = threading.Lock()
+
+    def classify(batch):
+        with lock:
+            prompts.append(render(canonical_json(batch)))
+        if any(r['service_name'] == 'Procedure number 0' for r in batch):
+            raise RuntimeError("still failing after retries")
+        return [{'row_id': r['row_id'], 'service_name': r['service_name'], 'clinical_risk': 'LOW'} for r in batch]
+
+    outputs, report = RowClassifier(classify, {}.get, lambda h, c: None, budget_tokens=150,
+                                    render=render, max_workers=4).run(rows)
+    assert report.batches == len(prompts) > 1
+    assert all(count_tokens(p) <= 150 for p in prompts)
+    failed = [s for s in report.batch_status if s['status'] == 'failed']
+    assert len(failed) == 1 and report.failed_rows == failed[0]['rows'] == outputs.count(None)
+    assert outputs[0] is None and outputs[-1]['service_name'] == 'Procedure number 39'
+    print("   ✅ Batches fit the token budget")
+
+
+def test_results_matched_by_row_id_only():
+    """Reordered results land on their own rows; rows whose id is not echoed fail, even with the same name"""
+    rows = [{'specialty': 'Surgery', 'service_name': name, 'tariff': 1000} for name in ('Appendectomy', 'Hernia repair',
+                                                                                      'Cholecystectomy')]
+    cache = {}
+
+    def classify(batch):
+        by_name = {r['service_name']: r['row_id'] for r in batch}
+        return [{'row_id': by_name['Cholecystectomy'], 'service_name': 'Cholecystectomy', 'clinical_risk': 'HIGH'},
+                {'row_id': by_name['Appendectomy'], 'service_name': 'Appendectomy', 'clinical_risk': 'LOW'},
+                {'service_name': 'Hernia repair', 'clinical_risk': 'MEDIUM'}]
+
+    outputs, report = RowClassifier(classify, cache.get, cache.__setitem__, budget_tokens=1000).run(rows)
+    assert [o and o['clinical_risk'] for o in outputs] == ['LOW', None, 'HIGH']
+    assert report.failed_rows == 1 and report.batch_status[0]['status'] == 'partial' and len(cache) == 2
+    print("   ✅ Results matched by row id")
+
+
+if __name__ == "__main__":
+    test_duplicates_classified_once_and_fanned_out()
+    test_cached_rows_are_not_resent()
+    test_batches_fit_the_token_budget()
+    test_results_matched_by_row_id_only()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Tests for the vectorised per-specialty tariff outlier engine"""
+
+import time
+
+import numpy as np
+
+from tariff_outliers import detect_tariff_outliers
+
+
+def test_outliers_judged_within_specialty():
+    """A tariff normal for one specialty is an outlier in another; invalid tariffs are skipped"""
+    specialties = ['Oncology'] * 8 + ['Dental'] * 8
+    tariffs = [200000, 210000, 190000, 205000, 195000, 215000, 185000, 200000,
+               2000, 2100, 1900, 2050, 1950, 2000, 200000, float('nan')]
+    procedures = [f"proc-{i}" for i in range(len(tariffs))]
+    report = detect_tariff_outliers(tariffs, specialties, procedures=procedures)
+    top = report.top()
+    assert [row['procedure'] for row in top] == ['proc-14']
+    assert top[0]['specialty'] == 'Dental' and top[0]['direction'] == 'high'
+    assert top[0]['ratio_to_median'] > 50 and top[0]['robust_z'] > 3.5
+    assert report.skipped_rows == 1
+    stats = {s['specialty']: s for s in report.specialty_stats()}
+    assert stats['Oncology']['flagged'] == 0 and stats['Dental']['count'] == 7
+    print("   ✅ Outliers scored against their own specialty")
+
+
+def test_ranking_codes_and_small_groups():
+    """Flags rank by score, integer codes match labels, and small groups are never flagged"""
+    rng = np.random.default_rng(7)
+    codes = np.repeat([0, 1, 2], [200, 200, 3])
+    tariffs = np.exp(rng.normal(8, 0.2, len(codes)))
+    tariffs[[5, 250]] *= [40, 0.05]
+    tariffs[-1] *= 100
+    names = ['Surgery', 'Medicine', 'Rare']
+    report = detect_tariff_outliers(tariffs, codes, specialty_names=names)
+    by_label = detect_tariff_outliers(tariffs, np.array(names)[codes])
+    assert list(report.row_index) == list(by_label.row_index)
+    assert set(report.row_index[:2]) == {5, 250}
+    assert list(report.scores) == sorted(report.scores, reverse=True)
+    assert len(codes) - 1 not in set(report.row_index)
+    assert report.top(1)[0]['direction'] in ('high', 'low') and len(report.to_dict(top_n=1)['flagged']) == 1
+    print("   ✅ Ranking, integer codes and minimum group size")
+
+
+def test_million_rows_under_a_second():
+    """One grouped pass over 1M procedures in 50 specialties stays under a second"""
+    rng = np.random.default_rng(0)
+    codes = rng.integers(0, 50, 1_000_000)
+    tariffs = np.exp(rng.normal(8 + codes * 0.05, 0.5))
+    started = time.time()
+    report = detect_tariff_outliers(tariffs, codes, specialty_names=[f"S{i}" for i in range(50)])
+    elapsed = time.time() - started
+    assert report.stats['count'].sum() == 1_000_000
+    assert elapsed < 1.0, f"took {elapsed:.2f}s"
+    print(f"   ✅ 1M procedures scored in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    test_outliers_judged_within_specialty()
+    test_ranking_codes_and_small_groups()
+    test_million_rows_under_a_second()
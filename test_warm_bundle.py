@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Tests for exporting, verifying and importing warm-cache bundles"""
+
+import io
+import json
+import os
+import tarfile
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+import warm_bundle
+from ai_response_store import AIResponseStore
+from extraction_cache import ExtractionCache
+from warm_bundle import BundleError, export_bundle, import_bundle, verify_bundle
+
+
+def _source(tmp: Path):
+    """A machine that already ran the analysis: PDF, AI store, extraction entry and run folder."""
+    pdf = tmp / "doc.pdf"
+    pdf.write_bytes(b"%PDF-1.4 tariffs")
+    store = AIResponseStore(db_path=str(tmp / "src_ai" / "ai.sqlite3"))
+    store.set('k1', '{"gaps": []}', model='gpt-5-mini', tag='gaps_main', template='t', template_hash='h')
+    store.set('k2', 'text', model='gpt-5-mini', tag='coverage_analysis')
+    extractions = ExtractionCache(tmp / "src_extractions")
+    frame = pd.DataFrame({'specialty': ['ENT'], 'intervention': ['Tonsillectomy'], 'tariff': [40000.0]})
+    extractions.save(pdf, {'tariff'}, {'raw': frame, 'structured': frame, 'wide': frame, 'exploded': frame},
+                     {'procedures': frame})
+    run_dir = tmp / "outputs_run_20250101_000000"
+    run_dir.mkdir()
+    (run_dir / "ai_gaps.csv").write_text("gap_id,description\nG1,Missing dialysis cover\n")
+    return pdf, store, extractions, run_dir
+
+
+def test_export_and_import_into_cold_instance():
+    """A cold checkout gets the AI responses, extraction entry and run folder"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        pdf, store, extractions, run_dir = _source(tmp)
+        bundle = export_bundle(pdf, tmp / "bundles", run_dir, store=store, extraction_cache=extractions)
+        assert bundle.name.startswith("shif-warm-") and bundle.name.endswith(".tar.gz")
+        manifest = verify_bundle(bundle)
+        assert manifest['run_dir'] == run_dir.name and manifest['ai_entries'] == 2
+        assert f"run/{run_dir.name}/ai_gaps.csv" in manifest['files']
+
+        cold = tmp / "cold"
+        cold.mkdir()
+        cold_store = AIResponseStore(db_path=str(cold / "ai_cache" / "ai.sqlite3"))
+        cold_store.set('k2', 'newer local text', tag='coverage_analysis')
+        cold_extractions = ExtractionCache(cold / "ai_cache" / "extractions")
+        summary = import_bundle(bundle, pdf, store=cold_store, extraction_cache=cold_extractions, base_dir=cold)
+        assert summary['code_match'] and summary['ai_entries'] == 1 and summary['extractions'] == 1
+        assert cold_store.get('k1', template_hash='h') == '{"gaps": []}'
+        assert cold_store.get('k2') == 'newer local text'  # local entries win
+        assert cold_extractions.load(pdf)['doc_vocab'] == {'tariff'}
+        assert (cold / run_dir.name / "ai_gaps.csv").read_text().startswith("gap_id")
+    print("   ✅ Bundles warm a cold instance")
+
+
+def test_tampered_or_foreign_bundles_are_rejected():
+    """Checksum, unlisted members and a different PDF all stop the import before anything is written"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        pdf, store, extractions, run_dir = _source(tmp)
+        bundle = export_bundle(pdf, tmp / "bundles", run_dir, store=store, extraction_cache=extractions)
+
+        def rewrite(name, edit=lambda data: data, extra=None):
+            target = tmp / name
+            with tarfile.open(bundle, "r:gz") as src, tarfile.open(target, "w:gz") as out:
+                for member in src.getmembers():
+                    data = edit(src.extractfile(member).read())
+                    member.size = len(data)
+                    out.addfile(member, io.BytesIO(data))
+                if extra:
+                    out.addfile(tarfile.TarInfo(extra), io.BytesIO(b""))
+            return target
+
+        tampered = rewrite("tampered.tar.gz", lambda data: data.replace(b"dialysis", b"dialysiS"))
+        cold_store = AIResponseStore(db_path=str(tmp / "cold" / "ai.sqlite3"))
+        for bad in (tampered, tmp / "missing.tar.gz"):
+            try:
+                import_bundle(bad, pdf, store=cold_store, extraction_cache=ExtractionCache(tmp / "cold_x"),
+                              base_dir=tmp / "cold")
+                raise AssertionError("expected BundleError")
+            except BundleError:
+                pass
+        assert cold_store.stats()['entries'] == 0 and not (tmp / "cold" / run_dir.name).exists()
+
+        try:
+            verify_bundle(rewrite("extra.tar.gz", extra="../escape.txt"))
+            raise AssertionError("expected BundleError")
+        except BundleError as e:
+            assert "unlisted" in str(e)
+
+        other_pdf = tmp / "other.pdf"
+        other_pdf.write_bytes(b"%PDF-1.4 another edition")
+        try:
+            import_bundle(bundle, other_pdf, store=cold_store, extraction_cache=ExtractionCache(tmp / "cold_x"))
+            raise AssertionError("expected BundleError")
+        except BundleError as e:
+            assert "different PDF" in str(e)
+    print("   ✅ Tampered and foreign bundles are rejected")
+
+
+def test_boot_import_once_and_stale_runs():
+    """Boot picks the bundle for the local PDF once; runs from other code versions need opting in"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        pdf, store, extractions, run_dir = _source(tmp)
+        bundle = export_bundle(pdf, tmp / "bundles", run_dir, store=store, extraction_cache=extractions)
+        assert warm_bundle.locate_bundle(str(tmp / "bundles"), pdf) == bundle
+        other_pdf = tmp / "other.pdf"
+        other_pdf.write_bytes(b"%PDF-1.4 another edition")
+        assert warm_bundle.locate_bundle(str(tmp / "bundles"), other_pdf) is None
+
+        original = warm_bundle.code_version
+        warm_bundle.code_version = lambda root=None: "f" * 40
+        try:
+            kwargs = dict(store=AIResponseStore(db_path=str(tmp / "c1" / "ai.sqlite3")),
+                          extraction_cache=ExtractionCache(tmp / "c1" / "x"), base_dir=tmp / "c1")
+            summary = import_bundle(bundle, pdf, **kwargs)
+            assert not summary['code_match'] and summary['run_dir'] is None and summary['ai_entries'] == 2
+            assert import_bundle(bundle, pdf, allow_stale=True, **kwargs)['run_dir'] is not None
+        finally:
+            warm_bundle.code_version = original
+
+        state_path, boot = warm_bundle.STATE_PATH, (warm_bundle._boot_done, warm_bundle._boot_result)
+        warm_bundle.STATE_PATH = tmp / "state.json"
+        # The default store and caches belong to the working directory; only the boot logic is exercised here
+        warm_bundle.import_bundle = lambda path, pdf_path, allow_stale=False: {
+            'bundle': path.name, 'ai_entries': 2, 'extractions': 1, 'run_dir': None}
+        try:
+            os.environ['SHIF_WARM_BUNDLE'] = str(tmp / "bundles")
+            warm_bundle._boot_done = False
+            first = warm_bundle.import_on_boot(pdf)
+            assert first['bundle'] == bundle.name and warm_bundle.import_on_boot(pdf) is first
+            warm_bundle._boot_done = False  # a restart on the same disk
+            assert warm_bundle.import_on_boot(pdf)['already_imported']
+            assert list(json.loads(warm_bundle.STATE_PATH.read_text())['imported'])
+        finally:
+            os.environ.pop('SHIF_WARM_BUNDLE', None)
+            warm_bundle.import_bundle = import_bundle
+            warm_bundle.STATE_PATH = state_path
+            warm_bundle._boot_done, warm_bundle._boot_result = boot
+    print("   ✅ Boot import runs once and stale runs need opting in")
+
+
+if __name__ == "__main__":
+    test_export_and_import_into_cold_instance()
+    test_tampered_or_foreign_bundles_are_rejected()
+    test_boot_import_once_and_stale_runs()
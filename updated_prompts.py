@@ -4,15 +4,42 @@ UPDATED AI PROMPTS WITH REAL KENYA HEALTH DATA (2024)
 Enhanced prompts using current, validated statistics from official sources.
 
 Note: This module provides prompt builders only. It does not call any API.
+
+Layout: every builder emits its static text (persona, Kenya context,
+framework, output format) first and appends the per-run data last via
+with_run_data. The static part is then a byte-identical prefix across runs
+and calls, which lets the provider's automatic prompt-prefix caching apply.
 """
 
+from typing import Tuple
+
+# Separates the static, cacheable prefix from the per-run data
+RUN_DATA_MARKER = "**RUN DATA** (apply the instructions and output format above to the data below):"
+
+# Added to the contradiction/gap prompts for the reduce step of sharded analysis
+CROSS_SHARD_INSTRUCTIONS = """**CROSS-SHARD REVIEW:**
+The data below is one compact digest per shard (a policy fund/section or a set of annex specialties),
+each listing the {kind} findings already reported within that shard. Report ONLY {kind}s that span two
+or more shards (e.g. a policy fund versus annex tariffs, or two funds covering the same service
+differently). Do not repeat findings already listed in a digest. Use the same output format.
+
+"""
+
+
+def with_run_data(static_prefix: str, *sections: Tuple[str, str]) -> str:
+    """Static prefix first, then each (header, data) section after RUN_DATA_MARKER."""
+    parts = [static_prefix.rstrip("\n"), RUN_DATA_MARKER]
+    parts.extend(f"{header}\n{value}" for header, value in sections)
+    return "\n\n".join(parts) + "\n"
+
+
 class EnhancedHealthcareAIPrompts:
     """Advanced AI prompts for healthcare policy analysis with clinical expertise"""
 
     @staticmethod
     def get_advanced_contradiction_prompt(extracted_data: str, specialties_data: str) -> str:
         """Advanced medical contradiction detection with clinical reasoning"""
-        return f"""
+        return with_run_data(f"""
 You are **Dr. Amina Hassan**, Chief Medical Officer and Healthcare Policy Expert with 20+ years across multiple medical specializations. You're conducting a CRITICAL SAFETY REVIEW of Kenya's SHIF healthcare policies.
 
 **YOUR CLINICAL EXPERTISE:**
@@ -25,12 +52,6 @@ You are **Dr. Amina Hassan**, Chief Medical Officer and Healthcare Policy Expert
 💊 **Pharmacology**: Drug interactions, dosing protocols, safety monitoring
 🏥 **Health Systems**: Kenya's 6-tier system, facility capabilities, resource allocation
 
-**EXTRACTED KENYA SHIF DATA:**
-{extracted_data}
-
-**MEDICAL SPECIALTIES ANALYSIS:**
-{specialties_data}
-
 **🚨 CRITICAL DETECTION FRAMEWORK:**
 
 **PRIORITY 1 - LIFE-THREATENING CONTRADICTIONS:**
@@ -105,12 +126,15 @@ For EACH contradiction:
     }}
   }}
 ]
-"""
+""",
+            ("**EXTRACTED KENYA SHIF DATA:**", extracted_data),
+            ("**MEDICAL SPECIALTIES ANALYSIS:**", specialties_data),
+        )
 
     @staticmethod
     def get_comprehensive_gap_analysis_prompt(services_data: str, kenya_context: str) -> str:
         """Comprehensive gap analysis with Kenya health system expertise"""
-        return f"""
+        return with_run_data(f"""
 You are **Dr. Grace Kiprotich**, former Director of Medical Services for Kenya's Ministry of Health with 25+ years in health system design and policy implementation. You have intimate knowledge of Kenya's healthcare landscape, disease patterns, and implementation challenges.
 
 **YOUR EXPERTISE COVERS:**
@@ -121,12 +145,6 @@ You are **Dr. Grace Kiprotich**, former Director of Medical Services for Kenya's
 👥 **Health Equity**: Urban-rural disparities, vulnerable populations, access barriers
 📋 **WHO Standards**: Essential health services, UHC benchmarks
 
-**CURRENT SHIF COVERAGE ANALYSIS:**
-{services_data}
-
-**KENYA HEALTH CONTEXT:**
-{kenya_context}
-
 **🎯 COMPREHENSIVE GAP ANALYSIS FRAMEWORK:**
 1) Disease burden alignment, 2) Health system level gaps, 3) Population-specific gaps, 4) Care continuum gaps
 
@@ -156,12 +174,15 @@ You are **Dr. Grace Kiprotich**, former Director of Medical Services for Kenya's
     }}
   }}
 ]
-"""
+""",
+            ("**CURRENT SHIF COVERAGE ANALYSIS:**", services_data),
+            ("**KENYA HEALTH CONTEXT:**", kenya_context),
+        )
 
     @staticmethod
     def get_strategic_policy_recommendations_prompt(analysis_data: str) -> str:
         """Comprehensive strategic policy recommendations with detailed implementation roadmaps - ENHANCED"""
-        return f"""
+        return with_run_data(f"""
 You are **Dr. Margaret Kobia**, Former Principal Secretary for Health and current Senior Healthcare Policy Advisor with 20+ years experience in Kenya's health system transformation. You have overseen major healthcare reforms including Universal Health Coverage pilots, county health system devolution, and NHIF transformations. Your expertise spans health economics, policy implementation, stakeholder management, and sustainable financing mechanisms.
 
 **KENYA HEALTH SYSTEM CONTEXT:**
@@ -180,9 +201,6 @@ Develop EXECUTIVE-LEVEL strategic recommendations that are:
 4. **Evidence-based** using identified gaps and priority interventions
 5. **Stakeholder-aligned** across counties, providers, and beneficiaries
 
-**COMPREHENSIVE ANALYSIS TO REVIEW:**
-{analysis_data}
-
 **REQUIRED STRATEGIC FRAMEWORK:**
 
 **1. EXECUTIVE SUMMARY** (2-3 paragraphs)
@@ -295,27 +313,26 @@ Return ONLY a valid JSON object with this exact structure:
 - Ensure all recommendations are Kenya-context appropriate
 - Provide concrete implementation steps with timelines
 - Consider resource constraints and political feasibility
-- Focus on measurable outcomes and sustainable impact"""
+- Focus on measurable outcomes and sustainable impact""",
+            ("**COMPREHENSIVE ANALYSIS TO REVIEW:**", analysis_data),
+        )
 
     @staticmethod
     def get_conversational_analysis_prompt(user_question: str, context_data: str) -> str:
         """Dynamic conversational prompt for chat interface"""
-        return f"""
+        return with_run_data("""
 You are **Dr. Alex Mutua**, Senior Healthcare Policy Analyst. Respond conversationally with Kenya-specific context.
 
-**CONTEXT:**
-{context_data}
-
-**QUESTION:**
-{user_question}
-
 Start with a direct answer, add evidence from the analysis, explain medical/policy relevance, and suggest next steps.
-"""
+""",
+            ("**CONTEXT:**", context_data),
+            ("**QUESTION:**", user_question),
+        )
 
     @staticmethod
     def get_predictive_analysis_prompt(trends_data: str, scenario: str) -> str:
         """Comprehensive predictive analysis with health economics forecasting - ENHANCED"""
-        return f"""
+        return with_run_data(f"""
 You are **Dr. Wanjiku Ndirangu**, Senior Health Economist and Policy Modeling Expert with 20+ years experience in healthcare forecasting and system dynamics. You have led health economics research at University of Nairobi, served on WHO technical advisory groups, and developed predictive models for Kenya's health system including UHC financial projections, disease burden forecasts, and health workforce planning. Your expertise spans econometric modeling, demographic transitions, epidemiological forecasting, and health system performance prediction.
 
 **HEALTH ECONOMICS AND FORECASTING EXPERTISE:**
@@ -340,12 +357,6 @@ Use sophisticated modeling incorporating:
 4. **System Capacity**: Infrastructure development, workforce scaling, technology adoption
 5. **Policy Implementation**: SHIF rollout, service expansion, quality improvements
 
-**HISTORICAL TRENDS AND CURRENT DATA:**
-{trends_data}
-
-**SPECIFIC FORECASTING SCENARIO:**
-{scenario}
-
 **COMPREHENSIVE FORECASTING FRAMEWORK:**
 
 **1. BASELINE SCENARIO MODELING**
@@ -498,7 +509,10 @@ Return ONLY a valid JSON object with this exact structure:
 - Incorporate uncertainty ranges and confidence intervals
 - Ground projections in historical trends and comparative analysis
 - Consider both internal system dynamics and external influences  
-- Focus on actionable insights for policy and planning decisions"""
+- Focus on actionable insights for policy and planning decisions""",
+            ("**HISTORICAL TRENDS AND CURRENT DATA:**", trends_data),
+            ("**SPECIFIC FORECASTING SCENARIO:**", scenario),
+        )
 
 
 class UpdatedHealthcareAIPrompts(EnhancedHealthcareAIPrompts):
@@ -515,14 +529,14 @@ class UpdatedHealthcareAIPrompts(EnhancedHealthcareAIPrompts):
             "- Health System: 47 counties, 6-tier structure\n"
             "- CVD: 25% hospital admissions; Hypertension 24% of adults\n"
         )
-        return base.replace("**EXTRACTED KENYA SHIF DATA:**", kenya_block + "\n**EXTRACTED KENYA SHIF DATA:**")
+        return base.replace("**🚨 CRITICAL DETECTION FRAMEWORK:**", kenya_block + "\n**🚨 CRITICAL DETECTION FRAMEWORK:**", 1)
 
     # ===== Additional prompt builders for broader use-cases =====
 
     @staticmethod
     def get_annex_quality_prompt(annex_summary: str, sample_rows: str) -> str:
         """Comprehensive surgical tariff quality assessment with clinical expertise - ENHANCED"""
-        return f"""
+        return with_run_data(f"""
 You are **Dr. Joseph Kiprotich**, Chief of Surgery and Health Economics Consultant with 15+ years experience in surgical service delivery and healthcare financing in Kenya. You have served as Chair of the Kenya Association of Surgeons, advised on NHIF-SHIF transition, and developed surgical tariff frameworks for major hospitals including KNH and Mater Hospital. Your expertise spans surgical complexity assessment, resource-based costing, and clinical outcome optimization.
 
 **CLINICAL AND FINANCIAL EXPERTISE:**
@@ -547,12 +561,6 @@ Conduct EXPERT-LEVEL surgical tariff analysis focusing on:
 4. **Quality Incentives**: Tariff structure encourages best practices and outcomes
 5. **System Integration**: Consistency with overall SHIF benefit design
 
-**ANNEX SURGICAL TARIFF DATA:**
-{annex_summary}
-
-**DETAILED PROCEDURE SAMPLE:**
-{sample_rows}
-
 **COMPREHENSIVE QUALITY ASSESSMENT FRAMEWORK:**
 
 **1. SURGICAL COMPLEXITY VALIDATION**
@@ -678,20 +686,17 @@ Return ONLY a valid JSON object with this exact structure:
 - Prioritize patient access and quality of care
 - Consider Kenya's resource constraints and healthcare system capacity
 - Focus on actionable recommendations with clear implementation pathways
-- Balance sustainability concerns with clinical excellence requirements"""
+- Balance sustainability concerns with clinical excellence requirements""",
+            ("**ANNEX SURGICAL TARIFF DATA:**", annex_summary),
+            ("**DETAILED PROCEDURE SAMPLE:**", sample_rows),
+        )
 
     @staticmethod
     def get_rules_contradiction_map_prompt(policy_summary: str, sample_rules: str) -> str:
         """Create a contradiction map for pages 1–18 rules by fund/section."""
-        return f"""
+        return with_run_data(f"""
 You are a clinical policy analyst. Build a contradiction map across fund → service sections using rules (Scope, Access Point, Tariff, Access Rules).
 
-POLICY SUMMARY:
-{policy_summary}
-
-SAMPLE RULE ROWS (CSV-like rows or JSON list):
-{sample_rules}
-
 OUTPUT (JSON object):
 {{
   "contradictions": [
@@ -708,23 +713,22 @@ OUTPUT (JSON object):
     {{"field": "naming|levels|units", "proposal": "how to normalize across sections"}}
   ]
 }}
-"""
+""",
+            ("POLICY SUMMARY:", policy_summary),
+            ("SAMPLE RULE ROWS (CSV-like rows or JSON list):", sample_rules),
+        )
 
     @staticmethod
     def get_batch_service_analysis_prompt(services_json: str, context: str) -> str:
         """Analyze a batch of services for risk, coverage adequacy, and clinical considerations."""
-        return f"""
+        return with_run_data(f"""
 You are a multidisciplinary clinician. For each service in the batch, provide risk, facility level fit, and coverage adequacy.
+Copy each service's row_id into its result unchanged.
 
-CONTEXT:
-{context}
-
-SERVICES (JSON array):
-{services_json}
-
-OUTPUT (JSON array with same order):
+OUTPUT (JSON array, one object per service):
 [
   {{
+    "row_id": "",
     "service_name": "",
     "specialty": "",
     "recommended_facility_level": [4,5,6],
@@ -733,20 +737,17 @@ OUTPUT (JSON array with same order):
     "notes": "short clinical rationale"
   }}
 ]
-"""
+""",
+            ("CONTEXT:", context),
+            ("SERVICES (JSON array):", services_json),
+        )
 
     @staticmethod
     def get_individual_service_analysis_prompt(service_json: str, context: str) -> str:
         """Deep-dive on a single service with recommendations."""
-        return f"""
+        return with_run_data(f"""
 You are a specialist clinician. Provide a concise deep-dive on this service.
 
-CONTEXT:
-{context}
-
-SERVICE (JSON object):
-{service_json}
-
 OUTPUT (JSON):
 {{
   "service_name": "",
@@ -756,74 +757,72 @@ OUTPUT (JSON):
   "coverage_recommendation": "ADD|ADJUST|MAINTAIN",
   "tariff_note": "if pricing seems off, explain briefly"
 }}
-"""
+""",
+            ("CONTEXT:", context),
+            ("SERVICE (JSON object):", service_json),
+        )
 
     @staticmethod
     def get_inference_prompt(data_summary: str, questions: str) -> str:
         """General inference and hypothesis generation over extracted data."""
-        return f"""
+        return with_run_data(f"""
 You are a health systems scientist. Answer the questions using the data summary; be concise and evidence-oriented.
 
-DATA SUMMARY:
-{data_summary}
-
-QUESTIONS:
-{questions}
-
 OUTPUT: bullet points with short justifications.
-"""
+""",
+            ("DATA SUMMARY:", data_summary),
+            ("QUESTIONS:", questions),
+        )
 
     @staticmethod
     def get_tariff_outlier_prompt(stats_json: str) -> str:
-        """Tariff outlier detection guidance using descriptive stats."""
-        return f"""
-You are a health economist. Identify tariff outliers using the provided descriptive statistics and specialty-level distributions.
+        """Explain tariff outliers already flagged by per-specialty robust statistics."""
+        return with_run_data(f"""
+You are a health economist. Each FLAGGED procedure was scored against its own specialty on a log scale (robust z-score from the median and MAD, plus IQR fences) and ranked by score. Explain why each flagged tariff is, or is not, a genuine outlier given its specialty statistics and the clinical nature of the procedure. Do not add procedures that are not in the list.
 
-STATS (JSON):
-{stats_json}
-
-OUTPUT (JSON array):
+OUTPUT (JSON array, one item per flagged procedure):
 [
   {{"specialty": "", "procedure": "", "outlier_reason": "", "action": "review|adjust"}}
 ]
-"""
+""",
+            ("FLAGGED PROCEDURES AND SPECIALTY STATS (JSON):", stats_json),
+        )
 
     @staticmethod
     def get_section_summaries_prompt(policy_rows_json: str) -> str:
         """Summarize pages 1–18 by fund → service with key rules and risks."""
-        return f"""
+        return with_run_data(f"""
 You are a clinical policy summarizer. Produce concise summaries by fund → service with key scope points, access rules, tariffs, and notable risks/ambiguities.
 
-RULE ROWS (JSON array):
-{policy_rows_json}
-
 OUTPUT (JSON array):
 [
   {{"fund": "", "service": "", "key_points": [""], "risks": [""], "notes": ""}}
 ]
-"""
+""",
+            ("RULE ROWS (JSON array):", policy_rows_json),
+        )
 
     @staticmethod
     def get_name_canonicalization_prompt(services_list_json: str) -> str:
         """Canonicalize procedure names; group duplicates and variants."""
-        return f"""
+        return with_run_data(f"""
 You are a medical terminology expert. Canonicalize service/procedure names; detect duplicates/variants and propose a canonical form per group.
 
-SERVICES (JSON array of strings):
-{services_list_json}
-
 OUTPUT (JSON):
 {{
   "canonical_groups": [
     {{"canonical": "", "members": ["", ""], "notes": "e.g., abbreviations, spelling variants"}}
   ]
 }}
-"""
+""",
+            ("SERVICES (JSON array of candidate groups, each an array of names; only names in the same group may merge):",
+             services_list_json),
+        )
 
     @staticmethod
     def get_facility_level_validation_prompt(policy_rows_json: str) -> str:
         """Comprehensive facility level validation with Kenya health system expertise - ENHANCED"""
-        return f"""
+        return with_run_data(f"""
 You are **Dr. Lillian Mbau**, Director of Health Infrastructure and former County Director of Health Services with 18+ years experience in Kenya's health system. You have overseen facility upgrades across all 47 counties, managed devolution transitions, and developed facility capability standards for the Ministry of Health. Your expertise spans clinical service delivery, equipment requirements, staffing standards, and quality assurance across Kenya's 6-tier health system.
 
 **HEALTH SYSTEM INFRASTRUCTURE EXPERTISE:**
@@ -883,9 +882,6 @@ Conduct SYSTEMATIC facility level validation focusing on:
 4. **Referral Optimization**: Appropriate care level assignments prevent over/under-utilization
 5. **Access Equity**: Services distributed to maximize population reach
 
-**POLICY SERVICE ASSIGNMENTS TO VALIDATE:**
-{policy_rows_json}
-
 **COMPREHENSIVE VALIDATION FRAMEWORK:**
 
 **1. CLINICAL CAPABILITY ASSESSMENT**
@@ -1009,32 +1005,32 @@ Return ONLY a valid JSON object with this exact structure:
 - Ground recommendations in Kenya health system realities
 - Consider resource constraints and capacity building needs
 - Focus on equitable access while maintaining quality standards
-- Ensure sustainability and system integration"""
+- Ensure sustainability and system integration
+- Rows carry a rule-based pre-check (local_status, local_levels, local_findings); confirm or overturn it for each row""",
+            ("**POLICY SERVICE ASSIGNMENTS TO VALIDATE:**", policy_rows_json),
+        )
 
     @staticmethod
     def get_policy_annex_alignment_prompt(policy_summary: str, annex_summary: str) -> str:
         """Check alignment between policy structure and annex procedures (coverage consistency)."""
-        return f"""
+        return with_run_data(f"""
 You are a benefits package integrator. Check alignment between the policy structure (pages 1–18) and annex procedures (pages 19–54). Identify missing mappings, contradictions, and inconsistent inclusion.
 
-POLICY SUMMARY:
-{policy_summary}
-
-ANNEX SUMMARY:
-{annex_summary}
-
 OUTPUT (JSON):
 {{
   "alignment_issues": [
     {{"type": "missing_mapping|inconsistent_inclusion|naming_mismatch", "example": "", "recommendation": ""}}
   ]
 }}
-"""
+""",
+            ("POLICY SUMMARY:", policy_summary),
+            ("ANNEX SUMMARY:", annex_summary),
+        )
 
     @staticmethod
     def get_equity_analysis_prompt(coverage_summary: str, county_note: str) -> str:
         """Comprehensive equity analysis with detailed rural-urban and county considerations - ENHANCED"""
-        return f"""
+        return with_run_data(f"""
 You are **Dr. Mercy Mwangangi**, former Chief Administrative Secretary for Health and leading Health Equity Expert with 20+ years addressing health disparities across Kenya. You have extensive experience in rural health service delivery, county health system development, and marginalized population health programming.
 
 **YOUR EXPERTISE:**
@@ -1052,12 +1048,6 @@ You are **Dr. Mercy Mwangangi**, former Chief Administrative Secretary for Healt
 - **Health Workforce**: 80% of specialists concentrated in Nairobi, Mombasa, Nakuru counties
 - **Infrastructure Gaps**: 15 counties lack Level 5 hospitals, 8 counties have no functional ICU
 
-**COVERAGE SUMMARY ANALYSIS:**
-{coverage_summary}
-
-**COUNTY STRUCTURE CONTEXT:**
-{county_note}
-
 **COMPREHENSIVE EQUITY ASSESSMENT FRAMEWORK:**
 
 **DIMENSION 1 - GEOGRAPHIC EQUITY:**
@@ -1189,4 +1179,7 @@ You are **Dr. Mercy Mwangangi**, former Chief Administrative Secretary for Healt
 3. **Quality Equity**: Same-quality services regardless of location or income
 4. **Responsive Services**: Health system adaptation to diverse population needs
 5. **Community Ownership**: Marginalized populations participating in health governance
-"""
+""",
+            ("**COVERAGE SUMMARY ANALYSIS:**", coverage_summary),
+            ("**COUNTY STRUCTURE CONTEXT:**", county_note),
+        )
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Warm Bundle - Portable warm caches for cold Streamlit Cloud / Vercel instances
+Used by the Streamlit app at boot (import_on_boot) and by the export CLI on a
+machine that already ran the analysis.
+
+A bundle is one gzip tarball keyed by the PDF hash and the code version
+(shif-warm-<pdf>-<code>.tar.gz) holding:
+    manifest.json          format, PDF SHA-256, code/extraction versions, SHA-256 of every member
+    ai_responses.sqlite3   snapshot of the AI response store
+    extractions/           extraction cache entries for the PDF (extraction_cache)
+    run/<outputs_run_*>/   artefacts of the latest analysis run
+
+Import verifies the manifest and every member hash before touching anything,
+and refuses a bundle built from a different PDF. AI responses and extraction
+entries carry their own versions (prompt template hash, extraction version),
+so they are merged whatever code built the bundle; the run artefacts are only
+restored when the code version matches (or SHIF_WARM_BUNDLE_ALLOW_STALE is
+on). The imported bundle is recorded in ai_cache/warm_bundle_state.json so a
+restart on a warm disk does not import it again.
+
+CLI:
+    python warm_bundle.py export [--pdf PDF] [--run-dir DIR] [--out DIR]
+    python warm_bundle.py verify BUNDLE
+    python warm_bundle.py import BUNDLE [--allow-stale]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import urllib.request
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, Optional
+
+from extraction_cache import DEFAULT_PDF, ExtractionCache, extraction_version, pdf_sha256
+
+BUNDLE_FORMAT = 1
+DEFAULT_BUNDLE_DIR = Path("warm_bundles")
+DOWNLOAD_DIR = Path("ai_cache") / "bundles"
+STATE_PATH = Path("ai_cache") / "warm_bundle_state.json"
+MANIFEST = "manifest.json"
+AI_STORE_MEMBER = "ai_responses.sqlite3"
+EXTRACTIONS_PREFIX = "extractions"
+RUN_PREFIX = "run"
+_REPO_DIR = Path(__file__).resolve().parent
+
+
+class BundleError(Exception):
+    """A bundle that cannot be verified or does not apply to this deployment"""
+
+
+def _file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def code_version(root=None) -> str:
+    """Hash of the application's Python sources (tests excluded)."""
+    digest = hashlib.sha1()
+    for path in sorted(Path(root or _REPO_DIR).glob("*.py")):
+        if path.name.startswith("test_"):
+            continue
+        digest.update(path.name.encode("utf-8") + b"\0" + path.read_bytes() + b"\0")
+    return digest.hexdigest()
+
+
+def bundle_name(pdf_hash: str, code: str) -> str:
+    return f"shif-warm-{pdf_hash[:16]}-{code[:12]}.tar.gz"
+
+
+def latest_run_dir(base=".") -> Optional[Path]:
+    """Newest outputs_run_* folder that holds results (runs that stopped early are skipped)."""
+    for path in sorted(Path(base).glob("outputs_run_*"), key=lambda p: p.name, reverse=True):
+        if path.is_dir() and any(path.glob("*.csv")):
+            return path
+    return None
+
+
+# ---------- export ----------
+
+def export_bundle(pdf_path=DEFAULT_PDF, out_dir=DEFAULT_BUNDLE_DIR, run_dir=None, store=None,
+                  extraction_cache: ExtractionCache = None) -> Path:
+    """Pack the AI store, the PDF's extraction cache entries and a run folder into a bundle."""
+    from ai_response_store import get_default_store
+    from config import get_ai_backend
+    if store is None and get_ai_backend() == 'offline':
+        raise BundleError("SHIF_AI_BACKEND=offline: the default store holds synthetic responses, not a warm cache")
+    store = store or get_default_store()
+    extraction_cache = extraction_cache or ExtractionCache()
+    pdf_hash = pdf_sha256(pdf_path)
+    code = code_version()
+    run_dir = Path(run_dir) if run_dir else latest_run_dir()
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        members: Dict[str, Path] = {AI_STORE_MEMBER: store.snapshot(Path(tmp) / AI_STORE_MEMBER)}
+        for path in extraction_cache.entries(pdf_hash):
+            members[f"{EXTRACTIONS_PREFIX}/{path.name}"] = path
+        if run_dir is not None:
+            for path in sorted(run_dir.rglob("*")):
+                if path.is_file():
+                    members[f"{RUN_PREFIX}/{run_dir.name}/{path.relative_to(run_dir).as_posix()}"] = path
+        manifest = {
+            'format': BUNDLE_FORMAT,
+            'created_at': datetime.now().isoformat(),
+            'pdf_name': Path(pdf_path).name,
+            'pdf_sha256': pdf_hash,
+            'code_version': code,
+            'extraction_version': extraction_version(),
+            'run_dir': run_dir.name if run_dir is not None else None,
+            'ai_entries': store.stats()['entries'],
+            'files': {name: {'sha256': _file_sha256(path), 'bytes': path.stat().st_size}
+                      for name, path in members.items()},
+        }
+        manifest_path = Path(tmp) / MANIFEST
+        manifest_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+        target = out_dir / bundle_name(pdf_hash, code)
+        partial = target.with_name(target.name + ".partial")
+        with tarfile.open(partial, "w:gz", compresslevel=6) as tar:
+            tar.add(manifest_path, arcname=MANIFEST)
+            for name, path in members.items():
+                tar.add(path, arcname=name)
+        os.replace(partial, target)
+    return target
+
+
+# ---------- verify / import ----------
+
+def _safe_member(name: str) -> bool:
+    parts = PurePosixPath(name).parts
+    return bool(parts) and not PurePosixPath(name).is_absolute() and '..' not in parts
+
+
+def unpack_bundle(bundle_path, dest) -> Dict:
+    """Extract a bundle into dest, checking the manifest and every member's hash; returns the manifest."""
+    dest = Path(dest)
+    try:
+        with tarfile.open(bundle_path, "r:gz") as tar:
+            members = {m.name: m for m in tar.getmembers()}
+            if MANIFEST not in members:
+                raise BundleError("bundle has no manifest")
+            manifest = json.load(tar.extractfile(members[MANIFEST]))
+            if manifest.get('format') != BUNDLE_FORMAT:
+                raise BundleError(f"unsupported bundle format {manifest.get('format')!r}")
+            listed = manifest.get('files') or {}
+            unexpected = sorted(set(members) - set(listed) - {MANIFEST})
+            if unexpected:
+                raise BundleError(f"unlisted bundle members: {unexpected[:3]}")
+            for name, meta in listed.items():
+                member = members.get(name)
+                if member is None or not member.isfile() or not _safe_member(name):
+                    raise BundleError(f"missing or invalid bundle member: {name}")
+                target = dest.joinpath(*PurePosixPath(name).parts)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                digest = hashlib.sha256()
+                with tar.extractfile(member) as src, open(target, 'wb') as out:
+                    for chunk in iter(lambda: src.read(1 << 20), b""):
+                        digest.update(chunk)
+                        out.write(chunk)
+                if digest.hexdigest() != meta.get('sha256'):
+                    raise BundleError(f"checksum mismatch for {name}")
+    except (tarfile.TarError, OSError, ValueError) as e:
+        raise BundleError(f"unreadable bundle: {e}") from e
+    return manifest
+
+
+def verify_bundle(bundle_path) -> Dict:
+    """Manifest of a bundle whose contents all match their recorded hashes (raises BundleError)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        return unpack_bundle(bundle_path, tmp)
+
+
+def import_bundle(bundle_path, pdf_path=DEFAULT_PDF, store=None, extraction_cache: ExtractionCache = None,
+                  allow_stale: bool = False, base_dir=".") -> Dict:
+    """Verify a bundle, then merge its AI responses and extraction entries and restore its run folder."""
+    from ai_response_store import get_default_store
+    store = store or get_default_store()
+    extraction_cache = extraction_cache or ExtractionCache()
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = unpack_bundle(bundle_path, tmp)
+        if Path(pdf_path).exists() and pdf_sha256(pdf_path) != manifest['pdf_sha256']:
+            raise BundleError(f"bundle was built from a different PDF than {Path(pdf_path).name}")
+        code_match = manifest['code_version'] == code_version()
+        summary = {
+            'bundle': Path(bundle_path).name, 'created_at': manifest.get('created_at'), 'code_match': code_match,
+            'ai_entries': store.merge_from(Path(tmp) / AI_STORE_MEMBER), 'extractions': 0, 'run_dir': None,
+        }
+
+        extraction_cache.cache_dir.mkdir(parents=True, exist_ok=True)
+        for path in sorted(Path(tmp, EXTRACTIONS_PREFIX).glob("*.json.gz")):
+            target = extraction_cache.cache_dir / path.name
+            if not target.exists():
+                shutil.copy2(path, target)
+                summary['extractions'] += 1
+
+        run_name = manifest.get('run_dir')
+        if run_name and (code_match or allow_stale):
+            target = Path(base_dir) / run_name
+            if not target.exists():
+                shutil.copytree(Path(tmp, RUN_PREFIX, run_name), target)
+            summary['run_dir'] = str(target)
+        elif run_name:
+            summary['skipped_run_dir'] = f"{run_name} was built by another code version"
+    return summary
+
+
+# ---------- boot ----------
+
+def _download(url: str) -> Path:
+    target = DOWNLOAD_DIR / (Path(url.split("?", 1)[0]).name or "bundle.tar.gz")
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        partial = target.with_name(target.name + ".partial")
+        with urllib.request.urlopen(url, timeout=60) as response, open(partial, 'wb') as out:
+            shutil.copyfileobj(response, out)
+        os.replace(partial, target)
+    return target
+
+
+def locate_bundle(location: str, pdf_path=DEFAULT_PDF) -> Optional[Path]:
+    """Bundle file for a location: a file, a URL (downloaded once) or the best match in a directory.
+
+    In a directory, bundles for the local PDF are preferred, then the current
+    code version, then the newest file.
+    """
+    if not location:
+        return None
+    if location.startswith(("http://", "https://")):
+        return _download(location)
+    path = Path(location)
+    if path.is_file():
+        return path
+    if not path.is_dir():
+        return None
+    candidates: List[Path] = list(path.glob("shif-warm-*.tar.gz"))
+    if Path(pdf_path).exists():
+        prefix = f"shif-warm-{pdf_sha256(pdf_path)[:16]}-"
+        candidates = [p for p in candidates if p.name.startswith(prefix)]
+    if not candidates:
+        return None
+    current = f"-{code_version()[:12]}.tar.gz"
+    return max(candidates, key=lambda p: (p.name.endswith(current), p.stat().st_mtime))
+
+
+def _load_state() -> Dict:
+    try:
+        return json.loads(STATE_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {'imported': {}}
+
+
+def _save_state(state: Dict) -> None:
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    STATE_PATH.write_text(json.dumps(state, indent=2), encoding="utf-8")
+
+
+_boot_result: Optional[Dict] = None
+_boot_done = False
+_boot_lock = threading.Lock()
+
+
+def import_on_boot(pdf_path=DEFAULT_PDF) -> Optional[Dict]:
+    """Import the configured bundle once per process; None when there is nothing to import.
+
+    Returns the import summary ('already_imported' when this disk already holds
+    it, 'error' when the bundle was rejected).
+    """
+    global _boot_result, _boot_done
+    with _boot_lock:
+        if _boot_done:
+            return _boot_result
+        _boot_done = True
+        from config import get_warm_bundle_settings
+        settings = get_warm_bundle_settings()
+        if not settings['enabled']:
+            return None
+        try:
+            path = locate_bundle(settings['location'], pdf_path)
+            if path is None:
+                return None
+            digest = _file_sha256(path)
+            if settings['sha256'] and digest != settings['sha256']:
+                raise BundleError(f"{path.name} does not match SHIF_WARM_BUNDLE_SHA256")
+            state = _load_state()
+            previous = state.setdefault('imported', {}).get(digest)
+            if previous and (not previous.get('run_dir') or Path(previous['run_dir']).exists()):
+                _boot_result = dict(previous, already_imported=True)
+                return _boot_result
+            summary = import_bundle(path, pdf_path, allow_stale=settings['allow_stale'])
+            summary['imported_at'] = datetime.now().isoformat()
+            state['imported'][digest] = summary
+            _save_state(state)
+            print(f"♨️ Warm bundle {path.name}: {summary['ai_entries']} AI responses, "
+                  f"{summary['extractions']} extraction(s), run {summary['run_dir'] or 'not restored'}")
+            _boot_result = summary
+        except Exception as e:
+            print(f"⚠️ Warm bundle not imported: {e}")
+            _boot_result = {'error': str(e)}
+        return _boot_result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export and import warm-cache bundles")
+    parser.add_argument('--db', default=None, help="AI response store (default: ai_cache/ai_responses.sqlite3)")
+    sub = parser.add_subparsers(dest='command')
+    export_p = sub.add_parser('export', help="Pack the AI store, extraction cache and latest run")
+    export_p.add_argument('--pdf', default=DEFAULT_PDF)
+    export_p.add_argument('--run-dir', default=None, help="Run folder to include (default: latest outputs_run_*)")
+    export_p.add_argument('--out', default=str(DEFAULT_BUNDLE_DIR))
+    verify_p = sub.add_parser('verify', help="Check a bundle's manifest and checksums")
+    verify_p.add_argument('bundle')
+    import_p = sub.add_parser('import', help="Verify and import a bundle into this checkout")
+    import_p.add_argument('bundle')
+    import_p.add_argument('--pdf', default=DEFAULT_PDF)
+    import_p.add_argument('--allow-stale', action='store_true', help="Restore the run folder across code versions")
+    args = parser.parse_args(argv)
+
+    from ai_response_store import AIResponseStore
+    store = AIResponseStore(db_path=args.db) if args.db else None
+    if args.command == 'export':
+        if not Path(args.pdf).exists():
+            print(f"❌ PDF not found: {args.pdf}")
+            return 1
+        try:
+            path = export_bundle(args.pdf, args.out, args.run_dir, store=store)
+        except BundleError as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"✅ Wrote {path} ({path.stat().st_size / 1024 / 1024:.1f} MiB, sha256 {_file_sha256(path)})")
+        return 0
+    if args.command not in ('verify', 'import'):
+        parser.print_help()
+        return 2
+    try:
+        if args.command == 'verify':
+            manifest = verify_bundle(args.bundle)
+            print(f"✅ {Path(args.bundle).name}: {len(manifest['files'])} files verified "
+                  f"(PDF {manifest['pdf_sha256'][:16]}, code {manifest['code_version'][:12]}"
+                  f"{'' if manifest['code_version'] == code_version() else ', differs from this checkout'})")
+        else:
+            print(json.dumps(import_bundle(args.bundle, args.pdf, store=store, allow_stale=args.allow_stale), indent=2))
+    except BundleError as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())